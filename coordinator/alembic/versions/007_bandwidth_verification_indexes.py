@@ -0,0 +1,39 @@
+"""Add indexes for the set-based bandwidth verification pass.
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 00:00:00.000000+00:00
+
+Adds:
+  - bandwidth_ledger (id) WHERE is_verified = false — keyset walk over the
+    unverified backlog without touching verified history
+  - probe_results (node_id, probe_type, probe_timestamp) — range join of
+    ledger intervals against spot-check probes
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "007"
+down_revision = "006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_bandwidth_ledger_unverified_id",
+        "bandwidth_ledger",
+        ["id"],
+        postgresql_where=sa.text("is_verified = false"),
+    )
+    op.create_index(
+        "ix_probe_results_node_type_timestamp",
+        "probe_results",
+        ["node_id", "probe_type", "probe_timestamp"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_probe_results_node_type_timestamp", table_name="probe_results")
+    op.drop_index("ix_bandwidth_ledger_unverified_id", table_name="bandwidth_ledger")
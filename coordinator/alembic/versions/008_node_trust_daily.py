@@ -0,0 +1,44 @@
+"""Add node_trust_daily counters for incremental trust scores.
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 01:00:00.000000+00:00
+
+Per-node, per-UTC-day totals of bandwidth reports and verified reports.
+Backfilled from bandwidth_ledger so scores are unchanged after deploy.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "008"
+down_revision = "007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "node_trust_daily",
+        sa.Column("id", sa.BigInteger(), primary_key=True, index=True),
+        sa.Column("node_id", sa.String(255), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("total_reports", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("verified_reports", sa.Integer(), nullable=False, server_default="0"),
+        sa.UniqueConstraint("node_id", "day", name="uq_node_trust_daily_node_day"),
+    )
+    op.execute(
+        """
+        INSERT INTO node_trust_daily (node_id, day, total_reports, verified_reports)
+        SELECT reporting_node_id,
+               CAST(report_timestamp AS DATE),
+               count(*),
+               count(*) FILTER (WHERE is_verified)
+        FROM bandwidth_ledger
+        GROUP BY reporting_node_id, CAST(report_timestamp AS DATE)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("node_trust_daily")
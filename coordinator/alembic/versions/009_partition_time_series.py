@@ -0,0 +1,131 @@
+"""Convert bandwidth_ledger and probe_results to daily range partitions.
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 02:00:00.000000+00:00
+
+Both tables become PARTITION BY RANGE on their timestamp column with one
+partition per UTC day (``<table>_pYYYYMMDD``) and a ``<table>_default``
+catch-all; see app/partitions.py.  The primary keys become
+(id, <timestamp>) as Postgres requires the partition key in them.
+
+Partitions are created for the last RECENT_DAYS days of existing data
+through PRECREATE_DAYS days ahead; older rows land in the default
+partition and are purged by data retention as before.  probe_timestamp
+becomes NOT NULL (existing NULLs are set to the migration time).
+
+Rows are copied in one statement per table — run during a maintenance
+window on large installations.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "009"
+down_revision = "008"
+branch_labels = None
+depends_on = None
+
+RECENT_DAYS = 120
+PRECREATE_DAYS = 7
+
+# table, partition key, FK column → streams.stream_id, indexes (name, columns, where)
+TABLES = [
+    (
+        "bandwidth_ledger",
+        "report_timestamp",
+        "session_id",
+        [
+            ("ix_bandwidth_ledger_id", "id", None),
+            ("ix_bandwidth_ledger_session_id", "session_id", None),
+            ("ix_bandwidth_ledger_reporting_node_id", "reporting_node_id", None),
+            ("ix_bandwidth_ledger_report_timestamp", "report_timestamp", None),
+            ("ix_bandwidth_ledger_unverified_id", "id", "is_verified = false"),
+        ],
+    ),
+    (
+        "probe_results",
+        "probe_timestamp",
+        "stream_id",
+        [
+            ("ix_probe_results_id", "id", None),
+            ("ix_probe_results_node_id", "node_id", None),
+            ("ix_probe_results_node_type_timestamp", "node_id, probe_type, probe_timestamp", None),
+        ],
+    ),
+]
+
+
+def _create_indexes(table: str, indexes) -> None:
+    for name, columns, where in indexes:
+        op.execute(
+            f"CREATE INDEX {name} ON {table} ({columns})" + (f" WHERE {where}" if where else "")
+        )
+
+
+def _swap(table: str, build_sql: str, pkey: str, fk_column: str) -> None:
+    """Replace *table* with the table built by *build_sql* from ``{table}_old``."""
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    op.execute(f"ALTER INDEX {table}_pkey RENAME TO {table}_old_pkey")
+    # The id sequence outlives the old table
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+    op.execute(build_sql)
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({pkey})")
+    op.execute(
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_{fk_column}_fkey "
+        f"FOREIGN KEY ({fk_column}) REFERENCES streams (stream_id)"
+    )
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    today = datetime.now(timezone.utc).date()
+
+    for table, column, fk_column, indexes in TABLES:
+        if table == "probe_results":
+            op.execute("UPDATE probe_results SET probe_timestamp = now() WHERE probe_timestamp IS NULL")
+
+        _swap(
+            table,
+            f"CREATE TABLE {table} (LIKE {table}_old INCLUDING DEFAULTS) PARTITION BY RANGE ({column})",
+            f"id, {column}",
+            fk_column,
+        )
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+
+        oldest = bind.execute(sa.text(f"SELECT CAST(min({column}) AS date) FROM {table}_old")).scalar()
+        first = max(oldest or today, today - timedelta(days=RECENT_DAYS))
+        day = first
+        while day <= today + timedelta(days=PRECREATE_DAYS):
+            op.execute(
+                f"CREATE TABLE {table}_p{day:%Y%m%d} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{day:%Y-%m-%d}') TO ('{day + timedelta(days=1):%Y-%m-%d}')"
+            )
+            day += timedelta(days=1)
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+        op.execute(f"INSERT INTO {table} SELECT * FROM {table}_old")
+        op.execute(f"DROP TABLE {table}_old")
+        _create_indexes(table, indexes)
+        op.execute(f"ANALYZE {table}")
+
+
+def downgrade() -> None:
+    for table, column, fk_column, indexes in TABLES:
+        _swap(
+            table,
+            f"CREATE TABLE {table} (LIKE {table}_old INCLUDING DEFAULTS)",
+            "id",
+            fk_column,
+        )
+        if table == "probe_results":
+            op.execute("ALTER TABLE probe_results ALTER COLUMN probe_timestamp DROP NOT NULL")
+
+        op.execute(f"INSERT INTO {table} SELECT * FROM {table}_old")
+        # Drops every partition with it
+        op.execute(f"DROP TABLE {table}_old")
+        _create_indexes(table, indexes)
@@ -0,0 +1,84 @@
+"""Composite and partial indexes for the verification, payout and trust queries.
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 03:00:00.000000+00:00
+
+Adds:
+  - bandwidth_ledger (report_timestamp, reporting_node_id)
+    WHERE is_verified = true AND trust_score IS NULL — the payout cycle's
+    verified-but-unpaid rows for the last hour; stays tiny because paid
+    rows leave it
+  - bandwidth_ledger (reporting_node_id, report_timestamp) INCLUDE
+    (is_verified) — per-node window counts for trust counter rebuilds,
+    index-only
+  - probe_results (node_id, probe_timestamp) INCLUDE (success)
+    WHERE probe_type = 'spot_check' — the verification range join,
+    index-only and without the stats_poll rows
+
+Drops the single-column reporting_node_id / node_id indexes, which are
+prefixes of the composites above (and of 007's probe index).
+
+Indexes on partitioned parents cascade to every partition; CONCURRENTLY is
+not available for them, so each CREATE INDEX blocks writes while it builds.
+scripts/explain_hot_queries.py shows the plans before and after.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "010"
+down_revision = "009"
+branch_labels = None
+depends_on = None
+
+# name, table, columns, include, where
+NEW_INDEXES = [
+    (
+        "ix_bandwidth_ledger_unpaid",
+        "bandwidth_ledger",
+        ["report_timestamp", "reporting_node_id"],
+        [],
+        "is_verified = true AND trust_score IS NULL",
+    ),
+    (
+        "ix_bandwidth_ledger_node_timestamp",
+        "bandwidth_ledger",
+        ["reporting_node_id", "report_timestamp"],
+        ["is_verified"],
+        None,
+    ),
+    (
+        "ix_probe_results_spot_check",
+        "probe_results",
+        ["node_id", "probe_timestamp"],
+        ["success"],
+        "probe_type = 'spot_check'",
+    ),
+]
+
+# name, table, columns
+REDUNDANT_INDEXES = [
+    ("ix_bandwidth_ledger_reporting_node_id", "bandwidth_ledger", ["reporting_node_id"]),
+    ("ix_probe_results_node_id", "probe_results", ["node_id"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns, include, where in NEW_INDEXES:
+        op.create_index(
+            name,
+            table,
+            columns,
+            postgresql_include=include,
+            postgresql_where=sa.text(where) if where else None,
+        )
+    for name, table, _ in REDUNDANT_INDEXES:
+        op.drop_index(name, table_name=table)
+
+
+def downgrade() -> None:
+    for name, table, columns in REDUNDANT_INDEXES:
+        op.create_index(name, table, columns)
+    for name, table, *_ in reversed(NEW_INDEXES):
+        op.drop_index(name, table_name=table)
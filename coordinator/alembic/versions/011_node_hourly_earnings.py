@@ -0,0 +1,45 @@
+"""Add node_hourly_earnings rollup for the node economics endpoint.
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-18 04:00:00.000000+00:00
+
+Per-node earnings and bytes per UTC hour, written by the payout cycle.
+Backfilled from payout_log_entries so existing history is visible after
+deploy.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "011"
+down_revision = "010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "node_hourly_earnings",
+        sa.Column("id", sa.BigInteger(), primary_key=True, index=True),
+        sa.Column("node_id", sa.String(), nullable=False),
+        sa.Column("hour", sa.DateTime(), nullable=False),
+        sa.Column("earnings_usd", sa.Numeric(12, 4), nullable=False, server_default="0"),
+        sa.Column("bytes_relayed", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.UniqueConstraint("node_id", "hour", name="uq_node_hourly_earnings_node_hour"),
+    )
+    op.execute(
+        """
+        INSERT INTO node_hourly_earnings (node_id, hour, earnings_usd, bytes_relayed)
+        SELECT node_id,
+               date_trunc('hour', timestamp),
+               sum(earnings_usd),
+               sum(bytes_relayed)
+        FROM payout_log_entries
+        GROUP BY node_id, date_trunc('hour', timestamp)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("node_hourly_earnings")
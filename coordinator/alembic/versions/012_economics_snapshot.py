@@ -0,0 +1,33 @@
+"""Add economics_snapshot for the dashboard and validation report.
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-18 05:00:00.000000+00:00
+
+Single-row table holding the latest platform-wide metrics as JSONB,
+refreshed by a scheduled job (see app/economics_snapshot.py).  Starts
+empty; the first read or job run fills it.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "012"
+down_revision = "011"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "economics_snapshot",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("refreshed_at", sa.DateTime(), nullable=False),
+        sa.Column("refresh_ms", sa.Integer(), nullable=False),
+        sa.Column("payload", postgresql.JSONB(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("economics_snapshot")
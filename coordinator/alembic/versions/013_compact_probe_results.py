@@ -0,0 +1,100 @@
+"""Typed stats columns on probe_results instead of keeping every raw payload.
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-18 06:00:00.000000+00:00
+
+Adds stream_present, connection_count, connection_state and bitrate_kbps
+(what stats validation reads from a node's stats.json) and backfills them
+from response_data in keyset batches of BATCH_SIZE rows (parsed in
+Python, so malformed payloads summarise as "no stream" instead of
+failing the migration).  The raw payload of successful polls is then cleared; failed
+polls keep theirs for investigation.  Space is reclaimed by VACUUM and as
+daily partitions are dropped by retention.
+
+The summary logic mirrors app/stats_collector.summarize_stats as of this
+revision.  Downgrade drops the columns; cleared payloads are not restored.
+"""
+
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "013"
+down_revision = "012"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+HEALTHY_STATES = ("publishing", "streaming", "connected")
+
+COLUMNS = [
+    sa.Column("stream_present", sa.Boolean()),
+    sa.Column("connection_count", sa.Integer()),
+    sa.Column("connection_state", sa.String(32)),
+    sa.Column("bitrate_kbps", sa.Integer()),
+]
+
+
+def _as_int(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return int(value)
+
+
+def _summarize(raw: str, stream_id: str) -> dict:
+    summary = {"stream_present": False, "connection_count": 0, "connection_state": None, "bitrate_kbps": None}
+    try:
+        data = json.loads(raw)
+        for stream in data.get("streams", None) or []:
+            if stream_id not in stream.get("stream_name", ""):
+                continue
+            summary["stream_present"] = True
+            if summary["bitrate_kbps"] is None:
+                summary["bitrate_kbps"] = _as_int(stream.get("bitrate_kbps", stream.get("bitrate")))
+            connections = stream.get("connections", []) or []
+            summary["connection_count"] += len(connections)
+            for conn in connections:
+                state = str(conn.get("state", "")).lower()[:32] or None
+                current = summary["connection_state"]
+                if current is None or (state in HEALTHY_STATES and current not in HEALTHY_STATES):
+                    summary["connection_state"] = state
+    except Exception:
+        return {"stream_present": False, "connection_count": 0, "connection_state": None, "bitrate_kbps": None}
+    return summary
+
+
+def upgrade() -> None:
+    for column in COLUMNS:
+        op.add_column("probe_results", column)
+
+    bind = op.get_bind()
+    update = sa.text(
+        "UPDATE probe_results SET stream_present = :stream_present, connection_count = :connection_count, "
+        "connection_state = :connection_state, bitrate_kbps = :bitrate_kbps, "
+        "response_data = CASE WHEN success THEN NULL ELSE response_data END "
+        "WHERE id = :id AND probe_timestamp = :probe_timestamp"
+    )
+    after_id = 0
+    while True:
+        rows = bind.execute(
+            sa.text(
+                "SELECT id, probe_timestamp, stream_id, response_data FROM probe_results "
+                "WHERE probe_type = 'stats_poll' AND response_data IS NOT NULL AND id > :after "
+                "ORDER BY id LIMIT :limit"
+            ),
+            {"after": after_id, "limit": BATCH_SIZE},
+        ).all()
+        if not rows:
+            break
+        bind.execute(update, [
+            {"id": row.id, "probe_timestamp": row.probe_timestamp, **_summarize(row.response_data, row.stream_id)}
+            for row in rows
+        ])
+        after_id = rows[-1].id
+
+
+def downgrade() -> None:
+    for column in reversed(COLUMNS):
+        op.drop_column("probe_results", column.name)
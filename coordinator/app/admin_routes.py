@@ -5,19 +5,29 @@ Tasks 4.10, 7.21
 Provides:
 - GET /api/v1/admin/mesh/nodes — VPN mesh status via Headscale API
 - GET /api/v1/admin/validation-report — Aggregated validation metrics
+- POST /api/v1/admin/economics/refresh — Recompute the economics snapshot
 """
 
+import asyncio
 import logging
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from typing import Optional
 
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy import func, and_
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
-from . import models
+from .auth import AuthenticatedUser, require_streamer
 from .database import get_db
+from .economics_snapshot import (
+    ECONOMICS_SNAPSHOT_MIN_REFRESH_SECONDS,
+    compute_metrics,
+    get_snapshot,
+    refresh_snapshot_if_older,
+    snapshot_age_seconds,
+    staleness,
+)
 from .headscale_client import get_headscale_client
 
 logger = logging.getLogger(__name__)
@@ -42,7 +52,7 @@ async def mesh_nodes():
 # ---------------------------------------------------------------------------
 
 @router.get("/validation-report")
-async def validation_report(
+def validation_report(
     start: Optional[str] = Query(None, description="ISO 8601 start datetime"),
     end: Optional[str] = Query(None, description="ISO 8601 end datetime"),
     db: Session = Depends(get_db),
@@ -52,125 +62,49 @@ async def validation_report(
 
     Returns: stream uptime, node uptime, total bandwidth,
     payout accuracy, and viewer experience indicators.
+
+    The default range (last 24 hours) is served from the economics
+    snapshot, with its age under ``snapshot``; explicit ranges are
+    computed live (a plain ``def``, so FastAPI runs the aggregates in
+    its threadpool rather than on the event loop).
     """
     now = datetime.now(timezone.utc)
 
     # Parse time range (default: last 24 hours)
     try:
-        range_start = datetime.fromisoformat(start) if start else now - timedelta(hours=24)
+        range_start = datetime.fromisoformat(start) if start else None
     except ValueError:
-        range_start = now - timedelta(hours=24)
+        range_start = None
 
     try:
-        range_end = datetime.fromisoformat(end) if end else now
+        range_end = datetime.fromisoformat(end) if end else None
     except ValueError:
-        range_end = now
-
-    # --- Stream uptime ---
-    total_streams = db.query(func.count(models.Stream.id)).scalar() or 0
-    live_streams = (
-        db.query(func.count(models.Stream.id))
-        .filter(models.Stream.status == "LIVE")
-        .scalar()
-    ) or 0
-
-    # --- Node uptime ---
-    total_nodes = db.query(func.count(models.Node.id)).scalar() or 0
-    active_nodes = (
-        db.query(func.count(models.Node.id))
-        .filter(models.Node.status == "active")
-        .scalar()
-    ) or 0
-
-    # --- Total bandwidth in range ---
-    total_bytes = (
-        db.query(func.sum(models.BandwidthLedger.bytes_transferred))
-        .filter(
-            models.BandwidthLedger.report_timestamp >= range_start,
-            models.BandwidthLedger.report_timestamp <= range_end,
-        )
-        .scalar()
-    ) or 0
-
-    verified_bytes = (
-        db.query(func.sum(models.BandwidthLedger.bytes_transferred))
-        .filter(
-            models.BandwidthLedger.report_timestamp >= range_start,
-            models.BandwidthLedger.report_timestamp <= range_end,
-            models.BandwidthLedger.is_verified == True,  # noqa: E712
-        )
-        .scalar()
-    ) or 0
-
-    total_reports = (
-        db.query(func.count(models.BandwidthLedger.id))
-        .filter(
-            models.BandwidthLedger.report_timestamp >= range_start,
-            models.BandwidthLedger.report_timestamp <= range_end,
-        )
-        .scalar()
-    ) or 0
-
-    verified_reports = (
-        db.query(func.count(models.BandwidthLedger.id))
-        .filter(
-            models.BandwidthLedger.report_timestamp >= range_start,
-            models.BandwidthLedger.report_timestamp <= range_end,
-            models.BandwidthLedger.is_verified == True,  # noqa: E712
-        )
-        .scalar()
-    ) or 0
-
-    # --- Payout accuracy ---
-    payout_cycles = (
-        db.query(func.count(models.PayoutLog.id))
-        .filter(
-            models.PayoutLog.cycle_timestamp >= range_start,
-            models.PayoutLog.cycle_timestamp <= range_end,
-        )
-        .scalar()
-    ) or 0
-
-    total_paid_usd = (
-        db.query(func.sum(models.PayoutLog.total_amount_usd))
-        .filter(
-            models.PayoutLog.cycle_timestamp >= range_start,
-            models.PayoutLog.cycle_timestamp <= range_end,
+        range_end = None
+
+    snapshot = None
+    if range_start is None and range_end is None:
+        metrics, snapshot = get_snapshot(db)
+    else:
+        metrics = compute_metrics(
+            db,
+            range_start or now - timedelta(hours=24),
+            range_end or now,
         )
-        .scalar()
-    ) or Decimal("0")
-
-    penalties_applied = (
-        db.query(func.sum(models.PayoutLog.penalties_applied))
-        .filter(
-            models.PayoutLog.cycle_timestamp >= range_start,
-            models.PayoutLog.cycle_timestamp <= range_end,
-        )
-        .scalar()
-    ) or 0
-
-    # --- Viewer experience ---
-    avg_trust = (
-        db.query(func.avg(models.UserAccount.trust_score)).scalar()
-    ) or Decimal("0")
-
-    flagged_nodes = (
-        db.query(func.count(models.Node.id))
-        .filter(models.Node.status == "flagged")
-        .scalar()
-    ) or 0
-
-    total_gb = Decimal(str(total_bytes)) / Decimal(str(1024 ** 3))
-    verified_gb = Decimal(str(verified_bytes)) / Decimal(str(1024 ** 3))
+
+    streams, nodes, bandwidth = metrics["streams"], metrics["nodes"], metrics["bandwidth"]
+    payouts, accounts = metrics["payouts"], metrics["accounts"]
+    total_streams, live_streams = streams["total"], streams["live"]
+    total_nodes, active_nodes, flagged_nodes = nodes["total"], nodes["active"], nodes["flagged"]
+    total_reports, verified_reports = bandwidth["total_reports"], bandwidth["verified_reports"]
+
+    total_gb = Decimal(str(bandwidth["total_bytes"])) / Decimal(str(1024 ** 3))
+    verified_gb = Decimal(str(bandwidth["verified_bytes"])) / Decimal(str(1024 ** 3))
     verification_rate = (
         (verified_reports / total_reports * 100) if total_reports > 0 else 0
     )
 
     return {
-        "range": {
-            "start": range_start.isoformat(),
-            "end": range_end.isoformat(),
-        },
+        "range": metrics["range"],
         "stream_uptime": {
             "total_streams": total_streams,
             "live_streams": live_streams,
@@ -183,7 +117,7 @@ async def validation_report(
             "flagged_nodes": flagged_nodes,
         },
         "bandwidth": {
-            "total_bytes": total_bytes,
+            "total_bytes": bandwidth["total_bytes"],
             "total_gb": float(total_gb.quantize(Decimal("0.01"))),
             "verified_gb": float(verified_gb.quantize(Decimal("0.01"))),
             "total_reports": total_reports,
@@ -191,14 +125,48 @@ async def validation_report(
             "verification_rate_pct": round(verification_rate, 1),
         },
         "payout_accuracy": {
-            "payout_cycles": payout_cycles,
-            "total_paid_usd": float(total_paid_usd),
-            "penalties_applied": penalties_applied,
+            "payout_cycles": payouts["cycles"],
+            "total_paid_usd": float(payouts["total_paid_usd"]),
+            "penalties_applied": payouts["penalties_applied"],
         },
         "viewer_experience": {
             "avg_network_trust_score": float(
-                Decimal(str(avg_trust)).quantize(Decimal("0.01"))
+                Decimal(accounts["avg_trust_score"]).quantize(Decimal("0.01"))
             ),
             "flagged_nodes": flagged_nodes,
         },
+        "snapshot": snapshot,
     }
+
+
+# ---------------------------------------------------------------------------
+# Economics snapshot refresh
+# ---------------------------------------------------------------------------
+
+_refresh_lock = asyncio.Lock()
+
+
+@router.post("/economics/refresh")
+async def refresh_economics_snapshot(
+    user: AuthenticatedUser = Depends(require_streamer),
+    db: Session = Depends(get_db),
+):
+    """
+    Recompute the economics snapshot now instead of waiting for the
+    scheduled refresh.  One refresh at a time per process, and none while
+    the snapshot is younger than ECONOMICS_SNAPSHOT_MIN_REFRESH_SECONDS
+    (429 with Retry-After).
+    """
+    if _refresh_lock.locked():
+        raise HTTPException(status_code=429, detail="Refresh already running", headers={"Retry-After": "1"})
+    async with _refresh_lock:
+        snapshot, refreshed = await run_in_threadpool(refresh_snapshot_if_older, db)
+    if not refreshed:
+        retry_after = max(1, int(ECONOMICS_SNAPSHOT_MIN_REFRESH_SECONDS - snapshot_age_seconds(snapshot)))
+        raise HTTPException(
+            status_code=429,
+            detail="Snapshot refreshed recently",
+            headers={"Retry-After": str(retry_after)},
+        )
+    logger.info("Economics snapshot refreshed on demand by %s", user.user_id)
+    return {"refresh_ms": snapshot.refresh_ms, "snapshot": staleness(snapshot)}
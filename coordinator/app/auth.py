@@ -1,19 +1,44 @@
 """
-JWT RS256 Authentication Module for StreamrP2P Coordinator.
-
-Provides asymmetric JWT signing/verification using RSA keys,
-FastAPI dependencies for route protection, and JWKS endpoint support.
+JWT Authentication Module for StreamrP2P Coordinator.
+
+Provides asymmetric JWT signing/verification using RSA (RS256) or Ed25519
+(EdDSA) keys, FastAPI dependencies for route protection, and JWKS endpoint
+support.
+
+Tokens carry a ``kid`` header (the RFC 7638 thumbprint of the signing
+key).  To rotate keys — or move from RS256 to the much cheaper EdDSA —
+deploy the new pair and list the old public key in
+JWT_ADDITIONAL_PUBLIC_KEYS: new tokens are signed with the new key, tokens
+signed by the old one verify until they expire, and the JWKS serves both.
+
+Nodes send the same 24h token with every heartbeat and bandwidth report,
+so verified claims are kept in a bounded LRU keyed by the token's SHA-256
+digest (see VerifiedClaimsCache).  Entries are served only until the
+token's ``exp`` and are dropped when the signing keys are (re)loaded.
+
+Configurable via environment variables:
+  JWT_ALGORITHM               (default RS256; RS256 or EdDSA)
+  JWT_PRIVATE_KEY / JWT_PUBLIC_KEY  (PEM signing pair; ephemeral if unset)
+  JWT_ADDITIONAL_PUBLIC_KEYS  (concatenated PEM public keys, verify only)
+  JWT_CLAIMS_CACHE_SIZE       (default 10000, 0 disables caching)
 """
 
+import base64
+import hashlib
+import json
 import logging
 import os
-from dataclasses import dataclass, field
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import jwt
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
 from fastapi import Depends, HTTPException, Security
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
@@ -23,7 +48,9 @@ logger = logging.getLogger(__name__)
 
 TOKEN_EXPIRY_HOURS = 24
 ISSUER = "streamr-coordinator"
-ALGORITHM = "RS256"
+ALGORITHM = os.getenv("JWT_ALGORITHM", "RS256")  # signing algorithm
+SUPPORTED_ALGORITHMS = ("RS256", "EdDSA")
+JWT_CLAIMS_CACHE_SIZE = int(os.getenv("JWT_CLAIMS_CACHE_SIZE", "10000"))
 
 # --- Dataclass ---
 
@@ -40,19 +67,94 @@ class AuthenticatedUser:
 
 # --- Key Management ---
 
-_private_key = None
-_public_key = None
+
+@dataclass(frozen=True)
+class KeyRing:
+    """
+    Signing key plus every public key accepted for verification, by ``kid``.
+
+    ``verification_keys`` maps kid → (algorithm, public key) and always
+    includes the signing key first; the rest are previous keys still
+    honoured during a rotation.
+    """
+
+    algorithm: str
+    kid: str
+    private_key: Any
+    verification_keys: Dict[str, Tuple[str, Any]]
+
+    @property
+    def public_key(self):
+        return self.verification_keys[self.kid][1]
+
+
+_keyring: Optional[KeyRing] = None
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _int_to_base64url(n: int) -> str:
+    return _b64url(n.to_bytes((n.bit_length() + 7) // 8, byteorder="big"))
+
+
+def key_algorithm(key) -> str:
+    """JWS algorithm for an RSA or Ed25519 key (private or public)."""
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return "RS256"
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "EdDSA"
+    raise ValueError(f"Unsupported JWT key type: {type(key).__name__}")
+
+
+def _public_jwk_fields(public_key) -> dict:
+    """Required JWK members of *public_key* (RFC 7517 / RFC 8037)."""
+    if key_algorithm(public_key) == "RS256":
+        numbers = public_key.public_numbers()
+        return {"kty": "RSA", "n": _int_to_base64url(numbers.n), "e": _int_to_base64url(numbers.e)}
+    raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return {"kty": "OKP", "crv": "Ed25519", "x": _b64url(raw)}
+
+
+def key_id(public_key) -> str:
+    """
+    RFC 7638 JWK thumbprint of *public_key*.  Deterministic, so every
+    coordinator derives the same ``kid`` from the same key without extra
+    configuration.
+    """
+    members = json.dumps(_public_jwk_fields(public_key), sort_keys=True, separators=(",", ":"))
+    return _b64url(hashlib.sha256(members.encode()).digest())
+
+
+def _generate_private_key(algorithm: str):
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def _load_pem_public_keys(bundle: str) -> list:
+    """All public keys in a bundle of concatenated PEM blocks."""
+    blocks = re.findall(r"-----BEGIN PUBLIC KEY-----.+?-----END PUBLIC KEY-----", bundle, re.S)
+    return [serialization.load_pem_public_key(block.encode()) for block in blocks]
 
 
 def _load_keys():
     """
-    Load RSA key pair for JWT signing/verification.
+    Load the JWT signing key and the set of verification keys.
+
+    Priority for the signing pair:
+    1. JWT_PRIVATE_KEY / JWT_PUBLIC_KEY env vars (PEM-encoded strings); the
+       key type must match JWT_ALGORITHM
+    2. Auto-generate a dev key pair for JWT_ALGORITHM (with warning)
 
-    Priority:
-    1. JWT_PRIVATE_KEY / JWT_PUBLIC_KEY env vars (PEM-encoded strings)
-    2. Auto-generate a dev key pair (with warning)
+    Public keys in JWT_ADDITIONAL_PUBLIC_KEYS are accepted for verification
+    only, so tokens signed by a previous key keep working until they expire.
     """
-    global _private_key, _public_key
+    global _keyring
+
+    if ALGORITHM not in SUPPORTED_ALGORITHMS:
+        raise ValueError(f"JWT_ALGORITHM must be one of {SUPPORTED_ALGORITHMS}, got {ALGORITHM!r}")
 
     private_pem = os.getenv("JWT_PRIVATE_KEY")
     public_pem = os.getenv("JWT_PUBLIC_KEY")
@@ -61,34 +163,56 @@ def _load_keys():
         # Replace literal \n with actual newlines (common in env vars)
         private_pem = private_pem.replace("\\n", "\n")
         public_pem = public_pem.replace("\\n", "\n")
-        _private_key = serialization.load_pem_private_key(
+        private_key = serialization.load_pem_private_key(
             private_pem.encode(), password=None
         )
-        _public_key = serialization.load_pem_public_key(public_pem.encode())
-        logger.info("Loaded RSA key pair from environment variables")
+        public_key = serialization.load_pem_public_key(public_pem.encode())
+        if key_algorithm(private_key) != ALGORITHM or key_algorithm(public_key) != ALGORITHM:
+            raise ValueError(f"JWT_PRIVATE_KEY / JWT_PUBLIC_KEY are not {ALGORITHM} keys")
+        logger.info("Loaded %s key pair from environment variables", ALGORITHM)
     else:
         logger.warning(
-            "JWT_PRIVATE_KEY / JWT_PUBLIC_KEY not set — generating ephemeral dev key pair. "
-            "DO NOT use in production."
-        )
-        _private_key = rsa.generate_private_key(
-            public_exponent=65537, key_size=2048
+            "JWT_PRIVATE_KEY / JWT_PUBLIC_KEY not set — generating ephemeral %s dev key pair. "
+            "DO NOT use in production.",
+            ALGORITHM,
         )
-        _public_key = _private_key.public_key()
+        private_key = _generate_private_key(ALGORITHM)
+        public_key = private_key.public_key()
+
+    kid = key_id(public_key)
+    verification_keys = {kid: (ALGORITHM, public_key)}
+    additional = os.getenv("JWT_ADDITIONAL_PUBLIC_KEYS", "").replace("\\n", "\n")
+    for extra in _load_pem_public_keys(additional):
+        verification_keys.setdefault(key_id(extra), (key_algorithm(extra), extra))
+    if len(verification_keys) > 1:
+        logger.info("Accepting %d additional JWT verification key(s)", len(verification_keys) - 1)
+
+    _keyring = KeyRing(
+        algorithm=ALGORITHM,
+        kid=kid,
+        private_key=private_key,
+        verification_keys=verification_keys,
+    )
 
+    # Claims verified against the previous keys are no longer trusted
+    claims_cache.clear()
 
-def get_private_key():
-    """Return the loaded RSA private key, loading on first access."""
-    if _private_key is None:
+
+def get_keyring() -> KeyRing:
+    """Return the loaded key ring, loading on first access."""
+    if _keyring is None:
         _load_keys()
-    return _private_key
+    return _keyring
+
+
+def get_private_key():
+    """Return the loaded signing private key, loading on first access."""
+    return get_keyring().private_key
 
 
 def get_public_key():
-    """Return the loaded RSA public key, loading on first access."""
-    if _public_key is None:
-        _load_keys()
-    return _public_key
+    """Return the public half of the signing key, loading on first access."""
+    return get_keyring().public_key
 
 
 # --- JWT Encode / Decode ---
@@ -101,7 +225,8 @@ def encode_jwt(
     stream_ids: Optional[List[str]] = None,
 ) -> str:
     """
-    Create a signed RS256 JWT.
+    Create a JWT signed with the current key (RS256 or EdDSA), tagged with
+    its ``kid``.
 
     Args:
         user_id: The subject (sub) claim — user identity ID.
@@ -124,12 +249,23 @@ def encode_jwt(
     if node_id is not None:
         payload["node_id"] = node_id
 
-    return jwt.encode(payload, get_private_key(), algorithm=ALGORITHM)
+    keyring = get_keyring()
+    return jwt.encode(
+        payload,
+        keyring.private_key,
+        algorithm=keyring.algorithm,
+        headers={"kid": keyring.kid},
+    )
 
 
 def decode_jwt(token: str) -> dict:
     """
-    Decode and verify an RS256 JWT.
+    Decode and verify a JWT against the key named by its ``kid`` header.
+
+    Tokens without a ``kid`` (issued before keys were tagged) are tried
+    against every verification key of the header's algorithm.  Each key
+    only accepts its own algorithm, so an RSA public key can never be
+    used as an HMAC secret or the like.
 
     Args:
         token: The raw JWT string.
@@ -139,14 +275,119 @@ def decode_jwt(token: str) -> dict:
 
     Raises:
         jwt.ExpiredSignatureError: Token has expired.
-        jwt.InvalidTokenError: Token is invalid (bad signature, issuer, etc.).
+        jwt.InvalidTokenError: Token is invalid (bad signature, unknown key, issuer, etc.).
     """
-    return jwt.decode(
-        token,
-        get_public_key(),
-        algorithms=[ALGORITHM],
-        issuer=ISSUER,
-    )
+    header = jwt.get_unverified_header(token)
+    keys = get_keyring().verification_keys
+
+    kid = header.get("kid")
+    if kid is not None:
+        candidates = [keys[kid]] if kid in keys else []
+    else:
+        candidates = [entry for entry in keys.values() if entry[0] == header.get("alg")]
+    if not candidates:
+        raise jwt.InvalidTokenError("No verification key for token")
+
+    for algorithm, public_key in candidates[:-1]:
+        try:
+            return jwt.decode(token, public_key, algorithms=[algorithm], issuer=ISSUER)
+        except jwt.InvalidSignatureError:
+            continue
+    algorithm, public_key = candidates[-1]
+    return jwt.decode(token, public_key, algorithms=[algorithm], issuer=ISSUER)
+
+
+# --- Verified claims cache ---
+
+
+@dataclass
+class ClaimsCacheMetrics:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+
+class VerifiedClaimsCache:
+    """
+    Bounded LRU of token digest → (exp, claims) for tokens that passed
+    full verification.  Only successful verifications are cached, so an
+    invalid or expired token always goes through ``decode_jwt`` and gets
+    its specific error.
+    """
+
+    def __init__(self, max_entries: int = JWT_CLAIMS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.metrics = ClaimsCacheMetrics()
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        # Request handlers run on the event loop, but sync dependencies run
+        # in the threadpool
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.metrics.misses += 1
+                return None
+            exp, claims = entry
+            if time.time() >= exp:
+                del self._entries[key]
+                self.metrics.expired += 1
+                self.metrics.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.metrics.hits += 1
+            return claims
+
+    def put(self, token: str, claims: dict) -> None:
+        exp = claims.get("exp")
+        if self.max_entries <= 0 or not isinstance(exp, (int, float)):
+            return
+        key = self._digest(token)
+        with self._lock:
+            self._entries[key] = (exp, claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.metrics.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._entries:
+                self.metrics.invalidations += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.metrics.hits + self.metrics.misses
+        return {
+            **asdict(self.metrics),
+            "hit_ratio": round(self.metrics.hits / lookups, 4) if lookups else None,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+
+# Module-level singleton used by get_current_user
+claims_cache = VerifiedClaimsCache()
+
+
+def decode_jwt_cached(token: str) -> dict:
+    """
+    ``decode_jwt`` with the verified-claims cache in front.  Raises the same
+    errors; a cached token is rejected once its ``exp`` has passed.
+    """
+    claims = claims_cache.get(token)
+    if claims is None:
+        claims = decode_jwt(token)
+        claims_cache.put(token, claims)
+    return claims
 
 
 # --- FastAPI Dependencies ---
@@ -162,12 +403,13 @@ async def get_current_user(
     Authorization: Bearer header, returning an AuthenticatedUser.
     """
     try:
-        payload = decode_jwt(credentials.credentials)
+        payload = decode_jwt_cached(credentials.credentials)
         return AuthenticatedUser(
             user_id=payload["sub"],
             node_id=payload.get("node_id"),
             role=payload.get("role", "node"),
-            stream_ids=payload.get("stream_ids", []),
+            # Copied so handlers can't mutate the cached claims
+            stream_ids=list(payload.get("stream_ids", [])),
         )
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -189,33 +431,21 @@ async def require_streamer(
 
 def get_jwks() -> dict:
     """
-    Return a JWKS (JSON Web Key Set) representation of the public key.
+    Return a JWKS (JSON Web Key Set) of every verification key — the
+    current signing key first, then any previous keys still accepted.
 
     Used by the ``GET /api/v1/auth/.well-known/jwks.json`` endpoint so that
     external services (e.g. Go node clients) can verify tokens without
-    sharing the private key.
+    sharing the private key.  Clients select the key by the token's ``kid``.
     """
-    import base64
-
-    pub = get_public_key()
-    pub_numbers = pub.public_numbers()
-
-    def _int_to_base64url(n: int) -> str:
-        byte_length = (n.bit_length() + 7) // 8
-        return (
-            base64.urlsafe_b64encode(n.to_bytes(byte_length, byteorder="big"))
-            .rstrip(b"=")
-            .decode()
-        )
-
     return {
         "keys": [
             {
-                "kty": "RSA",
-                "alg": "RS256",
+                **_public_jwk_fields(public_key),
+                "alg": algorithm,
                 "use": "sig",
-                "n": _int_to_base64url(pub_numbers.n),
-                "e": _int_to_base64url(pub_numbers.e),
+                "kid": kid,
             }
+            for kid, (algorithm, public_key) in get_keyring().verification_keys.items()
         ]
     }
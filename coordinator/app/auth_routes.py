@@ -9,7 +9,6 @@ import logging
 import os
 from typing import Optional
 
-import bcrypt
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
@@ -23,6 +22,9 @@ from .auth import (
 from .database import get_db
 from .models import Node, Stream, UserAccount, UserIdentity
 from .headscale_client import get_headscale_client
+from .password_hashing import PasswordHashPoolSaturated, password_pool
+from .preauth_key_pool import preauth_key_pool
+from .redis_state import get_redis
 
 logger = logging.getLogger(__name__)
 
@@ -65,14 +67,28 @@ class AuthResponse(BaseModel):
 # ---------------------------------------------------------------------------
 
 
-def _hash_password(password: str) -> str:
-    """Hash a plaintext password with bcrypt."""
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+def _password_pool_saturated() -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many concurrent password checks, retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
 
+async def _hash_password(password: str) -> str:
+    """Hash a plaintext password with bcrypt on the password hashing pool."""
+    try:
+        return await password_pool.hash_password(password)
+    except PasswordHashPoolSaturated:
+        raise _password_pool_saturated()
 
-def _verify_password(password: str, hashed: str) -> bool:
-    """Verify a plaintext password against a bcrypt hash."""
-    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+async def _verify_password(password: str, hashed: str) -> bool:
+    """Verify a plaintext password against a bcrypt hash on the password hashing pool."""
+    try:
+        return await password_pool.verify_password(password, hashed)
+    except PasswordHashPoolSaturated:
+        raise _password_pool_saturated()
 
 
 def _ensure_user_account(db: Session, user_id: str) -> UserAccount:
@@ -111,7 +127,7 @@ async def register_streamer(
     user = UserIdentity(
         display_name=body.display_name,
         email=body.email,
-        hashed_password=_hash_password(body.password),
+        hashed_password=await _hash_password(body.password),
         role="streamer",
     )
     db.add(user)
@@ -143,7 +159,7 @@ async def login(
     if not user or not user.hashed_password:
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
-    if not _verify_password(body.password, user.hashed_password):
+    if not await _verify_password(body.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
     # Build stream_ids list for the token
@@ -225,12 +241,11 @@ async def register_node(
         stream_ids=[stream.stream_id],
     )
 
-    # Create a Headscale pre-auth key for VPN mesh joining
+    # Hand out a pre-minted Headscale pre-auth key for VPN mesh joining
     headscale_auth_key = None
     try:
-        hs_client = get_headscale_client()
-        headscale_auth_key = await hs_client.create_preauth_key(
-            expiry_hours=24, reusable=False
+        headscale_auth_key = await preauth_key_pool.take(
+            await get_redis(), get_headscale_client()
         )
     except Exception:
         logger.warning("Failed to create Headscale auth key for node %s", body.node_id, exc_info=True)
@@ -4,94 +4,219 @@ Task 5.1 — Req 13.1–13.3, Design §16
 
 Runs every 15 minutes via APScheduler. Cross-references unverified bandwidth
 reports with spot-check probe results and marks them verified/unverified.
+
+Reports are processed in keyset-paginated chunks (by id).  Each chunk is one
+statement: the chunk's ledger intervals are range-joined against spot-check
+probes and the outcome is written with a bulk UPDATE ... FROM (which also
+bumps the node_trust_daily counters), so the job costs one query per chunk
+instead of one probe query per report.
+
+The 15-minute pass only considers reports from the last
+BANDWIDTH_VERIFICATION_LOOKBACK_HOURS, and probes are bounded by the
+chunk's interval range, so both sides prune to the few daily partitions
+that can still change.
+
+Operational impact: an unverified report is never paid, so anything older
+than the lookback — the backlog present at deploy time, or reports left
+behind by a verifier outage longer than the window — would otherwise stay
+unpaid for good.  A catch-up pass with no lower bound picks those up: it
+runs once at startup and then every
+BANDWIDTH_VERIFICATION_CATCHUP_INTERVAL_HOURS (see main.py), and logs how
+many reports it found past the window.  Without a lower bound it can't
+prune partitions and scans every retained day of the ledger, which is why
+it runs daily rather than with the 15-minute pass.
+
+Configurable via environment variables:
+  BANDWIDTH_VERIFICATION_CHUNK_SIZE      (default 5000)
+  BANDWIDTH_VERIFICATION_LOOKBACK_HOURS  (default 48)
+  BANDWIDTH_VERIFICATION_CATCHUP_INTERVAL_HOURS  (default 24)
 """
 
 import logging
+import os
 from datetime import datetime, timedelta, timezone
-from decimal import Decimal
+from typing import Optional
 
+from sqlalchemy import Date, and_, case, cast, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
 
 from . import models
 from .trust_scoring import recalculate_and_store, apply_trust_consequences
 
 logger = logging.getLogger(__name__)
 
+BANDWIDTH_VERIFICATION_CHUNK_SIZE = int(os.getenv("BANDWIDTH_VERIFICATION_CHUNK_SIZE", "5000"))
+BANDWIDTH_VERIFICATION_LOOKBACK_HOURS = int(os.getenv("BANDWIDTH_VERIFICATION_LOOKBACK_HOURS", "48"))
+BANDWIDTH_VERIFICATION_CATCHUP_INTERVAL_HOURS = int(os.getenv("BANDWIDTH_VERIFICATION_CATCHUP_INTERVAL_HOURS", "24"))
+
 # Tolerance for claimed vs probe-estimated bytes (50%)
 TOLERANCE = 0.50
 
+# Probes this far either side of a report's interval count towards it
+PROBE_WINDOW = timedelta(minutes=5)
+
 
-def run_bandwidth_verification(db: Session) -> dict:
+def _verify_chunk_stmt(after_id: int, chunk_size: int, since: Optional[datetime]):
     """
-    Verify unverified bandwidth reports by comparing against spot-check
-    probe results for the same node in an overlapping time window.
+    Single-statement verification pass over the next *chunk_size*
+    unverified reports with id > *after_id* reported at or after *since*
+    (naive UTC, so partitions prune at plan time; None for no lower bound).
 
-    Returns a summary dict with counts.
+    Returns one row: last_id, scanned, skipped, verified, failed, node_ids.
     """
-    now = datetime.now(timezone.utc)
-    verified_count = 0
-    failed_count = 0
-    skipped_count = 0
-    affected_nodes: set[str] = set()
+    ledger = models.BandwidthLedger.__table__
+    probes = models.ProbeResult.__table__
 
-    # Fetch all unverified reports
-    unverified = (
-        db.query(models.BandwidthLedger)
-        .filter(models.BandwidthLedger.is_verified == False)  # noqa: E712
-        .all()
+    window = [ledger.c.report_timestamp >= since] if since is not None else []
+    chunk = (
+        select(
+            ledger.c.id,
+            ledger.c.report_timestamp,
+            ledger.c.reporting_node_id,
+            ledger.c.start_interval,
+            ledger.c.end_interval,
+        )
+        .where(
+            ledger.c.is_verified == False,  # noqa: E712
+            ledger.c.id > after_id,
+            *window,
+        )
+        .order_by(ledger.c.id)
+        .limit(chunk_size)
+        .cte("chunk")
     )
 
-    if not unverified:
-        logger.info("Bandwidth verification: no unverified reports")
-        return {"verified": 0, "failed": 0, "skipped": 0}
-
-    for report in unverified:
-        # Find spot-check probes for this node overlapping the report interval
-        # We look for probes within a generous window around the report period
-        window_start = report.start_interval - timedelta(minutes=5)
-        window_end = report.end_interval + timedelta(minutes=5)
+    # Chunk-wide probe range: lets the probe side prune partitions up front
+    probes_from = select(func.min(chunk.c.start_interval)).scalar_subquery() - PROBE_WINDOW
+    probes_to = select(func.max(chunk.c.end_interval)).scalar_subquery() + PROBE_WINDOW
 
-        probes = (
-            db.query(models.ProbeResult)
-            .filter(
+    outcome = (
+        select(
+            chunk.c.id,
+            chunk.c.report_timestamp,
+            # probe_timestamp (NOT NULL) rather than id keeps the probe side index-only
+            func.count(probes.c.probe_timestamp).label("probes"),
+            func.count(probes.c.probe_timestamp).filter(probes.c.success.is_(True)).label("passed"),
+        )
+        .select_from(
+            chunk.outerjoin(
+                probes,
                 and_(
-                    models.ProbeResult.node_id == report.reporting_node_id,
-                    models.ProbeResult.probe_type == "spot_check",
-                    models.ProbeResult.probe_timestamp >= window_start,
-                    models.ProbeResult.probe_timestamp <= window_end,
-                )
+                    probes.c.node_id == chunk.c.reporting_node_id,
+                    probes.c.probe_type == "spot_check",
+                    probes.c.probe_timestamp >= chunk.c.start_interval - PROBE_WINDOW,
+                    probes.c.probe_timestamp <= chunk.c.end_interval + PROBE_WINDOW,
+                    probes.c.probe_timestamp.between(probes_from, probes_to),
+                ),
             )
-            .all()
         )
+        .group_by(chunk.c.id, chunk.c.report_timestamp)
+        .cte("outcome")
+    )
 
-        if not probes:
-            # No probe data to compare — skip, leave unverified for now
-            skipped_count += 1
-            continue
+    # If any spot-check probe succeeded, the node was genuinely serving;
+    # if all failed it was claiming bandwidth but not serving.
+    passed_any = outcome.c.passed > 0
+    updated = (
+        update(ledger)
+        # Matching the whole (id, report_timestamp) key lets each row's
+        # lookup prune to its own partition
+        .where(
+            ledger.c.id == outcome.c.id,
+            ledger.c.report_timestamp == outcome.c.report_timestamp,
+            outcome.c.probes > 0,
+        )
+        .values(
+            is_verified=passed_any,
+            verification_notes=case(
+                (passed_any, func.concat(
+                    "Verified: ", outcome.c.passed, "/", outcome.c.probes, " spot checks passed",
+                )),
+                else_=func.concat(
+                    "Failed: 0/", outcome.c.probes, " spot checks passed during reporting window",
+                ),
+            ),
+        )
+        .returning(ledger.c.reporting_node_id, ledger.c.report_timestamp, ledger.c.is_verified)
+        .cte("updated")
+    )
 
-        # If any spot-check probe succeeded, the node was genuinely serving
-        successful_probes = [p for p in probes if p.success]
+    # Every returned row was unverified before this pass, so each verified
+    # one adds to its node/day trust counter
+    daily = models.NodeTrustDaily.__table__
+    day = cast(updated.c.report_timestamp, Date)
+    counted = pg_insert(daily).from_select(
+        ["node_id", "day", "total_reports", "verified_reports"],
+        select(updated.c.reporting_node_id, day, literal(0), func.count())
+        .where(updated.c.is_verified.is_(True))
+        .group_by(updated.c.reporting_node_id, day),
+    )
+    counted = counted.on_conflict_do_update(
+        constraint="uq_node_trust_daily_node_day",
+        set_={"verified_reports": daily.c.verified_reports + counted.excluded.verified_reports},
+    ).cte("counted")
 
-        if successful_probes:
-            # Node passed spot check during this window → mark verified
-            report.is_verified = True
-            report.verification_notes = (
-                f"Verified: {len(successful_probes)}/{len(probes)} spot checks passed"
-            )
-            verified_count += 1
-        else:
-            # All probes failed — node was claiming bandwidth but not serving
-            report.is_verified = False
-            report.verification_notes = (
-                f"Failed: 0/{len(probes)} spot checks passed during reporting window"
-            )
-            failed_count += 1
+    def _count(source, *where):
+        return select(func.count()).select_from(source).where(*where).scalar_subquery()
 
-        affected_nodes.add(report.reporting_node_id)
+    return select(
+        select(func.max(chunk.c.id)).scalar_subquery().label("last_id"),
+        _count(chunk).label("scanned"),
+        _count(outcome, outcome.c.probes == 0).label("skipped"),
+        _count(updated, updated.c.is_verified.is_(True)).label("verified"),
+        _count(updated, updated.c.is_verified.is_(False)).label("failed"),
+        select(func.array_agg(updated.c.reporting_node_id.distinct())).scalar_subquery().label("node_ids"),
+    ).add_cte(counted)
+
+
+def run_bandwidth_verification(
+    db: Session,
+    chunk_size: int = BANDWIDTH_VERIFICATION_CHUNK_SIZE,
+    lookback_hours: Optional[int] = BANDWIDTH_VERIFICATION_LOOKBACK_HOURS,
+) -> dict:
+    """
+    Verify unverified bandwidth reports by comparing against spot-check
+    probe results for the same node in an overlapping time window.
+
+    Reports without probe data are skipped and stay unverified; reports
+    whose probes all failed stay unverified with a failure note and are
+    re-checked on later runs until they fall out of the lookback window,
+    after which only the catch-up pass (*lookback_hours* None) sees them.
+    Each chunk is committed as it completes.
+
+    Returns a summary dict with counts.
+    """
+    verified_count = 0
+    failed_count = 0
+    skipped_count = 0
+    chunks = 0
+    affected_nodes: set[str] = set()
+
+    since = None
+    if lookback_hours is not None:
+        since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=lookback_hours)
+    after_id = 0
+    while True:
+        row = db.execute(_verify_chunk_stmt(after_id, chunk_size, since)).one()
+        if not row.scanned:
+            break
+        chunks += 1
+        verified_count += row.verified
+        failed_count += row.failed
+        skipped_count += row.skipped
+        affected_nodes.update(row.node_ids or ())
+        db.commit()
+        if row.scanned < chunk_size:
+            break
+        after_id = row.last_id
+
+    if not chunks:
+        logger.info("Bandwidth verification: no unverified reports")
+        return {"verified": 0, "failed": 0, "skipped": 0, "chunks": 0}
 
     # Recalculate trust scores for all affected nodes
-    for node_id in affected_nodes:
+    for node_id in sorted(affected_nodes):
         score = recalculate_and_store(node_id, db)
         apply_trust_consequences(node_id, score, db)
         logger.info(
@@ -104,11 +229,38 @@ def run_bandwidth_verification(db: Session) -> dict:
         "verified": verified_count,
         "failed": failed_count,
         "skipped": skipped_count,
+        "chunks": chunks,
     }
     logger.info(
-        "Bandwidth verification complete: %d verified, %d failed, %d skipped",
+        "Bandwidth verification complete: %d verified, %d failed, %d skipped (%d chunks)",
         verified_count,
         failed_count,
         skipped_count,
+        chunks,
+    )
+    return summary
+
+
+def run_bandwidth_verification_catchup(db: Session, chunk_size: int = BANDWIDTH_VERIFICATION_CHUNK_SIZE) -> dict:
+    """
+    Verification pass with no lookback bound, for reports the regular pass
+    no longer reaches.  Logs how many unverified reports were past the
+    window so a stranded backlog is visible.
+    """
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=BANDWIDTH_VERIFICATION_LOOKBACK_HOURS)
+    ledger = models.BandwidthLedger.__table__
+    stranded = db.scalar(
+        select(func.count()).select_from(ledger).where(
+            ledger.c.is_verified == False,  # noqa: E712
+            ledger.c.report_timestamp < cutoff,
+        )
     )
+    if stranded:
+        logger.warning(
+            "Bandwidth verification catch-up: %d unverified reports older than %dh",
+            stranded,
+            BANDWIDTH_VERIFICATION_LOOKBACK_HOURS,
+        )
+    summary = run_bandwidth_verification(db, chunk_size, lookback_hours=None)
+    summary["stranded"] = stranded
     return summary
@@ -0,0 +1,192 @@
+"""
+Per-node circuit breaker for proxy fetches, shared across coordinator
+replicas through Redis.
+
+After BREAKER_FAILURE_THRESHOLD consecutive failed fetches a node's breaker
+opens and the proxy stops sending viewers to it.  Once
+BREAKER_COOLDOWN_SECONDS have passed the breaker is half-open: a single
+replica wins the right to send one probe request.  A success closes the
+breaker, a failure re-opens it for another cooldown.
+
+Keys:
+  breaker:node:{node_id}        — hash: failures, state ("open" when tripped), opened_at (epoch)
+  breaker:node:{node_id}:probe  — half-open probe lock (SET NX, expires after one cooldown)
+
+Each replica caches breaker state for BREAKER_LOCAL_CACHE_SECONDS so the
+proxy hot path doesn't read Redis on every segment.  Redis errors fail open
+(the node is tried as before).
+
+Configurable via environment variables:
+  BREAKER_FAILURE_THRESHOLD     (default 3)
+  BREAKER_COOLDOWN_SECONDS      (default 15)
+  BREAKER_STATE_TTL_SECONDS     (default 300)
+  BREAKER_LOCAL_CACHE_SECONDS   (default 1.0)
+"""
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable
+
+from .redis_state import get_redis
+
+logger = logging.getLogger(__name__)
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "15"))
+BREAKER_STATE_TTL_SECONDS = int(os.getenv("BREAKER_STATE_TTL_SECONDS", "300"))
+BREAKER_LOCAL_CACHE_SECONDS = float(os.getenv("BREAKER_LOCAL_CACHE_SECONDS", "1.0"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Returns 1 when this failure trips the breaker, 0 otherwise.  A failure while
+# already open (a failed half-open probe) restarts the cooldown.
+_RECORD_FAILURE_LUA = """
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+if redis.call('HGET', KEYS[1], 'state') == 'open' then
+  redis.call('HSET', KEYS[1], 'opened_at', ARGV[2])
+  return 0
+end
+if failures >= tonumber(ARGV[1]) then
+  redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', ARGV[2])
+  return 1
+end
+return 0
+"""
+
+
+def _key(node_id: str) -> str:
+    return f"breaker:node:{node_id}"
+
+
+@dataclass
+class _Snapshot:
+    failures: int
+    is_open: bool
+    opened_at: float
+    fetched_at: float
+
+    def state(self, now: float) -> str:
+        if not self.is_open:
+            return CLOSED
+        if now - self.opened_at < BREAKER_COOLDOWN_SECONDS:
+            return OPEN
+        return HALF_OPEN
+
+
+_CLEAN = _Snapshot(failures=0, is_open=False, opened_at=0.0, fetched_at=0.0)
+
+
+class NodeCircuitBreaker:
+    def __init__(self):
+        self._local: Dict[str, _Snapshot] = {}
+        self._failure_script = None
+
+    @staticmethod
+    def _parse(raw: dict, fetched_at: float) -> _Snapshot:
+        return _Snapshot(
+            failures=int(raw.get("failures", 0)),
+            is_open=raw.get("state") == OPEN,
+            opened_at=float(raw.get("opened_at", 0)),
+            fetched_at=fetched_at,
+        )
+
+    async def _snapshots(self, node_ids: Iterable[str]) -> Dict[str, _Snapshot]:
+        """Breaker state for *node_ids*, reading Redis only for stale local entries."""
+        now = time.monotonic()
+        result: Dict[str, _Snapshot] = {}
+        missing = []
+        for node_id in node_ids:
+            snap = self._local.get(node_id)
+            if snap is not None and now - snap.fetched_at < BREAKER_LOCAL_CACHE_SECONDS:
+                result[node_id] = snap
+            else:
+                missing.append(node_id)
+        if not missing:
+            return result
+        try:
+            r = await get_redis()
+            pipe = r.pipeline(transaction=False)
+            for node_id in missing:
+                pipe.hgetall(_key(node_id))
+            rows = await pipe.execute()
+        except Exception:
+            logger.debug("Breaker state unavailable, treating nodes as closed", exc_info=True)
+            for node_id in missing:
+                result[node_id] = _CLEAN
+            return result
+        for node_id, raw in zip(missing, rows):
+            snap = self._parse(raw or {}, now)
+            self._local[node_id] = snap
+            result[node_id] = snap
+        return result
+
+    async def states(self, node_ids: Iterable[str]) -> Dict[str, str]:
+        """Map node_id → closed | open | half_open."""
+        now = time.time()
+        return {n: snap.state(now) for n, snap in (await self._snapshots(node_ids)).items()}
+
+    async def open_nodes(self, node_ids: Iterable[str]) -> set:
+        """Nodes whose breaker is open (half-open nodes are not excluded)."""
+        return {n for n, state in (await self.states(node_ids)).items() if state == OPEN}
+
+    async def allow(self, node_id: str) -> bool:
+        """Whether a request may be sent to *node_id* right now."""
+        snap = (await self._snapshots([node_id]))[node_id]
+        state = snap.state(time.time())
+        if state == CLOSED:
+            return True
+        if state == OPEN:
+            return False
+        # Half-open: only one probe per cooldown across all replicas
+        try:
+            r = await get_redis()
+            return bool(await r.set(
+                f"{_key(node_id)}:probe", "1", nx=True, ex=max(1, int(BREAKER_COOLDOWN_SECONDS)),
+            ))
+        except Exception:
+            return True
+
+    async def record_success(self, node_id: str) -> None:
+        """Close the breaker.  Free when the local view shows no failures."""
+        snap = self._local.get(node_id)
+        if snap is None or (snap.failures == 0 and not snap.is_open):
+            return
+        self._local[node_id] = _Snapshot(0, False, 0.0, time.monotonic())
+        try:
+            r = await get_redis()
+            await r.delete(_key(node_id), f"{_key(node_id)}:probe")
+        except Exception:
+            logger.debug("Failed to reset breaker for %s", node_id, exc_info=True)
+
+    async def record_failure(self, node_id: str) -> bool:
+        """Count a failed fetch.  Returns True if this call tripped the breaker."""
+        now = time.time()
+        try:
+            r = await get_redis()
+            if self._failure_script is None:
+                self._failure_script = r.register_script(_RECORD_FAILURE_LUA)
+            tripped = bool(await self._failure_script(
+                keys=[_key(node_id)],
+                args=[BREAKER_FAILURE_THRESHOLD, now, BREAKER_STATE_TTL_SECONDS],
+            ))
+        except Exception:
+            logger.debug("Failed to record breaker failure for %s", node_id, exc_info=True)
+            return False
+        # Force a re-read on next use so the new count / state is picked up
+        self._local.pop(node_id, None)
+        if tripped:
+            logger.warning("Circuit breaker opened for node %s", node_id)
+            self._local[node_id] = _Snapshot(BREAKER_FAILURE_THRESHOLD, True, now, time.monotonic())
+        return tripped
+
+    def clear_local(self) -> None:
+        self._local.clear()
+
+
+# Module-level singleton shared by the proxy, viewer routing and peers API
+node_breaker = NodeCircuitBreaker()
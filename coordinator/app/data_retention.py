@@ -1,25 +1,32 @@
 """
 Data Retention Background Task
 
-Aggregates old bandwidth_ledger records into monthly_summaries,
-then deletes stale bandwidth_ledger and probe_results entries.
+Moves old bandwidth_ledger records into monthly_summaries and deletes
+stale probe_results entries within a time budget: whole expired daily
+partitions are dropped (see partitions.py), anything left over is deleted
+in small batches.
 
 Configurable via environment variables:
-  DATA_RETENTION_BANDWIDTH_DAYS  (default 90)
-  DATA_RETENTION_PROBES_DAYS     (default 60)
+  DATA_RETENTION_BANDWIDTH_DAYS        (default 90)
+  DATA_RETENTION_PROBES_DAYS           (default 60)
+  DATA_RETENTION_BATCH_SIZE            (default 5000)
+  DATA_RETENTION_BATCH_PAUSE_SECONDS   (default 0.1)
+  DATA_RETENTION_TIME_BUDGET_SECONDS   (default 600)
 
 Scheduled daily at 03:00 UTC via APScheduler (see main.py).
 """
 
 import logging
 import os
-from datetime import datetime, timedelta, timezone
+import time
+from datetime import date, datetime, timedelta, timezone
 
-from sqlalchemy import case, func, literal, Date
+from sqlalchemy import case, delete, func, literal, select, Date
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
-from .models import BandwidthLedger, ProbeResult, MonthlySummary
+from . import partitions
+from .models import BandwidthLedger, ProbeResult, MonthlySummary, Node, NodeTrustDaily
 
 logger = logging.getLogger(__name__)
 
@@ -31,20 +38,47 @@ def _get_thresholds() -> tuple[int, int]:
     return bandwidth_days, probes_days
 
 
+def _get_batch_settings() -> tuple[int, float, float]:
+    """Read batch size, inter-batch pause and per-run time budget."""
+    batch_size = int(os.getenv("DATA_RETENTION_BATCH_SIZE", "5000"))
+    pause = float(os.getenv("DATA_RETENTION_BATCH_PAUSE_SECONDS", "0.1"))
+    budget = float(os.getenv("DATA_RETENTION_TIME_BUDGET_SECONDS", "600"))
+    return batch_size, pause, budget
+
+
+# Seconds between progress log lines while a purge is running
+PROGRESS_LOG_INTERVAL = 10.0
+
+
 def run_data_retention(db: Session) -> dict:
     """
     Execute the full data-retention cycle:
-      1. Aggregate old bandwidth_ledger rows into monthly_summaries (upsert).
-      2. Delete bandwidth_ledger rows older than threshold.
-      3. Delete probe_results rows older than threshold.
-      4. Log counts.
+      1. Drop partitions that are wholly past the threshold, summarising
+         bandwidth_ledger days into monthly_summaries first.
+      2. Move remaining bandwidth_ledger rows older than threshold into
+         monthly_summaries, one batch per transaction: each batch is
+         deleted and aggregated (upsert) by the same statement.
+      3. Delete remaining probe_results rows older than threshold, in batches.
+      4. Drop trust counters for purged days.
+      5. Log counts.
+
+    Thresholds are rounded down to UTC midnight so they line up with the
+    daily partitions; on partitioned tables step 1 does the work and the
+    batches only sweep the default partition.
+
+    Batches are keyset ranges of DATA_RETENTION_BATCH_SIZE primary keys,
+    committed individually with a short pause in between so locks are
+    held briefly.  A run stops once DATA_RETENTION_TIME_BUDGET_SECONDS is
+    spent; the remainder is picked up by the next run ("complete" is False).
 
     Returns a dict with counts for observability / testing.
     """
     bandwidth_days, probes_days = _get_thresholds()
-    now = datetime.now(timezone.utc)
-    bandwidth_cutoff = now - timedelta(days=bandwidth_days)
-    probes_cutoff = now - timedelta(days=probes_days)
+    batch_size, pause, budget = _get_batch_settings()
+    today = datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+    bandwidth_cutoff = today - timedelta(days=bandwidth_days)
+    probes_cutoff = today - timedelta(days=probes_days)
+    deadline = time.monotonic() + budget
 
     logger.info(
         "Data retention starting — bandwidth_cutoff=%s (%d days), probes_cutoff=%s (%d days)",
@@ -55,116 +89,220 @@ def run_data_retention(db: Session) -> dict:
     )
 
     # ------------------------------------------------------------------
-    # Step 1: Aggregate old bandwidth_ledger into monthly_summaries
+    # Step 1: Drop expired partitions
     # ------------------------------------------------------------------
-    aggregated_count = _aggregate_bandwidth(db, bandwidth_cutoff)
+    dropped = _drop_expired_partitions(
+        db,
+        {BandwidthLedger.__tablename__: bandwidth_cutoff, ProbeResult.__tablename__: probes_cutoff},
+        deadline,
+    )
 
     # ------------------------------------------------------------------
-    # Step 2: Delete old bandwidth_ledger entries
+    # Step 2: Aggregate + delete old bandwidth_ledger entries
     # ------------------------------------------------------------------
-    bandwidth_deleted = (
-        db.query(BandwidthLedger)
-        .filter(BandwidthLedger.report_timestamp < bandwidth_cutoff)
-        .delete(synchronize_session="fetch")
+    bandwidth = _purge_in_batches(
+        db, "bandwidth_ledger",
+        lambda after_id: _ledger_batch_stmt(bandwidth_cutoff, after_id, batch_size),
+        batch_size, pause, deadline,
     )
 
     # ------------------------------------------------------------------
     # Step 3: Delete old probe_results entries
     # ------------------------------------------------------------------
-    probes_deleted = (
-        db.query(ProbeResult)
-        .filter(ProbeResult.probe_timestamp < probes_cutoff)
-        .delete(synchronize_session="fetch")
+    probes = _purge_in_batches(
+        db, "probe_results",
+        lambda after_id: _probe_batch_stmt(probes_cutoff, after_id, batch_size),
+        batch_size, pause, deadline,
     )
 
+    # ------------------------------------------------------------------
+    # Step 4: Trust counters for purged days (long outside the trust window)
+    # ------------------------------------------------------------------
+    db.execute(delete(NodeTrustDaily).where(NodeTrustDaily.day < bandwidth_cutoff.date()))
     db.commit()
 
-    logger.info(
-        "Data retention complete — aggregated=%d, bandwidth_deleted=%d, probes_deleted=%d",
-        aggregated_count,
-        bandwidth_deleted,
-        probes_deleted,
+    result = {
+        "aggregated": dropped["aggregated"] + bandwidth["aggregated"],
+        "bandwidth_deleted": dropped["bandwidth_deleted"] + bandwidth["deleted"],
+        "probes_deleted": probes["deleted"],
+        "partitions_dropped": dropped["dropped"],
+        "complete": dropped["complete"] and bandwidth["complete"] and probes["complete"],
+    }
+    logger.log(
+        logging.INFO if result["complete"] else logging.WARNING,
+        "Data retention %s — aggregated=%d, bandwidth_deleted=%d, probes_deleted=%d, partitions_dropped=%d",
+        "complete" if result["complete"] else "stopped at time budget (%.0fs)" % budget,
+        result["aggregated"],
+        result["bandwidth_deleted"],
+        result["probes_deleted"],
+        result["partitions_dropped"],
     )
+    return result
 
-    return {
-        "aggregated": aggregated_count,
-        "bandwidth_deleted": bandwidth_deleted,
-        "probes_deleted": probes_deleted,
-    }
+
+def _purge_in_batches(db: Session, label: str, make_stmt, batch_size: int, pause: float, deadline: float) -> dict:
+    """
+    Run *make_stmt(after_id)* batches until one comes back short or the
+    deadline passes.  Each statement returns last_id, deleted, aggregated.
+    """
+    totals = {"deleted": 0, "aggregated": 0, "batches": 0, "complete": False}
+    after_id = 0
+    last_log = time.monotonic()
+    while time.monotonic() < deadline:
+        row = db.execute(make_stmt(after_id)).one()
+        db.commit()
+        totals["batches"] += 1
+        totals["deleted"] += row.deleted
+        totals["aggregated"] += row.aggregated
+        if row.deleted < batch_size:
+            totals["complete"] = True
+            break
+        after_id = row.last_id
+        if time.monotonic() - last_log >= PROGRESS_LOG_INTERVAL:
+            last_log = time.monotonic()
+            logger.info(
+                "Data retention: %s — %d rows deleted in %d batches so far",
+                label, totals["deleted"], totals["batches"],
+            )
+        time.sleep(pause)
+    return totals
+
+
+def _doomed(table, ts_column, cutoff: datetime, after_id: int, batch_size: int):
+    return (
+        select(table.c.id)
+        .where(ts_column < cutoff, table.c.id > after_id)
+        .order_by(table.c.id)
+        .limit(batch_size)
+        .cte("doomed")
+    )
 
 
-def _aggregate_bandwidth(db: Session, cutoff: datetime) -> int:
+def _probe_batch_stmt(cutoff: datetime, after_id: int, batch_size: int):
+    """Delete the next batch of probe_results older than *cutoff*."""
+    probes = ProbeResult.__table__
+    doomed = _doomed(probes, probes.c.probe_timestamp, cutoff, after_id, batch_size)
+    deleted = delete(probes).where(probes.c.id == doomed.c.id).returning(probes.c.id).cte("deleted")
+    return select(
+        func.max(deleted.c.id).label("last_id"),
+        func.count().label("deleted"),
+        literal(0).label("aggregated"),
+    ).select_from(deleted)
+
+
+def _rollup(source):
     """
-    Group bandwidth_ledger rows older than *cutoff* by
-    (reporting_node_id, month) and upsert into monthly_summaries.
+    INSERT ... SELECT ... ON CONFLICT folding ledger rows from *source* into
+    monthly_summaries, grouped by (reporting_node_id, month).
 
-    Returns the number of groups (rows upserted).
+    Returns (rolled, upserted) CTEs: the per-group rows and the upsert.
     """
-    # Build the aggregation query
-    month_expr = func.date_trunc("month", BandwidthLedger.report_timestamp).cast(Date)
-
-    agg_query = (
-        db.query(
-            BandwidthLedger.reporting_node_id.label("node_id"),
-            month_expr.label("month"),
-            func.sum(BandwidthLedger.bytes_transferred).label("total_bytes"),
+    nodes = Node.__table__
+    summaries = MonthlySummary.__table__
+
+    # monthly_summaries.user_id is required; it lives on the Node row
+    node_users = (
+        select(nodes.c.node_id, func.min(nodes.c.user_id).label("user_id"))
+        .where(nodes.c.node_id.in_(select(source.c.reporting_node_id)))
+        .group_by(nodes.c.node_id)
+        .cte("node_users")
+    )
+    month = func.date_trunc("month", source.c.report_timestamp).cast(Date)
+    user_id = func.coalesce(node_users.c.user_id, literal("unknown"))
+    rolled = (
+        select(
+            source.c.reporting_node_id.label("node_id"),
+            user_id.label("user_id"),
+            month.label("month"),
+            func.sum(source.c.bytes_transferred).label("total_bytes"),
             func.sum(
-                case(
-                    (BandwidthLedger.is_verified == True, BandwidthLedger.bytes_transferred),  # noqa: E712
-                    else_=literal(0),
-                )
+                case((source.c.is_verified == True, source.c.bytes_transferred), else_=literal(0))  # noqa: E712
             ).label("verified_bytes"),
-            func.coalesce(func.avg(BandwidthLedger.trust_score), 0).label("avg_trust_score"),
+            func.round(func.coalesce(func.avg(source.c.trust_score), 0), 2).label("avg_trust_score"),
             func.count().label("total_reports"),
         )
-        .filter(BandwidthLedger.report_timestamp < cutoff)
-        .group_by(BandwidthLedger.reporting_node_id, month_expr)
-        .all()
+        .select_from(source.outerjoin(node_users, node_users.c.node_id == source.c.reporting_node_id))
+        .group_by(source.c.reporting_node_id, user_id, month)
+        .cte("rolled")
     )
 
-    if not agg_query:
-        return 0
-
-    for row in agg_query:
-        # We need the user_id for the FK.  Look it up from the first
-        # matching ledger entry (all entries for a node share the same
-        # session which maps to a stream, but user_id lives on the node).
-        # For simplicity, use a sub-query on the ledger's session → stream → node → user.
-        # However, monthly_summaries.user_id is required.  The safest
-        # approach: grab user_id from the Node table for this node_id.
-        from .models import Node  # local import to avoid circular
-
-        node = (
-            db.query(Node.user_id)
-            .filter(Node.node_id == row.node_id)
-            .first()
-        )
-        user_id = node.user_id if node else "unknown"
-
-        stmt = pg_insert(MonthlySummary).values(
-            node_id=row.node_id,
-            user_id=user_id,
-            month=row.month,
-            total_bytes=int(row.total_bytes),
-            verified_bytes=int(row.verified_bytes),
-            avg_trust_score=round(float(row.avg_trust_score), 2),
-            total_reports=int(row.total_reports),
-        )
+    columns = ["node_id", "user_id", "month", "total_bytes", "verified_bytes", "avg_trust_score", "total_reports"]
+    stmt = pg_insert(summaries).from_select(columns, select(*(rolled.c[c] for c in columns)))
+    # ON CONFLICT (node_id, month) → accumulate
+    upserted = stmt.on_conflict_do_update(
+        constraint="uq_monthly_summary_node_month",
+        set_={
+            "total_bytes": summaries.c.total_bytes + stmt.excluded.total_bytes,
+            "verified_bytes": summaries.c.verified_bytes + stmt.excluded.verified_bytes,
+            "avg_trust_score": (
+                (summaries.c.avg_trust_score * summaries.c.total_reports
+                 + stmt.excluded.avg_trust_score * stmt.excluded.total_reports)
+                / (summaries.c.total_reports + stmt.excluded.total_reports)
+            ),
+            "total_reports": summaries.c.total_reports + stmt.excluded.total_reports,
+        },
+    ).returning(summaries.c.id).cte("upserted")
+    return rolled, upserted
+
 
-        # ON CONFLICT (node_id, month) → accumulate
-        stmt = stmt.on_conflict_do_update(
-            constraint="uq_monthly_summary_node_month",
-            set_={
-                "total_bytes": MonthlySummary.total_bytes + stmt.excluded.total_bytes,
-                "verified_bytes": MonthlySummary.verified_bytes + stmt.excluded.verified_bytes,
-                "avg_trust_score": (
-                    (MonthlySummary.avg_trust_score * MonthlySummary.total_reports
-                     + stmt.excluded.avg_trust_score * stmt.excluded.total_reports)
-                    / (MonthlySummary.total_reports + stmt.excluded.total_reports)
-                ),
-                "total_reports": MonthlySummary.total_reports + stmt.excluded.total_reports,
-            },
+def _ledger_batch_stmt(cutoff: datetime, after_id: int, batch_size: int):
+    """
+    Delete the next batch of bandwidth_ledger rows older than *cutoff* and
+    fold them into monthly_summaries in the same statement — a row is
+    summarised exactly once even if a run stops part-way.
+    """
+    ledger = BandwidthLedger.__table__
+    doomed = _doomed(ledger, ledger.c.report_timestamp, cutoff, after_id, batch_size)
+    deleted = (
+        delete(ledger)
+        .where(ledger.c.id == doomed.c.id)
+        .returning(
+            ledger.c.id, ledger.c.reporting_node_id, ledger.c.report_timestamp,
+            ledger.c.bytes_transferred, ledger.c.is_verified, ledger.c.trust_score,
         )
-        db.execute(stmt)
+        .cte("deleted")
+    )
+    _, upserted = _rollup(deleted)
+    return select(
+        select(func.max(deleted.c.id)).scalar_subquery().label("last_id"),
+        select(func.count()).select_from(deleted).scalar_subquery().label("deleted"),
+        select(func.count()).select_from(upserted).scalar_subquery().label("aggregated"),
+    )
+
 
-    return len(agg_query)
+def _ledger_day_rollup_stmt(day: date):
+    """Fold one day of bandwidth_ledger (about to be dropped) into monthly_summaries."""
+    ledger = BandwidthLedger.__table__
+    lo = datetime.combine(day, datetime.min.time())
+    source = (
+        select(ledger)
+        .where(ledger.c.report_timestamp >= lo, ledger.c.report_timestamp < lo + timedelta(days=1))
+        .cte("source")
+    )
+    rolled, upserted = _rollup(source)
+    return select(
+        select(func.coalesce(func.sum(rolled.c.total_reports), 0)).scalar_subquery().label("deleted"),
+        select(func.count()).select_from(upserted).scalar_subquery().label("aggregated"),
+    )
+
+
+def _drop_expired_partitions(db: Session, cutoffs: dict, deadline: float) -> dict:
+    """
+    Drop partitions that lie wholly before the retention cutoff, one
+    transaction each; ledger days are summarised first.
+    """
+    totals = {"bandwidth_deleted": 0, "aggregated": 0, "dropped": 0, "complete": True}
+    for table, cutoff in cutoffs.items():
+        for day in partitions.expired_partitions(db, table, cutoff):
+            if time.monotonic() >= deadline:
+                totals["complete"] = False
+                return totals
+            if table == BandwidthLedger.__tablename__:
+                row = db.execute(_ledger_day_rollup_stmt(day)).one()
+                totals["bandwidth_deleted"] += int(row.deleted)
+                totals["aggregated"] += row.aggregated
+            partitions.drop_partition(db, table, day)
+            db.commit()
+            totals["dropped"] += 1
+            logger.info("Data retention: dropped partition %s", partitions.partition_name(table, day))
+    return totals
@@ -0,0 +1,235 @@
+"""
+Background-refreshed snapshot of platform-wide economics metrics.
+
+The economics dashboard and the admin validation report used to run about
+ten aggregate queries over full tables on every page load.  They now read
+a single economics_snapshot row, recomputed every
+ECONOMICS_SNAPSHOT_INTERVAL_SECONDS by a scheduled job (see main.py) or on
+demand via POST /api/v1/admin/economics/refresh.  The manual refresh needs
+a streamer token, runs in the threadpool and is refused while the snapshot
+is younger than ECONOMICS_SNAPSHOT_MIN_REFRESH_SECONDS, so it can't be used
+to put the full-window aggregates back on the request path.
+
+The snapshot covers the last 24 hours (the dashboard's window and the
+validation report's default range); a validation report for any other
+range is still computed live.  Readers report the snapshot's age so
+consumers can tell how stale it is.
+
+Configurable via environment variables:
+  ECONOMICS_SNAPSHOT_INTERVAL_SECONDS     (default 60)
+  ECONOMICS_SNAPSHOT_MIN_REFRESH_SECONDS  (default 30)
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional, Tuple
+
+from sqlalchemy import Integer, cast, desc, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+ECONOMICS_SNAPSHOT_INTERVAL_SECONDS = int(os.getenv("ECONOMICS_SNAPSHOT_INTERVAL_SECONDS", "60"))
+ECONOMICS_SNAPSHOT_MIN_REFRESH_SECONDS = int(os.getenv("ECONOMICS_SNAPSHOT_MIN_REFRESH_SECONDS", "30"))
+
+SNAPSHOT_WINDOW = timedelta(hours=24)
+SNAPSHOT_ID = 1  # single-row table
+
+# Dashboard thresholds
+QUALIFIED_EARNINGS_MIN = Decimal("50.00")
+QUALIFIED_EARNINGS_MAX = Decimal("200.00")
+SUSPICIOUS_TRUST = Decimal("0.8")
+TOP_EARNERS = 5
+
+
+# ---------------------------------------------------------------------------
+# Compute
+# ---------------------------------------------------------------------------
+
+def _naive_utc(dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def compute_metrics(db: Session, start: datetime, end: datetime) -> dict:
+    """
+    Aggregate the metrics for [*start*, *end*] — one query per table, using
+    FILTER clauses instead of a query per metric.  Also used live by the
+    validation report for ranges other than the snapshot's.
+
+    Returns a JSON-serialisable dict.
+    """
+    # Naive UTC like the columns, so ledger partitions prune at plan time
+    start, end = _naive_utc(start), _naive_utc(end)
+
+    streams = models.Stream.__table__
+    stream_counts = db.execute(
+        select(
+            func.count(),
+            func.count().filter(streams.c.status == "LIVE"),
+            func.count().filter(streams.c.status.in_(["READY", "TESTING", "LIVE"])),
+        )
+    ).one()
+
+    nodes = models.Node.__table__
+    node_counts = db.execute(
+        select(
+            func.count(),
+            func.count().filter(nodes.c.status == "active"),
+            func.count().filter(nodes.c.status == "flagged"),
+        )
+    ).one()
+
+    ledger = models.BandwidthLedger.__table__
+    verified = ledger.c.is_verified == True  # noqa: E712
+    bandwidth = db.execute(
+        select(
+            func.coalesce(func.sum(ledger.c.bytes_transferred), 0),
+            func.coalesce(func.sum(ledger.c.bytes_transferred).filter(verified), 0),
+            func.count(),
+            func.count().filter(verified),
+            func.count().filter(ledger.c.trust_score < SUSPICIOUS_TRUST),
+        ).where(ledger.c.report_timestamp >= start, ledger.c.report_timestamp <= end)
+    ).one()
+
+    payout_log = models.PayoutLog.__table__
+    payouts = db.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(payout_log.c.total_amount_usd), 0),
+            cast(func.coalesce(func.sum(payout_log.c.penalties_applied), 0), Integer),
+        ).where(payout_log.c.cycle_timestamp >= start, payout_log.c.cycle_timestamp <= end)
+    ).one()
+
+    accounts = models.UserAccount.__table__
+    account_stats = db.execute(
+        select(
+            func.count().filter(
+                accounts.c.earnings_last_30d >= QUALIFIED_EARNINGS_MIN,
+                accounts.c.earnings_last_30d <= QUALIFIED_EARNINGS_MAX,
+            ),
+            func.coalesce(func.avg(accounts.c.trust_score), 0),
+        )
+    ).one()
+    top_earners = db.execute(
+        select(
+            accounts.c.user_id, accounts.c.earnings_last_30d,
+            accounts.c.total_gb_relayed, accounts.c.trust_score,
+        )
+        .where(accounts.c.earnings_last_30d > 0)
+        .order_by(desc(accounts.c.earnings_last_30d))
+        .limit(TOP_EARNERS)
+    ).all()
+
+    return {
+        "range": {"start": start.isoformat(), "end": end.isoformat()},
+        "streams": {
+            "total": stream_counts[0],
+            "live": stream_counts[1],
+            "active_sessions": stream_counts[2],
+        },
+        "nodes": {
+            "total": node_counts[0],
+            "active": node_counts[1],
+            "flagged": node_counts[2],
+        },
+        "bandwidth": {
+            "total_bytes": int(bandwidth[0]),
+            "verified_bytes": int(bandwidth[1]),
+            "total_reports": bandwidth[2],
+            "verified_reports": bandwidth[3],
+            "low_trust_reports": bandwidth[4],
+        },
+        "payouts": {
+            "cycles": payouts[0],
+            "total_paid_usd": str(payouts[1]),
+            "penalties_applied": payouts[2],
+        },
+        "accounts": {
+            "qualified_earners": account_stats[0],
+            "avg_trust_score": str(account_stats[1]),
+            "top_earners": [
+                {
+                    "node_id": row.user_id[:8] + "...",  # Truncate for privacy
+                    "earnings": float(row.earnings_last_30d),
+                    "gb_relayed": float(row.total_gb_relayed),
+                    "trust_score": float(row.trust_score),
+                }
+                for row in top_earners
+            ],
+        },
+    }
+
+
+def refresh_snapshot(db: Session) -> models.EconomicsSnapshot:
+    """Recompute the snapshot for the last SNAPSHOT_WINDOW and store it.  Commits."""
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    payload = compute_metrics(db, now - SNAPSHOT_WINDOW, now)
+    elapsed_ms = int((time.perf_counter() - started) * 1000)
+
+    table = models.EconomicsSnapshot.__table__
+    values = {
+        "id": SNAPSHOT_ID,
+        "refreshed_at": now.replace(tzinfo=None),
+        "refresh_ms": elapsed_ms,
+        "payload": payload,
+    }
+    stmt = pg_insert(table).values(values)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={k: stmt.excluded[k] for k in ("refreshed_at", "refresh_ms", "payload")},
+    ))
+    db.commit()
+    logger.info("Economics snapshot refreshed in %d ms", elapsed_ms)
+    return db.get(models.EconomicsSnapshot, SNAPSHOT_ID, populate_existing=True)
+
+
+def refresh_snapshot_if_older(
+    db: Session, min_age_seconds: Optional[float] = None
+) -> Tuple[models.EconomicsSnapshot, bool]:
+    """
+    Refresh the snapshot unless the stored one is younger than
+    *min_age_seconds* (default ECONOMICS_SNAPSHOT_MIN_REFRESH_SECONDS).
+    Returns (snapshot, refreshed).
+    """
+    if min_age_seconds is None:
+        min_age_seconds = ECONOMICS_SNAPSHOT_MIN_REFRESH_SECONDS
+    snapshot = db.get(models.EconomicsSnapshot, SNAPSHOT_ID)
+    if snapshot is not None and snapshot_age_seconds(snapshot) < min_age_seconds:
+        return snapshot, False
+    return refresh_snapshot(db), True
+
+
+# ---------------------------------------------------------------------------
+# Read
+# ---------------------------------------------------------------------------
+
+def snapshot_age_seconds(snapshot: models.EconomicsSnapshot, now: Optional[datetime] = None) -> float:
+    now = (now or datetime.now(timezone.utc)).replace(tzinfo=None)
+    return max(0.0, round((now - snapshot.refreshed_at).total_seconds(), 1))
+
+
+def staleness(snapshot: models.EconomicsSnapshot) -> dict:
+    """Freshness fields included in responses served from the snapshot."""
+    return {
+        "refreshed_at": snapshot.refreshed_at.replace(tzinfo=timezone.utc).isoformat(),
+        "age_seconds": snapshot_age_seconds(snapshot),
+        "refresh_interval_seconds": ECONOMICS_SNAPSHOT_INTERVAL_SECONDS,
+    }
+
+
+def get_snapshot(db: Session) -> Tuple[dict, dict]:
+    """
+    (payload, staleness) of the stored snapshot, refreshing it first if
+    none exists yet (fresh install, job not run).
+    """
+    snapshot = db.get(models.EconomicsSnapshot, SNAPSHOT_ID)
+    if snapshot is None:
+        snapshot = refresh_snapshot(db)
+    return snapshot.payload, staleness(snapshot)
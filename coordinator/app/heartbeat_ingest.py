@@ -0,0 +1,370 @@
+"""
+Batched heartbeat ingestion.
+
+``POST /nodes/heartbeat`` validates and enqueues; this module coalesces
+queued heartbeats per (node_id, stream_id) and flushes them on a fixed tick:
+a bulk ``INSERT ... ON CONFLICT`` into nodes, one trust-score lookup and a
+single Redis pipeline for the peer tables.  The upsert is split into as few
+statements as Postgres' 32767 bind-parameter limit allows, all in one
+transaction.
+
+A node's first heartbeat (one this process hasn't written within
+REJOIN_THRESHOLD_SECONDS) is written before it is acknowledged, so the node
+row exists by the time the node sends its first bandwidth report.  Only the
+steady-state heartbeats that follow are batched.
+
+Configurable via environment variables:
+  HEARTBEAT_FLUSH_INTERVAL_SECONDS  (default 1.0)
+  HEARTBEAT_MAX_BATCH               (default 5000)
+  HEARTBEAT_STREAM_CACHE_SECONDS    (default 60)
+
+Started and stopped from the FastAPI lifespan (see main.py).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import asyncpg
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .database import get_async_sessionmaker
+from .redis_state import get_redis, stage_node_state, stage_peer_invalidation
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_FLUSH_INTERVAL_SECONDS = float(os.getenv("HEARTBEAT_FLUSH_INTERVAL_SECONDS", "1.0"))
+HEARTBEAT_MAX_BATCH = int(os.getenv("HEARTBEAT_MAX_BATCH", "5000"))
+HEARTBEAT_STREAM_CACHE_SECONDS = float(os.getenv("HEARTBEAT_STREAM_CACHE_SECONDS", "60"))
+
+DEFAULT_TRUST_SCORE = 0.75
+# Below the 90s stale-node sweep age (see main._cleanup_stale_nodes_job)
+REJOIN_THRESHOLD_SECONDS = 60
+# Bind parameters per statement accepted by the Postgres wire protocol (asyncpg)
+POSTGRES_MAX_BIND_PARAMS = 32767
+
+
+@dataclass
+class PendingHeartbeat:
+    node_id: str
+    stream_id: str
+    user_id: str
+    stats_url: str
+    vpn_ip: Optional[str]
+    capacity_pct: Optional[int]
+    timestamp: datetime
+
+
+@dataclass
+class IngestMetrics:
+    received: int = 0
+    coalesced: int = 0
+    flushed: int = 0
+    immediate_writes: int = 0
+    dropped_unknown_stream: int = 0
+    flushes: int = 0
+    failed_flushes: int = 0
+    last_flush_ms: float = 0.0
+    max_flush_ms: float = 0.0
+    last_flush_at: Optional[str] = None
+    pruned: int = 0
+
+
+def _upsert_statement(rows: list[dict], with_capacity: bool = True):
+    """
+    Bulk upsert of node rows.  Rows whose heartbeat omitted capacity_pct go
+    through the *with_capacity=False* variant: inserted with the column
+    default 0, and an existing node keeps its last reported value.
+    """
+    stmt = pg_insert(models.Node).values(rows)
+    set_ = {
+        "stats_url": stmt.excluded.stats_url,
+        "last_heartbeat": stmt.excluded.last_heartbeat,
+        "status": "active",
+        "vpn_ip": func.coalesce(func.nullif(stmt.excluded.vpn_ip, ""), models.Node.vpn_ip),
+    }
+    if with_capacity:
+        set_["capacity_pct"] = stmt.excluded.capacity_pct
+    return stmt.on_conflict_do_update(constraint="uq_node_stream", set_=set_).returning(
+        models.Node.node_id,
+        models.Node.stream_id,
+        models.Node.user_id,
+        models.Node.vpn_ip,
+        models.Node.capacity_pct,
+    )
+
+
+@lru_cache(maxsize=1)
+def _upsert_chunk_rows() -> int:
+    """Rows per upsert statement that stay under the bind-parameter limit."""
+    sample = {
+        "node_id": "",
+        "stream_id": "",
+        "user_id": "",
+        "stats_url": "",
+        "last_heartbeat": None,
+        "status": "active",
+        "vpn_ip": "",
+        "capacity_pct": None,
+    }
+    # Compiled with the driver the coordinator runs on; a single row carries
+    # the per-row parameters (incl. column defaults) plus the ON CONFLICT ones
+    params = len(_upsert_statement([sample]).compile(dialect=asyncpg.dialect()).params)
+    return POSTGRES_MAX_BIND_PARAMS // params
+
+
+class HeartbeatIngestor:
+    """Coalescing heartbeat queue with periodic bulk flushes."""
+
+    def __init__(
+        self,
+        flush_interval: float = HEARTBEAT_FLUSH_INTERVAL_SECONDS,
+        max_batch: int = HEARTBEAT_MAX_BATCH,
+        stream_cache_seconds: float = HEARTBEAT_STREAM_CACHE_SECONDS,
+    ):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.stream_cache_seconds = stream_cache_seconds
+        self.metrics = IngestMetrics()
+        self._pending: Dict[Tuple[str, str], PendingHeartbeat] = {}
+        self._known_streams: Dict[str, float] = {}
+        # (vpn_ip, monotonic time) last written per (node_id, stream_id), to
+        # publish peer-cache invalidations only on membership / address changes
+        self._published: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        # monotonic time each (node_id, stream_id) row was last written
+        self._written: Dict[Tuple[str, str], float] = {}
+        self._last_prune = time.monotonic()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def submit(self, hb: PendingHeartbeat) -> None:
+        """Enqueue a heartbeat, merging it with any not-yet-flushed one for the same node/stream."""
+        self.metrics.received += 1
+        key = (hb.node_id, hb.stream_id)
+        previous = self._pending.get(key)
+        if previous is not None:
+            self.metrics.coalesced += 1
+            # Optional fields omitted by the newer heartbeat keep the older value
+            if not hb.vpn_ip:
+                hb.vpn_ip = previous.vpn_ip
+            if hb.capacity_pct is None:
+                hb.capacity_pct = previous.capacity_pct
+        self._pending[key] = hb
+
+    async def ingest(self, hb: PendingHeartbeat) -> None:
+        """
+        Accept a heartbeat: queue it if the node row was written recently,
+        otherwise write it now so the row exists once this returns.
+        """
+        if (hb.node_id, hb.stream_id) in self._written:
+            self.submit(hb)
+            return
+        self.metrics.received += 1
+        self.metrics.immediate_writes += 1
+        await self._write_batch([hb])
+
+    async def stream_exists(self, db: AsyncSession, stream_id: str) -> bool:
+        """Check a stream exists, caching positive answers so steady-state heartbeats skip the query."""
+        now = time.monotonic()
+        expires = self._known_streams.get(stream_id)
+        if expires is not None and expires > now:
+            return True
+        found = await db.scalar(
+            select(models.Stream.id).where(models.Stream.stream_id == stream_id)
+        )
+        if found is None:
+            return False
+        self._known_streams[stream_id] = now + self.stream_cache_seconds
+        return True
+
+    # ------------------------------------------------------------------
+    # Flush side
+    # ------------------------------------------------------------------
+
+    def _take_batch(self) -> list[PendingHeartbeat]:
+        if len(self._pending) <= self.max_batch:
+            batch = list(self._pending.values())
+            self._pending = {}
+            return batch
+        keys = list(self._pending)[: self.max_batch]
+        return [self._pending.pop(k) for k in keys]
+
+    async def flush(self) -> int:
+        """Write all queued heartbeats. Returns the number of node rows upserted."""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch = self._take_batch()
+            start = time.perf_counter()
+            try:
+                written = await self._write_batch(batch)
+            except Exception:
+                self.metrics.failed_flushes += 1
+                # Requeue unless a newer heartbeat for the same key arrived meanwhile
+                for hb in batch:
+                    self._pending.setdefault((hb.node_id, hb.stream_id), hb)
+                raise
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.metrics.flushes += 1
+            self.metrics.flushed += written
+            self.metrics.last_flush_ms = round(elapsed_ms, 2)
+            self.metrics.max_flush_ms = round(max(self.metrics.max_flush_ms, elapsed_ms), 2)
+            self.metrics.last_flush_at = datetime.now(timezone.utc).isoformat()
+            self._prune_published()
+            return written
+
+    def _prune_published(self) -> None:
+        """
+        Forget nodes not written for REJOIN_THRESHOLD_SECONDS.  Their next
+        heartbeat counts as a change (and is written immediately) either
+        way, so dropping them loses nothing; without this the maps grow
+        with every node ever seen.
+        """
+        now = time.monotonic()
+        if now - self._last_prune < REJOIN_THRESHOLD_SECONDS:
+            return
+        self._last_prune = now
+        stale = [k for k, (_, written) in self._published.items() if now - written > REJOIN_THRESHOLD_SECONDS]
+        for key in stale:
+            del self._published[key]
+        for key in [k for k, written in self._written.items() if now - written > REJOIN_THRESHOLD_SECONDS]:
+            del self._written[key]
+        self.metrics.pruned += len(stale)
+
+    async def _write_batch(self, batch: list[PendingHeartbeat]) -> int:
+        async with get_async_sessionmaker()() as db:
+            stream_ids = {hb.stream_id for hb in batch}
+            known = set(
+                (await db.scalars(
+                    select(models.Stream.stream_id).where(models.Stream.stream_id.in_(stream_ids))
+                )).all()
+            )
+            rows = [
+                {
+                    "node_id": hb.node_id,
+                    "stream_id": hb.stream_id,
+                    "user_id": hb.user_id,
+                    "stats_url": hb.stats_url,
+                    "last_heartbeat": hb.timestamp,
+                    "status": "active",
+                    "vpn_ip": hb.vpn_ip or "",
+                    "capacity_pct": hb.capacity_pct,
+                }
+                for hb in batch
+                if hb.stream_id in known
+            ]
+            self.metrics.dropped_unknown_stream += len(batch) - len(rows)
+            for stream_id in stream_ids - known:
+                self._known_streams.pop(stream_id, None)
+            if not rows:
+                return 0
+
+            upserted = []
+            chunk = _upsert_chunk_rows()
+            with_capacity = [row for row in rows if row["capacity_pct"] is not None]
+            without_capacity = [{**row, "capacity_pct": 0} for row in rows if row["capacity_pct"] is None]
+            for group, has_capacity in ((with_capacity, True), (without_capacity, False)):
+                for i in range(0, len(group), chunk):
+                    stmt = _upsert_statement(group[i:i + chunk], with_capacity=has_capacity)
+                    upserted += (await db.execute(stmt)).all()
+
+            user_ids = {row.user_id for row in upserted}
+            trust_by_user = {
+                user_id: float(score)
+                for user_id, score in (await db.execute(
+                    select(models.UserAccount.user_id, models.UserAccount.trust_score)
+                    .where(models.UserAccount.user_id.in_(user_ids))
+                )).all()
+            }
+            await db.commit()
+
+        # A node not written for longer than the stale sweep window may have
+        # been removed from Redis since, so its return counts as a change
+        now = time.monotonic()
+        for row in upserted:
+            self._written[(row.node_id, row.stream_id)] = now
+        changed_streams = set()
+        for row in upserted:
+            previous = self._published.get((row.node_id, row.stream_id))
+            if (
+                previous is None
+                or previous[0] != (row.vpn_ip or "")
+                or now - previous[1] > REJOIN_THRESHOLD_SECONDS
+            ):
+                changed_streams.add(row.stream_id)
+
+        try:
+            r = await get_redis()
+            pipe = r.pipeline(transaction=False)
+            for row in upserted:
+                stage_node_state(
+                    pipe,
+                    stream_id=row.stream_id,
+                    node_id=row.node_id,
+                    vpn_ip=row.vpn_ip or "",
+                    trust_score=trust_by_user.get(row.user_id, DEFAULT_TRUST_SCORE),
+                    capacity_pct=row.capacity_pct or 0,
+                    viewer_count=0,  # live counts are in stream:{id}:load (viewer_assignment)
+                )
+            stage_peer_invalidation(pipe, changed_streams)
+            await pipe.execute()
+            for row in upserted:
+                self._published[(row.node_id, row.stream_id)] = (row.vpn_ip or "", now)
+        except Exception:
+            logger.warning("Failed to update Redis node state for %d nodes", len(upserted), exc_info=True)
+
+        return len(upserted)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def run(self) -> None:
+        """Flush loop — runs until cancelled."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Heartbeat flush failed (%d queued)", self.queue_depth)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancel the flush loop and drain whatever is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Final heartbeat flush failed (%d dropped)", self.queue_depth)
+
+    def stats(self) -> dict:
+        return {"queue_depth": self.queue_depth, "tracked_nodes": len(self._published), **asdict(self.metrics)}
+
+
+# Module-level singleton used by the heartbeat route and lifespan
+heartbeat_ingestor = HeartbeatIngestor()
@@ -15,7 +15,8 @@ from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, text as sa_text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, desc, select, text as sa_text
 from typing import List, Optional
 import os
 from dotenv import load_dotenv
@@ -32,19 +33,33 @@ from slowapi.errors import RateLimitExceeded
 
 import secrets
 
-from . import models, schemas, database
-from .database import get_db, SessionLocal
-from .payout_service import PayoutService
+from . import models, schemas, database, response_cache
+from .database import get_db, get_async_db, SessionLocal, close_async_engine
+from .payout_service import PayoutService, hourly_earnings_stmt
 from .data_retention import run_data_retention
+from .partitions import ensure_partitions
 from .auth_routes import router as auth_router
 from .stream_routes import router as stream_router
 from .viewer_routes import router as viewer_router
-from .proxy import router as proxy_router
-from .auth import get_current_user, require_streamer, AuthenticatedUser
-from .redis_state import get_redis, close_redis, update_node_state, cleanup_stale_nodes
-from .bandwidth_verification import run_bandwidth_verification
+from .proxy import router as proxy_router, close_proxy_clients
+from .auth import get_current_user, require_streamer, AuthenticatedUser, claims_cache
+from .password_hashing import password_pool
+from .preauth_key_pool import PREAUTH_POOL_REFILL_INTERVAL_SECONDS, preauth_key_pool
+from .headscale_client import get_headscale_client
+from .redis_state import get_redis, close_redis, cleanup_stale_nodes
+from .heartbeat_ingest import heartbeat_ingestor, PendingHeartbeat
+from .peer_cache import peer_cache
+from .circuit_breaker import node_breaker
+from .viewer_assignment import assignment_stats, expire_idle_viewers, get_loads, rebalance_viewers
+from .segment_cache import segment_cache
+from .bandwidth_verification import (
+    BANDWIDTH_VERIFICATION_CATCHUP_INTERVAL_HOURS,
+    run_bandwidth_verification,
+    run_bandwidth_verification_catchup,
+)
 from .economic_config import economic_config
-from .trust_scoring import calculate_trust_score, apply_trust_consequences
+from .economics_snapshot import ECONOMICS_SNAPSHOT_INTERVAL_SECONDS, get_snapshot as get_economics_snapshot, refresh_snapshot
+from .trust_scoring import calculate_trust_score, rebuild_trust_counters
 from .feedback_routes import router as feedback_router
 from .admin_routes import router as admin_router
 
@@ -121,6 +136,44 @@ scheduler.add_job(
 )
 
 
+async def _expire_viewer_assignments_job():
+    """Drop viewer assignments without proxy activity for a TTL."""
+    try:
+        r = await get_redis()
+        expired = await expire_idle_viewers(r)
+        if expired:
+            logger.info("Viewer assignment expiry: removed %d idle viewers", expired)
+    except Exception:
+        logger.exception("Viewer assignment expiry failed")
+
+
+scheduler.add_job(
+    _expire_viewer_assignments_job,
+    trigger=IntervalTrigger(seconds=30),
+    id="viewer_assignment_expiry",
+    name="Expire idle viewer assignments (every 30s)",
+    replace_existing=True,
+)
+
+
+async def _rebalance_viewers_job():
+    """Move viewers off nodes above the capacity watermark."""
+    try:
+        r = await get_redis()
+        await rebalance_viewers(r)
+    except Exception:
+        logger.exception("Viewer rebalance failed")
+
+
+scheduler.add_job(
+    _rebalance_viewers_job,
+    trigger=IntervalTrigger(seconds=60),
+    id="viewer_rebalance",
+    name="Rebalance viewers off hot nodes (every 60s)",
+    replace_existing=True,
+)
+
+
 def _run_bandwidth_verification_job():
     """Wrapper executed by APScheduler — verifies bandwidth reports every 15 min."""
     db = SessionLocal()
@@ -142,6 +195,70 @@ scheduler.add_job(
 )
 
 
+def _run_bandwidth_verification_catchup_job():
+    """Wrapper executed by APScheduler — verifies reports older than the lookback window."""
+    db = SessionLocal()
+    try:
+        run_bandwidth_verification_catchup(db)
+    except Exception:
+        logger.exception("Bandwidth verification catch-up failed")
+        db.rollback()
+    finally:
+        db.close()
+
+
+scheduler.add_job(
+    _run_bandwidth_verification_catchup_job,
+    trigger=IntervalTrigger(hours=BANDWIDTH_VERIFICATION_CATCHUP_INTERVAL_HOURS),
+    next_run_time=datetime.now(timezone.utc),  # once at startup for any deploy-time backlog
+    id="bandwidth_verification_catchup",
+    name=f"Verify reports past the lookback window (every {BANDWIDTH_VERIFICATION_CATCHUP_INTERVAL_HOURS}h)",
+    replace_existing=True,
+)
+
+
+def _run_partition_maintenance_job():
+    """Wrapper executed by APScheduler — pre-create upcoming daily partitions."""
+    db = SessionLocal()
+    try:
+        ensure_partitions(db)
+    except Exception:
+        logger.exception("Partition maintenance job failed")
+        db.rollback()
+    finally:
+        db.close()
+
+
+scheduler.add_job(
+    _run_partition_maintenance_job,
+    trigger=CronTrigger(hour=2, minute=30),
+    id="partition_maintenance",
+    name="Pre-create daily table partitions",
+    replace_existing=True,
+)
+
+
+def _run_trust_counter_check_job():
+    """Wrapper executed by APScheduler — daily trust counter consistency check."""
+    db = SessionLocal()
+    try:
+        rebuild_trust_counters(db)
+    except Exception:
+        logger.exception("Trust counter check failed")
+        db.rollback()
+    finally:
+        db.close()
+
+
+scheduler.add_job(
+    _run_trust_counter_check_job,
+    trigger=CronTrigger(hour=3, minute=30),
+    id="trust_counter_check",
+    name="Daily trust counter consistency check",
+    replace_existing=True,
+)
+
+
 def _run_payout_cycle_job():
     """Wrapper executed by APScheduler — hourly payout cycle."""
     db = SessionLocal()
@@ -164,15 +281,60 @@ scheduler.add_job(
 )
 
 
+def _run_economics_snapshot_job():
+    """Wrapper executed by APScheduler — refresh the economics dashboard snapshot."""
+    db = SessionLocal()
+    try:
+        refresh_snapshot(db)
+    except Exception:
+        logger.exception("Economics snapshot refresh failed")
+        db.rollback()
+    finally:
+        db.close()
+
+
+scheduler.add_job(
+    _run_economics_snapshot_job,
+    trigger=IntervalTrigger(seconds=ECONOMICS_SNAPSHOT_INTERVAL_SECONDS),
+    id="economics_snapshot",
+    name=f"Refresh economics snapshot (every {ECONOMICS_SNAPSHOT_INTERVAL_SECONDS}s)",
+    replace_existing=True,
+)
+
+
+async def _refill_preauth_key_pool_job():
+    """Top up the pool of pre-minted Headscale pre-auth keys."""
+    try:
+        await preauth_key_pool.refill(await get_redis(), get_headscale_client())
+    except Exception:
+        logger.exception("Pre-auth key pool refill failed")
+
+
+scheduler.add_job(
+    _refill_preauth_key_pool_job,
+    trigger=IntervalTrigger(seconds=PREAUTH_POOL_REFILL_INTERVAL_SECONDS),
+    id="preauth_key_pool_refill",
+    name=f"Refill Headscale pre-auth key pool (every {PREAUTH_POOL_REFILL_INTERVAL_SECONDS}s)",
+    replace_existing=True,
+)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     scheduler.start()
+    heartbeat_ingestor.start()
+    peer_cache.start()
     logger.info("APScheduler started — data retention + stale node cleanup scheduled")
     yield
     # Shutdown
     scheduler.shutdown(wait=False)
+    await heartbeat_ingestor.stop()
+    await peer_cache.stop()
+    password_pool.shutdown()
+    await close_proxy_clients()
     await close_redis()
+    await close_async_engine()
     logger.info("APScheduler shut down")
 
 
@@ -371,71 +533,33 @@ async def delete_stream(
 async def node_heartbeat(
     heartbeat: schemas.NodeHeartbeat,
     user: AuthenticatedUser = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Receive heartbeat from node operators. JWT node_id must match payload."""
     # Verify JWT node_id matches heartbeat payload
     if user.node_id != heartbeat.node_id:
         raise HTTPException(status_code=403, detail="node_id mismatch with JWT")
 
-    # Check if stream exists
-    stream = db.query(models.Stream).filter(models.Stream.stream_id == heartbeat.stream_id).first()
-    if not stream:
+    # Existence check is cached in the ingestor; the row is written before
+    # returning for a node's first heartbeat, by the batched flush after
+    # that (see heartbeat_ingest.py)
+    if not await heartbeat_ingestor.stream_exists(db, heartbeat.stream_id):
         raise HTTPException(status_code=404, detail="Stream not found")
-    
-    # Update or create node record
-    node = db.query(models.Node).filter(
-        models.Node.node_id == heartbeat.node_id,
-        models.Node.stream_id == heartbeat.stream_id
-    ).first()
-    
-    if node:
-        node.stats_url = heartbeat.stats_url
-        node.last_heartbeat = heartbeat.timestamp
-        node.status = "active"
-        if heartbeat.vpn_ip:
-            node.vpn_ip = heartbeat.vpn_ip
-        if heartbeat.capacity_pct is not None:
-            node.capacity_pct = heartbeat.capacity_pct
-    else:
-        node = models.Node(
-            node_id=heartbeat.node_id,
-            stream_id=heartbeat.stream_id,
-            stats_url=heartbeat.stats_url,
-            last_heartbeat=heartbeat.timestamp,
-            status="active",
-            vpn_ip=heartbeat.vpn_ip or "",
-            capacity_pct=heartbeat.capacity_pct or 0,
-        )
-        db.add(node)
-    
-    db.commit()
 
-    # Update Redis state for fast peer lookups
-    try:
-        # Look up trust score from user account
-        account = db.query(models.UserAccount).filter(
-            models.UserAccount.user_id == user.user_id
-        ).first()
-        trust_score = float(account.trust_score) if account else 0.75
-
-        r = await get_redis()
-        await update_node_state(
-            r,
-            stream_id=heartbeat.stream_id,
-            node_id=heartbeat.node_id,
-            vpn_ip=node.vpn_ip or "",
-            trust_score=trust_score,
-            capacity_pct=node.capacity_pct or 0,
-            viewer_count=0,  # updated by viewer routing
-        )
-    except Exception:
-        logger.warning("Failed to update Redis node state for %s", heartbeat.node_id, exc_info=True)
+    await heartbeat_ingestor.ingest(PendingHeartbeat(
+        node_id=heartbeat.node_id,
+        stream_id=heartbeat.stream_id,
+        user_id=user.user_id,
+        stats_url=heartbeat.stats_url,
+        vpn_ip=heartbeat.vpn_ip,
+        capacity_pct=heartbeat.capacity_pct,
+        timestamp=heartbeat.timestamp,
+    ))
 
     return {"status": "success", "message": "Heartbeat received"}
 
 @app.get("/dashboard")
-async def dashboard(limit: int = 10, node_statuses: str = "active", db: Session = Depends(get_db)):
+async def dashboard(limit: int = 10, node_statuses: str = "active", db: AsyncSession = Depends(get_async_db)):
     """
     Dashboard showing streams and nodes with flexible filtering
     
@@ -467,19 +591,23 @@ async def dashboard(limit: int = 10, node_statuses: str = "active", db: Session
     # PERFORMANCE FIX: Use only 2 database queries instead of N+1
     
     # Query 1: Get streams
-    streams = db.query(models.Stream).filter(
-        models.Stream.status.in_(operational_statuses)
-    ).limit(limit).all()
-    
+    streams = (await db.scalars(
+        select(models.Stream).where(
+            models.Stream.status.in_(operational_statuses)
+        ).limit(limit)
+    )).all()
+
     if not streams:
         return {"streams": []}
-    
+
     # Query 2: Get all relevant nodes in a single query
     stream_ids = [s.stream_id for s in streams]
-    all_nodes = db.query(models.Node).filter(
-        models.Node.stream_id.in_(stream_ids),
-        models.Node.status.in_(node_status_list)
-    ).all()
+    all_nodes = (await db.scalars(
+        select(models.Node).where(
+            models.Node.stream_id.in_(stream_ids),
+            models.Node.status.in_(node_status_list)
+        )
+    )).all()
     
     # Map nodes to their stream_id for efficient lookup
     nodes_by_stream_id = {}
@@ -595,23 +723,27 @@ async def report_bandwidth(
     session_id: str,
     report: schemas.BandwidthReport,
     user: AuthenticatedUser = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Accept bandwidth usage reports from node clients.
     Performs basic validation and queues for verification.
     """
     # Verify session exists
-    stream = db.query(models.Stream).filter(models.Stream.stream_id == session_id).first()
-    if not stream:
+    stream_pk = await db.scalar(
+        select(models.Stream.id).where(models.Stream.stream_id == session_id)
+    )
+    if stream_pk is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    
+
     # Verify reporting node exists and is associated with this stream
-    node = db.query(models.Node).filter(
-        models.Node.node_id == user.node_id,
-        models.Node.stream_id == session_id
-    ).first()
-    if not node:
+    node_pk = await db.scalar(
+        select(models.Node.id).where(
+            models.Node.node_id == user.node_id,
+            models.Node.stream_id == session_id
+        )
+    )
+    if node_pk is None:
         raise HTTPException(status_code=403, detail="Node not authorized for this session")
     
     # Basic validation
@@ -635,168 +767,134 @@ async def report_bandwidth(
     )
     
     db.add(bandwidth_entry)
-    db.commit()
-    db.refresh(bandwidth_entry)
+    await db.commit()
+    await db.refresh(bandwidth_entry)
     
     # TODO: Trigger async verification task
     
     return bandwidth_entry
 
 @app.get("/api/v1/economics/dashboard", response_model=schemas.EconomicsDashboard)
-async def get_economics_dashboard(db: Session = Depends(get_db)):
+async def get_economics_dashboard(db: AsyncSession = Depends(get_async_db)):
     """
     Return summary data for the economic validation dashboard.
+
+    Served from the background-refreshed economics snapshot (see
+    economics_snapshot.py); ``snapshot`` reports when it was computed.
     """
-    # Get current timestamp for 24h calculations
-    twenty_four_hours_ago = datetime.now(timezone.utc) - timedelta(hours=24)
-    thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
-    
-    # Basic metrics
-    active_sessions = db.query(models.Stream).filter(
-        models.Stream.status.in_(["READY", "TESTING", "LIVE"])
-    ).count()
-    
-    total_nodes = db.query(models.Node).filter(
-        models.Node.status == "active"
-    ).count()
-    
-    # Total GB delivered in last 24h
-    gb_24h_result = db.query(func.sum(models.BandwidthLedger.bytes_transferred)).filter(
-        models.BandwidthLedger.report_timestamp >= twenty_four_hours_ago,
-        models.BandwidthLedger.is_verified == True
-    ).scalar()
-    total_gb_delivered_24h = Decimal(str((gb_24h_result or 0) / (1024**3)))  # Convert bytes to GB
-    
+    payload, staleness = await db.run_sync(get_economics_snapshot)
+
+    total_gb_delivered_24h = Decimal(str(payload["bandwidth"]["verified_bytes"] / (1024**3)))  # Convert bytes to GB
+
     # Platform economics (placeholder calculations)
     platform_margin_percent = Decimal("7.5")  # Example: 7.5% margin
     avg_creator_revenue_share = Decimal("87.5")  # Example: 87.5% to creators
-    
-    # Qualified earners (nodes earning $50-200/month)
-    qualified_earners = db.query(models.UserAccount).filter(
-        models.UserAccount.earnings_last_30d >= Decimal("50.00"),
-        models.UserAccount.earnings_last_30d <= Decimal("200.00")
-    ).count()
-    
-    # Top earners
-    top_earners_query = db.query(models.UserAccount).filter(
-        models.UserAccount.earnings_last_30d > 0
-    ).order_by(desc(models.UserAccount.earnings_last_30d)).limit(5).all()
-    
-    top_earners = []
-    for account in top_earners_query:
-        top_earners.append({
-            "node_id": account.user_id[:8] + "...",  # Truncate for privacy
-            "earnings": float(account.earnings_last_30d),
-            "gb_relayed": float(account.total_gb_relayed),
-            "trust_score": float(account.trust_score)
-        })
-    
-    # Suspicious activity (low trust scores)
-    suspicious_reports = db.query(models.BandwidthLedger).filter(
-        models.BandwidthLedger.trust_score < Decimal("0.8"),
-        models.BandwidthLedger.report_timestamp >= twenty_four_hours_ago
-    ).count()
-    
+
     suspicious_activity = [
         {
             "type": "low_trust_reports",
-            "count": suspicious_reports,
+            "count": payload["bandwidth"]["low_trust_reports"],
             "description": "Bandwidth reports with trust score < 0.8"
         }
     ]
-    
+
     return schemas.EconomicsDashboard(
-        active_sessions=active_sessions,
-        total_nodes=total_nodes,
+        active_sessions=payload["streams"]["active_sessions"],
+        total_nodes=payload["nodes"]["active"],
         total_gb_delivered_24h=total_gb_delivered_24h,
         platform_margin_percent=platform_margin_percent,
         avg_creator_revenue_share=avg_creator_revenue_share,
-        qualified_earners_count=qualified_earners,
-        top_earners=top_earners,
-        suspicious_activity=suspicious_activity
+        qualified_earners_count=payload["accounts"]["qualified_earners"],
+        top_earners=payload["accounts"]["top_earners"],
+        suspicious_activity=suspicious_activity,
+        snapshot=staleness,
     )
 
-async def get_node_economics(node_id: str, db: Session = Depends(get_db)):
+@app.get("/api/v1/economics/node/{node_id}", response_model=schemas.NodeEconomics)
+async def get_node_economics(node_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     Detailed economic data for a specific node.
     Includes live trust score calculation.
+
+    Responses are cached in Redis for NODE_ECONOMICS_CACHE_TTL_SECONDS
+    (see response_cache.py); hourly earnings come from the
+    node_hourly_earnings rollup written by the payout cycle.
     """
+    cached = await response_cache.get_cached("node_economics", node_id)
+    if cached is not None:
+        return cached
+
     # Resolve node_id → user_id via the Node table
-    node = db.query(models.Node).filter(models.Node.node_id == node_id).first()
-    user_id = node.user_id if node else node_id
-
-    # Get or create user account
-    user_account = db.query(models.UserAccount).filter(
-        models.UserAccount.user_id == user_id
-    ).first()
-
-    if not user_account:
-        # Create default account if doesn't exist
-        user_account = models.UserAccount(
-            user_id=user_id,
-            balance_usd=Decimal("0.00"),
-            total_gb_relayed=Decimal("0.00"),
-            earnings_last_30d=Decimal("0.00"),
-            trust_score=Decimal("0.75"),
-            flags=[],
-            last_updated_at=datetime.now(timezone.utc)
-        )
-        db.add(user_account)
-        db.commit()
-        db.refresh(user_account)
-
-    # Recalculate trust score from bandwidth ledger data
-    live_trust = calculate_trust_score(node_id, db)
-    if user_account.trust_score != live_trust:
-        user_account.trust_score = live_trust
-        user_account.last_updated_at = datetime.now(timezone.utc)
-        apply_trust_consequences(node_id, live_trust, db)
-        db.commit()
-
-    # Calculate hourly earnings for last 24 hours from payout_log_entries
-    hourly_earnings = []
-    for i in range(24):
-        hour_start = datetime.now(timezone.utc) - timedelta(hours=i+1)
-        hour_end = datetime.now(timezone.utc) - timedelta(hours=i)
-
-        hour_entry = db.query(
-            func.sum(models.PayoutLogEntry.earnings_usd).label("earnings"),
-            func.sum(models.PayoutLogEntry.bytes_relayed).label("bytes"),
-        ).filter(
-            models.PayoutLogEntry.node_id == node_id,
-            models.PayoutLogEntry.timestamp >= hour_start,
-            models.PayoutLogEntry.timestamp < hour_end,
-        ).first()
+    node_user_id = await db.scalar(
+        select(models.Node.user_id).where(models.Node.node_id == node_id).limit(1)
+    )
+    user_id = node_user_id or node_id
+
+    # Read-only: this endpoint is public (node dashboard), so it neither
+    # creates accounts nor applies trust consequences — the verification job
+    # stores trust scores and their consequences (bandwidth_verification.py)
+    user_account = await db.scalar(
+        select(models.UserAccount).where(models.UserAccount.user_id == user_id)
+    )
 
+    # Live trust score from bandwidth ledger data (sync helper run against
+    # the async session's underlying Session)
+    live_trust = await db.run_sync(lambda s: calculate_trust_score(node_id, s))
+
+    # Hourly earnings for the last 24 hours (current hour first), one range
+    # query over the rollup; hours without a payout are zero
+    current_hour = datetime.now(timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    hours = [current_hour - timedelta(hours=i) for i in range(24)]
+    rollup = {
+        row.hour: row
+        for row in (await db.execute(hourly_earnings_stmt(node_id, hours[-1]))).all()
+    }
+    hourly_earnings = []
+    for hour_start in hours:
+        row = rollup.get(hour_start)
         hourly_earnings.append({
             "hour": hour_start.strftime("%H:00"),
-            "earnings_usd": float(hour_entry.earnings or 0),
-            "gb_relayed": float((hour_entry.bytes or 0) / (1024**3)),
+            "earnings_usd": float(row.earnings_usd) if row else 0.0,
+            "gb_relayed": float(row.bytes_relayed / (1024**3)) if row else 0.0,
         })
 
-    return schemas.NodeEconomics(
+    zero = Decimal("0.00")
+    response = schemas.NodeEconomics(
         node_id=node_id,
-        balance_usd=user_account.balance_usd,
-        earnings_last_30d=user_account.earnings_last_30d,
-        gb_relayed=user_account.total_gb_relayed,
-        trust_score=user_account.trust_score,
+        balance_usd=user_account.balance_usd if user_account else zero,
+        earnings_last_30d=user_account.earnings_last_30d if user_account else zero,
+        gb_relayed=user_account.total_gb_relayed if user_account else zero,
+        trust_score=live_trust,
         hourly_earnings=hourly_earnings
     )
+    await response_cache.set_cached(
+        "node_economics", node_id, response.model_dump(mode="json"),
+        response_cache.NODE_ECONOMICS_CACHE_TTL_SECONDS,
+    )
+    return response
 
 @app.get("/api/v1/streams/{stream_id}/peers")
 async def get_stream_peers(stream_id: str):
     """
     Return active nodes for a stream, ordered by trust_score DESC,
     filtered to capacity_pct < 90.  Data sourced from Redis for speed.
+    viewer_count is the node's live assigned-viewer counter.  Each entry
+    reports the proxy circuit breaker state for the node
+    (closed | open | half_open).
     """
     try:
         r = await get_redis()
-        from .redis_state import get_stream_nodes
-        nodes = await get_stream_nodes(r, stream_id)
+        nodes = await peer_cache.get_nodes(r, stream_id)
     except Exception:
         logger.warning("Redis unavailable for peer list, returning empty", exc_info=True)
         return []
 
+    breaker_states = await node_breaker.states(n["node_id"] for n in nodes)
+    try:
+        loads = await get_loads(r, stream_id)
+    except Exception:
+        loads = {}
+
     # Filter out saturated nodes and sort by trust_score descending
     active = [
         {
@@ -804,7 +902,8 @@ async def get_stream_peers(stream_id: str):
             "vpn_ip": n.get("vpn_ip", ""),
             "trust_score": n.get("trust_score", 0),
             "capacity_pct": n.get("capacity_pct", 0),
-            "viewer_count": n.get("viewer_count", 0),
+            "viewer_count": loads.get(n["node_id"], n.get("viewer_count", 0)),
+            "breaker_state": breaker_states.get(n["node_id"], "closed"),
         }
         for n in nodes
         if n.get("capacity_pct", 0) < 90
@@ -813,6 +912,19 @@ async def get_stream_peers(stream_id: str):
     return active
 
 
+@app.get("/api/v1/streams/{stream_id}/assignments")
+async def get_stream_assignments(stream_id: str):
+    """Assigned viewer count per node for a stream (live counters)."""
+    try:
+        r = await get_redis()
+        loads = await get_loads(r, stream_id)
+    except Exception:
+        logger.warning("Redis unavailable for assignment counts", exc_info=True)
+        raise HTTPException(status_code=503, detail="Assignment state unavailable")
+    nodes = {node_id: count for node_id, count in loads.items() if count > 0}
+    return {"stream_id": stream_id, "total_viewers": sum(nodes.values()), "nodes": nodes}
+
+
 @app.get("/api/v1/economics/node/{node_id}/earnings", response_model=schemas.EarningsResponse)
 async def get_node_earnings_history(
     node_id: str,
@@ -858,7 +970,7 @@ async def get_economics_config():
 
 
 @app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     """
     Enhanced health check — verifies database, Redis, and background workers.
     Returns healthy | degraded | unhealthy with per-check details.
@@ -868,7 +980,7 @@ async def health_check(db: Session = Depends(get_db)):
 
     # Database check
     try:
-        db.execute(sa_text("SELECT 1"))
+        await db.execute(sa_text("SELECT 1"))
         checks["database"] = {"status": "ok"}
     except Exception as e:
         checks["database"] = {"status": "error", "detail": str(e)}
@@ -893,6 +1005,27 @@ async def health_check(db: Session = Depends(get_db)):
         if overall == "healthy":
             overall = "degraded"
 
+    # Heartbeat ingestion queue
+    checks["heartbeat_ingest"] = {"status": "ok", **heartbeat_ingestor.stats()}
+
+    # In-process peer list cache
+    checks["peer_cache"] = {"status": "ok", **peer_cache.stats()}
+
+    # HLS proxy segment cache
+    checks["segment_cache"] = {"status": "ok", **segment_cache.stats()}
+
+    # Viewer assignment expiry / rebalancing
+    checks["viewer_assignment"] = {"status": "ok", **assignment_stats()}
+
+    # Verified JWT claims cache
+    checks["jwt_claims_cache"] = {"status": "ok", **claims_cache.stats()}
+
+    # bcrypt thread pool (login / streamer registration)
+    checks["password_hashing"] = {"status": "ok", **password_pool.stats()}
+
+    # Pre-minted Headscale pre-auth keys for node registration
+    checks["preauth_key_pool"] = {"status": "ok", **preauth_key_pool.stats()}
+
     status_code = 200 if overall != "unhealthy" else 503
     from starlette.responses import JSONResponse
     return JSONResponse(
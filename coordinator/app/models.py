@@ -1,8 +1,9 @@
 from uuid import uuid4
 
-from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Text, ForeignKey, BigInteger, Numeric, ARRAY, UniqueConstraint
+from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Text, ForeignKey, BigInteger, Numeric, ARRAY, JSON, UniqueConstraint, DDL, event
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, relationship
 from datetime import datetime, timezone
 
 Base = declarative_base()
@@ -102,15 +103,22 @@ class Node(Base):
 
 class ProbeResult(Base):
     __tablename__ = "probe_results"
+    # Daily range partitions on probe_timestamp (migration 009, see partitions.py)
+    __table_args__ = {"postgresql_partition_by": "RANGE (probe_timestamp)"}
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     stream_id = Column(String, ForeignKey("streams.stream_id"), nullable=False)
-    node_id = Column(String, nullable=False, index=True)  # logical ref to nodes.node_id (not FK — node_id no longer unique)
+    node_id = Column(String, nullable=False)  # logical ref to nodes.node_id (not FK — node_id no longer unique)
     probe_type = Column(String, nullable=False)  # stats_poll, spot_check
     success = Column(Boolean, nullable=False)
-    response_data = Column(Text)  # JSON response from stats endpoint
+    response_data = Column(Text)  # raw stats.json — failed polls and a sample only (stats_collector.py)
     error_message = Column(Text)
-    probe_timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # Extracted from stats.json by stats_collector.summarize_stats (NULL for non-stats probes)
+    stream_present = Column(Boolean)
+    connection_count = Column(Integer)
+    connection_state = Column(String(32))
+    bitrate_kbps = Column(Integer)
+    probe_timestamp = Column(DateTime, primary_key=True, default=lambda: datetime.now(timezone.utc))
     
     # Relationships
     stream = relationship("Stream", back_populates="probe_results")
@@ -122,16 +130,19 @@ class ProbeResult(Base):
 
 class BandwidthLedger(Base):
     __tablename__ = "bandwidth_ledger"
+    # Daily range partitions on report_timestamp (migration 009, see partitions.py)
+    __table_args__ = {"postgresql_partition_by": "RANGE (report_timestamp)"}
     
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigInteger, primary_key=True, autoincrement=True, index=True)
     session_id = Column(String(255), ForeignKey("streams.stream_id"), nullable=False)
     reporting_node_id = Column(String(255), nullable=False)  # logical ref to nodes.node_id (not FK — node_id no longer unique)
     bytes_transferred = Column(BigInteger, nullable=False)
-    report_timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    report_timestamp = Column(DateTime, primary_key=True, default=lambda: datetime.now(timezone.utc))
     start_interval = Column(DateTime, nullable=False)
     end_interval = Column(DateTime, nullable=False)
     source_bitrate_kbps = Column(Integer)
-    is_verified = Column(Boolean, default=False, nullable=False)
+    # active_history: node_trust_daily counters need the old value on change
+    is_verified = column_property(Column(Boolean, default=False, nullable=False), active_history=True)
     trust_score = Column(Numeric(3, 2))  # 0.00-1.00
     verification_notes = Column(Text)
     
@@ -141,6 +152,42 @@ class BandwidthLedger(Base):
                                   foreign_keys="[BandwidthLedger.reporting_node_id]",
                                   primaryjoin="BandwidthLedger.reporting_node_id == Node.node_id")
 
+# Partitioned tables get a catch-all default partition; dated partitions are
+# created by the partition manager.  Partitioning is Postgres-only; elsewhere
+# (SQLite in tests/test_stream_routes.py) these are plain tables, and as SQLite
+# can't autoincrement part of a composite primary key, the id column drops its
+# autoincrement flag for the duration of a non-Postgres CREATE TABLE.
+def _suspend_composite_autoincrement(table, connection, **kw):
+    if connection.dialect.name != "postgresql":
+        table.c.id.autoincrement = "auto"
+
+
+def _restore_composite_autoincrement(table, connection, **kw):
+    table.c.id.autoincrement = True
+
+
+for _table in (ProbeResult.__table__, BandwidthLedger.__table__):
+    event.listen(_table, "before_create", _suspend_composite_autoincrement)
+    event.listen(_table, "after_create", _restore_composite_autoincrement)
+    event.listen(
+        _table,
+        "after_create",
+        DDL("CREATE TABLE %(fullname)s_default PARTITION OF %(fullname)s DEFAULT").execute_if(dialect="postgresql"),
+    )
+
+class NodeTrustDaily(Base):
+    """Per-node, per-UTC-day report counters backing trust scores (see trust_scoring.py)."""
+    __tablename__ = "node_trust_daily"
+    __table_args__ = (
+        UniqueConstraint("node_id", "day", name="uq_node_trust_daily_node_day"),
+    )
+
+    id = Column(BigInteger, primary_key=True, index=True)
+    node_id = Column(String(255), nullable=False)
+    day = Column(Date, nullable=False)
+    total_reports = Column(Integer, default=0, nullable=False)
+    verified_reports = Column(Integer, default=0, nullable=False)
+
 class UserAccount(Base):
     __tablename__ = "user_accounts"
     
@@ -207,6 +254,30 @@ class PayoutLogEntry(Base):
     user_identity = relationship("UserIdentity", backref="payout_entries")
 
 
+class NodeHourlyEarnings(Base):
+    """Per-node earnings per UTC hour, maintained by the payout cycle (see payout_service.py)."""
+    __tablename__ = "node_hourly_earnings"
+    __table_args__ = (
+        UniqueConstraint("node_id", "hour", name="uq_node_hourly_earnings_node_hour"),
+    )
+
+    id = Column(BigInteger, primary_key=True, index=True)
+    node_id = Column(String, nullable=False)
+    hour = Column(DateTime, nullable=False)  # naive UTC, truncated to the hour
+    earnings_usd = Column(Numeric(12, 4), default=0, nullable=False)
+    bytes_relayed = Column(BigInteger, default=0, nullable=False)
+
+
+class EconomicsSnapshot(Base):
+    """Latest platform-wide economics metrics, refreshed in the background (see economics_snapshot.py)."""
+    __tablename__ = "economics_snapshot"
+
+    id = Column(Integer, primary_key=True)  # single row
+    refreshed_at = Column(DateTime, nullable=False)  # naive UTC
+    refresh_ms = Column(Integer, nullable=False)
+    payload = Column(JSON().with_variant(JSONB, "postgresql"), nullable=False)
+
+
 class MonthlySummary(Base):
     __tablename__ = "monthly_summaries"
     __table_args__ = (
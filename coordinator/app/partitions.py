@@ -0,0 +1,155 @@
+"""
+Partition manager for the time-series tables.
+
+bandwidth_ledger (by report_timestamp) and probe_results (by
+probe_timestamp) are range-partitioned into one partition per UTC day,
+named ``<table>_pYYYYMMDD``, plus a ``<table>_default`` partition that
+catches anything outside the pre-created range (migration 009).
+
+  - ensure_partitions() pre-creates partitions for the coming days
+    (scheduled daily, see main.py).  Rows that already landed in the
+    default partition for a new day are moved into it.
+  - expired_partitions() / drop_partition() let data_retention.py drop
+    whole days instead of DELETEing rows.
+
+Every function is a no-op on a table that is not partitioned.
+
+Configurable via environment variables:
+  PARTITION_PRECREATE_DAYS  (default 7)
+"""
+
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PRECREATE_DAYS = int(os.getenv("PARTITION_PRECREATE_DAYS", "7"))
+
+# table → partition key column
+PARTITIONED_TABLES = {
+    "bandwidth_ledger": "report_timestamp",
+    "probe_results": "probe_timestamp",
+}
+
+_PARTITION_RE = re.compile(r"(.+)_p(\d{8})")
+
+
+def partition_name(table: str, day: date) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def is_partitioned(db: Session, table: str) -> bool:
+    return bool(db.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t))"),
+        {"t": table},
+    ).scalar())
+
+
+def list_partitions(db: Session, table: str) -> List[date]:
+    """Days that have their own partition, oldest first."""
+    names = db.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:t)"
+        ),
+        {"t": table},
+    ).scalars()
+    days = []
+    for name in names:
+        match = _PARTITION_RE.fullmatch(name)
+        if match and match.group(1) == table:
+            days.append(datetime.strptime(match.group(2), "%Y%m%d").date())
+    return sorted(days)
+
+
+def create_partition(db: Session, table: str, day: date) -> int:
+    """
+    Create and attach the partition for *day*, moving any rows for that day
+    out of the default partition first (a plain CREATE ... PARTITION OF
+    fails if the default holds rows for the new range).
+
+    Returns the number of rows moved.  Does not commit.
+    """
+    column = PARTITIONED_TABLES[table]
+    name = partition_name(table, day)
+    default = default_partition_name(table)
+    bounds = {"lo": datetime.combine(day, datetime.min.time()),
+              "hi": datetime.combine(day + timedelta(days=1), datetime.min.time())}
+
+    db.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = 0
+    if db.execute(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": default}).scalar():
+        moved = db.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {default} WHERE {column} >= :lo AND {column} < :hi RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ),
+            bounds,
+        ).rowcount
+    db.execute(text(
+        f"ALTER TABLE {table} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{bounds['lo']:%Y-%m-%d}') TO ('{bounds['hi']:%Y-%m-%d}')"
+    ))
+    return moved
+
+
+def ensure_partitions(
+    db: Session,
+    days_ahead: int = PARTITION_PRECREATE_DAYS,
+    today: Optional[date] = None,
+) -> int:
+    """
+    Make sure every partitioned table has partitions for today through
+    *days_ahead* days from now.  Each partition is committed on its own.
+
+    Returns the number of partitions created.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    created = 0
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(db, table):
+            continue
+        existing = set(list_partitions(db, table))
+        for offset in range(days_ahead + 1):
+            day = today + timedelta(days=offset)
+            if day in existing:
+                continue
+            try:
+                moved = create_partition(db, table, day)
+                db.commit()
+            except Exception:
+                db.rollback()
+                logger.exception("Failed to create partition %s", partition_name(table, day))
+                continue
+            created += 1
+            logger.info(
+                "Created partition %s (%d rows moved from default)", partition_name(table, day), moved,
+            )
+    return created
+
+
+def expired_partitions(db: Session, table: str, cutoff: datetime) -> List[date]:
+    """Days whose whole partition lies before *cutoff*, oldest first."""
+    if not is_partitioned(db, table):
+        return []
+    return [
+        day for day in list_partitions(db, table)
+        if datetime.combine(day + timedelta(days=1), datetime.min.time()) <= cutoff.replace(tzinfo=None)
+    ]
+
+
+def drop_partition(db: Session, table: str, day: date) -> None:
+    """Detach and drop the partition for *day*.  Does not commit."""
+    name = partition_name(table, day)
+    db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+    db.execute(text(f"DROP TABLE {name}"))
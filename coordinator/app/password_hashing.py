@@ -0,0 +1,133 @@
+"""
+bcrypt password hashing off the event loop, in a bounded thread pool.
+
+A bcrypt hash or check takes hundreds of milliseconds of CPU.  Run inline in
+``async def`` handlers it stalls every other request on the coordinator —
+heartbeats, proxied segments — for that long.  Hashes therefore run on a
+dedicated pool of PASSWORD_HASH_WORKERS threads (bcrypt releases the GIL
+while it works).
+
+At most PASSWORD_HASH_MAX_PENDING hashes may be running or queued.  Beyond
+that the pool rejects new work at once with PasswordHashPoolSaturated
+(mapped to 429 by the auth routes), so a login burst can't build an
+unbounded backlog of requests that would time out anyway.
+
+Configurable via environment variables:
+  PASSWORD_HASH_WORKERS      (default 4)
+  PASSWORD_HASH_MAX_PENDING  (default 32, running + queued)
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, Optional, TypeVar
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+T = TypeVar("T")
+
+
+class PasswordHashPoolSaturated(Exception):
+    """Raised when PASSWORD_HASH_MAX_PENDING hashes are already in flight."""
+
+
+def hash_password_sync(password: str) -> str:
+    """Hash a plaintext password with bcrypt (blocking)."""
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+
+def verify_password_sync(password: str, hashed: str) -> bool:
+    """Verify a plaintext password against a bcrypt hash (blocking)."""
+    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+@dataclass
+class PasswordHashMetrics:
+    completed: int = 0
+    rejected: int = 0
+    peak_pending: int = 0
+
+
+class PasswordHashPool:
+    """
+    Thread pool for bcrypt with a cap on running + queued work.
+
+    ``_pending`` is only touched from the event loop, so it needs no lock;
+    worker threads hand the release back with ``call_soon_threadsafe``.
+    The executor is created on first use so the pool can be shut down at
+    application exit and transparently recreated (e.g. across test apps).
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.metrics = PasswordHashMetrics()
+        self._pending = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Run *fn(*args)* on the pool, or raise PasswordHashPoolSaturated."""
+        if self._pending >= self.max_pending:
+            self.metrics.rejected += 1
+            raise PasswordHashPoolSaturated()
+        self._pending += 1
+        self.metrics.peak_pending = max(self.metrics.peak_pending, self._pending)
+        loop = asyncio.get_running_loop()
+        try:
+            job = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._pending -= 1
+            raise
+        # Release the slot when the job itself finishes, not when the caller
+        # stops waiting: a cancelled request leaves its bcrypt work running.
+        # Registered before wrap_future's callback, so the count is updated
+        # before the caller resumes.
+        job.add_done_callback(lambda done: self._release_threadsafe(loop, done))
+        return await asyncio.wrap_future(job)
+
+    def _release_threadsafe(self, loop: asyncio.AbstractEventLoop, job: Future) -> None:
+        try:
+            loop.call_soon_threadsafe(self._release, job)
+        except RuntimeError:
+            # Loop already closed (shutdown); nothing is waiting on the count
+            pass
+
+    def _release(self, job: Future) -> None:
+        self._pending -= 1
+        if not job.cancelled() and job.exception() is None:
+            self.metrics.completed += 1
+
+    async def hash_password(self, password: str) -> str:
+        return await self.run(hash_password_sync, password)
+
+    async def verify_password(self, password: str, hashed: str) -> bool:
+        return await self.run(verify_password_sync, password, hashed)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            **asdict(self.metrics),
+            "pending": self._pending,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+        }
+
+
+# Module-level singleton used by the auth routes
+password_pool = PasswordHashPool()
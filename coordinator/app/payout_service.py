@@ -4,7 +4,8 @@ Task 5.5 — Req 15.1–15.6, Design §18
 
 Calculates payouts from *verified* bandwidth reports, applies trust-score
 penalties, credits UserAccount balances, and logs every cycle to payout_log /
-payout_log_entries.
+payout_log_entries.  Each cycle also adds its per-node totals to the
+node_hourly_earnings rollup, which the node economics endpoint reads.
 """
 
 import logging
@@ -13,7 +14,8 @@ from datetime import datetime, timedelta, timezone
 from decimal import Decimal, ROUND_DOWN
 from typing import Dict, List
 
-from sqlalchemy import func, and_
+from sqlalchemy import Numeric, and_, func, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
 from . import models
@@ -27,6 +29,7 @@ logger = logging.getLogger(__name__)
 
 TRUST_PENALTY_THRESHOLD = Decimal("0.5")
 TRUST_PENALTY_MULTIPLIER = Decimal("0.5")  # 50% payout when trust < 0.5
+DEFAULT_TRUST = Decimal("0.75")  # nodes without a UserAccount row
 
 
 def _gb_from_bytes(b: int) -> Decimal:
@@ -37,77 +40,153 @@ def _gb_from_bytes(b: int) -> Decimal:
 # Core payout cycle
 # ---------------------------------------------------------------------------
 
+def _claim_unpaid_stmt(cycle_start: datetime):
+    """
+    Stamp verified-but-unpaid reports since *cycle_start* and aggregate them.
+
+    One statement: each reporting node is resolved to its owner and current
+    trust score, the reports are stamped with that trust score via
+    UPDATE ... FROM (marking them paid), and the stamped rows are summed per
+    node.  Aggregating what the UPDATE returned means a report that lands
+    mid-cycle is either both counted and stamped, or neither.
+
+    Returns rows: node_id, user_id, trust, bytes, reports.
+    """
+    ledger = models.BandwidthLedger.__table__
+    nodes = models.Node.__table__
+    accounts = models.UserAccount.__table__
+
+    unpaid = and_(
+        ledger.c.is_verified == True,  # noqa: E712
+        ledger.c.trust_score.is_(None),
+        ledger.c.report_timestamp >= cycle_start,
+    )
+
+    pending = select(ledger.c.reporting_node_id.label("node_id")).where(unpaid).distinct().cte("pending")
+    # A node_id registered on several streams maps to one owner
+    node_users = (
+        select(nodes.c.node_id, func.min(nodes.c.user_id).label("user_id"))
+        .where(nodes.c.node_id.in_(select(pending.c.node_id)))
+        .group_by(nodes.c.node_id)
+        .cte("node_users")
+    )
+    user_id = func.coalesce(node_users.c.user_id, pending.c.node_id)
+    owners = (
+        select(
+            pending.c.node_id,
+            user_id.label("user_id"),
+            func.coalesce(accounts.c.trust_score, literal(DEFAULT_TRUST, Numeric(3, 2))).label("trust"),
+        )
+        .select_from(
+            pending
+            .outerjoin(node_users, node_users.c.node_id == pending.c.node_id)
+            .outerjoin(accounts, accounts.c.user_id == user_id)
+        )
+        .cte("owners")
+    )
+    stamped = (
+        update(ledger)
+        .where(unpaid, ledger.c.reporting_node_id == owners.c.node_id)
+        .values(trust_score=owners.c.trust)
+        .returning(
+            ledger.c.reporting_node_id, ledger.c.bytes_transferred,
+            owners.c.user_id, owners.c.trust,
+        )
+        .cte("stamped")
+    )
+    return (
+        select(
+            stamped.c.reporting_node_id.label("node_id"),
+            stamped.c.user_id,
+            stamped.c.trust,
+            func.sum(stamped.c.bytes_transferred).label("bytes"),
+            func.count().label("reports"),
+        )
+        .group_by(stamped.c.reporting_node_id, stamped.c.user_id, stamped.c.trust)
+        .order_by(stamped.c.reporting_node_id)
+    )
+
+
+def _rollup_hourly_stmt(entries: List[dict], hour: datetime):
+    """Add each entry's earnings and bytes to its node's row for *hour*."""
+    rollup = models.NodeHourlyEarnings.__table__
+    totals: Dict[str, dict] = {}
+    for e in entries:
+        row = totals.setdefault(e["node_id"], {
+            "node_id": e["node_id"], "hour": hour, "earnings_usd": Decimal("0"), "bytes_relayed": 0,
+        })
+        row["earnings_usd"] += e["earnings_usd"]
+        row["bytes_relayed"] += e["bytes_relayed"]
+    stmt = pg_insert(rollup).values(list(totals.values()))
+    return stmt.on_conflict_do_update(
+        index_elements=[rollup.c.node_id, rollup.c.hour],
+        set_={
+            "earnings_usd": rollup.c.earnings_usd + stmt.excluded.earnings_usd,
+            "bytes_relayed": rollup.c.bytes_relayed + stmt.excluded.bytes_relayed,
+        },
+    )
+
+
+def hourly_earnings_stmt(node_id: str, since: datetime):
+    """(hour, earnings_usd, bytes_relayed) rollup rows for *node_id* from *since* (naive UTC)."""
+    rollup = models.NodeHourlyEarnings.__table__
+    return (
+        select(rollup.c.hour, rollup.c.earnings_usd, rollup.c.bytes_relayed)
+        .where(rollup.c.node_id == node_id, rollup.c.hour >= since)
+        .order_by(rollup.c.hour.desc())
+    )
+
+
 class PayoutService:
     """Hourly payout cycle driven by verified bandwidth reports."""
 
     def run_payout_cycle(self, db: Session) -> dict:
         """
         Execute one payout cycle:
-        1. Gather verified-but-unpaid bandwidth reports from the last hour.
-        2. Aggregate bytes per node.
-        3. Calculate earnings using EconomicConfig rate, minus platform margin.
-        4. Apply trust-score penalty where trust < 0.5.
-        5. Credit UserAccount.balance_usd.
-        6. Log to payout_log + payout_log_entries.
-        7. Mark processed reports (set trust_score on ledger rows).
-
-        Returns summary dict.
+        1. Stamp verified-but-unpaid reports from the last hour with the
+           node owner's trust score, aggregating bytes per node.
+        2. Calculate earnings using EconomicConfig rate, minus platform margin.
+        3. Apply trust-score penalty where trust < 0.5.
+        4. Credit UserAccount balances in one upsert.
+        5. Log to payout_log + payout_log_entries and add the per-node
+           totals to the node_hourly_earnings rollup.
+
+        All in one transaction.  Returns summary dict.
         """
         now = datetime.now(timezone.utc)
-        cycle_start = now - timedelta(hours=1)
+        # Naive UTC like the column, so ledger partitions prune at plan time
+        cycle_start = now.replace(tzinfo=None) - timedelta(hours=1)
 
-        # 1. Verified reports not yet paid (trust_score IS NULL on ledger = not yet processed by payout)
-        reports = (
-            db.query(models.BandwidthLedger)
-            .filter(
-                models.BandwidthLedger.is_verified == True,  # noqa: E712
-                models.BandwidthLedger.trust_score.is_(None),
-                models.BandwidthLedger.report_timestamp >= cycle_start,
-            )
-            .all()
-        )
+        # 1. Stamp + aggregate (trust_score IS NULL on ledger = not yet processed by payout)
+        rows = db.execute(_claim_unpaid_stmt(cycle_start)).all()
 
-        if not reports:
+        if not rows:
             logger.info("Payout cycle: no verified unpaid reports")
             return {"nodes_paid": 0, "total_usd": "0.00", "penalties": 0}
 
-        # 2. Aggregate bytes per node
-        node_bytes: Dict[str, int] = {}
-        node_user: Dict[str, str] = {}  # node_id → user_id (from ledger's reporting_node)
-        for r in reports:
-            node_bytes[r.reporting_node_id] = node_bytes.get(r.reporting_node_id, 0) + r.bytes_transferred
-            # Resolve user_id from Node table (first match)
-            if r.reporting_node_id not in node_user:
-                node = (
-                    db.query(models.Node)
-                    .filter(models.Node.node_id == r.reporting_node_id)
-                    .first()
-                )
-                node_user[r.reporting_node_id] = node.user_id if node else r.reporting_node_id
-
-        total_bytes = sum(node_bytes.values())
+        report_count = sum(r.reports for r in rows)
+        total_bytes = sum(int(r.bytes) for r in rows)
         if total_bytes == 0:
+            db.commit()
             logger.info("Payout cycle: total verified bytes = 0")
             return {"nodes_paid": 0, "total_usd": "0.00", "penalties": 0}
 
-        # 3-4. Calculate per-node earnings
+        # 2-3. Calculate per-node earnings
         rate = economic_config.rate_per_gb
         margin = economic_config.platform_margin
         min_threshold = economic_config.min_payout_threshold
         net_rate = rate * (Decimal("1") - margin)  # after platform cut
 
         entries: list[dict] = []
+        credits: Dict[str, dict] = {}  # user_id → balance deltas
         total_amount = Decimal("0")
         penalties_applied = 0
 
-        for node_id, nbytes in node_bytes.items():
+        for row in rows:
+            nbytes = int(row.bytes)
             gb = _gb_from_bytes(nbytes)
             earnings = (gb * net_rate).quantize(Decimal("0.0001"), rounding=ROUND_DOWN)
-
-            # Look up trust score
-            user_id = node_user.get(node_id, node_id)
-            account = db.query(models.UserAccount).filter(models.UserAccount.user_id == user_id).first()
-            trust = Decimal(str(account.trust_score)) if account else Decimal("0.75")
+            trust = Decimal(str(row.trust))
 
             penalty = False
             if trust < TRUST_PENALTY_THRESHOLD:
@@ -117,74 +196,63 @@ class PayoutService:
 
             if earnings < min_threshold:
                 # Below minimum — still log but don't credit
-                entries.append({
-                    "node_id": node_id,
-                    "user_id": user_id,
-                    "bytes": nbytes,
-                    "earnings": Decimal("0"),
-                    "trust": trust,
-                    "penalty": penalty,
+                earnings = Decimal("0")
+            else:
+                credit = credits.setdefault(row.user_id, {
+                    "user_id": row.user_id,
+                    "balance_usd": Decimal("0"),
+                    "total_gb_relayed": Decimal("0"),
+                    "earnings_last_30d": Decimal("0"),
+                    "trust_score": trust,
+                    "flags": [],
+                    "last_updated_at": now,
                 })
-                continue
-
-            # 5. Credit balance
-            if not account:
-                account = models.UserAccount(
-                    user_id=user_id,
-                    balance_usd=Decimal("0"),
-                    total_gb_relayed=Decimal("0"),
-                    earnings_last_30d=Decimal("0"),
-                    trust_score=trust,
-                    flags=[],
-                    last_updated_at=now,
-                )
-                db.add(account)
-                db.flush()
-
-            account.balance_usd += earnings
-            account.total_gb_relayed += gb
-            account.earnings_last_30d += earnings
-            account.last_updated_at = now
-            total_amount += earnings
+                credit["balance_usd"] += earnings
+                credit["total_gb_relayed"] += gb
+                credit["earnings_last_30d"] += earnings
+                total_amount += earnings
 
             entries.append({
-                "node_id": node_id,
-                "user_id": user_id,
-                "bytes": nbytes,
-                "earnings": earnings,
-                "trust": trust,
-                "penalty": penalty,
+                "node_id": row.node_id,
+                "user_id": row.user_id,
+                "bytes_relayed": nbytes,
+                "earnings_usd": earnings,
+                "trust_score": trust,
+                "penalty_applied": penalty,
+                "timestamp": now,
             })
 
-        # 6. Log cycle
+        # 4. Credit balances — accounts that don't exist yet are created
+        if credits:
+            accounts = models.UserAccount.__table__
+            stmt = pg_insert(accounts).values(list(credits.values()))
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[accounts.c.user_id],
+                set_={
+                    "balance_usd": accounts.c.balance_usd + stmt.excluded.balance_usd,
+                    "total_gb_relayed": accounts.c.total_gb_relayed + stmt.excluded.total_gb_relayed,
+                    "earnings_last_30d": accounts.c.earnings_last_30d + stmt.excluded.earnings_last_30d,
+                    "last_updated_at": stmt.excluded.last_updated_at,
+                },
+            )
+            db.execute(stmt)
+
+        # 5. Log cycle
         payout_log = models.PayoutLog(
             cycle_timestamp=now,
             total_amount_usd=total_amount,
             total_bytes_processed=total_bytes,
-            nodes_paid=len([e for e in entries if e["earnings"] > 0]),
+            nodes_paid=len([e for e in entries if e["earnings_usd"] > 0]),
             penalties_applied=penalties_applied,
-            notes=f"Rate {rate}/GB, margin {margin}, {len(reports)} reports processed",
+            notes=f"Rate {rate}/GB, margin {margin}, {report_count} reports processed",
         )
         db.add(payout_log)
         db.flush()  # get payout_log.id
 
         for e in entries:
-            db.add(models.PayoutLogEntry(
-                payout_log_id=payout_log.id,
-                node_id=e["node_id"],
-                user_id=e["user_id"],
-                bytes_relayed=e["bytes"],
-                earnings_usd=e["earnings"],
-                trust_score=e["trust"],
-                penalty_applied=e["penalty"],
-                timestamp=now,
-            ))
-
-        # 7. Stamp processed reports so they aren't picked up again
-        for r in reports:
-            user_id = node_user.get(r.reporting_node_id, r.reporting_node_id)
-            account = db.query(models.UserAccount).filter(models.UserAccount.user_id == user_id).first()
-            r.trust_score = Decimal(str(account.trust_score)) if account else Decimal("0.75")
+            e["payout_log_id"] = payout_log.id
+        db.execute(insert(models.PayoutLogEntry), entries)
+        db.execute(_rollup_hourly_stmt(entries, now.replace(tzinfo=None, minute=0, second=0, microsecond=0)))
 
         db.commit()
 
@@ -192,7 +260,7 @@ class PayoutService:
             "nodes_paid": payout_log.nodes_paid,
             "total_usd": str(total_amount),
             "penalties": penalties_applied,
-            "reports_processed": len(reports),
+            "reports_processed": report_count,
         }
         logger.info("Payout cycle complete: %s", summary)
         return summary
@@ -0,0 +1,194 @@
+"""
+Per-process cache of decoded stream node tables.
+
+Viewer routing and the HLS proxy read ``stream:{id}:nodes`` on every request;
+this keeps the decoded table in memory for PEER_CACHE_TTL_SECONDS and drops
+it early when another process publishes a membership change on the
+``peers:invalidate`` channel (new node, VPN IP change, node removal).
+
+Capacity, trust and viewer counts are allowed to be up to one TTL stale.
+Stream ids come straight from unauthenticated proxy paths, so empty node
+tables (unknown streams) aren't cached and the cache is an LRU bounded to
+PEER_CACHE_MAX_STREAMS entries.
+Pub/sub is used rather than keyspace notifications so no Redis server
+configuration (notify-keyspace-events) is required.
+
+Configurable via environment variables:
+  PEER_CACHE_TTL_SECONDS  (default 2.0, 0 disables caching)
+  PEER_CACHE_MAX_STREAMS  (default 10000)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from . import redis_state
+from .redis_state import PEER_INVALIDATION_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+PEER_CACHE_TTL_SECONDS = float(os.getenv("PEER_CACHE_TTL_SECONDS", "2.0"))
+PEER_CACHE_MAX_STREAMS = int(os.getenv("PEER_CACHE_MAX_STREAMS", "10000"))
+
+_RESUBSCRIBE_DELAY_SECONDS = 5.0
+
+# Handed to coalesced waiters when the loading request was cancelled
+_RETRY = object()
+
+
+@dataclass
+class PeerCacheMetrics:
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0
+    evictions: int = 0
+
+
+class PeerCache:
+    """TTL cache of stream node lists, invalidated over Redis pub/sub."""
+
+    def __init__(self, ttl: float = PEER_CACHE_TTL_SECONDS, max_streams: int = PEER_CACHE_MAX_STREAMS):
+        self.ttl = ttl
+        self.max_streams = max_streams
+        self.metrics = PeerCacheMetrics()
+        # stream_id -> (expires_at, nodes, nodes_by_id), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, List[dict], Dict[str, dict]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Bumped on every invalidation so a fetch that raced one isn't cached
+        self._generation = 0
+        self._subscribed = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def _load(self, r: aioredis.Redis, stream_id: str) -> Tuple[List[dict], Dict[str, dict]]:
+        now = time.monotonic()
+        entry = self._entries.get(stream_id)
+        if entry is not None and entry[0] > now:
+            self.metrics.hits += 1
+            self._entries.move_to_end(stream_id)
+            return entry[1], entry[2]
+
+        # Coalesce concurrent misses for the same stream into one HGETALL
+        pending = self._inflight.get(stream_id)
+        if pending is not None:
+            self.metrics.hits += 1
+            result = await asyncio.shield(pending)
+            if result is _RETRY:
+                # The loading request was cancelled; one waiter takes over
+                return await self._load(r, stream_id)
+            return result
+
+        self.metrics.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[stream_id] = future
+        generation = self._generation
+        try:
+            nodes = await redis_state.get_stream_nodes(r, stream_id)
+            by_id = {n["node_id"]: n for n in nodes}
+            if nodes and self.ttl > 0 and generation == self._generation:
+                self._store(stream_id, (time.monotonic() + self.ttl, nodes, by_id))
+            future.set_result((nodes, by_id))
+            return nodes, by_id
+        except asyncio.CancelledError:
+            future.set_result(_RETRY)
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark retrieved so an unawaited failure doesn't log a warning
+            future.exception()
+            raise
+        finally:
+            del self._inflight[stream_id]
+
+    def _store(self, stream_id: str, entry: Tuple[float, List[dict], Dict[str, dict]]) -> None:
+        self._entries[stream_id] = entry
+        self._entries.move_to_end(stream_id)
+        while len(self._entries) > self.max_streams:
+            self._entries.popitem(last=False)
+            self.metrics.evictions += 1
+
+    async def get_nodes(self, r: aioredis.Redis, stream_id: str) -> List[dict]:
+        """Node list for a stream (shared — callers must not mutate the dicts)."""
+        nodes, _ = await self._load(r, stream_id)
+        return nodes
+
+    async def get_node(self, r: aioredis.Redis, stream_id: str, node_id: str) -> Optional[dict]:
+        _, by_id = await self._load(r, stream_id)
+        return by_id.get(node_id)
+
+    def invalidate(self, stream_id: Optional[str] = None) -> None:
+        """Drop one stream (or everything when *stream_id* is None)."""
+        self.metrics.invalidations += 1
+        self._generation += 1
+        if stream_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(stream_id, None)
+
+    # ------------------------------------------------------------------
+    # Invalidation subscriber
+    # ------------------------------------------------------------------
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = None
+            try:
+                r = await redis_state.get_redis()
+                pubsub = r.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(PEER_INVALIDATION_CHANNEL)
+                # Anything may have changed while we weren't listening
+                self.invalidate()
+                self._subscribed = True
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.invalidate(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Peer cache invalidation subscriber disconnected", exc_info=True)
+            finally:
+                self._subscribed = False
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+            await asyncio.sleep(_RESUBSCRIBE_DELAY_SECONDS)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        lookups = self.metrics.hits + self.metrics.misses
+        return {
+            **asdict(self.metrics),
+            "hit_ratio": round(self.metrics.hits / lookups, 4) if lookups else None,
+            "streams_cached": len(self._entries),
+            "max_streams": self.max_streams,
+            "subscribed": self._subscribed,
+            "ttl_seconds": self.ttl,
+        }
+
+
+# Module-level singleton shared by viewer routing, the proxy and the peers API
+peer_cache = PeerCache()
+
+
+async def get_stream_nodes(r: aioredis.Redis, stream_id: str) -> List[dict]:
+    """Cached drop-in for ``redis_state.get_stream_nodes``."""
+    return await peer_cache.get_nodes(r, stream_id)
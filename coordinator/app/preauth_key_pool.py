@@ -0,0 +1,257 @@
+"""
+Pool of pre-minted Headscale pre-auth keys for node registration.
+
+Minting a key is an HTTP round-trip to Headscale.  Done inline in
+/register it made every registration pay that latency, and a Headscale
+outage slowed every registration down to the client timeout.  Single-use
+keys are now minted ahead of time and kept in Redis; registration pops one
+with a single LPOP.
+
+Keys:
+  headscale:preauth_keys         — list of "{expires_at_epoch}|{key}", oldest first
+  headscale:preauth_keys:refill  — refill lock (SET NX of a per-refill token, expires after
+                                   PREAUTH_POOL_REFILL_LOCK_SECONDS, released by compare-and-delete)
+
+Once the pool drops below PREAUTH_POOL_LOW_WATERMARK it is topped up to
+PREAUTH_POOL_TARGET, minting PREAUTH_POOL_REFILL_BATCH keys concurrently
+at a time.  Refills run from a scheduled job (see main.py) and are also
+started in the background when a pop leaves the pool under the watermark;
+the lock keeps replicas from refilling at the same time.
+
+Pooled keys are minted with PREAUTH_KEY_EXPIRY_HOURS of validity.  A key
+with less than PREAUTH_KEY_MIN_REMAINING_SECONDS left is discarded rather
+than handed out, so a node always has time to join the mesh.  When the
+pool is empty (fresh deploy, Redis down, or Headscale down for longer than
+the pool lasts) registration mints a key inline, bounded by
+PREAUTH_FALLBACK_TIMEOUT_SECONDS.
+
+Configurable via environment variables:
+  PREAUTH_POOL_TARGET                  (default 50)
+  PREAUTH_POOL_LOW_WATERMARK           (default 20)
+  PREAUTH_POOL_REFILL_BATCH            (default 10)
+  PREAUTH_POOL_REFILL_INTERVAL_SECONDS (default 30)
+  PREAUTH_POOL_REFILL_LOCK_SECONDS     (default 60)
+  PREAUTH_KEY_EXPIRY_HOURS             (default 24)
+  PREAUTH_KEY_MIN_REMAINING_SECONDS    (default 3600)
+  PREAUTH_FALLBACK_TIMEOUT_SECONDS     (default 2.0, 0 disables inline minting)
+"""
+
+import asyncio
+import logging
+import os
+import secrets
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from .headscale_client import HeadscaleClient
+
+logger = logging.getLogger(__name__)
+
+PREAUTH_POOL_TARGET = int(os.getenv("PREAUTH_POOL_TARGET", "50"))
+PREAUTH_POOL_LOW_WATERMARK = int(os.getenv("PREAUTH_POOL_LOW_WATERMARK", "20"))
+PREAUTH_POOL_REFILL_BATCH = int(os.getenv("PREAUTH_POOL_REFILL_BATCH", "10"))
+PREAUTH_POOL_REFILL_INTERVAL_SECONDS = int(os.getenv("PREAUTH_POOL_REFILL_INTERVAL_SECONDS", "30"))
+PREAUTH_POOL_REFILL_LOCK_SECONDS = int(os.getenv("PREAUTH_POOL_REFILL_LOCK_SECONDS", "60"))
+PREAUTH_KEY_EXPIRY_HOURS = int(os.getenv("PREAUTH_KEY_EXPIRY_HOURS", "24"))
+PREAUTH_KEY_MIN_REMAINING_SECONDS = int(os.getenv("PREAUTH_KEY_MIN_REMAINING_SECONDS", "3600"))
+PREAUTH_FALLBACK_TIMEOUT_SECONDS = float(os.getenv("PREAUTH_FALLBACK_TIMEOUT_SECONDS", "2.0"))
+
+POOL_KEY = "headscale:preauth_keys"
+REFILL_LOCK_KEY = "headscale:preauth_keys:refill"
+
+# Deletes the refill lock only if it still holds this refill's token: a
+# refill that outlived the lock TTL must not release another replica's lock.
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_release_script = None
+
+
+async def _release_refill_lock(r: aioredis.Redis, token: str) -> bool:
+    global _release_script
+    if _release_script is None:
+        _release_script = r.register_script(_RELEASE_LOCK_LUA)
+    return bool(await _release_script(keys=[REFILL_LOCK_KEY], args=[token], client=r))
+
+
+def encode_entry(key: str, expires_at: float) -> str:
+    return f"{int(expires_at)}|{key}"
+
+
+def decode_entry(raw: str) -> Tuple[float, str]:
+    expires_at, key = raw.split("|", 1)
+    return float(expires_at), key
+
+
+@dataclass
+class PreauthPoolMetrics:
+    pool_hits: int = 0
+    pool_misses: int = 0
+    discarded: int = 0
+    fallback_minted: int = 0
+    fallback_failed: int = 0
+    refills: int = 0
+    minted: int = 0
+    mint_failures: int = 0
+    last_pool_size: int = 0
+
+
+class PreauthKeyPool:
+    """Redis-backed pool of single-use pre-auth keys, refilled in batches."""
+
+    def __init__(
+        self,
+        target: int = PREAUTH_POOL_TARGET,
+        low_watermark: int = PREAUTH_POOL_LOW_WATERMARK,
+        batch_size: int = PREAUTH_POOL_REFILL_BATCH,
+        expiry_hours: int = PREAUTH_KEY_EXPIRY_HOURS,
+        min_remaining_seconds: int = PREAUTH_KEY_MIN_REMAINING_SECONDS,
+        fallback_timeout: float = PREAUTH_FALLBACK_TIMEOUT_SECONDS,
+    ):
+        self.target = target
+        self.low_watermark = min(low_watermark, target)
+        self.batch_size = max(1, batch_size)
+        self.expiry_hours = expiry_hours
+        self.min_remaining_seconds = min_remaining_seconds
+        self.fallback_timeout = fallback_timeout
+        self.metrics = PreauthPoolMetrics()
+        self._refill_task: Optional[asyncio.Task] = None
+
+    # -- registration path --------------------------------------------------
+
+    async def take(self, r: aioredis.Redis, client: HeadscaleClient) -> Optional[str]:
+        """
+        Pop a pooled key, or mint one inline if the pool is empty.  Returns
+        None if no key could be obtained (registration continues without one).
+        """
+        now = time.time()
+        try:
+            while True:
+                pipe = r.pipeline(transaction=False)
+                pipe.lpop(POOL_KEY)
+                pipe.llen(POOL_KEY)
+                raw, remaining = await pipe.execute()
+                self.metrics.last_pool_size = remaining
+                if raw is None:
+                    break
+                try:
+                    expires_at, key = decode_entry(raw)
+                except ValueError:
+                    expires_at, key = 0.0, ""
+                if expires_at - now >= self.min_remaining_seconds:
+                    self.metrics.pool_hits += 1
+                    if remaining < self.low_watermark:
+                        self.refill_in_background(r, client)
+                    return key
+                self.metrics.discarded += 1
+        except Exception:
+            logger.warning("Pre-auth key pool unavailable — minting inline", exc_info=True)
+
+        self.metrics.pool_misses += 1
+        self.refill_in_background(r, client)
+        return await self._mint_inline(client)
+
+    async def _mint_inline(self, client: HeadscaleClient) -> Optional[str]:
+        if self.fallback_timeout <= 0:
+            return None
+        try:
+            key = await asyncio.wait_for(
+                client.create_preauth_key(expiry_hours=self.expiry_hours, reusable=False),
+                timeout=self.fallback_timeout,
+            )
+        except asyncio.TimeoutError:
+            key = None
+        if key:
+            self.metrics.fallback_minted += 1
+        else:
+            self.metrics.fallback_failed += 1
+        return key
+
+    # -- refill -------------------------------------------------------------
+
+    async def _drop_stale(self, r: aioredis.Redis, now: float) -> int:
+        """Remove entries too close to expiry from the head of the list."""
+        dropped = 0
+        for raw in await r.lrange(POOL_KEY, 0, self.batch_size - 1):
+            try:
+                expires_at, _ = decode_entry(raw)
+            except ValueError:
+                expires_at = 0.0
+            if expires_at - now >= self.min_remaining_seconds:
+                break  # oldest first: the rest are fresher
+            # LREM the exact entry — a concurrent LPOP may already have taken it
+            dropped += await r.lrem(POOL_KEY, 1, raw)
+        self.metrics.discarded += dropped
+        return dropped
+
+    async def refill(self, r: aioredis.Redis, client: HeadscaleClient) -> int:
+        """
+        Top the pool up to ``target`` if it is below the low watermark.
+        Returns the number of keys added.  Stops early if a whole batch
+        fails to mint (Headscale down).
+        """
+        token = secrets.token_hex(16)
+        if not await r.set(REFILL_LOCK_KEY, token, nx=True, ex=PREAUTH_POOL_REFILL_LOCK_SECONDS):
+            return 0
+        added = 0
+        try:
+            await self._drop_stale(r, time.time())
+            size = await r.llen(POOL_KEY)
+            if size >= self.low_watermark:
+                self.metrics.last_pool_size = size
+                return 0
+            self.metrics.refills += 1
+            while size + added < self.target:
+                count = min(self.batch_size, self.target - size - added)
+                expires_at = time.time() + self.expiry_hours * 3600
+                keys = await asyncio.gather(*(
+                    client.create_preauth_key(expiry_hours=self.expiry_hours, reusable=False)
+                    for _ in range(count)
+                ))
+                minted = [k for k in keys if k]
+                self.metrics.mint_failures += count - len(minted)
+                if not minted:
+                    logger.warning("Pre-auth key refill stopped: Headscale minted no keys")
+                    break
+                await r.rpush(POOL_KEY, *(encode_entry(k, expires_at) for k in minted))
+                await r.expire(POOL_KEY, self.expiry_hours * 3600)
+                self.metrics.minted += len(minted)
+                added += len(minted)
+            self.metrics.last_pool_size = size + added
+            logger.info("Pre-auth key pool refilled: +%d keys (%d pooled)", added, size + added)
+            return added
+        finally:
+            if not await _release_refill_lock(r, token):
+                logger.warning("Pre-auth key refill outlived its lock; another refill may have overlapped")
+
+    def refill_in_background(self, r: aioredis.Redis, client: HeadscaleClient) -> None:
+        """Start a refill unless this process already has one running."""
+        if self._refill_task is not None and not self._refill_task.done():
+            return
+        self._refill_task = asyncio.create_task(self._safe_refill(r, client))
+
+    async def _safe_refill(self, r: aioredis.Redis, client: HeadscaleClient) -> None:
+        try:
+            await self.refill(r, client)
+        except Exception:
+            logger.warning("Pre-auth key pool refill failed", exc_info=True)
+
+    def stats(self) -> dict:
+        lookups = self.metrics.pool_hits + self.metrics.pool_misses
+        return {
+            **asdict(self.metrics),
+            "hit_ratio": round(self.metrics.pool_hits / lookups, 4) if lookups else None,
+            "target": self.target,
+            "low_watermark": self.low_watermark,
+        }
+
+
+# Module-level singleton used by node registration and the refill job
+preauth_key_pool = PreauthKeyPool()
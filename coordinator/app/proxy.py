@@ -5,12 +5,21 @@ Tasks 4.8, 4.9 — Req 11.1, 12.2–12.4, Design §14, §15
 
 import logging
 import os
+from typing import Awaitable, Callable
 
 import httpx
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import StreamingResponse
-
-from .redis_state import get_redis, get_stream_nodes
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from .circuit_breaker import node_breaker
+from .peer_cache import get_stream_nodes, peer_cache
+from .redis_state import get_redis
+from .segment_cache import CachedObject, CacheKey, segment_cache, ttl_for_path
+from .viewer_assignment import (
+    assign_viewer, assign_viewers, choose_node, eligible_nodes, get_loads, spread_viewers,
+    touch_viewer,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +27,18 @@ router = APIRouter(tags=["proxy"])
 
 SRS_HOST = os.getenv("SRS_HOST", "localhost")
 SRS_PORT = os.getenv("SRS_PORT", "8080")
+NODE_HLS_PORT = os.getenv("NODE_HLS_PORT", "8080")
+
+# Upstream connection pool tuning.  httpx keeps idle keep-alive connections
+# per origin (node VPN IP, or the sidecar proxy) up to the pool-wide cap.
+PROXY_MAX_CONNECTIONS = int(os.getenv("PROXY_MAX_CONNECTIONS", "1000"))
+PROXY_MAX_KEEPALIVE = int(os.getenv("PROXY_MAX_KEEPALIVE", "200"))
+PROXY_KEEPALIVE_EXPIRY = float(os.getenv("PROXY_KEEPALIVE_EXPIRY", "30"))
+PROXY_CONNECT_TIMEOUT = float(os.getenv("PROXY_CONNECT_TIMEOUT", "2.0"))
+PROXY_READ_TIMEOUT = float(os.getenv("PROXY_READ_TIMEOUT", "5.0"))
+
+# Response headers passed through from the upstream to the viewer
+_FORWARDED_HEADERS = ("content-length", "content-encoding", "cache-control", "last-modified", "etag")
 
 # Tailscale sidecar HTTP proxy for routing to VPN IPs (100.64.x.x)
 # In Fargate userspace mode, there's no TUN device — traffic to VPN IPs
@@ -29,10 +50,21 @@ _http_client: httpx.AsyncClient | None = None
 _vpn_client: httpx.AsyncClient | None = None
 
 
+def _client_kwargs() -> dict:
+    return {
+        "timeout": httpx.Timeout(PROXY_READ_TIMEOUT, connect=PROXY_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=PROXY_MAX_CONNECTIONS,
+            max_keepalive_connections=PROXY_MAX_KEEPALIVE,
+            keepalive_expiry=PROXY_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
 async def _get_http_client() -> httpx.AsyncClient:
     global _http_client
     if _http_client is None:
-        _http_client = httpx.AsyncClient(timeout=5.0)
+        _http_client = httpx.AsyncClient(**_client_kwargs())
     return _http_client
 
 
@@ -43,17 +75,125 @@ async def _get_vpn_client() -> httpx.AsyncClient:
         if TS_PROXY_URL:
             # httpx 0.25.x uses 'proxies' dict, not 'proxy' string (added in 0.27+)
             _vpn_client = httpx.AsyncClient(
-                timeout=5.0,
                 proxies={"http://": TS_PROXY_URL, "https://": TS_PROXY_URL},
+                **_client_kwargs(),
             )
             logger.info("VPN proxy client configured: %s", TS_PROXY_URL)
         else:
             # No proxy configured — fall back to direct (works if TUN exists)
-            _vpn_client = httpx.AsyncClient(timeout=5.0)
+            _vpn_client = httpx.AsyncClient(**_client_kwargs())
             logger.warning("No TS_OUTBOUND_HTTP_PROXY_URL set — VPN routing may fail")
     return _vpn_client
 
 
+async def close_proxy_clients() -> None:
+    """Close the shared upstream clients (call on shutdown)."""
+    global _http_client, _vpn_client
+    for client in (_http_client, _vpn_client):
+        if client is not None:
+            await client.aclose()
+    _http_client = None
+    _vpn_client = None
+
+
+async def _open_upstream(client: httpx.AsyncClient, url: str) -> httpx.Response:
+    """Send a GET and return as soon as the response headers arrive."""
+    return await client.send(client.build_request("GET", url), stream=True)
+
+
+def _relay(resp: httpx.Response, status_code: int) -> StreamingResponse:
+    """
+    Stream an open upstream response to the viewer chunk by chunk.
+
+    The upstream is closed when the body is exhausted, on error, or when the
+    viewer disconnects (the background task runs in every case).
+    """
+    async def _body():
+        try:
+            async for chunk in resp.aiter_raw():
+                yield chunk
+        except httpx.HTTPError as exc:
+            # Headers are already sent; all we can do is cut the body short
+            logger.warning("Upstream %s failed mid-stream (%s)", resp.url, type(exc).__name__)
+        finally:
+            await resp.aclose()
+
+    headers = {h: resp.headers[h] for h in _FORWARDED_HEADERS if h in resp.headers}
+    return StreamingResponse(
+        content=_body(),
+        status_code=status_code,
+        headers=headers,
+        media_type=resp.headers.get("content-type", "application/octet-stream"),
+        background=BackgroundTask(resp.aclose),
+    )
+
+
+async def _fetch(
+    client: httpx.AsyncClient,
+    url: str,
+    cache_key: CacheKey,
+    on_transport_error: Callable[[], Awaitable[None]] | None = None,
+) -> CachedObject | httpx.Response:
+    """
+    Fetch an HLS object through the segment cache.
+
+    Returns the cached object, or an open streaming response when the object
+    isn't cacheable (unknown path type, error status, oversized or unsized
+    body) — the caller relays or closes it as before.
+
+    *on_transport_error* runs once per upstream request that fails at the
+    transport level.  A coalesced load is one request, so it runs once in
+    the loader, however many viewers were waiting on it.
+    """
+    async def _counted(request: Callable[[], Awaitable]):
+        try:
+            return await request()
+        except httpx.TransportError:
+            if on_transport_error is not None:
+                await on_transport_error()
+            raise
+
+    ttl = ttl_for_path(cache_key[2])
+    if ttl is None or not segment_cache.enabled:
+        return await _counted(lambda: _open_upstream(client, url))
+
+    passthrough: httpx.Response | None = None
+
+    async def _load() -> CachedObject | None:
+        nonlocal passthrough
+        resp = await _open_upstream(client, url)
+        length = resp.headers.get("content-length")
+        if (
+            resp.status_code != 200
+            or length is None
+            or not length.isdigit()
+            or int(length) > segment_cache.max_object_bytes
+        ):
+            passthrough = resp
+            return None
+        try:
+            body = b"".join([chunk async for chunk in resp.aiter_raw()])
+        finally:
+            await resp.aclose()
+        return CachedObject(
+            body=body,
+            media_type=resp.headers.get("content-type", "application/octet-stream"),
+            headers={h: resp.headers[h] for h in _FORWARDED_HEADERS if h in resp.headers},
+        )
+
+    cached = await segment_cache.get_or_load(cache_key, ttl, lambda: _counted(_load))
+    if cached is not None:
+        return cached
+    if passthrough is not None:
+        return passthrough
+    # Another request's load was uncacheable — fetch our own copy
+    return await _counted(lambda: _open_upstream(client, url))
+
+
+def _cached_response(obj: CachedObject) -> Response:
+    return Response(content=obj.body, status_code=200, headers=obj.headers, media_type=obj.media_type)
+
+
 def _log_fallback(stream_id: str, reason: str) -> None:
     """Structured log for every SRS fallback event (Req 12.3)."""
     logger.info(
@@ -76,47 +216,82 @@ async def _get_viewer_assignment(stream_id: str, viewer_key: str) -> str | None:
         return None
 
 
-async def _reassign_viewer(stream_id: str, viewer_key: str) -> str | None:
+async def _touch_assignment(stream_id: str, viewer_key: str) -> None:
+    """Keep an active viewer's assignment from expiring."""
+    try:
+        r = await get_redis()
+        await touch_viewer(r, stream_id, viewer_key)
+    except Exception:
+        logger.debug("Failed to refresh viewer assignment", exc_info=True)
+
+
+async def _healthy_candidates(stream_id: str, exclude: str | None = None) -> list[dict]:
+    """Routable nodes for a stream, skipping open circuit breakers."""
+    r = await get_redis()
+    candidates = eligible_nodes(await get_stream_nodes(r, stream_id), exclude)
+    tripped = await node_breaker.open_nodes(n["node_id"] for n in candidates)
+    return [n for n in candidates if n["node_id"] not in tripped]
+
+
+async def _reassign_viewer(
+    stream_id: str, viewer_key: str, exclude: str | None = None
+) -> dict | None:
     """
     Try to assign the viewer to a different node.
-    Returns the new node's VPN IP or None if no nodes available.
+    Returns the new node (node_id, vpn_ip, ...) or None if no nodes available.
     """
     try:
+        candidates = await _healthy_candidates(stream_id, exclude)
+        if not candidates:
+            return None
         r = await get_redis()
-        nodes = await get_stream_nodes(r, stream_id)
+        node = choose_node(candidates, await get_loads(r, stream_id))
     except Exception:
         return None
 
-    candidates = [
-        n for n in nodes
-        if n.get("capacity_pct", 0) < 90
-        and n.get("trust_score", 0) >= 0.5
-    ]
-    if not candidates:
-        return None
+    try:
+        await assign_viewer(r, stream_id, viewer_key, node["node_id"])
+    except Exception:
+        pass
 
-    candidates.sort(
-        key=lambda n: (-n.get("trust_score", 0), n.get("viewer_count", 0))
-    )
-    best = candidates[0]
-    node_id = best["node_id"]
+    return node
 
+
+async def _evacuate_node(stream_id: str, node_id: str) -> int:
+    """
+    Move every viewer of *stream_id* off a node whose breaker just opened,
+    spreading them over the remaining healthy nodes in one write.  Viewers
+    with nowhere to go are unassigned (SRS until a node is available).
+    Returns the number of viewers moved.
+    """
     try:
-        await r.hset(f"stream:{stream_id}:viewers", viewer_key, node_id)
+        r = await get_redis()
+        assignments = await r.hgetall(f"stream:{stream_id}:viewers")
+        affected = [viewer for viewer, assigned in assignments.items() if assigned == node_id]
+        if not affected:
+            return 0
+        candidates = await _healthy_candidates(stream_id, exclude=node_id)
+        moves = spread_viewers(affected, candidates, await get_loads(r, stream_id)) if candidates else {}
+        await assign_viewers(r, stream_id, {viewer: moves.get(viewer) for viewer in affected})
     except Exception:
-        pass
+        logger.warning("Failed to reassign viewers off node %s", node_id, exc_info=True)
+        return 0
+    logger.info("Reassigned %d viewers of %s off node %s", len(affected), stream_id, node_id)
+    return len(affected)
 
-    return best.get("vpn_ip")
+
+async def _node_failed(stream_id: str, node_id: str) -> None:
+    if await node_breaker.record_failure(node_id):
+        await _evacuate_node(stream_id, node_id)
 
 
 async def _resolve_node_vpn_ip(stream_id: str, node_id: str) -> str | None:
-    """Look up a node's VPN IP from Redis."""
+    """Look up a node's VPN IP (served from the in-process peer cache)."""
     try:
         r = await get_redis()
-        nodes = await get_stream_nodes(r, stream_id)
-        for n in nodes:
-            if n["node_id"] == node_id:
-                return n.get("vpn_ip")
+        node = await peer_cache.get_node(r, stream_id, node_id)
+        if node:
+            return node.get("vpn_ip")
     except Exception:
         pass
     return None
@@ -136,31 +311,46 @@ async def proxy_hls(stream_id: str, path: str, request: Request):
     node_id = await _get_viewer_assignment(stream_id, viewer_key)
 
     vpn_ip: str | None = None
+    skipped: str | None = None
     if node_id:
-        vpn_ip = await _resolve_node_vpn_ip(stream_id, node_id)
+        if await node_breaker.allow(node_id):
+            vpn_ip = await _resolve_node_vpn_ip(stream_id, node_id)
+            if vpn_ip:
+                await _touch_assignment(stream_id, viewer_key)
+        else:
+            # Known-bad node: don't wait out another timeout on it
+            skipped = node_id
 
     if not vpn_ip:
-        # No assignment or node gone — try reassignment
-        vpn_ip = await _reassign_viewer(stream_id, viewer_key)
+        # No assignment, node gone or breaker open — try reassignment
+        node = await _reassign_viewer(stream_id, viewer_key, exclude=skipped)
+        if node:
+            node_id, vpn_ip = node["node_id"], node.get("vpn_ip")
 
     if vpn_ip:
-        node_url = f"http://{vpn_ip}:8080/live/{stream_id}/{path}"
+        node_url = f"http://{vpn_ip}:{NODE_HLS_PORT}/live/{stream_id}/{path}"
         try:
             client = await _get_vpn_client()
-            resp = await client.get(node_url)
+            resp = await _fetch(
+                client, node_url, (stream_id, vpn_ip, path),
+                on_transport_error=lambda: _node_failed(stream_id, node_id),
+            )
+            if isinstance(resp, CachedObject):
+                return _cached_response(resp)
             if resp.status_code == 200:
-                return StreamingResponse(
-                    content=resp.aiter_bytes(),
-                    media_type=resp.headers.get("content-type", "application/octet-stream"),
-                    status_code=200,
-                )
+                await node_breaker.record_success(node_id)
+                return _relay(resp, 200)
             else:
+                await resp.aclose()
+                if resp.status_code >= 500:
+                    await _node_failed(stream_id, node_id)
                 _log_fallback(stream_id, "node_offline")
                 logger.warning(
                     "Node %s returned %d for %s, falling back to SRS",
                     node_id, resp.status_code, path,
                 )
-        except (httpx.ConnectError, httpx.TimeoutException) as exc:
+        except httpx.TransportError as exc:
+            # Counted against the node by _fetch, once per upstream request
             _log_fallback(stream_id, "node_offline")
             logger.warning(
                 "Node %s unreachable (%s), falling back to SRS",
@@ -178,11 +368,9 @@ async def proxy_hls(stream_id: str, path: str, request: Request):
     srs_url = f"http://{SRS_HOST}:{SRS_PORT}/live/{srs_path}"
     try:
         client = await _get_http_client()
-        resp = await client.get(srs_url)
-        return StreamingResponse(
-            content=resp.aiter_bytes(),
-            media_type=resp.headers.get("content-type", "application/octet-stream"),
-            status_code=resp.status_code,
-        )
+        resp = await _fetch(client, srs_url, (stream_id, "srs", srs_path))
+        if isinstance(resp, CachedObject):
+            return _cached_response(resp)
+        return _relay(resp, resp.status_code)
     except Exception:
         raise HTTPException(status_code=502, detail="Stream unavailable")
@@ -5,21 +5,39 @@ Maintains per-stream node state in Redis hashes for fast peer lookups
 and viewer routing decisions.
 
 Keys:
-  stream:{stream_id}:nodes   — hash: node_id → JSON{vpn_ip, trust_score, capacity_pct, viewer_count, last_heartbeat}
+  stream:{stream_id}:nodes   — hash: node_id → "2|vpn_ip|trust_score|capacity_pct|viewer_count|last_heartbeat_epoch"
   stream:{stream_id}:viewers — hash: viewer_key → node_id
+  stream:{stream_id}:load    — hash: node_id → assigned viewer count (see viewer_assignment.py)
+  nodes:heartbeats           — zset: "{stream_id}|{node_id}" → last heartbeat (epoch seconds)
+
+Channel:
+  peers:invalidate           — stream_id whose node membership or VPN IPs changed
+
+The heartbeat index lets the stale-node sweeper find expired entries with a
+single ZRANGEBYSCORE instead of scanning every stream hash.
+
+Node values use a versioned delimited encoding (see encode_node_state).  The
+original JSON payloads are still readable and are rewritten on the first
+sweep after deploy (see backfill_heartbeat_index).
 """
 
 import json
 import logging
 import os
-from datetime import datetime, timezone
-from typing import List, Optional
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
 
 import redis.asyncio as aioredis
 
 logger = logging.getLogger(__name__)
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_SWEEP_USE_LUA = os.getenv("REDIS_SWEEP_USE_LUA", "true").lower() in ("1", "true", "yes")
+REDIS_SWEEP_BATCH = int(os.getenv("REDIS_SWEEP_BATCH", "1000"))
+
+HEARTBEAT_INDEX_KEY = "nodes:heartbeats"
+PEER_INVALIDATION_CHANNEL = "peers:invalidate"
 
 _redis_pool: Optional[aioredis.Redis] = None
 
@@ -51,15 +69,90 @@ async def update_node_state(
     viewer_count: int,
 ) -> None:
     """Update a node's state in the stream's Redis hash."""
+    pipe = r.pipeline(transaction=False)
+    stage_node_state(pipe, stream_id, node_id, vpn_ip, trust_score, capacity_pct, viewer_count)
+    await pipe.execute()
+
+
+# ---------------------------------------------------------------------------
+# Node state encoding
+# ---------------------------------------------------------------------------
+
+NODE_STATE_VERSION = "2"
+_NODE_STATE_PREFIX = NODE_STATE_VERSION + "|"
+
+
+def encode_node_state(
+    vpn_ip: str,
+    trust_score: float,
+    capacity_pct: int,
+    viewer_count: int,
+    last_heartbeat: float,
+) -> str:
+    """
+    Encode node state as ``2|vpn_ip|trust|capacity|viewers|epoch``.
+
+    A delimited string rather than packed binary because the shared pool runs
+    with ``decode_responses=True``; none of the fields can contain ``|``.
+    """
+    return (
+        f"{_NODE_STATE_PREFIX}{vpn_ip or ''}|{trust_score:g}|{int(capacity_pct)}"
+        f"|{int(viewer_count)}|{last_heartbeat:.3f}"
+    )
+
+
+def decode_node_state(raw: str) -> dict:
+    """
+    Decode a node state value written by either encoding.
+
+    ``last_heartbeat`` is returned as epoch seconds.  Raises ValueError for
+    unreadable payloads.
+    """
+    if raw.startswith(_NODE_STATE_PREFIX):
+        parts = raw.split("|")
+        if len(parts) != 6:
+            raise ValueError(f"expected 6 fields, got {len(parts)}")
+        return {
+            "vpn_ip": parts[1],
+            "trust_score": float(parts[2]),
+            "capacity_pct": int(parts[3]),
+            "viewer_count": int(parts[4]),
+            "last_heartbeat": float(parts[5]),
+        }
+    # Legacy v1: JSON with an ISO-8601 timestamp
+    try:
+        data = json.loads(raw)
+        data["last_heartbeat"] = datetime.fromisoformat(data["last_heartbeat"]).timestamp()
+    except (json.JSONDecodeError, TypeError, KeyError) as exc:
+        raise ValueError(str(exc)) from exc
+    return data
+
+
+def stage_node_state(
+    pipe,
+    stream_id: str,
+    node_id: str,
+    vpn_ip: str,
+    trust_score: float,
+    capacity_pct: int,
+    viewer_count: int,
+) -> None:
+    """Queue a node state update on a Redis pipeline (sent on ``execute()``)."""
     key = f"stream:{stream_id}:nodes"
-    value = json.dumps({
-        "vpn_ip": vpn_ip or "",
-        "trust_score": trust_score,
-        "capacity_pct": capacity_pct,
-        "viewer_count": viewer_count,
-        "last_heartbeat": datetime.now(timezone.utc).isoformat(),
-    })
-    await r.hset(key, node_id, value)
+    now = time.time()
+    value = encode_node_state(vpn_ip, trust_score, capacity_pct, viewer_count, now)
+    pipe.hset(key, node_id, value)
+    pipe.zadd(HEARTBEAT_INDEX_KEY, {heartbeat_member(stream_id, node_id): now})
+
+
+def heartbeat_member(stream_id: str, node_id: str) -> str:
+    """Member name for a node in the heartbeat index."""
+    return f"{stream_id}|{node_id}"
+
+
+def _split_member(member: str) -> Tuple[str, str]:
+    stream_id, _, node_id = member.partition("|")
+    return stream_id, node_id
 
 
 async def get_stream_nodes(r: aioredis.Redis, stream_id: str) -> List[dict]:
@@ -69,44 +162,169 @@ async def get_stream_nodes(r: aioredis.Redis, stream_id: str) -> List[dict]:
     nodes = []
     for node_id, data_str in raw.items():
         try:
-            data = json.loads(data_str)
+            data = decode_node_state(data_str)
             data["node_id"] = node_id
             nodes.append(data)
-        except (json.JSONDecodeError, TypeError):
+        except ValueError:
             logger.warning("Corrupt Redis entry for node %s in stream %s", node_id, stream_id)
     return nodes
 
 
 async def remove_node(r: aioredis.Redis, stream_id: str, node_id: str) -> None:
     """Remove a node from the stream's Redis hash."""
-    key = f"stream:{stream_id}:nodes"
-    await r.hdel(key, node_id)
+    pipe = r.pipeline(transaction=False)
+    pipe.hdel(f"stream:{stream_id}:nodes", node_id)
+    pipe.hdel(f"stream:{stream_id}:load", node_id)
+    pipe.zrem(HEARTBEAT_INDEX_KEY, heartbeat_member(stream_id, node_id))
+    stage_peer_invalidation(pipe, [stream_id])
+    await pipe.execute()
 
 
-async def cleanup_stale_nodes(r: aioredis.Redis, max_age_seconds: int = 90) -> int:
+def stage_peer_invalidation(pipe, stream_ids: Iterable[str]) -> None:
+    """Queue peer-cache invalidations for *stream_ids* (see peer_cache.py)."""
+    for stream_id in stream_ids:
+        pipe.publish(PEER_INVALIDATION_CHANNEL, stream_id)
+
+
+# ---------------------------------------------------------------------------
+# Stale node sweeper
+# ---------------------------------------------------------------------------
+
+# Removes up to ARGV[2] index members scored at or below ARGV[1] together with
+# their stream hash fields, atomically, so a heartbeat landing mid-sweep is
+# never deleted.  Stream hash keys are derived from the member name, which
+# assumes a single (non-cluster) Redis as used by the coordinator.
+_SWEEP_LUA = """
+local stale = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, member in ipairs(stale) do
+  local sep = string.find(member, '|', 1, true)
+  if sep then
+    local prefix = 'stream:' .. string.sub(member, 1, sep - 1)
+    local node_id = string.sub(member, sep + 1)
+    redis.call('HDEL', prefix .. ':nodes', node_id)
+    redis.call('HDEL', prefix .. ':load', node_id)
+  end
+  redis.call('ZREM', KEYS[1], member)
+end
+return stale
+"""
+
+_sweep_script = None
+_index_backfilled = False
+
+
+async def _sweep_batch_lua(r: aioredis.Redis, cutoff: float, batch: int) -> List[str]:
+    global _sweep_script
+    if _sweep_script is None:
+        _sweep_script = r.register_script(_SWEEP_LUA)
+    return list(await _sweep_script(keys=[HEARTBEAT_INDEX_KEY], args=[cutoff, batch]))
+
+
+async def _sweep_batch_pipelined(r: aioredis.Redis, cutoff: float, batch: int) -> List[str]:
+    stale = await r.zrangebyscore(HEARTBEAT_INDEX_KEY, "-inf", cutoff, start=0, num=batch)
+    if not stale:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for member in stale:
+        stream_id, node_id = _split_member(member)
+        pipe.hdel(f"stream:{stream_id}:nodes", node_id)
+        pipe.hdel(f"stream:{stream_id}:load", node_id)
+    # ZREM with the original score bound is not available, so a node that
+    # heartbeats between the read and this pipeline is dropped until its next
+    # heartbeat re-adds it (a few seconds); use the Lua path to avoid that.
+    pipe.zrem(HEARTBEAT_INDEX_KEY, *stale)
+    await pipe.execute()
+    return stale
+
+
+# Rewrites a hash field only if it still holds the value that was read, so a
+# heartbeat written meanwhile is never replaced by the converted older state.
+_REWRITE_IF_UNCHANGED_LUA = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+  redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+  return 1
+end
+return 0
+"""
+
+_rewrite_script = None
+
+
+async def backfill_heartbeat_index(r: aioredis.Redis) -> int:
     """
-    Scan all stream node hashes and remove entries whose last_heartbeat
-    is older than *max_age_seconds*.  Returns the number of removed entries.
+    Index node hash entries written before the heartbeat index existed, and
+    rewrite legacy JSON values in the current encoding.
+
+    Entries with an unparseable payload are indexed with score 0 so the next
+    sweep removes them.  Returns the number of index members added.
     """
-    removed = 0
-    now = datetime.now(timezone.utc)
+    global _rewrite_script
+    if _rewrite_script is None:
+        _rewrite_script = r.register_script(_REWRITE_IF_UNCHANGED_LUA)
+
+    added = 0
+    rewritten = 0
     cursor = "0"
     while True:
         cursor, keys = await r.scan(cursor=cursor, match="stream:*:nodes", count=100)
         for key in keys:
+            stream_id = key[len("stream:"):-len(":nodes")]
             entries = await r.hgetall(key)
+            scores = {}
             for node_id, data_str in entries.items():
+                member = heartbeat_member(stream_id, node_id)
                 try:
-                    data = json.loads(data_str)
-                    last_hb = datetime.fromisoformat(data["last_heartbeat"])
-                    if (now - last_hb).total_seconds() > max_age_seconds:
-                        await r.hdel(key, node_id)
-                        removed += 1
-                        logger.info("Removed stale node %s from %s", node_id, key)
-                except Exception:
-                    # Corrupt entry — remove it
-                    await r.hdel(key, node_id)
-                    removed += 1
+                    data = decode_node_state(data_str)
+                except ValueError:
+                    scores[member] = 0
+                    continue
+                scores[member] = data["last_heartbeat"]
+                if not data_str.startswith(_NODE_STATE_PREFIX):
+                    encoded = encode_node_state(
+                        data.get("vpn_ip") or "",
+                        data.get("trust_score") or 0,
+                        data.get("capacity_pct") or 0,
+                        data.get("viewer_count") or 0,
+                        data["last_heartbeat"],
+                    )
+                    rewritten += await _rewrite_script(keys=[key], args=[node_id, data_str, encoded])
+            if scores:
+                # NX: never overwrite a fresher score written by a live heartbeat
+                added += await r.zadd(HEARTBEAT_INDEX_KEY, scores, nx=True)
         if cursor == "0" or cursor == 0:
             break
+    if rewritten:
+        logger.info("Rewrote %d legacy JSON node entries", rewritten)
+    return added
+
+
+async def cleanup_stale_nodes(r: aioredis.Redis, max_age_seconds: int = 90) -> int:
+    """
+    Remove node entries whose last heartbeat is older than *max_age_seconds*,
+    using the heartbeat index.  Returns the number of removed entries.
+    """
+    global _index_backfilled
+    if not _index_backfilled:
+        indexed = await backfill_heartbeat_index(r)
+        if indexed:
+            logger.info("Backfilled %d legacy entries into %s", indexed, HEARTBEAT_INDEX_KEY)
+        _index_backfilled = True
+
+    cutoff = time.time() - max_age_seconds
+    sweep = _sweep_batch_lua if REDIS_SWEEP_USE_LUA else _sweep_batch_pipelined
+    removed = 0
+    streams = set()
+    while True:
+        stale = await sweep(r, cutoff, REDIS_SWEEP_BATCH)
+        removed += len(stale)
+        for member in stale:
+            logger.info("Removed stale node %s", member)
+            streams.add(_split_member(member)[0])
+        if len(stale) < REDIS_SWEEP_BATCH:
+            break
+
+    if streams:
+        pipe = r.pipeline(transaction=False)
+        stage_peer_invalidation(pipe, streams)
+        await pipe.execute()
     return removed
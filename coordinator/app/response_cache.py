@@ -0,0 +1,56 @@
+"""
+Short-lived JSON response cache in Redis for dashboard endpoints.
+
+Dashboards poll the same per-node economics every few seconds; responses
+are stored as JSON under ``cache:{name}:{key}`` with a TTL so repeat polls
+(from any coordinator process) skip the database.  Entries are not
+invalidated on write — a response may be up to one TTL stale.
+
+The cache fails open: if Redis is unavailable the endpoint is computed as
+if nothing was cached.
+
+Configurable via environment variables:
+  NODE_ECONOMICS_CACHE_TTL_SECONDS  (default 15, 0 disables caching)
+"""
+
+import json
+import logging
+import os
+from typing import Any, Optional
+
+from .redis_state import get_redis
+
+logger = logging.getLogger(__name__)
+
+NODE_ECONOMICS_CACHE_TTL_SECONDS = int(os.getenv("NODE_ECONOMICS_CACHE_TTL_SECONDS", "15"))
+
+
+def cache_key(name: str, key: str) -> str:
+    return f"cache:{name}:{key}"
+
+
+async def get_cached(name: str, key: str) -> Optional[Any]:
+    """Decoded cached payload, or None on a miss or when Redis is unavailable."""
+    try:
+        r = await get_redis()
+        raw = await r.get(cache_key(name, key))
+    except Exception:
+        logger.debug("Response cache read failed for %s", cache_key(name, key), exc_info=True)
+        return None
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+async def set_cached(name: str, key: str, payload: Any, ttl: int) -> None:
+    """Store *payload* (JSON-serialisable) for *ttl* seconds; no-op if ttl <= 0."""
+    if ttl <= 0:
+        return
+    try:
+        r = await get_redis()
+        await r.set(cache_key(name, key), json.dumps(payload), ex=ttl)
+    except Exception:
+        logger.debug("Response cache write failed for %s", cache_key(name, key), exc_info=True)
@@ -206,6 +206,7 @@ class EconomicsDashboard(BaseModel):
     qualified_earners_count: int
     top_earners: List[dict]
     suspicious_activity: List[dict]
+    snapshot: Optional[dict] = None  # refreshed_at / age_seconds of the data served
 
 class NodeEconomics(BaseModel):
     node_id: str
@@ -0,0 +1,183 @@
+"""
+In-memory HLS object cache for the proxy.
+
+Playlists and media segments fetched from a friend node (or SRS) are kept in
+a byte-bounded LRU so concurrent viewers of the same stream share one
+upstream fetch.  Concurrent misses for the same key are coalesced: one
+request fetches, the others wait for its result (or its error).  If the
+fetching request is cancelled (its viewer disconnected) the waiters retry,
+one of them taking over the load.
+
+Keys are (stream_id, upstream, path) — each node packages its own
+segments, so a playlist from one node is never served to viewers of another.
+
+Configurable via environment variables:
+  SEGMENT_CACHE_MAX_BYTES         (default 268435456, 0 disables caching)
+  SEGMENT_CACHE_MAX_OBJECT_BYTES  (default 8388608)
+  SEGMENT_CACHE_PLAYLIST_TTL      (default 1.0 seconds, .m3u8)
+  SEGMENT_CACHE_SEGMENT_TTL       (default 60 seconds, .ts/.m4s/.mp4/.aac)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_CACHE_MAX_BYTES = int(os.getenv("SEGMENT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SEGMENT_CACHE_MAX_OBJECT_BYTES = int(os.getenv("SEGMENT_CACHE_MAX_OBJECT_BYTES", str(8 * 1024 * 1024)))
+SEGMENT_CACHE_PLAYLIST_TTL = float(os.getenv("SEGMENT_CACHE_PLAYLIST_TTL", "1.0"))
+SEGMENT_CACHE_SEGMENT_TTL = float(os.getenv("SEGMENT_CACHE_SEGMENT_TTL", "60"))
+
+_SEGMENT_SUFFIXES = (".ts", ".m4s", ".mp4", ".aac")
+
+CacheKey = Tuple[str, str, str]
+
+# Handed to coalesced waiters when the loading request was cancelled
+_RETRY = object()
+
+
+@dataclass
+class CachedObject:
+    body: bytes
+    media_type: str
+    headers: Dict[str, str]
+    expires_at: float = 0.0
+
+
+@dataclass
+class SegmentCacheMetrics:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    uncacheable: int = 0
+    evictions: int = 0
+
+
+def ttl_for_path(path: str) -> Optional[float]:
+    """Cache lifetime for an HLS path, or None if it shouldn't be cached."""
+    lowered = path.lower()
+    if lowered.endswith(".m3u8"):
+        return SEGMENT_CACHE_PLAYLIST_TTL
+    if lowered.endswith(_SEGMENT_SUFFIXES):
+        return SEGMENT_CACHE_SEGMENT_TTL
+    return None
+
+
+class SegmentCache:
+    """Byte-bounded LRU with per-entry TTL and single-flight loads."""
+
+    def __init__(
+        self,
+        max_bytes: int = SEGMENT_CACHE_MAX_BYTES,
+        max_object_bytes: int = SEGMENT_CACHE_MAX_OBJECT_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.max_object_bytes = min(max_object_bytes, max_bytes)
+        self.metrics = SegmentCacheMetrics()
+        self._entries: "OrderedDict[CacheKey, CachedObject]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: CacheKey) -> Optional[CachedObject]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: CacheKey, entry: CachedObject, ttl: float) -> None:
+        size = len(entry.body)
+        if size > self.max_object_bytes:
+            return
+        entry.expires_at = time.monotonic() + ttl
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.metrics.evictions += 1
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+    async def get_or_load(
+        self,
+        key: CacheKey,
+        ttl: float,
+        loader: Callable[[], Awaitable[Optional[CachedObject]]],
+    ) -> Optional[CachedObject]:
+        """
+        Return a cached object, loading it once for all concurrent callers.
+
+        *loader* returns None when the upstream response can't be cached
+        (error status, oversized body); waiters then get None too and make
+        their own request.  Loader exceptions propagate to every waiter,
+        except cancellation of the loading caller: waiters then retry.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            self.metrics.hits += 1
+            return entry
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.metrics.coalesced += 1
+            result = await asyncio.shield(pending)
+            if result is _RETRY:
+                return await self.get_or_load(key, ttl, loader)
+            return result
+
+        self.metrics.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            entry = await loader()
+            if entry is None:
+                self.metrics.uncacheable += 1
+            else:
+                self.put(key, entry, ttl)
+            future.set_result(entry)
+            return entry
+        except asyncio.CancelledError:
+            future.set_result(_RETRY)
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # mark retrieved when nobody is waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        served = self.metrics.hits + self.metrics.coalesced
+        lookups = served + self.metrics.misses
+        return {
+            **asdict(self.metrics),
+            "hit_ratio": round(served / lookups, 4) if lookups else None,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+# Module-level singleton used by the HLS proxy
+segment_cache = SegmentCache()
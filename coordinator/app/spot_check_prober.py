@@ -1,6 +1,8 @@
 import asyncio
+import os
 import random
 import logging
+import shutil
 import subprocess
 import json
 from datetime import datetime, timedelta, timezone
@@ -8,14 +10,22 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_
 
 from . import models, database
+from .rtmp_probe import RtmpProtocolError, probe_rtmp
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# "native" probes in-process (see rtmp_probe.py) and falls back to ffprobe
+# only when the node speaks RTMP the native client doesn't understand;
+# "ffprobe" always forks ffprobe as before
+SPOT_CHECK_PROBE_MODE = os.getenv("SPOT_CHECK_PROBE_MODE", "native").lower()
+FFPROBE_TIMEOUT_SECONDS = 15.0
+
 class SpotCheckProber:
-    def __init__(self, check_interval_min: int = 5, check_interval_max: int = 15):
+    def __init__(self, check_interval_min: int = 5, check_interval_max: int = 15, probe_mode: str = SPOT_CHECK_PROBE_MODE):
         self.check_interval_min = check_interval_min * 60  # Convert to seconds
         self.check_interval_max = check_interval_max * 60
+        self.probe_mode = probe_mode
     
     async def run_spot_checks(self):
         """Main spot check loop with random intervals"""
@@ -106,51 +116,68 @@ class SpotCheckProber:
             
             logger.debug(f"Testing RTMP connection to: {rtmp_url}")
             
-            # Use ffprobe to test the RTMP stream
-            # This will attempt to connect and read stream metadata
-            cmd = [
-                "ffprobe",
-                "-v", "quiet",
-                "-print_format", "json",
-                "-show_streams",
-                "-timeout", "10000000",  # 10 second timeout in microseconds
-                rtmp_url
-            ]
-            
-            # Run ffprobe with timeout
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            if self.probe_mode == "ffprobe":
+                return await self._ffprobe_rtmp(rtmp_url)
             
             try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=15.0)
-                
-                if process.returncode == 0:
-                    # Successfully connected and got stream info
-                    try:
-                        stream_info = json.loads(stdout.decode())
-                        streams = stream_info.get("streams", [])
-                        if streams:
-                            logger.debug(f"Successfully connected to {rtmp_url}, found {len(streams)} streams")
-                            return True, None
-                        else:
-                            return False, "No streams found in RTMP connection"
-                    except json.JSONDecodeError:
-                        return False, "Invalid JSON response from ffprobe"
-                else:
-                    error_msg = stderr.decode().strip()
-                    return False, f"ffprobe failed (code {process.returncode}): {error_msg}"
-                    
-            except asyncio.TimeoutError:
-                process.kill()
-                await process.wait()
-                return False, "Connection timeout"
+                result = await probe_rtmp(rtmp_url)
+            except RtmpProtocolError as e:
+                # Not evidence of fraud by itself — let ffprobe decide if we can
+                if shutil.which("ffprobe") is None:
+                    return False, f"RTMP protocol error: {e}"
+                logger.info(f"Native RTMP probe of {rtmp_url} failed ({e}), retrying with ffprobe")
+                return await self._ffprobe_rtmp(rtmp_url)
+            
+            if result.success:
+                logger.debug(f"Received {result.first_media} from {rtmp_url} in {result.elapsed_ms} ms")
+            return result.success, result.error
                 
         except Exception as e:
             return False, f"Spot check error: {str(e)}"
     
+    async def _ffprobe_rtmp(self, rtmp_url: str) -> tuple[bool, str]:
+        """Probe the stream with an ffprobe subprocess (fallback mode)."""
+        # This will attempt to connect and read stream metadata
+        cmd = [
+            "ffprobe",
+            "-v", "quiet",
+            "-print_format", "json",
+            "-show_streams",
+            "-timeout", "10000000",  # 10 second timeout in microseconds
+            rtmp_url
+        ]
+        
+        # Run ffprobe with timeout
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=FFPROBE_TIMEOUT_SECONDS)
+            
+            if process.returncode == 0:
+                # Successfully connected and got stream info
+                try:
+                    stream_info = json.loads(stdout.decode())
+                    streams = stream_info.get("streams", [])
+                    if streams:
+                        logger.debug(f"Successfully connected to {rtmp_url}, found {len(streams)} streams")
+                        return True, None
+                    else:
+                        return False, "No streams found in RTMP connection"
+                except json.JSONDecodeError:
+                    return False, "Invalid JSON response from ffprobe"
+            else:
+                error_msg = stderr.decode().strip()
+                return False, f"ffprobe failed (code {process.returncode}): {error_msg}"
+                
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return False, "Connection timeout"
+    
     def _extract_ip_from_stats_url(self, stats_url: str) -> str:
         """Extract IP address from stats URL like http://192.168.1.100:8080/stats.json"""
         try:
@@ -1,20 +1,142 @@
+"""
+Stats collector — polls every active node's stats endpoint once per round.
+
+Each round:
+  - loads the active nodes once and releases the DB session while polling;
+  - polls them with at most STATS_COLLECTOR_CONCURRENCY requests in flight
+    and STATS_COLLECTOR_PER_HOST_LIMIT per stats host;
+  - spreads the requests over STATS_COLLECTOR_SPREAD_FRACTION of the poll
+    interval, each node at a stable offset derived from its node_id, so
+    load is smooth and each node is still polled about once per interval;
+  - buffers the results and writes them with one bulk insert.
+
+Probe rows store the fields validation uses as typed columns
+(stream_present, connection_count, connection_state, bitrate_kbps — see
+summarize_stats).  The raw stats.json payload is kept in response_data
+only for failed polls and for a STATS_COLLECTOR_RAW_SAMPLE_RATE sample of
+successful ones.
+
+Round duration, node count, failures and flush time are kept in
+StatsCollector.metrics and logged per round.
+
+Configurable via environment variables:
+  STATS_COLLECTOR_CONCURRENCY      (default 50)
+  STATS_COLLECTOR_PER_HOST_LIMIT   (default 2)
+  STATS_COLLECTOR_SPREAD_FRACTION  (default 0.5, 0 polls all nodes at once)
+  STATS_COLLECTOR_RAW_SAMPLE_RATE  (default 0.01, 1 keeps every payload)
+"""
+
 import asyncio
 import httpx
 import json
 import logging
+import os
+import random
+import time
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
-from typing import Dict, Any
+from typing import Dict, Any, List, NamedTuple, Optional
+from urllib.parse import urlsplit
 
 from . import models, database
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+STATS_COLLECTOR_CONCURRENCY = int(os.getenv("STATS_COLLECTOR_CONCURRENCY", "50"))
+STATS_COLLECTOR_PER_HOST_LIMIT = int(os.getenv("STATS_COLLECTOR_PER_HOST_LIMIT", "2"))
+STATS_COLLECTOR_SPREAD_FRACTION = float(os.getenv("STATS_COLLECTOR_SPREAD_FRACTION", "0.5"))
+STATS_COLLECTOR_RAW_SAMPLE_RATE = float(os.getenv("STATS_COLLECTOR_RAW_SAMPLE_RATE", "0.01"))
+
+HEALTHY_STATES = ("publishing", "streaming", "connected")
+CONNECTION_STATE_MAX_LENGTH = 32
+
+
+class NodeTarget(NamedTuple):
+    node_id: str
+    stream_id: str
+    stats_url: str
+
+
+@dataclass
+class StatsCollectorMetrics:
+    rounds: int = 0
+    last_round_seconds: float = 0.0
+    max_round_seconds: float = 0.0
+    last_round_nodes: int = 0
+    last_round_failures: int = 0
+    last_flush_seconds: float = 0.0
+
+
+def _as_int(value: Any) -> Optional[int]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return int(value)
+
+
+def summarize_stats(stats_data: Any, expected_stream_id: str) -> dict:
+    """
+    Typed probe columns from a node's stats.json (elnormous/rtmp_relay
+    structure) for the streams matching *expected_stream_id*:
+
+      stream_present    — a matching stream is listed
+      connection_count  — connections across the matching streams
+      connection_state  — the first healthy connection state, else the
+                          first state seen (lower-cased)
+      bitrate_kbps      — the matching stream's ``bitrate_kbps`` /
+                          ``bitrate`` field when the relay reports one
+
+    Malformed payloads summarise as "no stream".
+    """
+    summary = {"stream_present": False, "connection_count": 0, "connection_state": None, "bitrate_kbps": None}
+    try:
+        for stream in stats_data.get("streams", None) or []:
+            if expected_stream_id not in stream.get("stream_name", ""):
+                continue
+            summary["stream_present"] = True
+            if summary["bitrate_kbps"] is None:
+                summary["bitrate_kbps"] = _as_int(stream.get("bitrate_kbps", stream.get("bitrate")))
+            connections = stream.get("connections", []) or []
+            summary["connection_count"] += len(connections)
+            for conn in connections:
+                state = str(conn.get("state", "")).lower()[:CONNECTION_STATE_MAX_LENGTH] or None
+                current = summary["connection_state"]
+                if current is None or (state in HEALTHY_STATES and current not in HEALTHY_STATES):
+                    summary["connection_state"] = state
+    except Exception as e:
+        logger.error(f"Error summarising stats data: {e}")
+        return {"stream_present": False, "connection_count": 0, "connection_state": None, "bitrate_kbps": None}
+    return summary
+
+
+def node_offset(node_id: str, spread: float) -> float:
+    """Stable delay in [0, spread) for *node_id* within a round."""
+    return (zlib.crc32(node_id.encode()) / 2**32) * spread
+
+
 class StatsCollector:
-    def __init__(self, poll_interval: int = 60):
+    def __init__(
+        self,
+        poll_interval: int = 60,
+        concurrency: int = STATS_COLLECTOR_CONCURRENCY,
+        per_host_limit: int = STATS_COLLECTOR_PER_HOST_LIMIT,
+        spread_fraction: float = STATS_COLLECTOR_SPREAD_FRACTION,
+        raw_sample_rate: float = STATS_COLLECTOR_RAW_SAMPLE_RATE,
+    ):
         self.poll_interval = poll_interval
-        self.client = httpx.AsyncClient(timeout=10.0)
+        self.concurrency = concurrency
+        self.per_host_limit = per_host_limit
+        self.spread = poll_interval * spread_fraction
+        self.raw_sample_rate = raw_sample_rate
+        self.metrics = StatsCollectorMetrics()
+        self.client = httpx.AsyncClient(
+            timeout=10.0,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
     
     async def collect_stats(self):
         """Main collection loop"""
@@ -22,49 +144,102 @@ class StatsCollector:
         
         while True:
             try:
+                started = time.monotonic()
                 await self._collect_round()
-                await asyncio.sleep(self.poll_interval)
+                # Keep the period at poll_interval however long the round took
+                await asyncio.sleep(max(0.0, self.poll_interval - (time.monotonic() - started)))
             except Exception as e:
                 logger.error(f"Error in stats collection: {e}")
                 await asyncio.sleep(5)  # Short retry delay
     
     async def _collect_round(self):
         """Perform one round of stats collection"""
+        started = time.monotonic()
         db = database.SessionLocal()
         try:
             # Get all active nodes
-            active_nodes = db.query(models.Node).filter(
-                models.Node.status == "active"
-            ).all()
-            
-            logger.info(f"Collecting stats from {len(active_nodes)} active nodes")
-            
-            # Collect stats from all nodes concurrently
-            tasks = [self._collect_node_stats(node, db) for node in active_nodes]
-            await asyncio.gather(*tasks, return_exceptions=True)
-            
+            active_nodes = [
+                NodeTarget(*row)
+                for row in db.execute(
+                    select(models.Node.node_id, models.Node.stream_id, models.Node.stats_url)
+                    .where(models.Node.status == "active")
+                ).all()
+            ]
+        finally:
+            db.close()
+
+        logger.info(f"Collecting stats from {len(active_nodes)} active nodes")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        host_limits: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(self.per_host_limit))
+
+        async def poll(node: NodeTarget) -> dict:
+            if self.spread > 0:
+                await asyncio.sleep(node_offset(node.node_id, self.spread))
+            async with semaphore, host_limits[urlsplit(node.stats_url).netloc]:
+                return await self._probe_node(node)
+
+        results = await asyncio.gather(*(poll(node) for node in active_nodes), return_exceptions=True)
+        rows = [r for r in results if isinstance(r, dict)]
+        for node, result in zip(active_nodes, results):
+            if not isinstance(result, dict):
+                logger.error(f"✗ Node {node.node_id} stats task failed: {result!r}")
+
+        flush_started = time.monotonic()
+        db = database.SessionLocal()
+        try:
+            self._flush_results(db, rows)
         finally:
             db.close()
+
+        elapsed = time.monotonic() - started
+        m = self.metrics
+        m.rounds += 1
+        m.last_round_seconds = elapsed
+        m.max_round_seconds = max(m.max_round_seconds, elapsed)
+        m.last_round_nodes = len(active_nodes)
+        m.last_round_failures = sum(1 for r in rows if not r["success"]) + len(results) - len(rows)
+        m.last_flush_seconds = time.monotonic() - flush_started
+        logger.info(
+            f"Stats round {m.rounds}: {m.last_round_nodes} nodes, {m.last_round_failures} failed, "
+            f"{elapsed:.2f}s (flush {m.last_flush_seconds * 1000:.0f} ms)"
+        )
+
+    def _flush_results(self, db: Session, rows: List[dict]) -> None:
+        """Write a round's probe results in one bulk insert."""
+        if not rows:
+            return
+        db.execute(insert(models.ProbeResult), rows)
+        db.commit()
     
-    async def _collect_node_stats(self, node: models.Node, db: Session):
-        """Collect stats from a single node"""
+    async def _probe_node(self, node: NodeTarget) -> dict:
+        """Poll a single node's stats endpoint; returns a probe_results row."""
+        probe_result = {
+            "stream_id": node.stream_id,
+            "node_id": node.node_id,
+            "probe_type": "stats_poll",
+            "success": False,
+            "response_data": None,
+            "error_message": None,
+            "stream_present": None,
+            "connection_count": None,
+            "connection_state": None,
+            "bitrate_kbps": None,
+        }
         try:
             # Make request to node's stats endpoint
             response = await self.client.get(node.stats_url)
             
             if response.status_code == 200:
                 stats_data = response.json()
-                success = self._validate_stats_data(stats_data, node.stream_id)
+                summary = summarize_stats(stats_data, node.stream_id)
+                success = summary["connection_state"] in HEALTHY_STATES
                 
-                # Store successful probe result
-                probe_result = models.ProbeResult(
-                    stream_id=node.stream_id,
-                    node_id=node.node_id,
-                    probe_type="stats_poll",
-                    success=success,
-                    response_data=json.dumps(stats_data),
-                    probe_timestamp=datetime.now(timezone.utc)
-                )
+                probe_result.update(summary)
+                probe_result["success"] = success
+                # Raw payload only where someone will look at it
+                if not success or random.random() < self.raw_sample_rate:
+                    probe_result["response_data"] = json.dumps(stats_data)
                 
                 if success:
                     logger.debug(f"✓ Node {node.node_id} stats collected successfully")
@@ -72,62 +247,22 @@ class StatsCollector:
                     logger.warning(f"⚠ Node {node.node_id} stats invalid - no active stream found")
                     
             else:
-                # Store failed probe result
-                probe_result = models.ProbeResult(
-                    stream_id=node.stream_id,
-                    node_id=node.node_id,
-                    probe_type="stats_poll",
-                    success=False,
-                    error_message=f"HTTP {response.status_code}: {response.text}",
-                    probe_timestamp=datetime.now(timezone.utc)
-                )
+                probe_result["error_message"] = f"HTTP {response.status_code}: {response.text}"
                 logger.warning(f"✗ Node {node.node_id} stats collection failed: HTTP {response.status_code}")
                 
         except Exception as e:
-            # Store error probe result
-            probe_result = models.ProbeResult(
-                stream_id=node.stream_id,
-                node_id=node.node_id,
-                probe_type="stats_poll",
-                success=False,
-                error_message=str(e),
-                probe_timestamp=datetime.now(timezone.utc)
-            )
+            probe_result["error_message"] = str(e)
             logger.error(f"✗ Node {node.node_id} stats collection error: {e}")
         
-        # Save probe result to database
-        db.add(probe_result)
-        db.commit()
+        probe_result["probe_timestamp"] = datetime.now(timezone.utc)
+        return probe_result
     
     def _validate_stats_data(self, stats_data: Dict[Any, Any], expected_stream_id: str) -> bool:
         """
         Validate that the stats data shows the node is actively relaying the expected stream.
         Based on our research of elnormous/rtmp_relay stats.json structure.
         """
-        try:
-            # Check if there are active streams
-            streams = stats_data.get("streams", [])
-            if not streams:
-                return False
-            
-            # Look for our stream in the active streams
-            for stream in streams:
-                stream_name = stream.get("stream_name", "")
-                connections = stream.get("connections", [])
-                
-                # Check if this matches our expected stream and has active connections
-                if expected_stream_id in stream_name and len(connections) > 0:
-                    # Check if any connection is in a healthy state
-                    for conn in connections:
-                        state = conn.get("state", "").lower()
-                        if state in ["publishing", "streaming", "connected"]:
-                            return True
-            
-            return False
-            
-        except Exception as e:
-            logger.error(f"Error validating stats data: {e}")
-            return False
+        return summarize_stats(stats_data, expected_stream_id)["connection_state"] in HEALTHY_STATES
     
     async def cleanup_old_results(self, days_to_keep: int = 7):
         """Clean up old probe results to prevent database bloat"""
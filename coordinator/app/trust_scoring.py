@@ -1,49 +1,57 @@
 """
 Trust score calculation and consequence enforcement.
 Tasks 5.2, 5.3 — Req 13.4–13.10, Design §16
+
+Scores are read from node_trust_daily, per-node counters of total and
+verified reports per UTC day, so a score is a sum over at most 30 small
+rows instead of two COUNTs over the ledger.  Counters are maintained:
+  - on ORM flushes that insert, delete or re-verify BandwidthLedger rows
+    (see _count_ledger_changes)
+  - by the set-based verification pass (bandwidth_verification.py)
+rebuild_trust_counters() recomputes them from the ledger and is run daily
+as a consistency check.
 """
 
 import logging
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
 
+from sqlalchemy import Date, cast, delete, event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
 from . import models
 
 logger = logging.getLogger(__name__)
 
+TRUST_WINDOW_DAYS = 30
+
+
+def _window_start(now: Optional[datetime] = None) -> date:
+    """First UTC day bucket inside the rolling window (today included)."""
+    now = now or datetime.now(timezone.utc)
+    return (now - timedelta(days=TRUST_WINDOW_DAYS - 1)).date()
+
 
 def calculate_trust_score(node_id: str, db: Session) -> Decimal:
     """
-    Trust score = verified_reports / total_reports over a rolling 30-day window.
+    Trust score = verified_reports / total_reports over the last 30 UTC days.
     Returns 0.75 default for nodes with fewer than 5 reports.
     """
-    cutoff = datetime.now(timezone.utc) - timedelta(days=30)
-
-    total = (
-        db.query(func.count(models.BandwidthLedger.id))
-        .filter(
-            models.BandwidthLedger.reporting_node_id == node_id,
-            models.BandwidthLedger.report_timestamp > cutoff,
+    daily = models.NodeTrustDaily
+    total, verified = (
+        db.query(
+            func.coalesce(func.sum(daily.total_reports), 0),
+            func.coalesce(func.sum(daily.verified_reports), 0),
         )
-        .scalar()
-    ) or 0
+        .filter(daily.node_id == node_id, daily.day >= _window_start())
+        .one()
+    )
 
     if total < 5:
         return Decimal("0.75")
 
-    verified = (
-        db.query(func.count(models.BandwidthLedger.id))
-        .filter(
-            models.BandwidthLedger.reporting_node_id == node_id,
-            models.BandwidthLedger.report_timestamp > cutoff,
-            models.BandwidthLedger.is_verified == True,  # noqa: E712
-        )
-        .scalar()
-    ) or 0
-
     score = Decimal(str(verified / total)).quantize(Decimal("0.01"))
     return score
 
@@ -94,3 +102,123 @@ def apply_trust_consequences(node_id: str, trust_score: Decimal, db: Session) ->
                 node_id,
                 trust_score,
             )
+
+
+# ---------------------------------------------------------------------------
+# Daily counters
+# ---------------------------------------------------------------------------
+
+CounterDeltas = Dict[Tuple[str, date], Tuple[int, int]]
+
+
+def upsert_trust_counters(db_or_conn, deltas: CounterDeltas) -> None:
+    """
+    Add (total, verified) deltas keyed by (node_id, day) to node_trust_daily
+    in one statement.
+    """
+    rows = [
+        {"node_id": node_id, "day": day, "total_reports": total, "verified_reports": verified}
+        for (node_id, day), (total, verified) in sorted(deltas.items())
+        if total or verified
+    ]
+    if not rows:
+        return
+    table = models.NodeTrustDaily.__table__
+    stmt = pg_insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_node_trust_daily_node_day",
+        set_={
+            "total_reports": table.c.total_reports + stmt.excluded.total_reports,
+            "verified_reports": table.c.verified_reports + stmt.excluded.verified_reports,
+        },
+    )
+    db_or_conn.execute(stmt)
+
+
+def _report_day(report: models.BandwidthLedger) -> date:
+    ts = report.report_timestamp or datetime.now(timezone.utc)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc)
+    return ts.date()
+
+
+@event.listens_for(Session, "after_flush")
+def _count_ledger_changes(session: Session, flush_context) -> None:
+    """Keep node_trust_daily in step with ORM writes to bandwidth_ledger."""
+    deltas: CounterDeltas = {}
+
+    def _add(report, total: int, verified: int) -> None:
+        key = (report.reporting_node_id, _report_day(report))
+        t, v = deltas.get(key, (0, 0))
+        deltas[key] = (t + total, v + verified)
+
+    for obj in session.new:
+        if isinstance(obj, models.BandwidthLedger):
+            _add(obj, 1, 1 if obj.is_verified else 0)
+    for obj in session.deleted:
+        if isinstance(obj, models.BandwidthLedger):
+            _add(obj, -1, -1 if obj.is_verified else 0)
+    for obj in session.dirty:
+        if isinstance(obj, models.BandwidthLedger) and obj not in session.new:
+            history = inspect(obj).attrs.is_verified.history
+            if history.added and history.deleted and bool(history.added[0]) != bool(history.deleted[0]):
+                _add(obj, 0, 1 if history.added[0] else -1)
+
+    if deltas:
+        upsert_trust_counters(session.connection(), deltas)
+
+
+def ledger_counts_stmt(start: date, node_ids: Optional[Iterable[str]] = None):
+    """(reporting_node_id, day, total, verified) from the ledger since *start*."""
+    ledger = models.BandwidthLedger.__table__
+    day = cast(ledger.c.report_timestamp, Date)
+    stmt = (
+        select(
+            ledger.c.reporting_node_id,
+            day.label("day"),
+            func.count().label("total"),
+            func.count().filter(ledger.c.is_verified.is_(True)).label("verified"),
+        )
+        .where(ledger.c.report_timestamp >= datetime.combine(start, datetime.min.time()))
+        .group_by(ledger.c.reporting_node_id, day)
+    )
+    if node_ids is not None:
+        stmt = stmt.where(ledger.c.reporting_node_id.in_(list(node_ids)))
+    return stmt
+
+
+def rebuild_trust_counters(db: Session, node_ids: Optional[Iterable[str]] = None) -> int:
+    """
+    Consistency check: recompute counters inside the trust window from the
+    ledger and repair any that drifted (missed bulk inserts, manual edits).
+    Counters outside the window are left alone.  Returns rows repaired.
+    """
+    daily = models.NodeTrustDaily.__table__
+    start = _window_start()
+    nodes = sorted(set(node_ids)) if node_ids is not None else None
+
+    actual_q = ledger_counts_stmt(start, nodes)
+    stored_q = select(daily.c.node_id, daily.c.day, daily.c.total_reports, daily.c.verified_reports).where(
+        daily.c.day >= start
+    )
+    if nodes is not None:
+        stored_q = stored_q.where(daily.c.node_id.in_(nodes))
+
+    actual = {(r[0], r[1]): (r[2], r[3]) for r in db.execute(actual_q)}
+    stored = {(r[0], r[1]): (r[2], r[3]) for r in db.execute(stored_q)}
+
+    fixes: CounterDeltas = {}
+    for key in actual.keys() | stored.keys():
+        want = actual.get(key, (0, 0))
+        have = stored.get(key, (0, 0))
+        if want != have:
+            fixes[key] = (want[0] - have[0], want[1] - have[1])
+
+    if fixes:
+        upsert_trust_counters(db, fixes)
+        db.execute(delete(daily).where(
+            daily.c.day >= start, daily.c.total_reports == 0, daily.c.verified_reports == 0,
+        ))
+        logger.warning("Trust counter check repaired %d node/day rows", len(fixes))
+    db.commit()
+    return len(fixes)
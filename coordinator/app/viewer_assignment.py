@@ -0,0 +1,423 @@
+"""
+Viewer → node assignment engine.
+
+Picks which friend node serves a new (or displaced) viewer and keeps an
+atomic per-node count of assigned viewers in Redis, so load is spread over
+every routable node instead of piling onto the highest-trust one until its
+self-reported capacity_pct crosses the saturation threshold.
+
+Selection weighs each node by trust_score × remaining capacity headroom:
+  p2c       — sample two distinct nodes by weight, keep the one with fewer
+              assigned viewers per unit of weight (power of two choices)
+  weighted  — a single weighted-random draw
+
+Assignments expire after VIEWER_ASSIGNMENT_TTL_SECONDS without proxy
+activity.  A periodic rebalancer moves part of the viewers off nodes whose
+capacity_pct is at or above REBALANCE_WATERMARK_PCT onto cooler nodes.
+
+Keys:
+  stream:{stream_id}:viewers — hash: viewer_key → node_id
+  stream:{stream_id}:load    — hash: node_id → assigned viewer count
+  viewers:activity           — zset: "{stream_id}|{viewer_key}" → last proxy activity (epoch seconds)
+  viewers:streams            — set: stream ids with at least one assignment
+
+All four are only changed together by the Lua scripts below, so the
+counters move with the assignments even under concurrent replicas.  The
+rebalancer walks viewers:streams, so its cost follows the streams that
+have viewers rather than the size of the node fleet.
+
+Configurable via environment variables:
+  VIEWER_ASSIGNMENT_POLICY          (default "p2c", or "weighted")
+  VIEWER_ASSIGNMENT_TTL_SECONDS     (default 120)
+  VIEWER_ACTIVITY_REFRESH_SECONDS   (default 15)
+  VIEWER_EXPIRY_BATCH               (default 1000)
+  REBALANCE_WATERMARK_PCT           (default 80)
+  REBALANCE_MAX_MOVES_PER_NODE      (default 50)
+"""
+
+import logging
+import math
+import os
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from .circuit_breaker import node_breaker
+from .redis_state import get_stream_nodes
+
+logger = logging.getLogger(__name__)
+
+VIEWER_ASSIGNMENT_POLICY = os.getenv("VIEWER_ASSIGNMENT_POLICY", "p2c").lower()
+VIEWER_ASSIGNMENT_TTL_SECONDS = int(os.getenv("VIEWER_ASSIGNMENT_TTL_SECONDS", "120"))
+VIEWER_ACTIVITY_REFRESH_SECONDS = float(os.getenv("VIEWER_ACTIVITY_REFRESH_SECONDS", "15"))
+VIEWER_EXPIRY_BATCH = int(os.getenv("VIEWER_EXPIRY_BATCH", "1000"))
+REBALANCE_WATERMARK_PCT = int(os.getenv("REBALANCE_WATERMARK_PCT", "80"))
+REBALANCE_MAX_MOVES_PER_NODE = int(os.getenv("REBALANCE_MAX_MOVES_PER_NODE", "50"))
+
+ACTIVITY_INDEX_KEY = "viewers:activity"
+ASSIGNED_STREAMS_KEY = "viewers:streams"
+
+# Nodes at or above this self-reported capacity take no new viewers
+MAX_CAPACITY_PCT = 90
+MIN_TRUST_SCORE = 0.5
+
+# Keeps a node at 89% capacity selectable (just very unlikely)
+_MIN_WEIGHT = 1e-3
+
+_rng = random.Random()
+
+
+def viewers_key(stream_id: str) -> str:
+    return f"stream:{stream_id}:viewers"
+
+
+def load_key(stream_id: str) -> str:
+    return f"stream:{stream_id}:load"
+
+
+def activity_member(stream_id: str, viewer_key: str) -> str:
+    return f"{stream_id}|{viewer_key}"
+
+
+@dataclass
+class AssignmentMetrics:
+    assigned: int = 0
+    touched: int = 0
+    expired: int = 0
+    rebalanced: int = 0
+    rebalance_runs: int = 0
+    last_rebalance_ms: float = 0.0
+
+
+metrics = AssignmentMetrics()
+
+
+# ---------------------------------------------------------------------------
+# Selection
+# ---------------------------------------------------------------------------
+
+def eligible_nodes(nodes: Iterable[dict], exclude: Optional[str] = None) -> List[dict]:
+    """Nodes that may take new viewers: below saturation and trusted enough."""
+    return [
+        n for n in nodes
+        if n.get("capacity_pct", 0) < MAX_CAPACITY_PCT
+        and n.get("trust_score", 0) >= MIN_TRUST_SCORE
+        and n["node_id"] != exclude
+    ]
+
+
+def node_weight(node: dict) -> float:
+    """trust_score × fraction of capacity headroom left before saturation."""
+    headroom = max(0.0, MAX_CAPACITY_PCT - node.get("capacity_pct", 0)) / MAX_CAPACITY_PCT
+    return max(node.get("trust_score", 0) * headroom, _MIN_WEIGHT)
+
+
+def _load(node: dict, loads: Mapping[str, int]) -> int:
+    # Nodes with no counter yet fall back to the heartbeat-reported count
+    return loads.get(node["node_id"], node.get("viewer_count", 0))
+
+
+def _cost(node: dict, loads: Mapping[str, int]) -> tuple:
+    return ((_load(node, loads) + 1) / node_weight(node), -node.get("trust_score", 0))
+
+
+def choose_node(
+    candidates: List[dict],
+    loads: Mapping[str, int],
+    policy: Optional[str] = None,
+    rng: Optional[random.Random] = None,
+) -> Optional[dict]:
+    """
+    Pick a node for one viewer from already-filtered *candidates*.
+    *loads* maps node_id → currently assigned viewers.
+    """
+    if not candidates:
+        return None
+    if len(candidates) == 1:
+        return candidates[0]
+    rng = rng or _rng
+    policy = policy or VIEWER_ASSIGNMENT_POLICY
+
+    weights = [node_weight(n) for n in candidates]
+    first = rng.choices(range(len(candidates)), weights=weights)[0]
+    if policy == "weighted":
+        return candidates[first]
+
+    rest = [i for i in range(len(candidates)) if i != first]
+    second = rng.choices(rest, weights=[weights[i] for i in rest])[0]
+    a, b = candidates[first], candidates[second]
+    return a if _cost(a, loads) <= _cost(b, loads) else b
+
+
+def spread_viewers(
+    viewer_keys: Iterable[str],
+    candidates: List[dict],
+    loads: Mapping[str, int],
+) -> Dict[str, str]:
+    """Choose a node for each viewer in turn, counting earlier picks as load."""
+    projected = {n["node_id"]: _load(n, loads) for n in candidates}
+    mapping: Dict[str, str] = {}
+    for viewer in viewer_keys:
+        node = choose_node(candidates, projected)
+        if node is None:
+            break
+        mapping[viewer] = node["node_id"]
+        projected[node["node_id"]] += 1
+    return mapping
+
+
+# ---------------------------------------------------------------------------
+# Redis counters
+# ---------------------------------------------------------------------------
+
+# KEYS: viewers hash, load hash, activity index, assigned streams set.
+# ARGV[1] is the current time, ARGV[2] the activity member prefix
+# ("{stream_id}|"), followed by viewer_key, node_id pairs; an empty node_id
+# unassigns the viewer.  The previous node's counter is decremented (never
+# below zero — it may have been dropped with the node) and the new node's
+# incremented.  Returns the number of viewers whose assignment changed.
+_ASSIGN_LUA = """
+local changed = 0
+for i = 3, #ARGV, 2 do
+  local viewer, node = ARGV[i], ARGV[i + 1]
+  local old = redis.call('HGET', KEYS[1], viewer) or ''
+  if node == '' then
+    redis.call('ZREM', KEYS[3], ARGV[2] .. viewer)
+  else
+    redis.call('ZADD', KEYS[3], ARGV[1], ARGV[2] .. viewer)
+  end
+  if old ~= node then
+    if old ~= '' and tonumber(redis.call('HGET', KEYS[2], old) or '0') > 0 then
+      redis.call('HINCRBY', KEYS[2], old, -1)
+    end
+    if node == '' then
+      redis.call('HDEL', KEYS[1], viewer)
+    else
+      redis.call('HSET', KEYS[1], viewer, node)
+      redis.call('HINCRBY', KEYS[2], node, 1)
+    end
+    changed = changed + 1
+  end
+end
+local stream_id = string.sub(ARGV[2], 1, -2)
+if redis.call('HLEN', KEYS[1]) > 0 then
+  redis.call('SADD', KEYS[4], stream_id)
+else
+  redis.call('SREM', KEYS[4], stream_id)
+end
+return changed
+"""
+
+# Drops up to ARGV[2] assignments idle since ARGV[1] together with their
+# counter contribution, and a stream's entry in the assigned streams set
+# (KEYS[2]) with its last viewer.  Stream keys are derived from the member
+# name, which assumes a single (non-cluster) Redis, as for the stale-node sweep.
+_EXPIRE_LUA = """
+local idle = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, member in ipairs(idle) do
+  local sep = string.find(member, '|', 1, true)
+  if sep then
+    local stream_id = string.sub(member, 1, sep - 1)
+    local prefix = 'stream:' .. stream_id
+    local viewer = string.sub(member, sep + 1)
+    local node = redis.call('HGET', prefix .. ':viewers', viewer)
+    if node then
+      redis.call('HDEL', prefix .. ':viewers', viewer)
+      if tonumber(redis.call('HGET', prefix .. ':load', node) or '0') > 0 then
+        redis.call('HINCRBY', prefix .. ':load', node, -1)
+      end
+      if redis.call('HLEN', prefix .. ':viewers') == 0 then
+        redis.call('SREM', KEYS[2], stream_id)
+      end
+    end
+  end
+  redis.call('ZREM', KEYS[1], member)
+end
+return #idle
+"""
+
+_assign_script = None
+_expire_script = None
+_activity_backfilled = False
+
+# (stream_id, viewer_key) → last activity write from this replica
+_last_touch: Dict[Tuple[str, str], float] = {}
+
+
+async def get_loads(r: aioredis.Redis, stream_id: str) -> Dict[str, int]:
+    """Assigned viewer count per node for a stream."""
+    raw = await r.hgetall(load_key(stream_id))
+    return {node_id: int(count) for node_id, count in raw.items()}
+
+
+async def assign_viewers(
+    r: aioredis.Redis, stream_id: str, mapping: Mapping[str, Optional[str]]
+) -> int:
+    """
+    Atomically apply viewer_key → node_id assignments (None unassigns) and
+    adjust per-node counters.  Returns the number of changed assignments.
+    """
+    global _assign_script
+    if not mapping:
+        return 0
+    if _assign_script is None:
+        _assign_script = r.register_script(_ASSIGN_LUA)
+    now = time.time()
+    args: List = [now, activity_member(stream_id, "")]
+    for viewer, node_id in mapping.items():
+        args += [viewer, node_id or ""]
+        if node_id:
+            _last_touch[(stream_id, viewer)] = now
+        else:
+            _last_touch.pop((stream_id, viewer), None)
+    changed = int(await _assign_script(
+        keys=[viewers_key(stream_id), load_key(stream_id), ACTIVITY_INDEX_KEY, ASSIGNED_STREAMS_KEY], args=args,
+    ))
+    metrics.assigned += changed
+    return changed
+
+
+async def assign_viewer(r: aioredis.Redis, stream_id: str, viewer_key: str, node_id: str) -> None:
+    await assign_viewers(r, stream_id, {viewer_key: node_id})
+
+
+async def touch_viewer(r: aioredis.Redis, stream_id: str, viewer_key: str) -> None:
+    """
+    Refresh an assignment's TTL on proxy activity.  Writes at most once per
+    VIEWER_ACTIVITY_REFRESH_SECONDS per viewer from each replica.
+    """
+    now = time.time()
+    key = (stream_id, viewer_key)
+    if now - _last_touch.get(key, 0.0) < VIEWER_ACTIVITY_REFRESH_SECONDS:
+        return
+    _last_touch[key] = now
+    # XX: an assignment dropped by the expiry sweep is not resurrected here
+    await r.zadd(ACTIVITY_INDEX_KEY, {activity_member(stream_id, viewer_key): now}, xx=True)
+    metrics.touched += 1
+
+
+# ---------------------------------------------------------------------------
+# Expiry
+# ---------------------------------------------------------------------------
+
+async def backfill_activity_index(r: aioredis.Redis) -> int:
+    """
+    Index assignments written before the activity index (and the assigned
+    streams set) existed so they expire one TTL from now and are seen by
+    the rebalancer.  Returns the number of activity members added.
+    """
+    now = time.time()
+    added = 0
+    cursor = "0"
+    while True:
+        cursor, keys = await r.scan(cursor=cursor, match="stream:*:viewers", count=100)
+        for key in keys:
+            stream_id = key[len("stream:"):-len(":viewers")]
+            viewers = await r.hkeys(key)
+            if viewers:
+                scores = {activity_member(stream_id, v): now for v in viewers}
+                added += await r.zadd(ACTIVITY_INDEX_KEY, scores, nx=True)
+                await r.sadd(ASSIGNED_STREAMS_KEY, stream_id)
+        if cursor == "0" or cursor == 0:
+            break
+    return added
+
+
+async def expire_idle_viewers(
+    r: aioredis.Redis, max_idle_seconds: int = VIEWER_ASSIGNMENT_TTL_SECONDS
+) -> int:
+    """Drop assignments without proxy activity for *max_idle_seconds*."""
+    global _expire_script, _activity_backfilled
+    if not _activity_backfilled:
+        indexed = await backfill_activity_index(r)
+        if indexed:
+            logger.info("Backfilled %d viewer assignments into %s", indexed, ACTIVITY_INDEX_KEY)
+        _activity_backfilled = True
+    if _expire_script is None:
+        _expire_script = r.register_script(_EXPIRE_LUA)
+
+    cutoff = time.time() - max_idle_seconds
+    expired = 0
+    while True:
+        batch = int(await _expire_script(
+            keys=[ACTIVITY_INDEX_KEY, ASSIGNED_STREAMS_KEY], args=[cutoff, VIEWER_EXPIRY_BATCH],
+        ))
+        expired += batch
+        if batch < VIEWER_EXPIRY_BATCH:
+            break
+
+    for key in [k for k, touched in _last_touch.items() if touched <= cutoff]:
+        del _last_touch[key]
+    metrics.expired += expired
+    return expired
+
+
+# ---------------------------------------------------------------------------
+# Rebalancing
+# ---------------------------------------------------------------------------
+
+def _moves_for(node: dict, assigned: int) -> int:
+    """How many of a hot node's viewers to move this round."""
+    capacity = node.get("capacity_pct", 0)
+    excess = (capacity - REBALANCE_WATERMARK_PCT) / max(capacity, 1)
+    return min(REBALANCE_MAX_MOVES_PER_NODE, assigned, max(1, math.ceil(assigned * excess)))
+
+
+async def rebalance_stream(r: aioredis.Redis, stream_id: str) -> int:
+    """
+    Move a share of the viewers on nodes at or above the watermark to nodes
+    below it.  capacity_pct only reflects the move after the node's next
+    heartbeat, so run this less often than nodes heartbeat.
+    """
+    nodes = await get_stream_nodes(r, stream_id)
+    hot = [n for n in nodes if n.get("capacity_pct", 0) >= REBALANCE_WATERMARK_PCT]
+    if not hot:
+        return 0
+    targets = [
+        n for n in eligible_nodes(nodes)
+        if n.get("capacity_pct", 0) < REBALANCE_WATERMARK_PCT
+    ]
+    tripped = await node_breaker.open_nodes(n["node_id"] for n in targets)
+    targets = [n for n in targets if n["node_id"] not in tripped]
+    if not targets:
+        return 0
+
+    by_node: Dict[str, List[str]] = {}
+    for viewer, node_id in (await r.hgetall(viewers_key(stream_id))).items():
+        by_node.setdefault(node_id, []).append(viewer)
+
+    movers: List[str] = []
+    for node in hot:
+        viewers = by_node.get(node["node_id"], [])
+        if viewers:
+            movers += viewers[:_moves_for(node, len(viewers))]
+    if not movers:
+        return 0
+
+    moves = spread_viewers(movers, targets, await get_loads(r, stream_id))
+    moved = await assign_viewers(r, stream_id, moves)
+    if moved:
+        logger.info("Rebalanced %d viewers of %s off %d hot nodes", moved, stream_id, len(hot))
+    return moved
+
+
+async def rebalance_viewers(r: aioredis.Redis) -> int:
+    """Rebalance every stream with assigned viewers.  Returns viewers moved."""
+    started = time.perf_counter()
+    moved = 0
+    for stream_id in sorted(await r.smembers(ASSIGNED_STREAMS_KEY)):
+        try:
+            moved += await rebalance_stream(r, stream_id)
+        except Exception:
+            logger.warning("Rebalance failed for stream %s", stream_id, exc_info=True)
+    metrics.rebalanced += moved
+    metrics.rebalance_runs += 1
+    metrics.last_rebalance_ms = round((time.perf_counter() - started) * 1000, 2)
+    return moved
+
+
+def assignment_stats() -> dict:
+    return {**asdict(metrics), "tracked_viewers": len(_last_touch)}
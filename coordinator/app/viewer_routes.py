@@ -9,7 +9,10 @@ from decimal import Decimal
 
 from fastapi import APIRouter, Request
 
-from .redis_state import get_redis, get_stream_nodes
+from .circuit_breaker import node_breaker
+from .peer_cache import get_stream_nodes
+from .redis_state import get_redis
+from .viewer_assignment import assign_viewer, choose_node, eligible_nodes, get_loads
 
 logger = logging.getLogger(__name__)
 
@@ -33,10 +36,12 @@ def _log_fallback(stream_id: str, reason: str) -> None:
 
 async def _pick_best_node(stream_id: str) -> dict | None:
     """
-    Select the best friend node for a viewer:
+    Select a friend node for a viewer:
     1. Filter out saturated nodes (capacity_pct >= 90)
     2. Filter out low-trust nodes (trust_score < 0.5)
-    3. Among remaining, pick highest trust_score; break ties by lowest viewer_count
+    3. Filter out nodes whose circuit breaker is open
+    4. Among remaining, choose by trust × capacity headroom against the
+       per-node assigned viewer counters (see viewer_assignment.py)
     """
     try:
         r = await get_redis()
@@ -45,29 +50,29 @@ async def _pick_best_node(stream_id: str) -> dict | None:
         logger.warning("Redis unavailable for viewer routing", exc_info=True)
         return None
 
-    candidates = [
-        n for n in nodes
-        if n.get("capacity_pct", 0) < 90
-        and n.get("trust_score", 0) >= 0.5
-    ]
+    candidates = eligible_nodes(nodes)
+
+    tripped = await node_breaker.open_nodes(n["node_id"] for n in candidates)
+    candidates = [n for n in candidates if n["node_id"] not in tripped]
 
     if not candidates:
         return None
 
-    # Sort: highest trust first, then lowest viewer_count
-    candidates.sort(
-        key=lambda n: (-n.get("trust_score", 0), n.get("viewer_count", 0))
-    )
-    return candidates[0]
+    try:
+        loads = await get_loads(r, stream_id)
+    except Exception:
+        logger.warning("Viewer counters unavailable, using heartbeat counts", exc_info=True)
+        loads = {}
+    return choose_node(candidates, loads)
 
 
 async def _record_viewer_assignment(
     stream_id: str, viewer_key: str, node_id: str
 ) -> None:
-    """Store viewer→node mapping in Redis for proxy lookups."""
+    """Store viewer→node mapping (and the node's viewer counter) in Redis."""
     try:
         r = await get_redis()
-        await r.hset(f"stream:{stream_id}:viewers", viewer_key, node_id)
+        await assign_viewer(r, stream_id, viewer_key, node_id)
     except Exception:
         logger.warning("Failed to record viewer assignment", exc_info=True)
 
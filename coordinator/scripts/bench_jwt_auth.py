@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: authenticated-request overhead with and without the verified
+JWT claims cache.
+
+``--nodes`` tokens are issued up front (one per simulated node) and each
+is presented ``--requests`` times, in round-robin order like heartbeats
+from a node fleet.  Two measurements per mode:
+
+  dependency — ``get_current_user`` called directly (pure auth cost)
+  request    — a GET through a minimal FastAPI app whose route depends on
+               ``get_current_user``, over httpx's in-process ASGI
+               transport (auth cost relative to a whole request)
+
+"uncached" runs with the cache disabled (every request does a full RS256
+verification), "cached" with a cache sized to hold every token.
+
+Usage (from coordinator/):
+    python -m scripts.bench_jwt_auth --nodes 500 --requests 20
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app import auth
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/whoami")
+    async def whoami(user: auth.AuthenticatedUser = Depends(auth.get_current_user)):
+        return {"user_id": user.user_id}
+
+    return app
+
+
+async def _bench_dependency(tokens: list, requests: int) -> list:
+    creds = [HTTPAuthorizationCredentials(scheme="Bearer", credentials=t) for t in tokens]
+    timings = []
+    for _ in range(requests):
+        for c in creds:
+            start = time.perf_counter()
+            await auth.get_current_user(c)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def _bench_request(tokens: list, requests: int) -> list:
+    headers = [{"Authorization": f"Bearer {t}"} for t in tokens]
+    timings = []
+    transport = httpx.ASGITransport(app=_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(requests):
+            for h in headers:
+                start = time.perf_counter()
+                resp = await client.get("/whoami", headers=h)
+                timings.append(time.perf_counter() - start)
+                assert resp.status_code == 200, resp.text
+    return timings
+
+
+def _row(label: str, timings: list) -> str:
+    us = sorted(t * 1e6 for t in timings)
+    p99 = us[int(len(us) * 0.99) - 1]
+    return f"  {label:22s} mean {statistics.fmean(us):8.1f} us   p50 {statistics.median(us):8.1f} us   p99 {p99:8.1f} us"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20, help="requests per node token")
+    args = parser.parse_args()
+
+    tokens = [auth.encode_jwt(user_id=f"bench-u{i}", role="node", node_id=f"bench-n{i}") for i in range(args.nodes)]
+    print(f"{args.nodes} tokens x {args.requests} requests")
+
+    results = {}
+    for mode, size in (("uncached", 0), ("cached", args.nodes)):
+        auth.claims_cache = auth.VerifiedClaimsCache(max_entries=size)
+        results[(mode, "dependency")] = await _bench_dependency(tokens, args.requests)
+        auth.claims_cache = auth.VerifiedClaimsCache(max_entries=size)
+        results[(mode, "request")] = await _bench_request(tokens, args.requests)
+        stats = auth.claims_cache.stats()
+        print(f"{mode}: hit_ratio={stats['hit_ratio']} entries={stats['entries']}")
+        for kind in ("dependency", "request"):
+            print(_row(kind, results[(mode, kind)]))
+
+    for kind in ("dependency", "request"):
+        before = statistics.fmean(results[("uncached", kind)])
+        after = statistics.fmean(results[("cached", kind)])
+        print(f"{kind:10s} speedup {before / after:5.1f}x  (saves {(before - after) * 1e6:.1f} us per request)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark: JWT sign / verify throughput, RS256 (RSA-2048) vs EdDSA (Ed25519).
+
+Each algorithm gets an ephemeral key pair loaded through ``auth._load_keys``
+(as a coordinator with JWT_ALGORITHM set would), then:
+
+  sign    — ``encode_jwt`` as called by /register, /login and /refresh
+  verify  — ``decode_jwt`` (the uncached path of ``get_current_user``)
+
+Usage (from coordinator/):
+    python -m scripts.bench_jwt_signing --tokens 2000
+"""
+
+import argparse
+import statistics
+import time
+
+from app import auth
+
+
+def _time(fn, args: list) -> list:
+    timings = []
+    for a in args:
+        start = time.perf_counter()
+        fn(a)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _row(label: str, timings: list) -> str:
+    us = sorted(t * 1e6 for t in timings)
+    p99 = us[int(len(us) * 0.99) - 1]
+    ops = len(us) / (sum(us) / 1e6)
+    return (
+        f"  {label:8s} {ops:9.0f} ops/s   mean {statistics.fmean(us):8.1f} us"
+        f"   p50 {statistics.median(us):8.1f} us   p99 {p99:8.1f} us"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = {}
+    for algorithm in auth.SUPPORTED_ALGORITHMS:
+        auth.ALGORITHM = algorithm
+        auth._load_keys()
+        ids = [f"bench-u{i}" for i in range(args.tokens)]
+        sign = _time(lambda uid: auth.encode_jwt(user_id=uid, role="node", node_id=uid), ids)
+        tokens = [auth.encode_jwt(user_id=uid, role="node", node_id=uid) for uid in ids]
+        verify = _time(auth.decode_jwt, tokens)
+        results[algorithm] = (sign, verify)
+        print(f"{algorithm} ({len(tokens[0])}-byte tokens)")
+        print(_row("sign", sign))
+        print(_row("verify", verify))
+
+    for i, op in enumerate(("sign", "verify")):
+        rs = statistics.fmean(results["RS256"][i])
+        ed = statistics.fmean(results["EdDSA"][i])
+        print(f"{op:6s} EdDSA is {rs / ed:5.1f}x RS256")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Redis node state encoding — legacy JSON vs the v2 delimited format.
+
+Times encode and decode (including timestamp parsing, which every reader
+pays) for ``--entries`` node values, and reports payload size.  With
+``--redis-url`` it also loads one stream hash of ``--entries`` nodes in each
+format and reports ``MEMORY USAGE`` per node.  The two benchmark keys are
+deleted afterwards.
+
+Usage (from coordinator/):
+    python -m scripts.bench_node_state_encoding --entries 50 --rounds 2000
+    python -m scripts.bench_node_state_encoding --redis-url redis://localhost:6379/15
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timezone
+
+from app.redis_state import decode_node_state, encode_node_state
+
+
+def _legacy_encode(vpn_ip, trust_score, capacity_pct, viewer_count, last_heartbeat):
+    return json.dumps({
+        "vpn_ip": vpn_ip,
+        "trust_score": trust_score,
+        "capacity_pct": capacity_pct,
+        "viewer_count": viewer_count,
+        "last_heartbeat": datetime.fromtimestamp(last_heartbeat, timezone.utc).isoformat(),
+    })
+
+
+def _sample_states(n: int) -> list[tuple]:
+    now = time.time()
+    return [(f"100.64.{i // 256}.{i % 256}", 0.75 + (i % 25) / 100, i % 90, i % 7, now - i) for i in range(n)]
+
+
+def _time_per_op(fn, items, rounds: int) -> float:
+    """Median microseconds per item over *rounds* passes."""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        samples.append((time.perf_counter() - start) / len(items) * 1e6)
+    return statistics.median(samples)
+
+
+async def _redis_memory(url: str, states: list[tuple]) -> None:
+    import redis.asyncio as aioredis
+
+    r = aioredis.from_url(url, decode_responses=True)
+    try:
+        for label, encode in (("json (v1)", _legacy_encode), ("v2", encode_node_state)):
+            key = f"bench:node_state:{label.split()[0]}"
+            await r.delete(key)
+            await r.hset(key, mapping={f"node-{i}": encode(*s) for i, s in enumerate(states)})
+            usage = await r.memory_usage(key, samples=0)
+            print(f"redis {label:<10} MEMORY USAGE {usage} bytes, {usage / len(states):.1f} bytes/node")
+            await r.delete(key)
+    finally:
+        await r.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=50, help="nodes per stream hash")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--redis-url", default="")
+    args = parser.parse_args()
+
+    states = _sample_states(args.entries)
+    legacy_raw = [_legacy_encode(*s) for s in states]
+    v2_raw = [encode_node_state(*s) for s in states]
+
+    # Decode cost for v1 is what get_stream_nodes used to pay per entry
+    def _legacy_decode(raw):
+        data = json.loads(raw)
+        datetime.fromisoformat(data["last_heartbeat"])
+        return data
+
+    results = [
+        ("encode json (v1)", _time_per_op(lambda s: _legacy_encode(*s), states, args.rounds)),
+        ("encode v2", _time_per_op(lambda s: encode_node_state(*s), states, args.rounds)),
+        ("decode json (v1)", _time_per_op(_legacy_decode, legacy_raw, args.rounds)),
+        ("decode v2", _time_per_op(decode_node_state, v2_raw, args.rounds)),
+    ]
+    for label, us in results:
+        print(f"{label:<18} {us:6.2f} us/node")
+    print(
+        f"payload size       json {statistics.fmean(map(len, legacy_raw)):.1f} B, "
+        f"v2 {statistics.fmean(map(len, v2_raw)):.1f} B (mean)"
+    )
+
+    if args.redis_url:
+        asyncio.run(_redis_memory(args.redis_url, states))
+
+
+if __name__ == "__main__":
+    main()
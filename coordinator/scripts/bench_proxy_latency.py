@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark: HLS proxy latency under concurrent heartbeat load.
+
+Registers N bench nodes against a running coordinator, keeps them
+heartbeating as fast as the server allows, and meanwhile samples latency of
+``GET /api/v1/proxy/{stream_id}/{path}`` from M concurrent viewers.  Run it
+once against the previous build and once against the current one to compare
+the p99 figures.
+
+Usage (from coordinator/):
+    python -m scripts.bench_proxy_latency \\
+        --base-url http://localhost:8000 \\
+        --stream-id bench-stream --stream-key <stream key> \\
+        --nodes 200 --viewers 20 --duration 30
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def _register_nodes(client: httpx.AsyncClient, stream_key: str, count: int) -> list[tuple[str, str]]:
+    """Register bench nodes and return (node_id, token) pairs."""
+    nodes = []
+    for i in range(count):
+        node_id = f"bench-node-{i}"
+        resp = await client.post(
+            "/api/v1/auth/register",
+            json={"node_id": node_id, "stream_key": stream_key, "display_name": node_id},
+        )
+        resp.raise_for_status()
+        nodes.append((node_id, resp.json()["token"]))
+    return nodes
+
+
+async def _heartbeat_loop(
+    client: httpx.AsyncClient, stream_id: str, node_id: str, token: str,
+    deadline: float, counter: list[int],
+) -> None:
+    headers = {"Authorization": f"Bearer {token}"}
+    body = {
+        "node_id": node_id,
+        "stream_id": stream_id,
+        "stats_url": "http://127.0.0.1:8080/stats.json",
+        "vpn_ip": "127.0.0.1",
+        "capacity_pct": 10,
+    }
+    while time.monotonic() < deadline:
+        try:
+            await client.post("/nodes/heartbeat", json=body, headers=headers)
+            counter[0] += 1
+        except httpx.HTTPError:
+            pass
+
+
+async def _viewer_loop(
+    client: httpx.AsyncClient, stream_id: str, path: str,
+    deadline: float, latencies: list[float],
+) -> None:
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            await client.get(f"/api/v1/proxy/{stream_id}/{path}")
+        except httpx.HTTPError:
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def run(args: argparse.Namespace) -> None:
+    limits = httpx.Limits(max_connections=args.nodes + args.viewers + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30.0, limits=limits) as client:
+        nodes = await _register_nodes(client, args.stream_key, args.nodes)
+
+        # Baseline: proxy latency with no heartbeat load
+        idle: list[float] = []
+        idle_deadline = time.monotonic() + min(5.0, args.duration)
+        await asyncio.gather(*[
+            _viewer_loop(client, args.stream_id, args.path, idle_deadline, idle)
+            for _ in range(args.viewers)
+        ])
+
+        loaded: list[float] = []
+        heartbeats = [0]
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(
+            *[
+                _heartbeat_loop(client, args.stream_id, node_id, token, deadline, heartbeats)
+                for node_id, token in nodes
+            ],
+            *[
+                _viewer_loop(client, args.stream_id, args.path, deadline, loaded)
+                for _ in range(args.viewers)
+            ],
+        )
+
+    for label, samples in (("idle", idle), ("under heartbeat load", loaded)):
+        print(
+            f"proxy latency {label}: n={len(samples)} "
+            f"p50={_percentile(samples, 50):.1f}ms p99={_percentile(samples, 99):.1f}ms "
+            f"max={max(samples, default=0):.1f}ms "
+            f"mean={statistics.fmean(samples) if samples else 0:.1f}ms"
+        )
+    print(f"heartbeats: {heartbeats[0]} in {args.duration}s ({heartbeats[0] / args.duration:.0f}/s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--stream-id", required=True)
+    parser.add_argument("--stream-key", required=True)
+    parser.add_argument("--path", default="index.m3u8")
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--viewers", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Benchmark: HLS proxy time-to-first-byte and memory under concurrent viewers.
+
+Starts a fake friend node (serves one ``--segment-kb`` segment, trickled out
+in ``--chunk-kb`` chunks with ``--chunk-delay-ms`` between them to mimic VPN
+throughput).  It then runs the proxy router under uvicorn in a child process,
+with viewer assignment pinned to that node.  ``--viewers`` concurrent viewers
+each fetch the segment; the child's RSS is sampled throughout.
+
+Two modes run, each in a fresh proxy process:
+  streaming — the current proxy_hls (headers relayed, body streamed)
+  buffered  — the previous behaviour (full upstream GET, then relay)
+
+Needs ``ulimit -n`` comfortably above 2 × viewers.
+
+Usage (from coordinator/):
+    python -m scripts.bench_proxy_streaming --viewers 1000 --segment-kb 2048
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+
+import httpx
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+# ---------------------------------------------------------------------------
+# Fake friend node
+# ---------------------------------------------------------------------------
+
+async def _serve_node(port: int, segment_kb: int, chunk_kb: int, chunk_delay: float) -> asyncio.AbstractServer:
+    chunk = b"\x47" * (chunk_kb * 1024)  # MPEG-TS sync byte filler
+    n_chunks = max(1, segment_kb // chunk_kb)
+    length = len(chunk) * n_chunks
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                if not head:
+                    break
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: video/mp2t\r\n"
+                    + f"Content-Length: {length}\r\n\r\n".encode()
+                )
+                for _ in range(n_chunks):
+                    writer.write(chunk)
+                    await writer.drain()
+                    if chunk_delay:
+                        await asyncio.sleep(chunk_delay)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Idle keep-alive connections are cancelled at shutdown
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", port, backlog=4096)
+
+
+# ---------------------------------------------------------------------------
+# Proxy under test (child process)
+# ---------------------------------------------------------------------------
+
+def _run_proxy(port: int, node_port: int) -> None:
+    os.environ["NODE_HLS_PORT"] = str(node_port)
+    os.environ.setdefault("PROXY_MAX_CONNECTIONS", "4096")
+
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import StreamingResponse
+
+    from app import proxy
+
+    async def _assigned(stream_id, viewer_key):
+        return "bench-node"
+
+    async def _node_ip(stream_id, node_id):
+        return "127.0.0.1"
+
+    proxy._get_viewer_assignment = _assigned
+    proxy._resolve_node_vpn_ip = _node_ip
+
+    app = FastAPI()
+    app.include_router(proxy.router)
+
+    @app.get("/legacy/{stream_id}/{path:path}")
+    async def legacy(stream_id: str, path: str):
+        # Previous proxy_hls: buffer the whole upstream body before replying
+        client = await proxy._get_vpn_client()
+        resp = await client.get(f"http://127.0.0.1:{node_port}/live/{stream_id}/{path}")
+        return StreamingResponse(
+            content=resp.aiter_bytes(),
+            media_type=resp.headers.get("content-type", "application/octet-stream"),
+        )
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+def _rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as fh:
+        for line in fh:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Load
+# ---------------------------------------------------------------------------
+
+async def _viewer(client: httpx.AsyncClient, url: str, ttfb: list[float], total: list[float]) -> None:
+    start = time.perf_counter()
+    async with client.stream("GET", url) as resp:
+        first = True
+        async for _ in resp.aiter_raw():
+            if first:
+                ttfb.append((time.perf_counter() - start) * 1000)
+                first = False
+    total.append((time.perf_counter() - start) * 1000)
+
+
+async def _run_mode(label: str, path: str, args: argparse.Namespace, node_port: int) -> None:
+    port = _free_port()
+    proc = multiprocessing.get_context("spawn").Process(target=_run_proxy, args=(port, node_port), daemon=True)
+    proc.start()
+    base = f"http://127.0.0.1:{port}"
+
+    limits = httpx.Limits(max_connections=args.viewers + 10, max_keepalive_connections=args.viewers + 10)
+    async with httpx.AsyncClient(base_url=base, timeout=120.0, limits=limits) as client:
+        for _ in range(100):
+            try:
+                await client.get("/docs")
+                break
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+        # Warm up the upstream pool and imports
+        await _viewer(client, path, [], [])
+        baseline = _rss_kb(proc.pid)
+
+        peak = [baseline]
+        done = asyncio.Event()
+
+        async def _sample():
+            while not done.is_set():
+                peak[0] = max(peak[0], _rss_kb(proc.pid))
+                await asyncio.sleep(0.02)
+
+        sampler = asyncio.create_task(_sample())
+        ttfb: list[float] = []
+        total: list[float] = []
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *[_viewer(client, path, ttfb, total) for _ in range(args.viewers)],
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - start
+        done.set()
+        await sampler
+
+    proc.terminate()
+    proc.join()
+
+    errors = sum(isinstance(r, Exception) for r in results)
+    print(
+        f"{label:<10} viewers={args.viewers} errors={errors} wall={elapsed:.2f}s  "
+        f"ttfb p50={_percentile(ttfb, 50):.0f}ms p99={_percentile(ttfb, 99):.0f}ms  "
+        f"total p50={_percentile(total, 50):.0f}ms  "
+        f"rss baseline={baseline / 1024:.0f}MiB peak={peak[0] / 1024:.0f}MiB "
+        f"(+{(peak[0] - baseline) / 1024:.0f}MiB)"
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    node_port = _free_port()
+    server = await _serve_node(node_port, args.segment_kb, args.chunk_kb, args.chunk_delay_ms / 1000)
+    print(
+        f"segment {args.segment_kb} KiB in {args.chunk_kb} KiB chunks, "
+        f"{args.chunk_delay_ms} ms between chunks"
+    )
+    try:
+        await _run_mode("streaming", "/api/v1/proxy/bench/seg-1.ts", args, node_port)
+        await _run_mode("buffered", "/legacy/bench/seg-1.ts", args, node_port)
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--viewers", type=int, default=1000)
+    parser.add_argument("--segment-kb", type=int, default=2048)
+    parser.add_argument("--chunk-kb", type=int, default=64)
+    parser.add_argument("--chunk-delay-ms", type=float, default=20.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
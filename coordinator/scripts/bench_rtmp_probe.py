@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: spot-check RTMP probes per second, native asyncio client vs
+ffprobe subprocesses, against the local RTMP test server
+(tests/fake_rtmp.py) serving one live stream.
+
+  native  — ``probe_rtmp`` (in-process; memory is the tracemalloc peak
+            divided by the number of probes in flight)
+  ffprobe — ``SpotCheckProber._ffprobe_rtmp`` (one process per probe;
+            memory is the peak RSS of the largest ffprobe child).
+            Skipped when ffprobe isn't installed.
+
+Usage (from coordinator/):
+    python -m scripts.bench_rtmp_probe --probes 500 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import resource
+import shutil
+import statistics
+import time
+import tracemalloc
+
+from app.rtmp_probe import probe_rtmp
+from app.spot_check_prober import SpotCheckProber
+from tests.fake_rtmp import FakeRtmpServer
+
+
+async def _run(probe, url: str, probes: int, concurrency: int) -> tuple:
+    sem = asyncio.Semaphore(concurrency)
+    timings, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        async with sem:
+            started = time.perf_counter()
+            ok = await probe(url)
+            timings.append(time.perf_counter() - started)
+            failures += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(probes)))
+    return time.perf_counter() - started, timings, failures
+
+
+def _row(label: str, probes: int, elapsed: float, timings: list, failures: int, mem_mb: float) -> str:
+    ms = sorted(t * 1000 for t in timings)
+    p99 = ms[max(0, int(len(ms) * 0.99) - 1)]
+    return (
+        f"  {label:8s} {probes / elapsed:8.1f} probes/s   p50 {statistics.median(ms):7.1f} ms"
+        f"   p99 {p99:7.1f} ms   ~{mem_mb:6.2f} MB/probe   failures {failures}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--probes", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    server = await FakeRtmpServer().start()
+    server.live.add("bench-stream")
+    url = server.url("bench-stream")
+    print(f"{args.probes} probes, {args.concurrency} concurrent, server on :{server.port}")
+
+    async def native(u):
+        return (await probe_rtmp(u)).success
+
+    elapsed, timings, failures = await _run(native, url, args.probes, args.concurrency)
+    # Memory in a separate pass of one probe per slot; tracemalloc skews timing
+    tracemalloc.start()
+    await _run(native, url, args.concurrency, args.concurrency)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(_row("native", args.probes, elapsed, timings, failures, peak / 1e6 / args.concurrency))
+
+    if shutil.which("ffprobe") is None:
+        print("  ffprobe  not installed — skipped")
+    else:
+        prober = SpotCheckProber(probe_mode="ffprobe")
+
+        async def ffprobe(u):
+            return (await prober._ffprobe_rtmp(u))[0]
+
+        elapsed, timings, failures = await _run(ffprobe, url, args.probes, args.concurrency)
+        child_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        print(_row("ffprobe", args.probes, elapsed, timings, failures, child_rss_mb))
+
+    await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
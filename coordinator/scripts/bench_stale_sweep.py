@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark: stale node sweep — legacy SCAN/HGETALL vs the heartbeat index.
+
+Fills a scratch Redis database with ``--streams`` × ``--nodes`` node entries
+(``--stale-pct`` of them older than the cutoff), then times each sweep
+strategy and reports the number of commands Redis processed for it
+(``total_commands_processed`` delta; Lua counts the EVALSHA plus the calls
+made inside the script).
+
+The target database is FLUSHED before every run — point it at a scratch DB.
+
+Usage (from coordinator/):
+    python -m scripts.bench_stale_sweep --redis-url redis://localhost:6379/15 \\
+        --streams 10000 --nodes 50 --stale-pct 10
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import redis.asyncio as aioredis
+
+from app import redis_state
+from app.redis_state import HEARTBEAT_INDEX_KEY, heartbeat_member
+
+MAX_AGE_SECONDS = 90
+
+
+async def _legacy_cleanup(r: aioredis.Redis, max_age_seconds: int) -> int:
+    """The previous implementation: SCAN every hash, one HDEL per stale entry."""
+    removed = 0
+    now = datetime.now(timezone.utc)
+    cursor = "0"
+    while True:
+        cursor, keys = await r.scan(cursor=cursor, match="stream:*:nodes", count=100)
+        for key in keys:
+            entries = await r.hgetall(key)
+            for node_id, data_str in entries.items():
+                last_hb = datetime.fromisoformat(json.loads(data_str)["last_heartbeat"])
+                if (now - last_hb).total_seconds() > max_age_seconds:
+                    await r.hdel(key, node_id)
+                    removed += 1
+        if cursor == "0" or cursor == 0:
+            break
+    return removed
+
+
+async def _populate(r: aioredis.Redis, streams: int, nodes: int, stale_pct: float) -> int:
+    await r.flushdb()
+    now = datetime.now(timezone.utc)
+    stale_every = int(100 / stale_pct) if stale_pct > 0 else 0
+    stale = 0
+    for s in range(streams):
+        stream_id = f"bench-stream-{s}"
+        pipe = r.pipeline(transaction=False)
+        fields, scores = {}, {}
+        for n in range(nodes):
+            node_id = f"node-{n}"
+            is_stale = stale_every and (s * nodes + n) % stale_every == 0
+            ts = now - timedelta(seconds=600 if is_stale else 5)
+            stale += bool(is_stale)
+            fields[node_id] = json.dumps({
+                "vpn_ip": f"100.64.{s % 256}.{n}",
+                "trust_score": 0.8,
+                "capacity_pct": 20,
+                "viewer_count": 0,
+                "last_heartbeat": ts.isoformat(),
+            })
+            scores[heartbeat_member(stream_id, node_id)] = ts.timestamp()
+        pipe.hset(f"stream:{stream_id}:nodes", mapping=fields)
+        pipe.zadd(HEARTBEAT_INDEX_KEY, scores)
+        await pipe.execute()
+    return stale
+
+
+async def _commands(r: aioredis.Redis) -> int:
+    return int((await r.info("stats"))["total_commands_processed"])
+
+
+async def _measure(label: str, r: aioredis.Redis, sweep) -> None:
+    before = await _commands(r)
+    start = time.perf_counter()
+    removed = await sweep()
+    elapsed = time.perf_counter() - start
+    # Subtract the INFO call itself
+    ops = await _commands(r) - before - 1
+    print(f"{label:<22} removed={removed:<7} time={elapsed * 1000:9.1f}ms  redis_ops={ops}")
+
+
+async def run(args: argparse.Namespace) -> None:
+    r = aioredis.from_url(args.redis_url, decode_responses=True)
+    print(f"{args.streams} streams x {args.nodes} nodes, {args.stale_pct}% stale")
+
+    expected = await _populate(r, args.streams, args.nodes, args.stale_pct)
+    print(f"populated, {expected} stale entries")
+    await _measure("legacy scan", r, lambda: _legacy_cleanup(r, MAX_AGE_SECONDS))
+
+    # Skip the one-off legacy backfill; the index is populated directly above
+    redis_state._index_backfilled = True
+    for label, use_lua in (("index + pipeline", False), ("index + lua", True)):
+        await _populate(r, args.streams, args.nodes, args.stale_pct)
+        redis_state.REDIS_SWEEP_USE_LUA = use_lua
+        redis_state._sweep_script = None
+        await _measure(label, r, lambda: redis_state.cleanup_stale_nodes(r, MAX_AGE_SECONDS))
+
+    # Steady state: nothing stale, which is what most 30s ticks look like
+    redis_state.REDIS_SWEEP_USE_LUA = True
+    await _measure("index, nothing stale", r, lambda: redis_state.cleanup_stale_nodes(r, MAX_AGE_SECONDS))
+
+    await r.flushdb()
+    await r.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--streams", type=int, default=10000)
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--stale-pct", type=float, default=10.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark: viewer load spread and tail latency across friend nodes.
+
+Simulates ``--nodes`` friend nodes with mixed trust scores and uplink
+capacities (max viewers each) receiving ``--viewers`` arrivals.  Nodes
+report capacity_pct in heartbeats, so routing sees a value that is only
+refreshed every ``--heartbeat-every`` arrivals, as in production.
+
+Policies compared:
+  argmax    — previous behaviour: highest trust, ties by viewer_count
+  weighted  — weighted-random by trust × capacity headroom
+  p2c       — power of two choices over the same weights and live counters
+
+Per-viewer segment latency is modelled as an M/M/1 queue on the node's
+uplink: ``base / (1 - utilisation)``, capped at the proxy read timeout for
+overloaded nodes (utilisation >= 1).
+
+Usage (from coordinator/):
+    python -m scripts.bench_viewer_assignment --nodes 50 --viewers 4000
+"""
+
+import argparse
+import random
+import statistics
+import time
+from collections import Counter
+
+from app.viewer_assignment import MAX_CAPACITY_PCT, choose_node, eligible_nodes
+
+TIMEOUT_MS = 5000.0
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _make_nodes(count: int, rng: random.Random) -> tuple[list[dict], dict]:
+    nodes, max_viewers = [], {}
+    for i in range(count):
+        node_id = f"node-{i:03d}"
+        nodes.append({
+            "node_id": node_id,
+            "vpn_ip": f"100.64.0.{i + 1}",
+            "trust_score": round(rng.uniform(0.5, 1.0), 3),
+            "capacity_pct": 0,
+            "viewer_count": 0,
+        })
+        max_viewers[node_id] = rng.choice((25, 50, 100, 150, 200))
+    return nodes, max_viewers
+
+
+def _argmax(candidates: list[dict], loads: Counter) -> dict:
+    return min(candidates, key=lambda n: (-n["trust_score"], n["viewer_count"]))
+
+
+def simulate(policy: str, args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    nodes, max_viewers = _make_nodes(args.nodes, rng)
+    loads: Counter = Counter()
+    pick_rng = random.Random(args.seed + 1)
+    fallback = 0
+    decision_s = 0.0
+
+    for i in range(args.viewers):
+        if i % args.heartbeat_every == 0:
+            for n in nodes:
+                n["capacity_pct"] = min(100, int(100 * loads[n["node_id"]] / max_viewers[n["node_id"]]))
+                n["viewer_count"] = loads[n["node_id"]]
+        start = time.perf_counter()
+        candidates = eligible_nodes(nodes)
+        if policy == "argmax":
+            node = _argmax(candidates, loads) if candidates else None
+        else:
+            node = choose_node(candidates, loads, policy=policy, rng=pick_rng)
+        decision_s += time.perf_counter() - start
+        if node is None:
+            fallback += 1
+            continue
+        loads[node["node_id"]] += 1
+
+    latencies: list[float] = []
+    utilisation = []
+    overloaded_viewers = 0
+    for n in nodes:
+        util = loads[n["node_id"]] / max_viewers[n["node_id"]]
+        utilisation.append(util)
+        if util >= 1:
+            latency = TIMEOUT_MS
+            overloaded_viewers += loads[n["node_id"]]
+        else:
+            latency = min(TIMEOUT_MS, args.base_ms / (1 - util))
+        latencies.extend([latency] * loads[n["node_id"]])
+
+    return {
+        "policy": policy,
+        "used": sum(1 for n in nodes if loads[n["node_id"]]),
+        "srs": fallback,
+        "util_max": max(utilisation),
+        "util_sd": statistics.pstdev(utilisation),
+        "overloaded": overloaded_viewers,
+        "p50": _percentile(latencies, 50),
+        "p99": _percentile(latencies, 99),
+        "p999": _percentile(latencies, 99.9),
+        "decision_us": decision_s / args.viewers * 1e6,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--viewers", type=int, default=4000)
+    parser.add_argument("--heartbeat-every", type=int, default=200,
+                        help="arrivals between capacity_pct refreshes (heartbeat staleness)")
+    parser.add_argument("--base-ms", type=float, default=40.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(
+        f"{args.nodes} nodes, {args.viewers} viewers, capacity_pct refreshed every "
+        f"{args.heartbeat_every} arrivals, saturation at {MAX_CAPACITY_PCT}%"
+    )
+    print(
+        f"{'policy':<9} {'nodes':>5} {'srs':>5} {'util max':>8} {'util sd':>7} "
+        f"{'overload':>8} {'p50 ms':>7} {'p99 ms':>7} {'p99.9 ms':>8} {'pick µs':>7}"
+    )
+    for policy in ("argmax", "weighted", "p2c"):
+        s = simulate(policy, args)
+        print(
+            f"{s['policy']:<9} {s['used']:>5} {s['srs']:>5} {s['util_max']:>8.2f} {s['util_sd']:>7.3f} "
+            f"{s['overloaded']:>8} {s['p50']:>7.0f} {s['p99']:>7.0f} {s['p999']:>8.0f} {s['decision_us']:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
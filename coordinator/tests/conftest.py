@@ -5,7 +5,8 @@ Task 7.5 — Req 22.4, Design §24
 Provides:
 - test_db: isolated SQLAlchemy session backed by test PostgreSQL (port 5433)
 - test_redis: isolated Redis client (port 6380)
-- client: FastAPI TestClient with dependency overrides
+- async_db: real asyncpg-backed AsyncSession in a rolled-back transaction
+- client: FastAPI TestClient with dependency overrides (sync and async DB)
 - mock services for PayoutService, SpotCheckProber, etc.
 
 DB-dependent tests auto-skip when PostgreSQL is unavailable (local dev).
@@ -14,12 +15,14 @@ CI provides PostgreSQL via service container so the full suite runs there.
 
 import os
 import pytest
+import pytest_asyncio
 from decimal import Decimal
 from datetime import datetime, timezone
 from unittest.mock import MagicMock, AsyncMock
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.testclient import TestClient
 
 # Override DATABASE_URL before any app imports
@@ -34,7 +37,7 @@ os.environ["REDIS_URL"] = TEST_REDIS_URL
 
 from app.models import Base
 from app import models
-from app.database import get_db
+from app.database import get_db, get_async_db
 
 
 # ---------------------------------------------------------------------------
@@ -87,6 +90,79 @@ def test_db(engine):
     connection.close()
 
 
+@pytest_asyncio.fixture()
+async def async_db(engine):
+    """
+    Per-test AsyncSession on the app's asyncpg engine (with its timestamp
+    codec), rolled back after each test.  The engine is disposed afterwards
+    because its pool is bound to the test's event loop.
+    """
+    from app import database
+
+    database.get_async_sessionmaker()
+    try:
+        async with database._async_engine.connect() as connection:
+            transaction = await connection.begin()
+            session = AsyncSession(
+                bind=connection,
+                expire_on_commit=False,
+                join_transaction_mode="create_savepoint",
+            )
+            yield session
+            await session.close()
+            await transaction.rollback()
+    finally:
+        await database.close_async_engine()
+
+
+class _AsyncSessionAdapter:
+    """
+    Minimal AsyncSession facade over the per-test sync Session.
+
+    Routes ported to ``get_async_db`` only use the awaitable subset below,
+    so they can run against the same rolled-back transaction as ``test_db``.
+    """
+
+    def __init__(self, session: Session):
+        self._session = session
+
+    def add(self, instance):
+        self._session.add(instance)
+
+    def add_all(self, instances):
+        self._session.add_all(instances)
+
+    async def execute(self, *args, **kwargs):
+        return self._session.execute(*args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return self._session.scalar(*args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return self._session.scalars(*args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return self._session.get(*args, **kwargs)
+
+    async def flush(self, *args, **kwargs):
+        self._session.flush(*args, **kwargs)
+
+    async def refresh(self, instance, *args, **kwargs):
+        self._session.refresh(instance, *args, **kwargs)
+
+    async def commit(self):
+        self._session.commit()
+
+    async def rollback(self):
+        self._session.rollback()
+
+    async def delete(self, instance):
+        self._session.delete(instance)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self._session, *args, **kwargs)
+
+
 # ---------------------------------------------------------------------------
 # Redis fixture
 # ---------------------------------------------------------------------------
@@ -102,6 +178,37 @@ def test_redis():
     return mock
 
 
+@pytest.fixture(autouse=True)
+def _reset_peer_cache():
+    """Keep cached peer lists, HLS objects, breaker state and JWT claims from leaking between tests."""
+    from app.auth import claims_cache
+    from app.circuit_breaker import node_breaker
+    from app.peer_cache import peer_cache
+    from app.segment_cache import segment_cache
+    peer_cache.invalidate()
+    segment_cache.clear()
+    node_breaker.clear_local()
+    claims_cache.clear()
+    yield
+    peer_cache.invalidate()
+    segment_cache.clear()
+    node_breaker.clear_local()
+    claims_cache.clear()
+
+
+# ---------------------------------------------------------------------------
+# Fake Headscale
+# ---------------------------------------------------------------------------
+
+@pytest.fixture()
+def fake_headscale():
+    """A local fake Headscale admin API on a free port (see fake_headscale.py)."""
+    from tests.fake_headscale import FakeHeadscale
+    server = FakeHeadscale().start()
+    yield server
+    server.stop()
+
+
 # ---------------------------------------------------------------------------
 # FastAPI TestClient
 # ---------------------------------------------------------------------------
@@ -134,7 +241,11 @@ def client(test_db):
         finally:
             pass
 
+    async def _override_get_async_db():
+        yield _AsyncSessionAdapter(test_db)
+
     app.dependency_overrides[get_db] = _override_get_db
+    app.dependency_overrides[get_async_db] = _override_get_async_db
     with TestClient(app) as c:
         yield c
     app.dependency_overrides.clear()
@@ -0,0 +1,67 @@
+"""
+Local fake Headscale admin API for tests.
+
+Serves the pre-auth key endpoint HeadscaleClient talks to on a real port
+(uvicorn in a background thread), so tests exercise the actual HTTP client,
+timeouts included.  Set ``fail`` to answer 503, or ``delay`` to stall each
+response.
+"""
+
+import asyncio
+import socket
+import threading
+import time
+import uuid
+from typing import List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+class FakeHeadscale:
+    def __init__(self):
+        self.minted: List[dict] = []
+        self.fail = False
+        self.delay = 0.0
+        self.app = FastAPI()
+        self.app.post("/api/v1/preauthkey")(self._create_preauth_key)
+        self._server = None
+        self._thread = None
+        self.url = ""
+
+    async def _create_preauth_key(self, request: Request):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            return JSONResponse({"message": "unavailable"}, status_code=503)
+        body = await request.json()
+        key = {
+            "key": uuid.uuid4().hex,
+            "user": body.get("user"),
+            "reusable": body.get("reusable"),
+            "expiration": body.get("expiration"),
+        }
+        self.minted.append(key)
+        return {"preAuthKey": key}
+
+    def start(self) -> "FakeHeadscale":
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 5
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("fake Headscale did not start")
+            time.sleep(0.01)
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
@@ -0,0 +1,127 @@
+"""
+Local RTMP test server for probe tests and scripts/bench_rtmp_probe.py.
+
+Accepts the simple handshake, answers connect / createStream / play like
+SRS does (window ack size, peer bandwidth, chunk size, onStatus), then
+sends onMetaData followed by video and audio messages for streams in
+``live``.  Other stream names get NetStream.Play.StreamNotFound.  Streams
+in ``silent`` are "found" but never send media.
+
+Server-side framing reuses app.rtmp_probe.RtmpChunkStream; media goes out
+at the default 128-byte chunk size unless ``chunk_size`` is set, and the
+first video message carries an extended timestamp, so reassembly and
+header compression are exercised on the client.
+"""
+
+import asyncio
+import os
+import struct
+from typing import Optional, Set
+
+from app.rtmp_probe import (
+    CSID_COMMAND,
+    CSID_PROTOCOL,
+    DEFAULT_CHUNK_SIZE,
+    HANDSHAKE_SIZE,
+    MSG_AUDIO,
+    MSG_COMMAND_AMF0,
+    MSG_DATA_AMF0,
+    MSG_SET_PEER_BANDWIDTH,
+    MSG_VIDEO,
+    MSG_WINDOW_ACK_SIZE,
+    RTMP_VERSION,
+    UC_STREAM_BEGIN,
+    RtmpChunkStream,
+    amf0_encode,
+    command_values,
+)
+
+CSID_MEDIA = 6
+VIDEO_PAYLOAD = b"\x17\x01" + os.urandom(1000)  # AVC keyframe, spans several chunks
+AUDIO_PAYLOAD = b"\xaf\x01" + os.urandom(200)
+
+
+class FakeRtmpServer:
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.live: Set[str] = set()
+        self.silent: Set[str] = set()
+        self.created_stream_id: float = 1
+        self.connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.port = 0
+
+    async def start(self) -> "FakeRtmpServer":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def url(self, stream_name: str, app: str = "live") -> str:
+        return f"rtmp://127.0.0.1:{self.port}/{app}/{stream_name}"
+
+    async def _handshake(self, reader, writer) -> None:
+        c0c1 = await reader.readexactly(1 + HANDSHAKE_SIZE)
+        s1 = struct.pack(">II", 0, 0) + os.urandom(HANDSHAKE_SIZE - 8)
+        writer.write(bytes((RTMP_VERSION,)) + s1 + c0c1[1:])  # S0, S1, S2 = C1
+        await writer.drain()
+        await reader.readexactly(HANDSHAKE_SIZE)  # C2
+
+    async def _handle(self, reader, writer) -> None:
+        self.connections += 1
+        try:
+            await self._handshake(reader, writer)
+            chunks = RtmpChunkStream(reader, writer)
+            while True:
+                message = await chunks.read_message()
+                if message.type_id != MSG_COMMAND_AMF0:
+                    continue
+                name, txn, *args = command_values(message)
+                if name == "connect":
+                    chunks.write_message(CSID_PROTOCOL, MSG_WINDOW_ACK_SIZE, struct.pack(">I", 2_500_000))
+                    chunks.write_message(CSID_PROTOCOL, MSG_SET_PEER_BANDWIDTH, struct.pack(">IB", 2_500_000, 2))
+                    if self.chunk_size != DEFAULT_CHUNK_SIZE:
+                        chunks.set_chunk_size(self.chunk_size)
+                    chunks.write_command("onBWDone", 0, None)
+                    chunks.write_command(
+                        "_result", txn,
+                        {"fmsVer": "FMS/3,5,3,888", "capabilities": 127},
+                        {"level": "status", "code": "NetConnection.Connect.Success"},
+                    )
+                elif name == "createStream":
+                    chunks.write_command("_result", txn, None, self.created_stream_id)
+                elif name == "play":
+                    await self._play(chunks, message.stream_id, args[1])
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _play(self, chunks: RtmpChunkStream, stream_id: int, stream_name: str) -> None:
+        if stream_name not in self.live and stream_name not in self.silent:
+            chunks.write_command(
+                "onStatus", 0, None,
+                {"level": "error", "code": "NetStream.Play.StreamNotFound"},
+                stream_id=stream_id, csid=5,
+            )
+            return
+        chunks.write_user_control(UC_STREAM_BEGIN, struct.pack(">I", stream_id))
+        chunks.write_command(
+            "onStatus", 0, None,
+            {"level": "status", "code": "NetStream.Play.Start"},
+            stream_id=stream_id, csid=5,
+        )
+        if stream_name in self.silent:
+            return
+        chunks.write_message(
+            CSID_MEDIA, MSG_DATA_AMF0,
+            amf0_encode("onMetaData", {"width": 1280, "height": 720, "videocodecid": 7}),
+            stream_id=stream_id,
+        )
+        chunks.write_message(CSID_MEDIA, MSG_VIDEO, VIDEO_PAYLOAD, stream_id=stream_id, timestamp=0x1000000)
+        chunks.write_message(CSID_MEDIA, MSG_AUDIO, AUDIO_PAYLOAD, stream_id=stream_id, timestamp=0x1000040)
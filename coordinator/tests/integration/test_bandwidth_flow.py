@@ -16,8 +16,8 @@ from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
 from app import models
-from app.bandwidth_verification import run_bandwidth_verification
-from app.trust_scoring import calculate_trust_score, recalculate_and_store
+from app.bandwidth_verification import run_bandwidth_verification, run_bandwidth_verification_catchup
+from app.trust_scoring import calculate_trust_score, rebuild_trust_counters, recalculate_and_store
 from app.payout_service import PayoutService
 
 
@@ -156,6 +156,115 @@ class TestBandwidthFlowPipeline:
         test_db.refresh(report)
         assert report.is_verified is False
 
+    def test_verification_walks_backlog_in_chunks(self, test_db, make_user, make_stream, make_node):
+        """Small chunks cover every report once, including ones left unverified."""
+        make_user(user_id="chunk-user", trust=0.75)
+        make_stream(stream_id="chunk-stream", owner_user_id="chunk-user")
+        make_node(node_id="chunk-ok", stream_id="chunk-stream", user_id="chunk-user")
+        make_node(node_id="chunk-bad", stream_id="chunk-stream", user_id="chunk-user")
+
+        ok = [
+            self._create_bandwidth_report(test_db, "chunk-stream", "chunk-ok", minutes_ago=100 + 20 * i)
+            for i in range(3)
+        ]
+        bad = [
+            self._create_bandwidth_report(test_db, "chunk-stream", "chunk-bad", minutes_ago=100 + 20 * i)
+            for i in range(2)
+        ]
+        orphan = self._create_bandwidth_report(test_db, "chunk-stream", "chunk-bad", minutes_ago=400)
+        for i in range(3):
+            self._create_probe_result(test_db, "chunk-stream", "chunk-ok", success=True, minutes_ago=100 + 20 * i)
+        for i in range(2):
+            self._create_probe_result(test_db, "chunk-stream", "chunk-bad", success=False, minutes_ago=100 + 20 * i)
+        # A failed and a passed probe in the same window still verifies
+        self._create_probe_result(test_db, "chunk-stream", "chunk-ok", success=False, minutes_ago=100)
+
+        summary = run_bandwidth_verification(test_db, chunk_size=2)
+
+        assert summary == {"verified": 3, "failed": 2, "skipped": 1, "chunks": 3}
+        for report in ok:
+            test_db.refresh(report)
+            assert report.is_verified is True
+        test_db.refresh(ok[0])
+        assert ok[0].verification_notes == "Verified: 1/2 spot checks passed"
+        for report in bad:
+            test_db.refresh(report)
+            assert report.is_verified is False
+            assert report.verification_notes == "Failed: 0/1 spot checks passed during reporting window"
+        test_db.refresh(orphan)
+        assert orphan.verification_notes is None
+
+    def test_verification_ignores_reports_past_lookback(self, test_db, make_user, make_stream, make_node):
+        """Reports older than the lookback window are no longer re-checked."""
+        make_user(user_id="stale-user", trust=0.75)
+        make_stream(stream_id="stale-stream", owner_user_id="stale-user")
+        make_node(node_id="stale-node", stream_id="stale-stream", user_id="stale-user")
+
+        stale = self._create_bandwidth_report(test_db, "stale-stream", "stale-node", minutes_ago=72 * 60)
+        self._create_probe_result(test_db, "stale-stream", "stale-node", success=True, minutes_ago=72 * 60)
+
+        summary = run_bandwidth_verification(test_db)
+
+        assert summary["chunks"] == 0
+        test_db.refresh(stale)
+        assert stale.is_verified is False
+
+        # The catch-up pass has no lower bound and picks it up
+        summary = run_bandwidth_verification_catchup(test_db)
+
+        assert summary["stranded"] == 1
+        assert summary["verified"] == 1
+        test_db.refresh(stale)
+        assert stale.is_verified is True
+
+    def test_trust_counters_follow_ledger_writes(self, test_db, make_user, make_stream, make_node):
+        """Inserts, verification and deletes keep node_trust_daily in step."""
+        make_user(user_id="count-user", trust=0.75)
+        make_stream(stream_id="count-stream", owner_user_id="count-user")
+        make_node(node_id="count-node", stream_id="count-stream", user_id="count-user")
+
+        reports = [
+            self._create_bandwidth_report(test_db, "count-stream", "count-node", minutes_ago=30 + 20 * i)
+            for i in range(6)
+        ]
+        for i in range(4):
+            self._create_probe_result(test_db, "count-stream", "count-node", success=True, minutes_ago=30 + 20 * i)
+
+        run_bandwidth_verification(test_db)
+        assert calculate_trust_score("count-node", test_db) == Decimal("0.67")
+
+        test_db.delete(reports[-1])
+        reports[0].is_verified = False
+        test_db.flush()
+        # 3 verified of 5
+        assert calculate_trust_score("count-node", test_db) == Decimal("0.60")
+        assert rebuild_trust_counters(test_db, ["count-node"]) == 0
+
+    def test_rebuild_repairs_counters_missed_by_bulk_insert(self, test_db, make_user, make_stream, make_node):
+        """Core inserts bypass the ORM hook; the consistency check catches them."""
+        make_user(user_id="drift-user", trust=0.75)
+        make_stream(stream_id="drift-stream", owner_user_id="drift-user")
+        make_node(node_id="drift-node", stream_id="drift-stream", user_id="drift-user")
+
+        now = datetime.now(timezone.utc)
+        test_db.execute(models.BandwidthLedger.__table__.insert(), [
+            {
+                "session_id": "drift-stream",
+                "reporting_node_id": "drift-node",
+                "bytes_transferred": 100_000,
+                "report_timestamp": now - timedelta(days=i),
+                "start_interval": now - timedelta(days=i, hours=1),
+                "end_interval": now - timedelta(days=i),
+                "is_verified": i % 2 == 0,
+            }
+            for i in range(6)
+        ])
+        assert calculate_trust_score("drift-node", test_db) == Decimal("0.75")
+
+        assert rebuild_trust_counters(test_db, ["drift-node"]) == 6
+        assert calculate_trust_score("drift-node", test_db) == Decimal("0.50")
+        assert rebuild_trust_counters(test_db, ["drift-node"]) == 0
+
     def test_payout_applies_trust_penalty(self, test_db, make_user, make_stream, make_node):
         """
         Nodes with trust < 0.5 get a 50% payout penalty.
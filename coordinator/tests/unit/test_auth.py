@@ -9,12 +9,20 @@ from unittest.mock import patch
 
 import jwt as pyjwt
 import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
 
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app import auth
 from app.auth import (
     ALGORITHM,
     ISSUER,
     TOKEN_EXPIRY_HOURS,
     AuthenticatedUser,
+    VerifiedClaimsCache,
+    claims_cache,
     decode_jwt,
     encode_jwt,
     get_jwks,
@@ -175,3 +183,166 @@ class TestJWKS:
         assert key["use"] == "sig"
         assert "n" in key
         assert "e" in key
+
+
+# ---------------------------------------------------------------------------
+# Key algorithms and rotation
+# ---------------------------------------------------------------------------
+
+
+def _pem(public_key) -> str:
+    return public_key.public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+
+
+@pytest.fixture()
+def restore_keyring():
+    old_keyring = auth._keyring
+    yield
+    auth._keyring = old_keyring
+    claims_cache.clear()
+
+
+@pytest.mark.usefixtures("restore_keyring")
+class TestKeyRotation:
+    def test_eddsa_signing(self, monkeypatch):
+        monkeypatch.setattr(auth, "ALGORITHM", "EdDSA")
+        auth._load_keys()
+
+        token = encode_jwt(user_id="kr-u1", role="node")
+        header = pyjwt.get_unverified_header(token)
+
+        assert header["alg"] == "EdDSA"
+        assert header["kid"] == auth.key_id(get_public_key())
+        assert decode_jwt(token)["sub"] == "kr-u1"
+        (key,) = get_jwks()["keys"]
+        assert key == {**key, "kty": "OKP", "crv": "Ed25519", "alg": "EdDSA", "kid": header["kid"]}
+
+    def test_rs256_tokens_verify_after_switch_to_eddsa(self, monkeypatch):
+        rsa_token = encode_jwt(user_id="kr-u2", role="node")
+        legacy_token = pyjwt.encode(  # issued before tokens carried a kid
+            {"sub": "kr-u3", "iss": ISSUER, "exp": datetime.now(timezone.utc) + timedelta(hours=1)},
+            get_private_key(),
+            algorithm="RS256",
+        )
+        monkeypatch.setenv("JWT_ADDITIONAL_PUBLIC_KEYS", _pem(get_public_key()))
+        monkeypatch.setattr(auth, "ALGORITHM", "EdDSA")
+        auth._load_keys()
+
+        assert decode_jwt(rsa_token)["sub"] == "kr-u2"
+        assert decode_jwt(legacy_token)["sub"] == "kr-u3"
+        assert pyjwt.get_unverified_header(encode_jwt(user_id="kr-u4", role="node"))["alg"] == "EdDSA"
+        keys = get_jwks()["keys"]
+        assert [k["alg"] for k in keys] == ["EdDSA", "RS256"]
+        assert keys[1]["kid"] == pyjwt.get_unverified_header(rsa_token)["kid"]
+
+    def test_retired_key_is_rejected(self):
+        token = encode_jwt(user_id="kr-u5", role="node")
+        auth._load_keys()  # rotate without keeping the old key
+
+        with pytest.raises(pyjwt.InvalidTokenError):
+            decode_jwt(token)
+
+    def test_unknown_kid_rejected(self):
+        token = pyjwt.encode(
+            {"sub": "kr-u6", "iss": ISSUER, "exp": datetime.now(timezone.utc) + timedelta(hours=1)},
+            get_private_key(),
+            algorithm=ALGORITHM,
+            headers={"kid": "not-a-key"},
+        )
+        with pytest.raises(pyjwt.InvalidTokenError):
+            decode_jwt(token)
+
+    def test_mismatched_key_type_rejected(self, monkeypatch):
+        private_key = ed25519.Ed25519PrivateKey.generate()
+        monkeypatch.setenv("JWT_PRIVATE_KEY", private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode())
+        monkeypatch.setenv("JWT_PUBLIC_KEY", _pem(private_key.public_key()))
+
+        with pytest.raises(ValueError):
+            auth._load_keys()  # ALGORITHM is still RS256
+
+
+# ---------------------------------------------------------------------------
+# Verified claims cache
+# ---------------------------------------------------------------------------
+
+
+def _bearer(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+class TestClaimsCache:
+    @pytest.mark.asyncio
+    async def test_repeat_token_skips_verification(self):
+        token = encode_jwt(user_id="cc-u1", role="node", node_id="cc-n1", stream_ids=["s1"])
+
+        with patch("app.auth.decode_jwt", wraps=decode_jwt) as verify:
+            first = await auth.get_current_user(_bearer(token))
+            first.stream_ids.append("mutated")
+            second = await auth.get_current_user(_bearer(token))
+
+        assert verify.call_count == 1
+        assert second == AuthenticatedUser(user_id="cc-u1", node_id="cc-n1", role="node", stream_ids=["s1"])
+        assert claims_cache.stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_entry_not_served_past_exp(self):
+        token = encode_jwt(user_id="cc-u2", role="node")
+        await auth.get_current_user(_bearer(token))
+
+        exp = decode_jwt(token)["exp"]
+        with patch("app.auth.time.time", return_value=exp + 1), \
+             patch("app.auth.decode_jwt", side_effect=pyjwt.ExpiredSignatureError("expired")):
+            with pytest.raises(HTTPException) as exc:
+                await auth.get_current_user(_bearer(token))
+
+        assert exc.value.status_code == 401
+        assert exc.value.detail == "Token expired"
+        assert claims_cache.stats()["expired"] == 1
+
+    @pytest.mark.asyncio
+    async def test_invalid_token_is_not_cached(self):
+        token = encode_jwt(user_id="cc-u3", role="node")
+        tampered = token[:-4] + "AAAA"
+
+        for _ in range(2):
+            with pytest.raises(HTTPException):
+                await auth.get_current_user(_bearer(tampered))
+
+        assert claims_cache.stats()["entries"] == 0
+
+    @pytest.mark.asyncio
+    async def test_key_reload_invalidates(self):
+        token = encode_jwt(user_id="cc-u4", role="node")
+        await auth.get_current_user(_bearer(token))
+        old_keyring = auth._keyring
+
+        try:
+            auth._load_keys()  # new ephemeral key pair
+            assert claims_cache.stats()["entries"] == 0
+            with pytest.raises(HTTPException):
+                await auth.get_current_user(_bearer(token))
+        finally:
+            auth._keyring = old_keyring
+            claims_cache.clear()
+
+    def test_lru_eviction(self):
+        cache = VerifiedClaimsCache(max_entries=2)
+        exp = time.time() + 60
+        for name in ("a", "b"):
+            cache.put(name, {"sub": name, "exp": exp})
+        assert cache.get("a") is not None  # a is now most recent
+        cache.put("c", {"sub": "c", "exp": exp})
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        assert cache.metrics.evictions == 1
+
+    def test_disabled_when_size_zero(self):
+        cache = VerifiedClaimsCache(max_entries=0)
+        cache.put("a", {"sub": "a", "exp": time.time() + 60})
+        assert cache.get("a") is None
@@ -0,0 +1,180 @@
+"""
+Unit tests for the per-node proxy circuit breaker — state transitions, the
+half-open probe lock, and the proxy skipping / evacuating tripped nodes.
+"""
+
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app import proxy
+from app.circuit_breaker import CLOSED, HALF_OPEN, NodeCircuitBreaker
+
+
+class _Body(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        yield b"ok"
+
+
+def _redis(rows=None, tripped=0, probe=True):
+    r = MagicMock()
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=rows or [{}])
+    r.pipeline.return_value = pipe
+    r.register_script.return_value = AsyncMock(return_value=tripped)
+    r.set = AsyncMock(return_value=probe)
+    r.delete = AsyncMock()
+    return r
+
+
+# ---------------------------------------------------------------------------
+# NodeCircuitBreaker
+# ---------------------------------------------------------------------------
+
+
+class TestNodeCircuitBreaker:
+    @pytest.mark.asyncio
+    async def test_closed_node_is_allowed(self):
+        breaker = NodeCircuitBreaker()
+        r = _redis([{"failures": "1"}])
+        with patch("app.circuit_breaker.get_redis", new_callable=AsyncMock, return_value=r):
+            assert await breaker.allow("n1") is True
+            assert await breaker.states(["n1"]) == {"n1": CLOSED}
+        # Second lookup within the local cache window doesn't hit Redis
+        assert r.pipeline.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_open_node_is_skipped(self):
+        breaker = NodeCircuitBreaker()
+        r = _redis([{"failures": "3", "state": "open", "opened_at": str(time.time())}])
+        with patch("app.circuit_breaker.get_redis", new_callable=AsyncMock, return_value=r):
+            assert await breaker.allow("n1") is False
+            assert await breaker.open_nodes(["n1"]) == {"n1"}
+
+    @pytest.mark.asyncio
+    async def test_half_open_allows_one_probe(self):
+        breaker = NodeCircuitBreaker()
+        opened = str(time.time() - 60)
+        r = _redis([{"failures": "3", "state": "open", "opened_at": opened}])
+        with patch("app.circuit_breaker.get_redis", new_callable=AsyncMock, return_value=r), \
+             patch("app.circuit_breaker.BREAKER_COOLDOWN_SECONDS", 15.0):
+            assert await breaker.states(["n1"]) == {"n1": HALF_OPEN}
+            assert await breaker.allow("n1") is True
+            r.set.return_value = False  # another replica holds the probe
+            assert await breaker.allow("n1") is False
+        assert r.set.call_args.kwargs["nx"] is True
+
+    @pytest.mark.asyncio
+    async def test_failure_trips_breaker(self):
+        breaker = NodeCircuitBreaker()
+        r = _redis(tripped=1)
+        with patch("app.circuit_breaker.get_redis", new_callable=AsyncMock, return_value=r):
+            assert await breaker.record_failure("n1") is True
+            assert await breaker.allow("n1") is False
+        script = r.register_script.return_value
+        assert script.call_args.kwargs["keys"] == ["breaker:node:n1"]
+        r.pipeline.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_success_resets_only_when_needed(self):
+        breaker = NodeCircuitBreaker()
+        r = _redis([{}])
+        with patch("app.circuit_breaker.get_redis", new_callable=AsyncMock, return_value=r):
+            await breaker.allow("n1")
+            await breaker.record_success("n1")
+            r.delete.assert_not_awaited()
+
+            breaker.clear_local()
+            r.pipeline.return_value.execute.return_value = [{"failures": "2"}]
+            await breaker.allow("n1")
+            await breaker.record_success("n1")
+            r.delete.assert_awaited_once_with("breaker:node:n1", "breaker:node:n1:probe")
+            assert await breaker.states(["n1"]) == {"n1": CLOSED}
+
+    @pytest.mark.asyncio
+    async def test_redis_errors_fail_open(self):
+        breaker = NodeCircuitBreaker()
+        with patch("app.circuit_breaker.get_redis", new_callable=AsyncMock, side_effect=ConnectionError):
+            assert await breaker.allow("n1") is True
+            assert await breaker.record_failure("n1") is False
+
+
+# ---------------------------------------------------------------------------
+# Proxy integration
+# ---------------------------------------------------------------------------
+
+
+_NODES = [
+    {"node_id": "dead", "vpn_ip": "100.64.0.1", "trust_score": 0.9, "capacity_pct": 10, "viewer_count": 2},
+    {"node_id": "n2", "vpn_ip": "100.64.0.2", "trust_score": 0.8, "capacity_pct": 10, "viewer_count": 0},
+    {"node_id": "n3", "vpn_ip": "100.64.0.3", "trust_score": 0.7, "capacity_pct": 10, "viewer_count": 0},
+]
+
+
+class TestProxyBreaker:
+    @pytest.mark.asyncio
+    async def test_open_node_skipped_without_upstream_call(self):
+        hosts = []
+
+        def node(request):
+            hosts.append(request.url.host)
+            return httpx.Response(
+                200, headers={"content-type": "video/mp2t", "content-length": "2"}, stream=_Body(),
+            )
+
+        app = FastAPI()
+        app.include_router(proxy.router)
+        async def _allow(node_id):
+            return node_id != "dead"
+
+        with patch("app.proxy._get_viewer_assignment", new_callable=AsyncMock, return_value="dead"), \
+             patch("app.proxy.get_redis", new_callable=AsyncMock), \
+             patch("app.proxy.get_stream_nodes", new_callable=AsyncMock, return_value=_NODES[:2]), \
+             patch("app.proxy.get_loads", new_callable=AsyncMock, return_value={}), \
+             patch("app.proxy.assign_viewer", new_callable=AsyncMock) as assign, \
+             patch.object(proxy.node_breaker, "allow", side_effect=_allow), \
+             patch.object(proxy.node_breaker, "open_nodes", new_callable=AsyncMock, return_value={"dead"}), \
+             patch.object(proxy, "_vpn_client", httpx.AsyncClient(transport=httpx.MockTransport(node))):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+                resp = await c.get("/api/v1/proxy/s1/index.m3u8")
+
+        assert resp.status_code == 200
+        assert hosts == ["100.64.0.2"]
+        assign.assert_awaited_once()
+        assert assign.call_args.args[1:] == ("s1", "127.0.0.1", "n2")
+
+    @pytest.mark.asyncio
+    async def test_tripping_breaker_moves_viewers_in_bulk(self):
+        redis = MagicMock()
+        redis.hgetall = AsyncMock(return_value={"v1": "dead", "v2": "dead", "v3": "n2", "v4": "dead"})
+
+        with patch("app.proxy.get_redis", new_callable=AsyncMock, return_value=redis), \
+             patch("app.proxy.get_stream_nodes", new_callable=AsyncMock, return_value=_NODES), \
+             patch("app.proxy.get_loads", new_callable=AsyncMock, return_value={"n2": 40}), \
+             patch("app.proxy.assign_viewers", new_callable=AsyncMock) as assign, \
+             patch.object(proxy.node_breaker, "record_failure", new_callable=AsyncMock, return_value=True), \
+             patch.object(proxy.node_breaker, "open_nodes", new_callable=AsyncMock, return_value=set()):
+            await proxy._node_failed("s1", "dead")
+
+        assign.assert_awaited_once()
+        mapping = assign.call_args.args[2]
+        assert set(mapping) == {"v1", "v2", "v4"}
+        # n2 is already loaded, so the displaced viewers go to n3
+        assert set(mapping.values()) == {"n3"}
+
+    @pytest.mark.asyncio
+    async def test_viewers_unassigned_when_no_healthy_nodes(self):
+        redis = MagicMock()
+        redis.hgetall = AsyncMock(return_value={"v1": "dead"})
+
+        with patch("app.proxy.get_redis", new_callable=AsyncMock, return_value=redis), \
+             patch("app.proxy.get_stream_nodes", new_callable=AsyncMock, return_value=_NODES[:1]), \
+             patch("app.proxy.assign_viewers", new_callable=AsyncMock) as assign, \
+             patch.object(proxy.node_breaker, "open_nodes", new_callable=AsyncMock, return_value=set()):
+            moved = await proxy._evacuate_node("s1", "dead")
+
+        assert moved == 1
+        assign.assert_awaited_once_with(redis, "s1", {"v1": None})
@@ -150,3 +150,53 @@ class TestFullCycle:
         assert result["aggregated"] == 0
         assert result["bandwidth_deleted"] == 0
         assert result["probes_deleted"] == 0
+
+
+class TestBatching:
+    def test_small_batches_aggregate_every_row_once(self, test_db, make_user, make_stream, make_node):
+        make_user(user_id="dr-u7")
+        make_stream(stream_id="dr-s7", owner_user_id="dr-u7")
+        make_node(node_id="dr-n7", stream_id="dr-s7", user_id="dr-u7")
+
+        for _ in range(5):
+            _add_ledger(test_db, "dr-n7", "dr-s7", days_ago=100, bytes_transferred=2_000_000)
+        _add_ledger(test_db, "dr-n7", "dr-s7", days_ago=100, bytes_transferred=1_000_000, verified=False)
+        _add_ledger(test_db, "dr-n7", "dr-s7", days_ago=10)
+
+        with patch.dict("os.environ", {
+            "DATA_RETENTION_BATCH_SIZE": "2",
+            "DATA_RETENTION_BATCH_PAUSE_SECONDS": "0",
+        }):
+            result = run_data_retention(test_db)
+
+        assert result["bandwidth_deleted"] == 6
+        assert result["complete"] is True
+        summaries = test_db.query(models.MonthlySummary).filter_by(node_id="dr-n7").all()
+        assert sum(s.total_bytes for s in summaries) == 11_000_000
+        assert sum(s.verified_bytes for s in summaries) == 10_000_000
+        assert sum(s.total_reports for s in summaries) == 6
+        assert all(s.user_id == "dr-u7" for s in summaries)
+        assert all(s.avg_trust_score == Decimal("0.90") for s in summaries)
+        assert test_db.query(models.BandwidthLedger).count() == 1
+
+    def test_stops_at_time_budget(self, test_db, make_user, make_stream, make_node):
+        make_user(user_id="dr-u8")
+        make_stream(stream_id="dr-s8", owner_user_id="dr-u8")
+        make_node(node_id="dr-n8", stream_id="dr-s8", user_id="dr-u8")
+
+        for _ in range(3):
+            _add_ledger(test_db, "dr-n8", "dr-s8", days_ago=100)
+            _add_probe(test_db, "dr-n8", "dr-s8", days_ago=70)
+
+        with patch.dict("os.environ", {
+            "DATA_RETENTION_BATCH_SIZE": "2",
+            "DATA_RETENTION_BATCH_PAUSE_SECONDS": "0",
+            "DATA_RETENTION_TIME_BUDGET_SECONDS": "0",
+        }):
+            result = run_data_retention(test_db)
+
+        assert result["complete"] is False
+        assert result["bandwidth_deleted"] == 0
+        assert result["probes_deleted"] == 0
+        # The next run picks up where this one left off
+        assert run_data_retention(test_db)["bandwidth_deleted"] == 3
@@ -0,0 +1,52 @@
+"""
+Tests against a real asyncpg AsyncSession — timestamp codec and routes
+ported to ``get_async_db``.  Skipped when PostgreSQL is unavailable.
+"""
+
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from sqlalchemy import select
+
+from app import models
+from app.database import _to_async_url
+
+
+def test_to_async_url_maps_driver():
+    assert _to_async_url("postgresql://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    assert _to_async_url("postgresql+psycopg2://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    assert _to_async_url("sqlite:///x.db") == "sqlite:///x.db"
+
+
+class TestAsyncSession:
+    @pytest.mark.asyncio
+    async def test_aware_timestamps_are_stored_as_naive_utc(self, async_db):
+        aware = datetime.now(timezone(timedelta(hours=2))).replace(microsecond=0)
+        async_db.add(models.UserIdentity(user_id="async-user", display_name="Async", role="node"))
+        await async_db.flush()
+        async_db.add(models.UserAccount(user_id="async-user", last_updated_at=aware))
+        await async_db.flush()
+
+        stored = await async_db.scalar(
+            select(models.UserAccount.last_updated_at).where(models.UserAccount.user_id == "async-user")
+        )
+        assert stored.tzinfo is None
+        assert stored == aware.astimezone(timezone.utc).replace(tzinfo=None)
+
+    @pytest.mark.asyncio
+    async def test_node_economics_route_runs_on_async_session(self, async_db):
+        from app.main import get_node_economics
+
+        async_db.add(models.UserIdentity(user_id="async-user", display_name="Async", role="node"))
+        await async_db.flush()
+        async_db.add(models.UserAccount(user_id="async-user", balance_usd=Decimal("1.5")))
+        await async_db.flush()
+
+        with patch("app.main.response_cache.get_cached", new_callable=AsyncMock, return_value=None), \
+             patch("app.main.response_cache.set_cached", new_callable=AsyncMock):
+            body = await get_node_economics("async-user", db=async_db)
+
+        assert body.balance_usd == Decimal("1.5")
+        assert len(body.hourly_earnings) == 24
@@ -0,0 +1,120 @@
+"""
+Unit tests for the economics snapshot — the dashboard and validation report
+serving the stored snapshot with its age, the authenticated, debounced
+manual refresh endpoint, and explicit report ranges computed live.
+"""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from app import models
+from app.auth import encode_jwt
+from app.economics_snapshot import compute_metrics, get_snapshot, refresh_snapshot
+
+
+def _add_report(db, node_id, stream_id, bytes_transferred, verified=True, hours_ago=1):
+    ts = datetime.now(timezone.utc) - timedelta(hours=hours_ago)
+    db.add(models.BandwidthLedger(
+        session_id=stream_id,
+        reporting_node_id=node_id,
+        bytes_transferred=bytes_transferred,
+        report_timestamp=ts,
+        start_interval=ts - timedelta(minutes=1),
+        end_interval=ts,
+        is_verified=verified,
+    ))
+    db.flush()
+
+
+def _setup(make_user, make_stream, make_node):
+    make_user(user_id="es-u1")
+    make_stream(stream_id="es-s1", owner_user_id="es-u1")
+    make_node(node_id="es-n1", stream_id="es-s1", user_id="es-u1")
+
+
+class TestComputeMetrics:
+    def test_counts_window_only(self, test_db, make_user, make_stream, make_node):
+        _setup(make_user, make_stream, make_node)
+        _add_report(test_db, "es-n1", "es-s1", 1_073_741_824)
+        _add_report(test_db, "es-n1", "es-s1", 500, verified=False)
+        _add_report(test_db, "es-n1", "es-s1", 7, hours_ago=30)
+        now = datetime.now(timezone.utc)
+
+        metrics = compute_metrics(test_db, now - timedelta(hours=24), now)
+
+        assert metrics["streams"] == {"total": 1, "live": 1, "active_sessions": 1}
+        assert metrics["nodes"] == {"total": 1, "active": 1, "flagged": 0}
+        assert metrics["bandwidth"]["total_bytes"] == 1_073_741_824 + 500
+        assert metrics["bandwidth"]["verified_bytes"] == 1_073_741_824
+        assert metrics["bandwidth"]["total_reports"] == 2
+        assert metrics["bandwidth"]["verified_reports"] == 1
+
+
+class TestSnapshotReads:
+    def test_dashboard_serves_snapshot_until_refreshed(self, test_db, client, make_user, make_stream, make_node):
+        _setup(make_user, make_stream, make_node)
+        _add_report(test_db, "es-n1", "es-s1", 1_073_741_824)
+        refresh_snapshot(test_db)
+
+        body = client.get("/api/v1/economics/dashboard").json()
+        assert float(body["total_gb_delivered_24h"]) == 1.0
+        assert body["snapshot"]["age_seconds"] >= 0
+        assert "refreshed_at" in body["snapshot"]
+
+        # New data isn't visible until the snapshot is refreshed
+        _add_report(test_db, "es-n1", "es-s1", 1_073_741_824)
+        assert float(client.get("/api/v1/economics/dashboard").json()["total_gb_delivered_24h"]) == 1.0
+
+        refresh_snapshot(test_db)
+        assert float(client.get("/api/v1/economics/dashboard").json()["total_gb_delivered_24h"]) == 2.0
+
+    def test_missing_snapshot_is_computed_on_first_read(self, test_db):
+        assert test_db.get(models.EconomicsSnapshot, 1) is None
+
+        payload, staleness = get_snapshot(test_db)
+
+        assert test_db.get(models.EconomicsSnapshot, 1) is not None
+        assert payload["bandwidth"]["total_reports"] >= 0
+        assert staleness["age_seconds"] >= 0
+
+    def test_validation_report_default_range_uses_snapshot(self, test_db, client, make_user, make_stream, make_node):
+        _setup(make_user, make_stream, make_node)
+        refresh_snapshot(test_db)
+        _add_report(test_db, "es-n1", "es-s1", 1_073_741_824)
+
+        cached = client.get("/api/v1/admin/validation-report").json()
+        assert cached["snapshot"] is not None
+        assert cached["bandwidth"]["total_reports"] == 0
+
+        start = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
+        live = client.get("/api/v1/admin/validation-report", params={"start": start}).json()
+        assert live["snapshot"] is None
+        assert live["bandwidth"]["total_reports"] == 1
+        assert live["stream_uptime"]["live_streams"] == 1
+
+
+def _auth(role: str) -> dict:
+    return {"Authorization": f"Bearer {encode_jwt(user_id='es-admin', role=role)}"}
+
+
+class TestManualRefresh:
+    def test_requires_streamer_token(self, client):
+        assert client.post("/api/v1/admin/economics/refresh").status_code in (401, 403)
+        assert client.post("/api/v1/admin/economics/refresh", headers=_auth("node")).status_code == 403
+
+    def test_refreshes_then_debounces(self, test_db, client, make_user, make_stream, make_node):
+        _setup(make_user, make_stream, make_node)
+        _add_report(test_db, "es-n1", "es-s1", 1_073_741_824)
+        refresh_snapshot(test_db)
+        _add_report(test_db, "es-n1", "es-s1", 1_073_741_824)
+
+        # Too recent to refresh again
+        resp = client.post("/api/v1/admin/economics/refresh", headers=_auth("streamer"))
+        assert resp.status_code == 429
+        assert int(resp.headers["retry-after"]) >= 1
+
+        with patch("app.economics_snapshot.ECONOMICS_SNAPSHOT_MIN_REFRESH_SECONDS", 0):
+            resp = client.post("/api/v1/admin/economics/refresh", headers=_auth("streamer"))
+        assert resp.status_code == 200
+        assert resp.json()["snapshot"]["age_seconds"] >= 0
+        assert float(client.get("/api/v1/economics/dashboard").json()["total_gb_delivered_24h"]) == 2.0
@@ -0,0 +1,298 @@
+"""
+Unit tests for batched heartbeat ingestion — per-node coalescing,
+stream existence caching, bulk flush and requeue on failure.
+"""
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from app.heartbeat_ingest import POSTGRES_MAX_BIND_PARAMS, HeartbeatIngestor, PendingHeartbeat
+from app.redis_state import decode_node_state
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _hb(node_id="n1", stream_id="s1", vpn_ip="10.0.0.1", capacity=20, user_id="u1"):
+    return PendingHeartbeat(
+        node_id=node_id,
+        stream_id=stream_id,
+        user_id=user_id,
+        stats_url=f"http://{node_id}/stats.json",
+        vpn_ip=vpn_ip,
+        capacity_pct=capacity,
+        timestamp=datetime.now(timezone.utc),
+    )
+
+
+def _mock_session(known_streams, upserted, trust_rows):
+    db = MagicMock()
+    db.scalars = AsyncMock(return_value=MagicMock(all=MagicMock(return_value=known_streams)))
+    db.execute = AsyncMock(side_effect=[
+        MagicMock(all=MagicMock(return_value=upserted)),
+        MagicMock(all=MagicMock(return_value=trust_rows)),
+    ])
+    db.commit = AsyncMock()
+    ctx = MagicMock()
+    ctx.__aenter__ = AsyncMock(return_value=db)
+    ctx.__aexit__ = AsyncMock(return_value=False)
+    return db, MagicMock(return_value=ctx)
+
+
+def _mock_redis():
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[])
+    r = MagicMock()
+    r.pipeline = MagicMock(return_value=pipe)
+    return r, pipe
+
+
+# ---------------------------------------------------------------------------
+# submit()
+# ---------------------------------------------------------------------------
+
+
+class TestSubmit:
+    def test_coalesces_same_node_and_stream(self):
+        ingestor = HeartbeatIngestor()
+        ingestor.submit(_hb(capacity=10))
+        ingestor.submit(_hb(capacity=40))
+        assert ingestor.queue_depth == 1
+        assert ingestor.metrics.received == 2
+        assert ingestor.metrics.coalesced == 1
+        assert ingestor._pending[("n1", "s1")].capacity_pct == 40
+
+    def test_distinct_streams_kept_separate(self):
+        ingestor = HeartbeatIngestor()
+        ingestor.submit(_hb(stream_id="s1"))
+        ingestor.submit(_hb(stream_id="s2"))
+        assert ingestor.queue_depth == 2
+
+    def test_omitted_fields_keep_previous_values(self):
+        ingestor = HeartbeatIngestor()
+        ingestor.submit(_hb(vpn_ip="10.0.0.9", capacity=55))
+        ingestor.submit(_hb(vpn_ip=None, capacity=None))
+        pending = ingestor._pending[("n1", "s1")]
+        assert pending.vpn_ip == "10.0.0.9"
+        assert pending.capacity_pct == 55
+
+    def test_take_batch_respects_max_batch(self):
+        ingestor = HeartbeatIngestor(max_batch=2)
+        for i in range(5):
+            ingestor.submit(_hb(node_id=f"n{i}"))
+        batch = ingestor._take_batch()
+        assert len(batch) == 2
+        assert ingestor.queue_depth == 3
+
+
+class TestIngest:
+    @pytest.mark.asyncio
+    async def test_first_heartbeat_is_written_before_returning(self):
+        ingestor = HeartbeatIngestor()
+
+        async def _write(batch):
+            ingestor._written[("n1", "s1")] = 0.0
+            return len(batch)
+
+        with patch.object(ingestor, "_write_batch", side_effect=_write) as write:
+            await ingestor.ingest(_hb())
+            write.assert_awaited_once()
+            assert ingestor.queue_depth == 0
+
+            # Later heartbeats are batched
+            await ingestor.ingest(_hb())
+            write.assert_awaited_once()
+        assert ingestor.queue_depth == 1
+        assert ingestor.metrics.immediate_writes == 1
+        assert ingestor.metrics.received == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_first_write_is_not_acknowledged(self):
+        ingestor = HeartbeatIngestor()
+        with patch.object(ingestor, "_write_batch", side_effect=RuntimeError("db down")):
+            with pytest.raises(RuntimeError):
+                await ingestor.ingest(_hb())
+        assert ("n1", "s1") not in ingestor._written
+
+
+# ---------------------------------------------------------------------------
+# stream_exists()
+# ---------------------------------------------------------------------------
+
+
+class TestStreamExists:
+    @pytest.mark.asyncio
+    async def test_positive_answer_is_cached(self):
+        ingestor = HeartbeatIngestor(stream_cache_seconds=60)
+        db = MagicMock()
+        db.scalar = AsyncMock(return_value=1)
+        assert await ingestor.stream_exists(db, "s1") is True
+        assert await ingestor.stream_exists(db, "s1") is True
+        assert db.scalar.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_missing_stream_not_cached(self):
+        ingestor = HeartbeatIngestor()
+        db = MagicMock()
+        db.scalar = AsyncMock(return_value=None)
+        assert await ingestor.stream_exists(db, "gone") is False
+        assert await ingestor.stream_exists(db, "gone") is False
+        assert db.scalar.await_count == 2
+
+
+# ---------------------------------------------------------------------------
+# flush()
+# ---------------------------------------------------------------------------
+
+
+class TestFlush:
+    @pytest.mark.asyncio
+    async def test_flush_writes_batch_and_pipelines_redis(self):
+        ingestor = HeartbeatIngestor()
+        ingestor.submit(_hb(node_id="n1", user_id="u1"))
+        ingestor.submit(_hb(node_id="n2", user_id="u2"))
+        upserted = [
+            SimpleNamespace(node_id="n1", stream_id="s1", user_id="u1", vpn_ip="10.0.0.1", capacity_pct=20),
+            SimpleNamespace(node_id="n2", stream_id="s1", user_id="u2", vpn_ip="10.0.0.1", capacity_pct=20),
+        ]
+        db, factory = _mock_session(["s1"], upserted, [("u1", 0.9)])
+        r, pipe = _mock_redis()
+
+        with patch("app.heartbeat_ingest.get_async_sessionmaker", return_value=factory), \
+             patch("app.heartbeat_ingest.get_redis", new_callable=AsyncMock, return_value=r):
+            written = await ingestor.flush()
+
+        assert written == 2
+        assert ingestor.queue_depth == 0
+        assert ingestor.metrics.flushes == 1
+        db.commit.assert_awaited_once()
+        # One round trip for all nodes
+        assert pipe.hset.call_count == 2
+        pipe.execute.assert_awaited_once()
+        # Unknown user falls back to the default trust score
+        values = {c.args[1]: decode_node_state(c.args[2]) for c in pipe.hset.call_args_list}
+        assert values["n1"]["trust_score"] == 0.9
+        assert values["n2"]["trust_score"] == 0.75
+
+    @pytest.mark.asyncio
+    async def test_peer_invalidation_only_on_new_node_or_ip_change(self):
+        ingestor = HeartbeatIngestor()
+        row = SimpleNamespace(node_id="n1", stream_id="s1", user_id="u1", vpn_ip="10.0.0.1", capacity_pct=20)
+        moved = SimpleNamespace(**{**vars(row), "vpn_ip": "10.0.0.2"})
+        published = []
+        for upserted in ([row], [row], [moved]):
+            ingestor.submit(_hb())
+            _, factory = _mock_session(["s1"], upserted, [])
+            r, pipe = _mock_redis()
+            with patch("app.heartbeat_ingest.get_async_sessionmaker", return_value=factory), \
+                 patch("app.heartbeat_ingest.get_redis", new_callable=AsyncMock, return_value=r):
+                await ingestor.flush()
+            published.append(pipe.publish.call_count)
+        assert published == [1, 0, 1]
+
+    def test_published_entries_are_pruned_by_age(self):
+        ingestor = HeartbeatIngestor()
+        ingestor._published = {("old", "s1"): ("10.0.0.1", 0.0), ("new", "s1"): ("10.0.0.2", 95.0)}
+        ingestor._last_prune = 0.0
+
+        with patch("app.heartbeat_ingest.time.monotonic", return_value=100.0):
+            ingestor._prune_published()
+
+        assert list(ingestor._published) == [("new", "s1")]
+        assert ingestor.metrics.pruned == 1
+
+    @pytest.mark.asyncio
+    async def test_unknown_streams_are_dropped(self):
+        ingestor = HeartbeatIngestor()
+        ingestor.submit(_hb(stream_id="deleted"))
+        db, factory = _mock_session([], [], [])
+
+        with patch("app.heartbeat_ingest.get_async_sessionmaker", return_value=factory):
+            written = await ingestor.flush()
+
+        assert written == 0
+        assert ingestor.metrics.dropped_unknown_stream == 1
+        db.execute.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_requeues_without_clobbering_newer(self):
+        ingestor = HeartbeatIngestor()
+        ingestor.submit(_hb(node_id="n1", capacity=10))
+        ingestor.submit(_hb(node_id="n2", capacity=10))
+
+        async def _fail(batch):
+            # A newer heartbeat arrives while the flush is in flight
+            ingestor.submit(_hb(node_id="n1", capacity=99))
+            raise RuntimeError("db down")
+
+        with patch.object(ingestor, "_write_batch", side_effect=_fail):
+            with pytest.raises(RuntimeError):
+                await ingestor.flush()
+
+        assert ingestor.queue_depth == 2
+        assert ingestor._pending[("n1", "s1")].capacity_pct == 99
+        assert ingestor.metrics.failed_flushes == 1
+
+    @pytest.mark.asyncio
+    async def test_large_batch_is_chunked_under_bind_param_limit(self):
+        ingestor = HeartbeatIngestor(max_batch=5000)
+        for i in range(5000):
+            ingestor.submit(_hb(node_id=f"n{i}"))
+        statements = []
+
+        async def _execute(stmt):
+            statements.append(stmt)
+            return MagicMock(all=MagicMock(return_value=[]))
+
+        db, factory = _mock_session(["s1"], [], [])
+        db.execute = AsyncMock(side_effect=_execute)
+        r, _ = _mock_redis()
+
+        with patch("app.heartbeat_ingest.get_async_sessionmaker", return_value=factory), \
+             patch("app.heartbeat_ingest.get_redis", new_callable=AsyncMock, return_value=r):
+            await ingestor.flush()
+
+        # 5000 rows x 9 parameters in one statement would be 45000
+        upserts = statements[:-1]  # the last one is the trust-score lookup
+        assert len(upserts) == 2
+        for stmt in upserts:
+            assert len(stmt.compile(dialect=asyncpg.dialect()).params) <= POSTGRES_MAX_BIND_PARAMS
+        assert ingestor.queue_depth == 0
+        db.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_omitted_capacity_inserts_default_and_keeps_existing(self):
+        ingestor = HeartbeatIngestor()
+        ingestor.submit(_hb(node_id="n1", capacity=40))
+        ingestor.submit(_hb(node_id="n2", capacity=None))
+        statements = []
+
+        async def _execute(stmt):
+            statements.append(stmt)
+            return MagicMock(all=MagicMock(return_value=[]))
+
+        db, factory = _mock_session(["s1"], [], [])
+        db.execute = AsyncMock(side_effect=_execute)
+
+        with patch("app.heartbeat_ingest.get_async_sessionmaker", return_value=factory), \
+             patch("app.heartbeat_ingest.get_redis", new_callable=AsyncMock, return_value=_mock_redis()[0]):
+            await ingestor.flush()
+
+        reported, omitted = (str(stmt.compile(dialect=asyncpg.dialect())) for stmt in statements[:2])
+        assert "capacity_pct = excluded.capacity_pct" in reported
+        assert "capacity_pct =" not in omitted.split("ON CONFLICT")[1]
+        params = statements[1].compile(dialect=asyncpg.dialect()).params
+        assert params["capacity_pct_m0"] == 0
+
+    @pytest.mark.asyncio
+    async def test_empty_queue_is_noop(self):
+        ingestor = HeartbeatIngestor()
+        with patch("app.heartbeat_ingest.get_async_sessionmaker") as factory:
+            assert await ingestor.flush() == 0
+        factory.assert_not_called()
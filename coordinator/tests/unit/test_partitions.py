@@ -0,0 +1,89 @@
+"""
+Unit tests for the partition manager — pre-creating daily partitions,
+moving rows out of the default partition, and retention dropping whole
+expired days instead of deleting rows.
+"""
+
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from app import models, partitions
+from app.data_retention import run_data_retention
+
+
+def _add_ledger(db, node_id, stream_id, ts, bytes_transferred=1_000_000):
+    db.add(models.BandwidthLedger(
+        session_id=stream_id,
+        reporting_node_id=node_id,
+        bytes_transferred=bytes_transferred,
+        report_timestamp=ts,
+        start_interval=ts - timedelta(minutes=1),
+        end_interval=ts,
+        is_verified=True,
+        trust_score=Decimal("0.80"),
+    ))
+    db.flush()
+
+
+def _partition_of(db, table, row_filter):
+    return db.execute(text(f"SELECT tableoid::regclass::text FROM {table} WHERE {row_filter}")).scalar()
+
+
+class TestEnsurePartitions:
+    def test_creates_today_and_days_ahead(self, test_db):
+        today = datetime.now(timezone.utc).date()
+
+        created = partitions.ensure_partitions(test_db, days_ahead=2, today=today)
+
+        assert created == 6
+        for table in partitions.PARTITIONED_TABLES:
+            assert partitions.list_partitions(test_db, table) == [today + timedelta(days=i) for i in range(3)]
+        # Idempotent
+        assert partitions.ensure_partitions(test_db, days_ahead=2, today=today) == 0
+
+    def test_moves_rows_out_of_default(self, test_db, make_user, make_stream, make_node):
+        make_user(user_id="pt-u1")
+        make_stream(stream_id="pt-s1", owner_user_id="pt-u1")
+        make_node(node_id="pt-n1", stream_id="pt-s1", user_id="pt-u1")
+        today = datetime.now(timezone.utc).date()
+        noon = datetime.combine(today, datetime.min.time()) + timedelta(hours=12)
+        _add_ledger(test_db, "pt-n1", "pt-s1", noon)
+        assert _partition_of(test_db, "bandwidth_ledger", "reporting_node_id = 'pt-n1'") == "bandwidth_ledger_default"
+
+        partitions.ensure_partitions(test_db, days_ahead=0, today=today)
+
+        assert _partition_of(test_db, "bandwidth_ledger", "reporting_node_id = 'pt-n1'") == (
+            partitions.partition_name("bandwidth_ledger", today)
+        )
+
+
+class TestRetentionDropsPartitions:
+    def test_expired_day_is_summarised_and_dropped(self, test_db, make_user, make_stream, make_node):
+        make_user(user_id="pt-u2")
+        make_stream(stream_id="pt-s2", owner_user_id="pt-u2")
+        make_node(node_id="pt-n2", stream_id="pt-s2", user_id="pt-u2")
+        old_day = (datetime.now(timezone.utc) - timedelta(days=100)).date()
+        partitions.create_partition(test_db, "bandwidth_ledger", old_day)
+        midnight = datetime.combine(old_day, datetime.min.time())
+        for hour in range(3):
+            _add_ledger(test_db, "pt-n2", "pt-s2", midnight + timedelta(hours=hour))
+
+        result = run_data_retention(test_db)
+
+        assert result["partitions_dropped"] == 1
+        assert result["bandwidth_deleted"] == 3
+        assert partitions.list_partitions(test_db, "bandwidth_ledger") == []
+        summary = test_db.query(models.MonthlySummary).filter_by(node_id="pt-n2").one()
+        assert summary.total_reports == 3
+        assert summary.total_bytes == 3_000_000
+        assert summary.user_id == "pt-u2"
+
+    def test_current_partitions_kept(self, test_db):
+        partitions.ensure_partitions(test_db, days_ahead=1)
+
+        result = run_data_retention(test_db)
+
+        assert result["partitions_dropped"] == 0
+        assert len(partitions.list_partitions(test_db, "probe_results")) == 2
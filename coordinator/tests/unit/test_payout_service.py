@@ -7,6 +7,8 @@ Task 7.7 — Req 21.1, Design §24, Properties 35–36
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
+from unittest.mock import AsyncMock, MagicMock, patch
+
 import pytest
 
 from app import models
@@ -127,6 +129,105 @@ class TestPayoutLogging:
         assert ledger.trust_score is not None
 
 
+class TestBulkCycle:
+    def test_nodes_of_one_user_credited_together(self, test_db, payout_svc, make_user, make_stream, make_node):
+        make_user(user_id="multi-user", role="node", trust=0.90)
+        make_stream(stream_id="multi-stream", owner_user_id="multi-user")
+        make_node(node_id="multi-node-1", stream_id="multi-stream", user_id="multi-user")
+        make_node(node_id="multi-node-2", stream_id="multi-stream", user_id="multi-user")
+        for node_id in ("multi-node-1", "multi-node-2"):
+            _add_bandwidth_report(test_db, node_id, "multi-stream", 1_073_741_824)
+            _add_bandwidth_report(test_db, node_id, "multi-stream", 1_073_741_824)
+
+        result = payout_svc.run_payout_cycle(test_db)
+
+        assert result["nodes_paid"] == 2
+        assert result["reports_processed"] == 4
+        account = test_db.query(models.UserAccount).filter_by(user_id="multi-user").one()
+        assert account.total_gb_relayed == Decimal("4.0000")
+        assert account.balance_usd == Decimal(result["total_usd"])
+        entries = test_db.query(models.PayoutLogEntry).filter_by(user_id="multi-user").all()
+        assert sorted(e.bytes_relayed for e in entries) == [2 * 1_073_741_824] * 2
+
+    def test_reports_stamped_with_trust_and_not_paid_twice(self, test_db, payout_svc, setup_stream_and_nodes):
+        user1_id, _ = setup_stream_and_nodes
+        report = _add_bandwidth_report(test_db, "pay-node-1", "pay-stream", 1_073_741_824)
+        unverified = _add_bandwidth_report(test_db, "pay-node-1", "pay-stream", 1_073_741_824, verified=False)
+
+        payout_svc.run_payout_cycle(test_db)
+        balance = test_db.query(models.UserAccount).filter_by(user_id=user1_id).one().balance_usd
+        second = payout_svc.run_payout_cycle(test_db)
+
+        test_db.refresh(report)
+        test_db.refresh(unverified)
+        assert report.trust_score == Decimal("0.90")
+        assert unverified.trust_score is None
+        assert second["nodes_paid"] == 0
+        assert test_db.query(models.UserAccount).filter_by(user_id=user1_id).one().balance_usd == balance
+
+    def test_missing_account_created_at_default_trust(self, test_db, payout_svc, make_user, make_stream, make_node):
+        make_user(user_id="acct-user", role="node", trust=0.90)
+        test_db.query(models.UserAccount).filter_by(user_id="acct-user").delete()
+        make_stream(stream_id="acct-stream", owner_user_id="acct-user")
+        make_node(node_id="acct-node", stream_id="acct-stream", user_id="acct-user")
+        _add_bandwidth_report(test_db, "acct-node", "acct-stream", 1_073_741_824)
+
+        result = payout_svc.run_payout_cycle(test_db)
+
+        account = test_db.query(models.UserAccount).filter_by(user_id="acct-user").one()
+        assert account.trust_score == Decimal("0.75")
+        assert account.balance_usd == Decimal(result["total_usd"]) > 0
+
+
+class TestHourlyRollup:
+    def test_cycles_in_one_hour_accumulate(self, test_db, payout_svc, setup_stream_and_nodes):
+        _add_bandwidth_report(test_db, "pay-node-1", "pay-stream", 1_073_741_824)
+        first = payout_svc.run_payout_cycle(test_db)
+        _add_bandwidth_report(test_db, "pay-node-1", "pay-stream", 2 * 1_073_741_824)
+        second = payout_svc.run_payout_cycle(test_db)
+
+        rows = test_db.query(models.NodeHourlyEarnings).filter_by(node_id="pay-node-1").all()
+        # One row per node and hour (two if the cycles straddled an hour boundary)
+        assert len(rows) in (1, 2)
+        assert sum(r.bytes_relayed for r in rows) == 3 * 1_073_741_824
+        assert sum(r.earnings_usd for r in rows) == Decimal(first["total_usd"]) + Decimal(second["total_usd"])
+        assert all(r.hour.minute == 0 and r.hour.second == 0 for r in rows)
+
+    def test_economics_endpoint_reads_rollup_and_caches(self, test_db, client, payout_svc, setup_stream_and_nodes):
+        _add_bandwidth_report(test_db, "pay-node-1", "pay-stream", 1_073_741_824)
+        result = payout_svc.run_payout_cycle(test_db)
+        store = {}
+        r = MagicMock()
+        r.get = AsyncMock(side_effect=lambda key: store.get(key))
+        r.set = AsyncMock(side_effect=lambda key, value, ex: store.__setitem__(key, value))
+
+        with patch("app.response_cache.get_redis", new_callable=AsyncMock, return_value=r):
+            body = client.get("/api/v1/economics/node/pay-node-1").json()
+            hourly = body["hourly_earnings"]
+            assert len(hourly) == 24
+            assert sum(h["earnings_usd"] for h in hourly) == pytest.approx(float(result["total_usd"]))
+            assert r.set.call_args.kwargs["ex"] == 15
+
+            # A later payout is not visible until the cached response expires
+            _add_bandwidth_report(test_db, "pay-node-1", "pay-stream", 1_073_741_824)
+            payout_svc.run_payout_cycle(test_db)
+            assert client.get("/api/v1/economics/node/pay-node-1").json() == body
+
+            store.clear()
+            refreshed = client.get("/api/v1/economics/node/pay-node-1").json()
+        assert sum(h["gb_relayed"] for h in refreshed["hourly_earnings"]) == pytest.approx(2.0)
+
+    def test_economics_endpoint_does_not_write(self, test_db, client):
+        r = MagicMock()
+        r.get = AsyncMock(return_value=None)
+        r.set = AsyncMock()
+
+        with patch("app.response_cache.get_redis", new_callable=AsyncMock, return_value=r):
+            body = client.get("/api/v1/economics/node/unknown-node").json()
+        assert Decimal(str(body["balance_usd"])) == 0
+        assert test_db.query(models.UserAccount).filter_by(user_id="unknown-node").count() == 0
+
+
 class TestLegacyHelpers:
     def test_get_node_earnings_summary(self, test_db, payout_svc, setup_stream_and_nodes):
         _add_bandwidth_report(test_db, "pay-node-1", "pay-stream", 1_073_741_824)
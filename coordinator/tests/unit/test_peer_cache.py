@@ -0,0 +1,155 @@
+"""
+Unit tests for the in-process peer list cache — TTL hits, invalidation,
+miss coalescing and proxy VPN IP resolution from memory.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.peer_cache import PeerCache
+
+
+def _nodes(*ids):
+    return [{"node_id": i, "vpn_ip": f"100.64.0.{n}", "trust_score": 0.9} for n, i in enumerate(ids, 1)]
+
+
+class TestPeerCache:
+    @pytest.mark.asyncio
+    async def test_second_lookup_is_served_from_memory(self):
+        cache = PeerCache(ttl=60)
+        with patch("app.peer_cache.redis_state.get_stream_nodes", new_callable=AsyncMock) as fetch:
+            fetch.return_value = _nodes("n1", "n2")
+            await cache.get_nodes(MagicMock(), "s1")
+            nodes = await cache.get_nodes(MagicMock(), "s1")
+        assert [n["node_id"] for n in nodes] == ["n1", "n2"]
+        assert fetch.await_count == 1
+        assert cache.metrics.hits == 1
+        assert cache.metrics.misses == 1
+
+    @pytest.mark.asyncio
+    async def test_expired_entry_is_refetched(self):
+        cache = PeerCache(ttl=60)
+        with patch("app.peer_cache.redis_state.get_stream_nodes", new_callable=AsyncMock) as fetch, \
+             patch("app.peer_cache.time.monotonic", side_effect=[0.0, 0.0, 100.0, 100.0]):
+            fetch.return_value = _nodes("n1")
+            await cache.get_nodes(MagicMock(), "s1")
+            await cache.get_nodes(MagicMock(), "s1")
+        assert fetch.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_invalidate_drops_only_that_stream(self):
+        cache = PeerCache(ttl=60)
+        with patch("app.peer_cache.redis_state.get_stream_nodes", new_callable=AsyncMock) as fetch:
+            fetch.return_value = _nodes("n1")
+            await cache.get_nodes(MagicMock(), "s1")
+            await cache.get_nodes(MagicMock(), "s2")
+            cache.invalidate("s1")
+            await cache.get_nodes(MagicMock(), "s1")
+            await cache.get_nodes(MagicMock(), "s2")
+        assert fetch.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_fetch(self):
+        cache = PeerCache(ttl=60)
+        release = asyncio.Event()
+
+        async def _slow_fetch(r, stream_id):
+            await release.wait()
+            return _nodes("n1")
+
+        with patch("app.peer_cache.redis_state.get_stream_nodes", side_effect=_slow_fetch) as fetch:
+            tasks = [asyncio.create_task(cache.get_nodes(MagicMock(), "s1")) for _ in range(10)]
+            await asyncio.sleep(0)
+            release.set()
+            results = await asyncio.gather(*tasks)
+        assert fetch.call_count == 1
+        assert all(r == results[0] for r in results)
+
+    @pytest.mark.asyncio
+    async def test_cancelled_fetch_hands_over_to_waiter(self):
+        cache = PeerCache(ttl=60)
+        started = asyncio.Event()
+
+        async def _fetch(r, stream_id):
+            if not started.is_set():
+                started.set()
+                await asyncio.sleep(60)  # the first caller's viewer disconnects
+            return _nodes("n1")
+
+        with patch("app.peer_cache.redis_state.get_stream_nodes", side_effect=_fetch):
+            leader = asyncio.create_task(cache.get_nodes(MagicMock(), "s1"))
+            await started.wait()
+            waiter = asyncio.create_task(cache.get_nodes(MagicMock(), "s1"))
+            await asyncio.sleep(0)
+            leader.cancel()
+
+            assert [n["node_id"] for n in await waiter] == ["n1"]
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    @pytest.mark.asyncio
+    async def test_fetch_racing_invalidation_is_not_cached(self):
+        cache = PeerCache(ttl=60)
+
+        async def _fetch(r, stream_id):
+            cache.invalidate(stream_id)  # publish arrives mid-fetch
+            return _nodes("n1")
+
+        with patch("app.peer_cache.redis_state.get_stream_nodes", side_effect=_fetch):
+            await cache.get_nodes(MagicMock(), "s1")
+        assert cache.stats()["streams_cached"] == 0
+
+    @pytest.mark.asyncio
+    async def test_zero_ttl_disables_caching(self):
+        cache = PeerCache(ttl=0)
+        with patch("app.peer_cache.redis_state.get_stream_nodes", new_callable=AsyncMock) as fetch:
+            fetch.return_value = _nodes("n1")
+            await cache.get_nodes(MagicMock(), "s1")
+            await cache.get_nodes(MagicMock(), "s1")
+        assert fetch.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_bounded_to_max_streams_lru(self):
+        cache = PeerCache(ttl=60, max_streams=2)
+        with patch("app.peer_cache.redis_state.get_stream_nodes", new_callable=AsyncMock) as fetch:
+            fetch.return_value = _nodes("n1")
+            for stream_id in ("s1", "s2", "s1", "s3"):
+                await cache.get_nodes(MagicMock(), stream_id)
+        assert list(cache._entries) == ["s1", "s3"]
+        assert cache.metrics.evictions == 1
+
+    @pytest.mark.asyncio
+    async def test_unknown_streams_are_not_cached(self):
+        cache = PeerCache(ttl=60)
+        with patch("app.peer_cache.redis_state.get_stream_nodes", new_callable=AsyncMock) as fetch:
+            fetch.return_value = []
+            for n in range(100):
+                await cache.get_nodes(MagicMock(), f"bogus-{n}")
+        assert cache.stats()["streams_cached"] == 0
+
+    @pytest.mark.asyncio
+    async def test_get_node_by_id(self):
+        cache = PeerCache(ttl=60)
+        with patch("app.peer_cache.redis_state.get_stream_nodes", new_callable=AsyncMock) as fetch:
+            fetch.return_value = _nodes("n1", "n2")
+            node = await cache.get_node(MagicMock(), "s1", "n2")
+            missing = await cache.get_node(MagicMock(), "s1", "n9")
+        assert node["vpn_ip"] == "100.64.0.2"
+        assert missing is None
+
+
+class TestProxyResolution:
+    @pytest.mark.asyncio
+    async def test_segment_requests_resolve_ip_without_redis_reads(self):
+        from app import proxy
+        from app.peer_cache import peer_cache
+
+        with patch("app.proxy.get_redis", new_callable=AsyncMock), \
+             patch("app.peer_cache.redis_state.get_stream_nodes", new_callable=AsyncMock) as fetch:
+            fetch.return_value = _nodes("n1", "n2")
+            ips = [await proxy._resolve_node_vpn_ip("s1", "n2") for _ in range(50)]
+        assert set(ips) == {"100.64.0.2"}
+        assert fetch.await_count == 1
+        assert peer_cache.metrics.hits >= 49
@@ -0,0 +1,164 @@
+"""
+Unit tests for the pre-minted Headscale pre-auth key pool — batch refills
+below the watermark against a local fake Headscale, O(1) pops, stale key
+handling, the bounded inline fallback and node registration.
+"""
+
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+import fakeredis.aioredis
+import pytest
+import pytest_asyncio
+
+from app import auth_routes
+from app.headscale_client import HeadscaleClient
+from app.preauth_key_pool import POOL_KEY, REFILL_LOCK_KEY, PreauthKeyPool, encode_entry
+
+
+@pytest_asyncio.fixture()
+async def redis():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+@pytest_asyncio.fixture()
+async def headscale(fake_headscale):
+    client = HeadscaleClient(base_url=fake_headscale.url, api_key="test")
+    yield client
+    await client.close()
+
+
+class TestRefill:
+    @pytest.mark.asyncio
+    async def test_refills_to_target_in_batches(self, redis, headscale, fake_headscale):
+        pool = PreauthKeyPool(target=12, low_watermark=5, batch_size=5)
+
+        assert await pool.refill(redis, headscale) == 12
+
+        assert await redis.llen(POOL_KEY) == 12
+        assert len(fake_headscale.minted) == 12
+        assert not any(k["reusable"] for k in fake_headscale.minted)
+        assert 0 < await redis.ttl(POOL_KEY) <= pool.expiry_hours * 3600
+
+    @pytest.mark.asyncio
+    async def test_no_refill_at_or_above_watermark(self, redis, headscale, fake_headscale):
+        pool = PreauthKeyPool(target=10, low_watermark=4, batch_size=10)
+        await pool.refill(redis, headscale)
+        for _ in range(6):
+            await pool.take(redis, headscale)
+        assert pool._refill_task is None  # the pop that reached the watermark didn't start one
+
+        assert await pool.refill(redis, headscale) == 0
+        assert await redis.llen(POOL_KEY) == 4
+
+        await pool.take(redis, headscale)  # 3 left: below the watermark
+        await pool._refill_task
+        assert await redis.llen(POOL_KEY) == 10
+        assert len(fake_headscale.minted) == 17
+
+    @pytest.mark.asyncio
+    async def test_headscale_down_stops_refill(self, redis, headscale, fake_headscale):
+        fake_headscale.fail = True
+        pool = PreauthKeyPool(target=10, low_watermark=5, batch_size=5)
+
+        assert await pool.refill(redis, headscale) == 0
+        assert pool.metrics.mint_failures == 5  # gave up after one failed batch
+
+    @pytest.mark.asyncio
+    async def test_one_refill_at_a_time(self, redis, headscale, fake_headscale):
+        fake_headscale.delay = 0.1
+        pool = PreauthKeyPool(target=5, low_watermark=5, batch_size=5)
+
+        added = await asyncio.gather(pool.refill(redis, headscale), pool.refill(redis, headscale))
+
+        assert sorted(added) == [0, 5]
+        assert len(fake_headscale.minted) == 5
+
+    @pytest.mark.asyncio
+    async def test_expired_lock_taken_over_is_not_released(self, redis, headscale, fake_headscale):
+        fake_headscale.delay = 0.1
+        pool = PreauthKeyPool(target=5, low_watermark=5, batch_size=5)
+        refill = asyncio.create_task(pool.refill(redis, headscale))
+        await asyncio.sleep(0.05)
+
+        # The lock expires mid-refill and another replica takes it
+        await redis.set(REFILL_LOCK_KEY, "other-replica")
+        assert await refill == 5
+
+        assert await redis.get(REFILL_LOCK_KEY) == "other-replica"
+
+    @pytest.mark.asyncio
+    async def test_refill_drops_keys_near_expiry(self, redis, headscale):
+        pool = PreauthKeyPool(target=3, low_watermark=3, batch_size=3, min_remaining_seconds=3600)
+        await redis.rpush(POOL_KEY, encode_entry("old", time.time() + 60))
+
+        assert await pool.refill(redis, headscale) == 3
+        assert "old" not in " ".join(await redis.lrange(POOL_KEY, 0, -1))
+
+
+class TestTake:
+    @pytest.mark.asyncio
+    async def test_pops_each_pooled_key_once(self, redis, headscale, fake_headscale):
+        pool = PreauthKeyPool(target=5, low_watermark=1, batch_size=5)
+        await pool.refill(redis, headscale)
+
+        taken = [await pool.take(redis, headscale) for _ in range(5)]
+        await pool._refill_task  # started by the pop that emptied the pool
+
+        assert taken == [k["key"] for k in fake_headscale.minted[:5]]
+        assert pool.metrics.pool_hits == 5
+
+    @pytest.mark.asyncio
+    async def test_skips_keys_near_expiry(self, redis, headscale):
+        pool = PreauthKeyPool(target=2, low_watermark=0, min_remaining_seconds=3600)
+        await redis.rpush(
+            POOL_KEY,
+            encode_entry("stale", time.time() + 60),
+            encode_entry("fresh", time.time() + 7200),
+        )
+
+        assert await pool.take(redis, headscale) == "fresh"
+        assert pool.metrics.discarded == 1
+
+    @pytest.mark.asyncio
+    async def test_empty_pool_mints_inline(self, redis, headscale, fake_headscale):
+        pool = PreauthKeyPool(target=3, low_watermark=1)
+
+        key = await pool.take(redis, headscale)
+        await pool._refill_task
+
+        assert key == fake_headscale.minted[0]["key"]
+        assert pool.metrics.fallback_minted == 1
+        assert await redis.llen(POOL_KEY) == 3  # background refill started by the miss
+
+    @pytest.mark.asyncio
+    async def test_inline_fallback_is_bounded_when_headscale_hangs(self, redis, headscale, fake_headscale):
+        fake_headscale.delay = 1.5
+        pool = PreauthKeyPool(target=3, low_watermark=1, fallback_timeout=0.2)
+
+        started = time.perf_counter()
+        key = await pool.take(redis, headscale)
+        elapsed = time.perf_counter() - started
+        pool._refill_task.cancel()
+
+        assert key is None
+        assert elapsed < 1.0
+        assert pool.metrics.fallback_failed == 1
+
+
+class TestRegisterNode:
+    def test_registration_returns_pooled_key(self, client, make_user, make_stream):
+        make_user(user_id="pk-u1", role="streamer")
+        stream = make_stream(stream_id="pk-s1", owner_user_id="pk-u1")
+        take = AsyncMock(return_value="pooled-key")
+
+        with patch.object(auth_routes.preauth_key_pool, "take", take), \
+             patch.object(auth_routes, "get_redis", AsyncMock()):
+            resp = client.post("/api/v1/auth/register", json={"node_id": "pk-n1", "stream_key": stream.stream_key})
+
+        assert resp.status_code == 200
+        assert resp.json()["headscale_auth_key"] == "pooled-key"
+        take.assert_awaited_once()
@@ -0,0 +1,127 @@
+"""
+Unit tests for the HLS proxy — streamed relay from friend nodes, upstream
+cleanup, and SRS fallback on node failure.
+"""
+
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import proxy
+
+
+# ---------------------------------------------------------------------------
+# Helpers — fake upstreams via httpx.MockTransport
+# ---------------------------------------------------------------------------
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Upstream body that records whether the proxy closed it."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def aclose(self):
+        self.closed = True
+
+
+def _client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.fixture()
+def app_client():
+    app = FastAPI()
+    app.include_router(proxy.router)
+    return TestClient(app)
+
+
+@pytest.fixture()
+def assigned():
+    """Viewer is assigned to a node at 100.64.0.5."""
+    with patch("app.proxy._get_viewer_assignment", new_callable=AsyncMock, return_value="n1"), \
+         patch("app.proxy._resolve_node_vpn_ip", new_callable=AsyncMock, return_value="100.64.0.5"):
+        yield
+
+
+# ---------------------------------------------------------------------------
+# proxy_hls
+# ---------------------------------------------------------------------------
+
+
+class TestProxyStreaming:
+    def test_streams_node_segment_and_closes_upstream(self, app_client, assigned):
+        body = _TrackedStream([b"a" * 1000, b"b" * 1000, b"c" * 500])
+        seen = []
+
+        def handler(request):
+            seen.append(str(request.url))
+            return httpx.Response(
+                200,
+                headers={"content-type": "video/mp2t", "content-length": "2500"},
+                stream=body,
+            )
+
+        with patch.object(proxy, "_vpn_client", _client(handler)), \
+             patch.object(proxy, "NODE_HLS_PORT", "9090"):
+            resp = app_client.get("/api/v1/proxy/s1/seg-1.ts")
+
+        assert resp.status_code == 200
+        assert resp.content == b"a" * 1000 + b"b" * 1000 + b"c" * 500
+        assert resp.headers["content-type"] == "video/mp2t"
+        assert resp.headers["content-length"] == "2500"
+        assert seen == ["http://100.64.0.5:9090/live/s1/seg-1.ts"]
+        assert body.closed
+
+    def test_node_error_status_falls_back_to_srs(self, app_client, assigned):
+        node_body = _TrackedStream([b"not found"])
+
+        def node(request):
+            return httpx.Response(404, stream=node_body)
+
+        def srs(request):
+            assert request.url.path == "/live/s1.m3u8"
+            return httpx.Response(
+                200,
+                headers={"content-type": "application/vnd.apple.mpegurl"},
+                stream=_TrackedStream([b"#EXTM3U"]),
+            )
+
+        with patch.object(proxy, "_vpn_client", _client(node)), \
+             patch.object(proxy, "_http_client", _client(srs)):
+            resp = app_client.get("/api/v1/proxy/s1/index.m3u8")
+
+        assert resp.status_code == 200
+        assert resp.content == b"#EXTM3U"
+        assert node_body.closed
+
+    def test_unreachable_node_falls_back_to_srs(self, app_client, assigned):
+        def node(request):
+            raise httpx.ConnectError("no route", request=request)
+
+        def srs(request):
+            return httpx.Response(200, stream=_TrackedStream([b"srs-seg"]))
+
+        with patch.object(proxy, "_vpn_client", _client(node)), \
+             patch.object(proxy, "_http_client", _client(srs)):
+            resp = app_client.get("/api/v1/proxy/s1/seg-2.ts")
+
+        assert resp.content == b"srs-seg"
+
+    def test_returns_502_when_srs_also_unreachable(self, app_client):
+        def down(request):
+            raise httpx.ConnectError("down", request=request)
+
+        with patch("app.proxy._get_viewer_assignment", new_callable=AsyncMock, return_value=None), \
+             patch("app.proxy._reassign_viewer", new_callable=AsyncMock, return_value=None), \
+             patch.object(proxy, "_http_client", _client(down)):
+            resp = app_client.get("/api/v1/proxy/s1/seg-3.ts")
+
+        assert resp.status_code == 502
@@ -0,0 +1,188 @@
+"""
+Unit tests for Redis node state — compact value encoding, heartbeat index
+maintenance and the index-based stale node sweeper.
+"""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app import redis_state
+from app.redis_state import (
+    HEARTBEAT_INDEX_KEY,
+    PEER_INVALIDATION_CHANNEL,
+    cleanup_stale_nodes,
+    decode_node_state,
+    encode_node_state,
+    get_stream_nodes,
+    remove_node,
+    stage_node_state,
+)
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _mock_redis(stale_batches=()):
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[])
+    r = MagicMock()
+    r.pipeline = MagicMock(return_value=pipe)
+    r.zrangebyscore = AsyncMock(side_effect=list(stale_batches) + [[]])
+    return r, pipe
+
+
+@pytest.fixture(autouse=True)
+def _index_already_backfilled():
+    with patch.object(redis_state, "_index_backfilled", True):
+        yield
+
+
+# ---------------------------------------------------------------------------
+# Index maintenance
+# ---------------------------------------------------------------------------
+
+
+class TestHeartbeatIndex:
+    def test_stage_node_state_indexes_heartbeat(self):
+        pipe = MagicMock()
+        stage_node_state(pipe, "s1", "n1", "10.0.0.1", 0.8, 20, 0)
+        pipe.hset.assert_called_once()
+        assert pipe.hset.call_args.args[:2] == ("stream:s1:nodes", "n1")
+        key, mapping = pipe.zadd.call_args.args
+        assert key == HEARTBEAT_INDEX_KEY
+        assert list(mapping) == ["s1|n1"]
+
+    @pytest.mark.asyncio
+    async def test_remove_node_drops_index_member(self):
+        r, pipe = _mock_redis()
+        await remove_node(r, "s1", "n1")
+        pipe.hdel.assert_any_call("stream:s1:nodes", "n1")
+        pipe.hdel.assert_any_call("stream:s1:load", "n1")
+        pipe.zrem.assert_called_once_with(HEARTBEAT_INDEX_KEY, "s1|n1")
+        pipe.publish.assert_called_once_with(PEER_INVALIDATION_CHANNEL, "s1")
+        pipe.execute.assert_awaited_once()
+
+
+# ---------------------------------------------------------------------------
+# cleanup_stale_nodes
+# ---------------------------------------------------------------------------
+
+
+class TestCleanupStaleNodes:
+    @pytest.mark.asyncio
+    async def test_pipelined_sweep_removes_stale_members(self):
+        r, pipe = _mock_redis([["s1|n1", "s2|n7"]])
+        with patch.object(redis_state, "REDIS_SWEEP_USE_LUA", False):
+            removed = await cleanup_stale_nodes(r, max_age_seconds=90)
+        assert removed == 2
+        pipe.hdel.assert_any_call("stream:s1:nodes", "n1")
+        pipe.hdel.assert_any_call("stream:s2:nodes", "n7")
+        pipe.zrem.assert_called_once_with(HEARTBEAT_INDEX_KEY, "s1|n1", "s2|n7")
+        # Peer caches for both affected streams are invalidated
+        published = sorted(c.args for c in pipe.publish.call_args_list)
+        assert published == [(PEER_INVALIDATION_CHANNEL, "s1"), (PEER_INVALIDATION_CHANNEL, "s2")]
+
+    @pytest.mark.asyncio
+    async def test_nothing_stale_is_single_round_trip(self):
+        r, pipe = _mock_redis()
+        with patch.object(redis_state, "REDIS_SWEEP_USE_LUA", False):
+            removed = await cleanup_stale_nodes(r, max_age_seconds=90)
+        assert removed == 0
+        r.zrangebyscore.assert_awaited_once()
+        pipe.execute.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_sweeps_in_batches_until_short_batch(self):
+        r, _ = _mock_redis([["s1|a", "s1|b"], ["s1|c"]])
+        with patch.object(redis_state, "REDIS_SWEEP_USE_LUA", False), \
+             patch.object(redis_state, "REDIS_SWEEP_BATCH", 2):
+            removed = await cleanup_stale_nodes(r, max_age_seconds=90)
+        assert removed == 3
+        assert r.zrangebyscore.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_lua_sweep_uses_registered_script(self):
+        r, _ = _mock_redis()
+        script = AsyncMock(return_value=["s1|a", "s1|b", "s2|c", "s2|d"])
+        r.register_script = MagicMock(return_value=script)
+        with patch.object(redis_state, "REDIS_SWEEP_USE_LUA", True), \
+             patch.object(redis_state, "_sweep_script", None):
+            removed = await cleanup_stale_nodes(r, max_age_seconds=90)
+        assert removed == 4
+        assert script.await_args.kwargs["keys"] == [HEARTBEAT_INDEX_KEY]
+
+    @pytest.mark.asyncio
+    async def test_first_sweep_backfills_legacy_entries(self):
+        r, _ = _mock_redis()
+        r.scan = AsyncMock(return_value=("0", ["stream:s1:nodes"]))
+        r.hgetall = AsyncMock(return_value={
+            "n1": '{"last_heartbeat": "2024-01-01T00:00:00+00:00"}',
+            "n2": "not json",
+        })
+        r.zadd = AsyncMock(return_value=2)
+        rewrite = AsyncMock(return_value=1)
+        with patch.object(redis_state, "_index_backfilled", False), \
+             patch.object(redis_state, "_rewrite_script", rewrite), \
+             patch.object(redis_state, "REDIS_SWEEP_USE_LUA", False):
+            await cleanup_stale_nodes(r, max_age_seconds=90)
+            assert redis_state._index_backfilled is True
+        mapping = r.zadd.await_args.args[1]
+        assert mapping["s1|n1"] == 1704067200.0
+        assert mapping["s1|n2"] == 0
+        assert r.zadd.await_args.kwargs == {"nx": True}
+        # Legacy JSON is rewritten (compare-and-set) in the compact encoding
+        key, = rewrite.await_args.kwargs["keys"]
+        node_id, old, new = rewrite.await_args.kwargs["args"]
+        assert (key, node_id) == ("stream:s1:nodes", "n1")
+        assert new.startswith("2|")
+        assert decode_node_state(new)["last_heartbeat"] == 1704067200.0
+
+
+# ---------------------------------------------------------------------------
+# Node state encoding
+# ---------------------------------------------------------------------------
+
+
+class TestNodeStateEncoding:
+    def test_round_trip(self):
+        raw = encode_node_state("100.64.0.7", 0.8125, 35, 4, 1718000000.125)
+        assert raw == "2|100.64.0.7|0.8125|35|4|1718000000.125"
+        assert decode_node_state(raw) == {
+            "vpn_ip": "100.64.0.7",
+            "trust_score": 0.8125,
+            "capacity_pct": 35,
+            "viewer_count": 4,
+            "last_heartbeat": 1718000000.125,
+        }
+
+    def test_ipv6_and_empty_ip(self):
+        assert decode_node_state(encode_node_state("fd7a:115c::1", 1, 0, 0, 0))["vpn_ip"] == "fd7a:115c::1"
+        assert decode_node_state(encode_node_state("", 1, 0, 0, 0))["vpn_ip"] == ""
+
+    def test_reads_legacy_json(self):
+        legacy = (
+            '{"vpn_ip": "10.0.0.1", "trust_score": 0.9, "capacity_pct": 20, '
+            '"viewer_count": 1, "last_heartbeat": "2024-01-01T00:00:00+00:00"}'
+        )
+        data = decode_node_state(legacy)
+        assert data["vpn_ip"] == "10.0.0.1"
+        assert data["last_heartbeat"] == 1704067200.0
+
+    @pytest.mark.parametrize("raw", ["not json", "2|too|few", '{"vpn_ip": "x"}', "2|ip|x|1|1|1"])
+    def test_corrupt_values_raise_value_error(self, raw):
+        with pytest.raises(ValueError):
+            decode_node_state(raw)
+
+    @pytest.mark.asyncio
+    async def test_get_stream_nodes_mixes_encodings_and_skips_corrupt(self):
+        r = MagicMock()
+        r.hgetall = AsyncMock(return_value={
+            "n1": encode_node_state("10.0.0.1", 0.9, 10, 0, 1.0),
+            "n2": '{"vpn_ip": "10.0.0.2", "trust_score": 0.7, "capacity_pct": 5, '
+                  '"viewer_count": 0, "last_heartbeat": "2024-01-01T00:00:00+00:00"}',
+            "n3": "garbage",
+        })
+        nodes = await get_stream_nodes(r, "s1")
+        assert {n["node_id"]: n["vpn_ip"] for n in nodes} == {"n1": "10.0.0.1", "n2": "10.0.0.2"}
@@ -0,0 +1,156 @@
+"""
+Unit tests for the native RTMP probe — AMF0 encoding, chunk stream framing,
+and full probes against the local RTMP test server (live, missing and
+silent streams, refused connections).
+"""
+
+import asyncio
+import struct
+
+import pytest
+import pytest_asyncio
+
+from app.rtmp_probe import (
+    MSG_SET_CHUNK_SIZE,
+    MSG_VIDEO,
+    RtmpChunkStream,
+    RtmpProbe,
+    RtmpProtocolError,
+    amf0_decode,
+    amf0_encode,
+    probe_rtmp,
+)
+from tests.fake_rtmp import FakeRtmpServer
+
+
+class TestAmf0:
+    def test_round_trip(self):
+        values = ["connect", 1.0, {"app": "live", "fpad": False, "nested": {"n": 2.0}}, None]
+        assert amf0_decode(amf0_encode(*values)) == values
+
+    def test_known_encoding(self):
+        assert amf0_encode("play", 0) == b"\x02\x00\x04play\x00" + struct.pack(">d", 0)
+
+    def test_ecma_array_and_strict_array(self):
+        ecma = b"\x08\x00\x00\x00\x01" + b"\x00\x05width" + amf0_encode(1280) + b"\x00\x00\x09"
+        strict = b"\x0a\x00\x00\x00\x02" + amf0_encode(1, "a")
+        assert amf0_decode(ecma + strict) == [{"width": 1280.0}, [1.0, "a"]]
+
+    def test_unsupported_marker(self):
+        with pytest.raises(RtmpProtocolError):
+            amf0_decode(b"\x11\x00")
+
+
+class _Sink:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+
+def _reader(data: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+class TestChunkStream:
+    @pytest.mark.asyncio
+    async def test_compressed_headers_and_extended_timestamps(self):
+        sink = _Sink()
+        out = RtmpChunkStream(_reader(b""), sink)
+        messages = [
+            (b"v" * 300, 0x1000000),  # fmt 0, extended timestamp, three chunks
+            (b"w" * 300, 0x1000040),  # same length/type: fmt 2
+            (b"x" * 10, 0x1000080),   # new length: fmt 1
+        ]
+        for payload, ts in messages:
+            out.write_message(6, MSG_VIDEO, payload, stream_id=1, timestamp=ts)
+
+        assert [sink.data[0] >> 6, sink.data[1:4]] == [0, b"\xff\xff\xff"]
+        parsed = RtmpChunkStream(_reader(bytes(sink.data)), _Sink())
+        for payload, ts in messages:
+            message = await parsed.read_message()
+            assert (message.type_id, message.stream_id, message.timestamp, message.payload) == (MSG_VIDEO, 1, ts, payload)
+
+    @pytest.mark.asyncio
+    async def test_set_chunk_size_applies_to_following_messages(self):
+        sink = _Sink()
+        out = RtmpChunkStream(_reader(b""), sink)
+        out.set_chunk_size(4096)
+        out.write_message(6, MSG_VIDEO, b"z" * 3000, stream_id=1)
+
+        parsed = RtmpChunkStream(_reader(bytes(sink.data)), _Sink())
+        message = await parsed.read_message()
+        assert parsed.in_chunk_size == 4096
+        assert message.payload == b"z" * 3000
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("payload", [b"\x00\x10", b"\x00\x00\x00\x00"], ids=["truncated", "zero"])
+    async def test_malformed_chunk_size_is_a_protocol_error(self, payload):
+        sink = _Sink()
+        RtmpChunkStream(_reader(b""), sink).write_message(2, MSG_SET_CHUNK_SIZE, payload)
+
+        parsed = RtmpChunkStream(_reader(bytes(sink.data)), _Sink())
+        with pytest.raises(RtmpProtocolError):
+            await parsed.read_message()
+
+
+@pytest_asyncio.fixture(params=[128, 4096], ids=["default-chunks", "large-chunks"])
+async def rtmp_server(request):
+    server = await FakeRtmpServer(chunk_size=request.param).start()
+    server.live.add("live-stream")
+    server.silent.add("quiet-stream")
+    yield server
+    await server.stop()
+
+
+class TestProbe:
+    @pytest.mark.asyncio
+    async def test_live_stream(self, rtmp_server):
+        result = await probe_rtmp(rtmp_server.url("live-stream"), timeout=2)
+
+        assert result.success is True
+        assert result.saw_metadata is True
+        assert result.first_media == "video"
+
+    @pytest.mark.asyncio
+    async def test_missing_stream_fails_fast(self, rtmp_server):
+        result = await probe_rtmp(rtmp_server.url("other-stream"), timeout=2)
+
+        assert result.success is False
+        assert "StreamNotFound" in result.error
+
+    @pytest.mark.asyncio
+    async def test_stream_without_media_times_out(self, rtmp_server):
+        result = await probe_rtmp(rtmp_server.url("quiet-stream"), timeout=0.3)
+
+        assert result.success is False
+        assert result.error == "Connection timeout"
+
+    @pytest.mark.asyncio
+    async def test_connection_refused(self, rtmp_server):
+        port = rtmp_server.port
+        await rtmp_server.stop()
+
+        result = await probe_rtmp(f"rtmp://127.0.0.1:{port}/live/live-stream", timeout=2)
+
+        assert result.success is False
+        assert result.error.startswith("RTMP probe failed")
+
+    @pytest.mark.asyncio
+    async def test_malformed_reply_raises_protocol_error(self, rtmp_server):
+        # int(nan) raised ValueError, which skipped the ffprobe fallback
+        rtmp_server.created_stream_id = float("nan")
+
+        with pytest.raises(RtmpProtocolError):
+            await probe_rtmp(rtmp_server.url("live-stream"), timeout=2)
+
+    def test_url_parsing(self):
+        probe = RtmpProbe.from_url("rtmp://10.0.0.5/live/abc")
+        assert (probe.host, probe.port, probe.app, probe.stream_name) == ("10.0.0.5", 1935, "live", "abc")
+        assert probe.tc_url == "rtmp://10.0.0.5:1935/live"
+        with pytest.raises(ValueError):
+            RtmpProbe.from_url("http://10.0.0.5/live/abc")
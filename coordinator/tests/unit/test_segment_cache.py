@@ -0,0 +1,197 @@
+"""
+Unit tests for the HLS segment cache — TTL by object type, byte-bounded LRU
+eviction, single-flight loads, and proxy upstream fetch coalescing.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app import proxy
+from app.segment_cache import CachedObject, SegmentCache, ttl_for_path
+
+
+class _Body(httpx.AsyncByteStream):
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def __aiter__(self):
+        yield self.data
+
+
+def _obj(size: int) -> CachedObject:
+    return CachedObject(body=b"x" * size, media_type="video/mp2t", headers={})
+
+
+# ---------------------------------------------------------------------------
+# SegmentCache
+# ---------------------------------------------------------------------------
+
+
+class TestSegmentCache:
+    def test_ttl_by_path_type(self):
+        with patch("app.segment_cache.SEGMENT_CACHE_PLAYLIST_TTL", 1.0), \
+             patch("app.segment_cache.SEGMENT_CACHE_SEGMENT_TTL", 60.0):
+            assert ttl_for_path("index.m3u8") == 1.0
+            assert ttl_for_path("seg-12.ts") == 60.0
+            assert ttl_for_path("chunk.M4S") == 60.0
+            assert ttl_for_path("stats.json") is None
+
+    def test_expired_entries_are_dropped(self):
+        cache = SegmentCache(max_bytes=1000)
+        with patch("app.segment_cache.time.monotonic", return_value=0.0):
+            cache.put(("s", "n", "a.m3u8"), _obj(10), ttl=1.0)
+        with patch("app.segment_cache.time.monotonic", return_value=0.5):
+            assert cache.get(("s", "n", "a.m3u8")) is not None
+        with patch("app.segment_cache.time.monotonic", return_value=2.0):
+            assert cache.get(("s", "n", "a.m3u8")) is None
+        assert cache.stats()["bytes"] == 0
+
+    def test_lru_evicts_by_bytes(self):
+        cache = SegmentCache(max_bytes=300)
+        cache.put(("s", "n", "1.ts"), _obj(100), ttl=60)
+        cache.put(("s", "n", "2.ts"), _obj(100), ttl=60)
+        cache.get(("s", "n", "1.ts"))  # 1.ts is now most recent
+        cache.put(("s", "n", "3.ts"), _obj(150), ttl=60)
+        assert cache.get(("s", "n", "2.ts")) is None
+        assert cache.get(("s", "n", "1.ts")) is not None
+        assert cache.stats()["bytes"] == 250
+        assert cache.metrics.evictions == 1
+
+    def test_oversized_objects_not_stored(self):
+        cache = SegmentCache(max_bytes=1000, max_object_bytes=100)
+        cache.put(("s", "n", "big.ts"), _obj(101), ttl=60)
+        assert cache.stats()["entries"] == 0
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_load_once(self):
+        cache = SegmentCache(max_bytes=1000)
+        release = asyncio.Event()
+        loads = []
+
+        async def _load():
+            loads.append(1)
+            await release.wait()
+            return _obj(10)
+
+        tasks = [asyncio.create_task(cache.get_or_load(("s", "n", "1.ts"), 60, _load)) for _ in range(20)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+        assert len(loads) == 1
+        assert all(r is results[0] for r in results)
+        assert cache.metrics.misses == 1
+        assert cache.metrics.coalesced == 19
+
+    @pytest.mark.asyncio
+    async def test_loader_error_reaches_every_waiter(self):
+        cache = SegmentCache(max_bytes=1000)
+        release = asyncio.Event()
+
+        async def _load():
+            await release.wait()
+            raise httpx.ConnectError("node down")
+
+        tasks = [asyncio.create_task(cache.get_or_load(("s", "n", "1.ts"), 60, _load)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(r, httpx.ConnectError) for r in results)
+        assert cache.stats()["entries"] == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_loader_hands_over_to_waiter(self):
+        cache = SegmentCache(max_bytes=1000)
+        started = asyncio.Event()
+
+        async def _hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        async def _load():
+            return _obj(10)
+
+        leader = asyncio.create_task(cache.get_or_load(("s", "n", "1.ts"), 60, _hang))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_load(("s", "n", "1.ts"), 60, _load))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        assert (await waiter).body == b"x" * 10
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert cache.get(("s", "n", "1.ts")) is not None
+
+
+# ---------------------------------------------------------------------------
+# Proxy integration
+# ---------------------------------------------------------------------------
+
+
+class TestProxyCoalescing:
+    @pytest.mark.asyncio
+    async def test_concurrent_viewers_share_one_upstream_fetch(self):
+        fetches = []
+        gate = asyncio.Event()
+
+        async def node(request):
+            fetches.append(request.url.path)
+            await gate.wait()
+            return httpx.Response(
+                200,
+                headers={"content-type": "video/mp2t", "content-length": "300"},
+                stream=_Body(b"seg" * 100),
+            )
+
+        app = FastAPI()
+        app.include_router(proxy.router)
+        upstream = httpx.AsyncClient(transport=httpx.MockTransport(node))
+
+        with patch("app.proxy._get_viewer_assignment", new_callable=AsyncMock, return_value="n1"), \
+             patch("app.proxy._resolve_node_vpn_ip", new_callable=AsyncMock, return_value="100.64.0.5"), \
+             patch.object(proxy, "_vpn_client", upstream):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as viewers:
+                requests = [asyncio.create_task(viewers.get("/api/v1/proxy/s1/seg-7.ts")) for _ in range(25)]
+                await asyncio.sleep(0.05)
+                gate.set()
+                responses = await asyncio.gather(*requests)
+                # Later viewers are served from memory
+                again = await viewers.get("/api/v1/proxy/s1/seg-7.ts")
+
+        assert fetches == ["/live/s1/seg-7.ts"]
+        assert all(r.status_code == 200 and r.content == b"seg" * 100 for r in responses)
+        assert again.content == b"seg" * 100
+        assert again.headers["content-type"] == "video/mp2t"
+
+    @pytest.mark.asyncio
+    async def test_coalesced_failure_counts_against_node_once(self):
+        gate = asyncio.Event()
+
+        async def node(request):
+            await gate.wait()
+            raise httpx.ConnectError("node down")
+
+        app = FastAPI()
+        app.include_router(proxy.router)
+        upstream = httpx.AsyncClient(transport=httpx.MockTransport(node))
+        srs = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, headers={"content-length": "3"}, stream=_Body(b"srs"))
+        ))
+        node_failed = AsyncMock()
+
+        with patch("app.proxy._get_viewer_assignment", new_callable=AsyncMock, return_value="n1"), \
+             patch("app.proxy._resolve_node_vpn_ip", new_callable=AsyncMock, return_value="100.64.0.5"), \
+             patch("app.proxy._node_failed", node_failed), \
+             patch.object(proxy, "_vpn_client", upstream), \
+             patch.object(proxy, "_http_client", srs):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as viewers:
+                requests = [asyncio.create_task(viewers.get("/api/v1/proxy/s1/seg-9.ts")) for _ in range(10)]
+                await asyncio.sleep(0.05)
+                gate.set()
+                responses = await asyncio.gather(*requests)
+
+        assert all(r.status_code == 200 and r.content == b"srs" for r in responses)
+        node_failed.assert_awaited_once_with("s1", "n1")
@@ -10,6 +10,7 @@ from unittest.mock import AsyncMock, patch
 import pytest
 
 from app import models
+from app.rtmp_probe import RtmpProtocolError, probe_rtmp
 from app.spot_check_prober import SpotCheckProber
 
 
@@ -144,3 +145,53 @@ class TestSpotCheckProberInit:
         prober = SpotCheckProber(check_interval_min=5, check_interval_max=15)
         assert prober.check_interval_min == 300
         assert prober.check_interval_max == 900
+
+
+class TestRtmpProbeModes:
+    @staticmethod
+    def _node():
+        return models.Node(node_id="sp-n5", stream_id="live-stream", stats_url="http://127.0.0.1:8080/stats")
+
+    @pytest.mark.asyncio
+    async def test_native_probe_against_local_server(self):
+        from tests.fake_rtmp import FakeRtmpServer
+        server = await FakeRtmpServer().start()
+        server.live.add("live-stream")
+        prober = SpotCheckProber()
+        try:
+            # Nodes are probed on :1935; point the probe at the test server's port
+            async def local(url):
+                return await probe_rtmp(url.replace(":1935/", f":{server.port}/"), timeout=2)
+
+            with patch("app.spot_check_prober.probe_rtmp", side_effect=local):
+                assert await prober._test_rtmp_connection(self._node()) == (True, None)
+        finally:
+            await server.stop()
+
+    @pytest.mark.asyncio
+    async def test_ffprobe_mode_uses_subprocess(self):
+        prober = SpotCheckProber(probe_mode="ffprobe")
+        prober._ffprobe_rtmp = AsyncMock(return_value=(True, None))
+
+        with patch("app.spot_check_prober.probe_rtmp") as native:
+            assert await prober._test_rtmp_connection(self._node()) == (True, None)
+
+        native.assert_not_called()
+        prober._ffprobe_rtmp.assert_awaited_once_with("rtmp://127.0.0.1:1935/live/live-stream")
+
+    @pytest.mark.asyncio
+    async def test_protocol_error_falls_back_to_ffprobe(self):
+        prober = SpotCheckProber(probe_mode="native")
+        prober._ffprobe_rtmp = AsyncMock(return_value=(True, None))
+        native = AsyncMock(side_effect=RtmpProtocolError("Unsupported AMF0 marker 0x11"))
+
+        with patch("app.spot_check_prober.probe_rtmp", native), \
+             patch("app.spot_check_prober.shutil.which", return_value="/usr/bin/ffprobe"):
+            assert await prober._test_rtmp_connection(self._node()) == (True, None)
+
+        with patch("app.spot_check_prober.probe_rtmp", native), \
+             patch("app.spot_check_prober.shutil.which", return_value=None):
+            success, error = await prober._test_rtmp_connection(self._node())
+        assert success is False
+        assert "protocol error" in error
+        assert prober._ffprobe_rtmp.await_count == 1
@@ -4,14 +4,17 @@ node status transitions, error handling for unreachable nodes.
 Task 7.9 — Req 21.2, Design §24
 """
 
+import asyncio
 import json
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import httpx
 import pytest
 
-from app.stats_collector import StatsCollector
+from app import stats_collector
+from app.stats_collector import NodeTarget, StatsCollector, node_offset, summarize_stats
 
 
 @pytest.fixture()
@@ -104,7 +107,8 @@ class TestCollectNodeStats:
     async def test_successful_collection(self, test_db, make_user, make_stream, make_node):
         make_user(user_id="sc-u1")
         make_stream(stream_id="sc-s1", owner_user_id="sc-u1")
-        node = make_node(node_id="sc-n1", stream_id="sc-s1", user_id="sc-u1")
+        make_node(node_id="sc-n1", stream_id="sc-s1", user_id="sc-u1")
+        node = NodeTarget("sc-n1", "sc-s1", "http://10.0.0.1:8080/stats")
 
         collector = StatsCollector()
         mock_response = MagicMock()
@@ -120,7 +124,7 @@ class TestCollectNodeStats:
         collector.client = AsyncMock()
         collector.client.get = AsyncMock(return_value=mock_response)
 
-        await collector._collect_node_stats(node, test_db)
+        collector._flush_results(test_db, [await collector._probe_node(node)])
 
         from app.models import ProbeResult
         probes = test_db.query(ProbeResult).filter_by(node_id="sc-n1").all()
@@ -131,7 +135,8 @@ class TestCollectNodeStats:
     async def test_http_error_stores_failure(self, test_db, make_user, make_stream, make_node):
         make_user(user_id="sc-u2")
         make_stream(stream_id="sc-s2", owner_user_id="sc-u2")
-        node = make_node(node_id="sc-n2", stream_id="sc-s2", user_id="sc-u2")
+        make_node(node_id="sc-n2", stream_id="sc-s2", user_id="sc-u2")
+        node = NodeTarget("sc-n2", "sc-s2", "http://10.0.0.1:8080/stats")
 
         collector = StatsCollector()
         mock_response = MagicMock()
@@ -140,7 +145,7 @@ class TestCollectNodeStats:
         collector.client = AsyncMock()
         collector.client.get = AsyncMock(return_value=mock_response)
 
-        await collector._collect_node_stats(node, test_db)
+        collector._flush_results(test_db, [await collector._probe_node(node)])
 
         from app.models import ProbeResult
         probes = test_db.query(ProbeResult).filter_by(node_id="sc-n2").all()
@@ -151,16 +156,158 @@ class TestCollectNodeStats:
     async def test_connection_error_stores_failure(self, test_db, make_user, make_stream, make_node):
         make_user(user_id="sc-u3")
         make_stream(stream_id="sc-s3", owner_user_id="sc-u3")
-        node = make_node(node_id="sc-n3", stream_id="sc-s3", user_id="sc-u3")
+        make_node(node_id="sc-n3", stream_id="sc-s3", user_id="sc-u3")
+        node = NodeTarget("sc-n3", "sc-s3", "http://10.0.0.1:8080/stats")
 
         collector = StatsCollector()
         collector.client = AsyncMock()
         collector.client.get = AsyncMock(side_effect=httpx.ConnectError("refused"))
 
-        await collector._collect_node_stats(node, test_db)
+        collector._flush_results(test_db, [await collector._probe_node(node)])
 
         from app.models import ProbeResult
         probes = test_db.query(ProbeResult).filter_by(node_id="sc-n3").all()
         assert len(probes) == 1
         assert probes[0].success is False
         assert "refused" in probes[0].error_message
+
+
+class TestCompactProbeStorage:
+    PAYLOAD = {
+        "streams": [
+            {"stream_name": "live/other", "connections": [{"state": "publishing"}]},
+            {
+                "stream_name": "live/cp-s1",
+                "bitrate": 2500,
+                "connections": [{"state": "idle"}, {"state": "Publishing"}],
+            },
+        ]
+    }
+
+    @staticmethod
+    def _client(payload):
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = payload
+        client = AsyncMock()
+        client.get = AsyncMock(return_value=response)
+        return client
+
+    def test_summary_of_matching_stream(self):
+        assert summarize_stats(self.PAYLOAD, "cp-s1") == {
+            "stream_present": True,
+            "connection_count": 2,
+            "connection_state": "publishing",
+            "bitrate_kbps": 2500,
+        }
+
+    def test_summary_of_missing_or_malformed(self):
+        empty = {"stream_present": False, "connection_count": 0, "connection_state": None, "bitrate_kbps": None}
+        assert summarize_stats({"streams": []}, "cp-s1") == empty
+        assert summarize_stats(None, "cp-s1") == empty
+
+    @pytest.mark.asyncio
+    async def test_successful_poll_stores_columns_without_payload(self):
+        collector = StatsCollector(raw_sample_rate=0)
+        collector.client = self._client(self.PAYLOAD)
+
+        row = await collector._probe_node(NodeTarget("cp-n1", "cp-s1", "http://10.0.0.1:8080/stats"))
+
+        assert row["success"] is True
+        assert row["connection_count"] == 2
+        assert row["response_data"] is None
+
+    @pytest.mark.asyncio
+    async def test_failed_poll_keeps_payload(self):
+        collector = StatsCollector(raw_sample_rate=0)
+        collector.client = self._client({"streams": []})
+
+        row = await collector._probe_node(NodeTarget("cp-n1", "cp-s1", "http://10.0.0.1:8080/stats"))
+
+        assert row["success"] is False
+        assert row["stream_present"] is False
+        assert json.loads(row["response_data"]) == {"streams": []}
+
+    @pytest.mark.asyncio
+    async def test_sampled_poll_keeps_payload(self):
+        collector = StatsCollector(raw_sample_rate=1)
+        collector.client = self._client(self.PAYLOAD)
+
+        row = await collector._probe_node(NodeTarget("cp-n1", "cp-s1", "http://10.0.0.1:8080/stats"))
+
+        assert row["success"] is True
+        assert json.loads(row["response_data"]) == self.PAYLOAD
+
+
+class TestCollectRound:
+    @staticmethod
+    def _nodes(test_db, make_user, make_stream, make_node, count, hosts):
+        make_user(user_id="sr-u1")
+        make_stream(stream_id="sr-s1", owner_user_id="sr-u1")
+        for i in range(count):
+            node = make_node(node_id=f"sr-n{i}", stream_id="sr-s1", user_id="sr-u1")
+            node.stats_url = f"http://10.0.0.{i % hosts}:8080/stats"
+        test_db.flush()
+
+    @staticmethod
+    def _session(test_db):
+        # The round closes its sessions; keep the test transaction open
+        session = MagicMock(wraps=test_db)
+        session.close = MagicMock()
+        return session
+
+    @staticmethod
+    def _slow_client(in_flight, peaks):
+        async def get(url):
+            in_flight[url] += 1
+            peaks["total"] = max(peaks["total"], sum(in_flight.values()))
+            peaks["host"] = max(peaks["host"], in_flight[url])
+            await asyncio.sleep(0.01)
+            in_flight[url] -= 1
+            response = MagicMock()
+            response.status_code = 500
+            response.text = "down"
+            return response
+
+        client = AsyncMock()
+        client.get = AsyncMock(side_effect=get)
+        return client
+
+    @pytest.mark.asyncio
+    async def test_concurrency_and_per_host_limits(self, test_db, make_user, make_stream, make_node):
+        self._nodes(test_db, make_user, make_stream, make_node, count=20, hosts=2)
+        collector = StatsCollector(concurrency=5, per_host_limit=2, spread_fraction=0)
+        in_flight, peaks = defaultdict(int), {"total": 0, "host": 0}
+        collector.client = self._slow_client(in_flight, peaks)
+
+        with patch.object(stats_collector.database, "SessionLocal", return_value=self._session(test_db)):
+            await collector._collect_round()
+
+        assert collector.client.get.await_count == 20
+        assert peaks["host"] <= 2
+        assert peaks["total"] <= 4  # two hosts x two each, under the pool size
+
+    @pytest.mark.asyncio
+    async def test_results_written_in_one_bulk_insert(self, test_db, make_user, make_stream, make_node):
+        self._nodes(test_db, make_user, make_stream, make_node, count=6, hosts=6)
+        collector = StatsCollector(spread_fraction=0)
+        collector.client = self._slow_client(defaultdict(int), {"total": 0, "host": 0})
+        session = self._session(test_db)
+
+        with patch.object(stats_collector.database, "SessionLocal", return_value=session):
+            await collector._collect_round()
+
+        from app.models import ProbeResult
+        assert test_db.query(ProbeResult).filter(ProbeResult.node_id.like("sr-n%")).count() == 6
+        assert session.commit.call_count == 1
+        assert collector.metrics.rounds == 1
+        assert collector.metrics.last_round_nodes == 6
+        assert collector.metrics.last_round_failures == 6
+        assert collector.metrics.last_round_seconds > 0
+
+    def test_node_offsets_are_stable_and_spread(self):
+        offsets = [node_offset(f"node-{i}", 30.0) for i in range(200)]
+        assert offsets == [node_offset(f"node-{i}", 30.0) for i in range(200)]
+        assert all(0 <= o < 30.0 for o in offsets)
+        # Roughly uniform: every 10s third of the window gets some nodes
+        assert {int(o // 10) for o in offsets} == {0, 1, 2}
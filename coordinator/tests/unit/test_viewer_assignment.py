@@ -0,0 +1,154 @@
+"""
+Unit tests for viewer assignment expiry and rebalancing — activity refresh
+throttling, batched expiry sweeps, and moving viewers off hot nodes.
+"""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import fakeredis.aioredis
+import pytest
+
+from app import viewer_assignment
+from app.viewer_assignment import (
+    ACTIVITY_INDEX_KEY,
+    ASSIGNED_STREAMS_KEY,
+    _moves_for,
+    assign_viewers,
+    expire_idle_viewers,
+    rebalance_stream,
+    rebalance_viewers,
+    touch_viewer,
+)
+
+
+@pytest.fixture(autouse=True)
+def _clear_touch_cache():
+    viewer_assignment._last_touch.clear()
+    yield
+    viewer_assignment._last_touch.clear()
+
+
+def _node(node_id, capacity, trust=0.9):
+    return {"node_id": node_id, "vpn_ip": "10.0.0.1", "trust_score": trust, "capacity_pct": capacity}
+
+
+# ---------------------------------------------------------------------------
+# Activity / expiry
+# ---------------------------------------------------------------------------
+
+
+class TestExpiry:
+    @pytest.mark.asyncio
+    async def test_touch_is_throttled_per_viewer(self):
+        r = MagicMock()
+        r.zadd = AsyncMock()
+        with patch("app.viewer_assignment.time.time", side_effect=[100.0, 105.0, 120.0]):
+            await touch_viewer(r, "s1", "1.2.3.4")
+            await touch_viewer(r, "s1", "1.2.3.4")
+            await touch_viewer(r, "s1", "1.2.3.4")
+        assert r.zadd.await_count == 2
+        args, kwargs = r.zadd.call_args
+        assert args == (ACTIVITY_INDEX_KEY, {"s1|1.2.3.4": 120.0})
+        # Never re-creates an assignment the sweep already dropped
+        assert kwargs == {"xx": True}
+
+    @pytest.mark.asyncio
+    async def test_expiry_sweeps_in_batches(self):
+        script = AsyncMock(side_effect=[3, 3, 1])
+        r = MagicMock()
+        r.register_script.return_value = script
+        with patch("app.viewer_assignment._expire_script", None), \
+             patch("app.viewer_assignment._activity_backfilled", True), \
+             patch("app.viewer_assignment.VIEWER_EXPIRY_BATCH", 3), \
+             patch("app.viewer_assignment.time.time", return_value=1000.0):
+            expired = await expire_idle_viewers(r, max_idle_seconds=120)
+        assert expired == 7
+        assert script.await_count == 3
+        assert script.call_args.kwargs == {"keys": [ACTIVITY_INDEX_KEY, ASSIGNED_STREAMS_KEY], "args": [880.0, 3]}
+
+    @pytest.mark.asyncio
+    async def test_first_sweep_backfills_legacy_assignments(self):
+        r = MagicMock()
+        r.scan = AsyncMock(return_value=(0, ["stream:s1:viewers"]))
+        r.hkeys = AsyncMock(return_value=["v1", "v2"])
+        r.zadd = AsyncMock(return_value=2)
+        r.sadd = AsyncMock(return_value=1)
+        r.register_script.return_value = AsyncMock(return_value=0)
+        with patch("app.viewer_assignment._expire_script", None), \
+             patch("app.viewer_assignment._activity_backfilled", False), \
+             patch("app.viewer_assignment.time.time", return_value=1000.0):
+            await expire_idle_viewers(r)
+        r.zadd.assert_awaited_once_with(
+            ACTIVITY_INDEX_KEY, {"s1|v1": 1000.0, "s1|v2": 1000.0}, nx=True,
+        )
+        r.sadd.assert_awaited_once_with(ASSIGNED_STREAMS_KEY, "s1")
+
+
+# ---------------------------------------------------------------------------
+# Rebalancing
+# ---------------------------------------------------------------------------
+
+
+class TestRebalance:
+    def test_moves_scale_with_excess_over_watermark(self):
+        with patch("app.viewer_assignment.REBALANCE_WATERMARK_PCT", 80), \
+             patch("app.viewer_assignment.REBALANCE_MAX_MOVES_PER_NODE", 50):
+            assert _moves_for(_node("n", 100), 40) == 8
+            assert _moves_for(_node("n", 81), 40) == 1
+            assert _moves_for(_node("n", 100), 1000) == 50
+
+    @pytest.mark.asyncio
+    async def test_moves_viewers_from_hot_to_cool_nodes(self):
+        nodes = [_node("hot", 100), _node("cool", 20), _node("warm", 85)]
+        assignments = {f"v{i}": "hot" for i in range(10)}
+        assignments["w1"] = "warm"
+        r = MagicMock()
+        r.hgetall = AsyncMock(return_value=assignments)
+
+        with patch("app.viewer_assignment.get_stream_nodes", new_callable=AsyncMock, return_value=nodes), \
+             patch("app.viewer_assignment.get_loads", new_callable=AsyncMock, return_value={"hot": 10, "warm": 1}), \
+             patch("app.viewer_assignment.assign_viewers", new_callable=AsyncMock, return_value=3) as assign, \
+             patch.object(viewer_assignment.node_breaker, "open_nodes", new_callable=AsyncMock, return_value=set()), \
+             patch("app.viewer_assignment.REBALANCE_WATERMARK_PCT", 80):
+            moved = await rebalance_stream(r, "s1")
+
+        assert moved == 3
+        mapping = assign.call_args.args[2]
+        # 2 of 10 off the node at 100%, 1 of 1 off the one at 85%, all to the cool node
+        assert len(mapping) == 3
+        assert "w1" in mapping
+        assert set(mapping.values()) == {"cool"}
+
+    @pytest.mark.asyncio
+    async def test_no_moves_without_cool_targets(self):
+        nodes = [_node("hot", 100), _node("warm", 85)]
+        r = MagicMock()
+        r.hgetall = AsyncMock()
+
+        with patch("app.viewer_assignment.get_stream_nodes", new_callable=AsyncMock, return_value=nodes), \
+             patch("app.viewer_assignment.assign_viewers", new_callable=AsyncMock) as assign, \
+             patch.object(viewer_assignment.node_breaker, "open_nodes", new_callable=AsyncMock, return_value=set()):
+            assert await rebalance_stream(r, "s1") == 0
+
+        assign.assert_not_awaited()
+        r.hgetall.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_only_streams_with_viewers_are_rebalanced(self):
+        r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        with patch("app.viewer_assignment._assign_script", None), \
+             patch("app.viewer_assignment._expire_script", None), \
+             patch("app.viewer_assignment._activity_backfilled", True):
+            await assign_viewers(r, "s1", {"v1": "n1", "v2": "n1"})
+            await assign_viewers(r, "s2", {"v3": "n2"})
+            await assign_viewers(r, "s2", {"v3": None})
+            assert await r.smembers(ASSIGNED_STREAMS_KEY) == {"s1"}
+
+            with patch("app.viewer_assignment.rebalance_stream", new_callable=AsyncMock, return_value=0) as stream:
+                await rebalance_viewers(r)
+            assert [c.args[1] for c in stream.await_args_list] == ["s1"]
+
+            # The last viewer expiring takes the stream out of the set
+            assert await expire_idle_viewers(r, max_idle_seconds=-1) == 2
+            assert await r.smembers(ASSIGNED_STREAMS_KEY) == set()
+        await r.aclose()
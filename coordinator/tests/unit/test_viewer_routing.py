@@ -1,14 +1,17 @@
 """
-Unit tests for viewer routing — trust-based selection, SRS fallback,
-capacity saturation exclusion, peer list ordering.
+Unit tests for viewer routing — weighted load-balanced selection, viewer
+counters, SRS fallback, capacity saturation exclusion, peer list ordering.
 Task 7.11 — Req 21, Design §24, Properties 25–26, 30–31
 """
 
 import json
+import random
+from collections import Counter
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
+from app.viewer_assignment import assign_viewers, choose_node, node_weight, spread_viewers
 from app.viewer_routes import _pick_best_node, _log_fallback
 
 
@@ -33,26 +36,40 @@ def _node(node_id, trust=0.9, capacity=50, viewers=2):
 
 class TestPickBestNode:
     @pytest.mark.asyncio
-    async def test_picks_highest_trust(self):
+    async def test_prefers_higher_trust_at_equal_load(self):
         nodes = [
             _node("n1", trust=0.7, capacity=30, viewers=1),
             _node("n2", trust=0.95, capacity=30, viewers=1),
-            _node("n3", trust=0.8, capacity=30, viewers=1),
         ]
-        with patch("app.viewer_routes.get_redis", new_callable=AsyncMock) as mock_redis, \
-             patch("app.viewer_routes.get_stream_nodes", new_callable=AsyncMock) as mock_nodes:
+        with patch("app.viewer_routes.get_redis", new_callable=AsyncMock), \
+             patch("app.viewer_routes.get_stream_nodes", new_callable=AsyncMock) as mock_nodes, \
+             patch("app.viewer_routes.get_loads", new_callable=AsyncMock, return_value={}):
+            mock_nodes.return_value = nodes
+            best = await _pick_best_node("stream-1")
+        assert best["node_id"] == "n2"
+
+    @pytest.mark.asyncio
+    async def test_prefers_fewer_assigned_viewers(self):
+        nodes = [
+            _node("n1", trust=0.9, capacity=30, viewers=0),
+            _node("n2", trust=0.9, capacity=30, viewers=0),
+        ]
+        with patch("app.viewer_routes.get_redis", new_callable=AsyncMock), \
+             patch("app.viewer_routes.get_stream_nodes", new_callable=AsyncMock) as mock_nodes, \
+             patch("app.viewer_routes.get_loads", new_callable=AsyncMock, return_value={"n1": 5, "n2": 1}):
             mock_nodes.return_value = nodes
             best = await _pick_best_node("stream-1")
         assert best["node_id"] == "n2"
 
     @pytest.mark.asyncio
-    async def test_breaks_tie_by_lowest_viewers(self):
+    async def test_falls_back_to_heartbeat_counts_without_counters(self):
         nodes = [
             _node("n1", trust=0.9, capacity=30, viewers=5),
             _node("n2", trust=0.9, capacity=30, viewers=1),
         ]
         with patch("app.viewer_routes.get_redis", new_callable=AsyncMock), \
-             patch("app.viewer_routes.get_stream_nodes", new_callable=AsyncMock) as mock_nodes:
+             patch("app.viewer_routes.get_stream_nodes", new_callable=AsyncMock) as mock_nodes, \
+             patch("app.viewer_routes.get_loads", new_callable=AsyncMock, side_effect=ConnectionError):
             mock_nodes.return_value = nodes
             best = await _pick_best_node("stream-1")
         assert best["node_id"] == "n2"
@@ -124,6 +141,62 @@ class TestPickBestNode:
         assert best is None
 
 
+# ---------------------------------------------------------------------------
+# Assignment engine
+# ---------------------------------------------------------------------------
+
+
+class TestChooseNode:
+    def test_weight_scales_with_trust_and_headroom(self):
+        assert node_weight(_node("n1", trust=1.0, capacity=0)) == pytest.approx(1.0)
+        assert node_weight(_node("n2", trust=0.8, capacity=45)) == pytest.approx(0.4)
+        assert node_weight(_node("n3", trust=0.9, capacity=90)) > 0
+
+    def test_spreads_load_instead_of_argmax(self):
+        nodes = [_node(f"n{i}", trust=0.6 + i * 0.05, capacity=20) for i in range(8)]
+        rng = random.Random(7)
+        loads = Counter()
+        for _ in range(800):
+            loads[choose_node(nodes, loads, rng=rng)["node_id"]] += 1
+        assert len(loads) == 8
+        # Every node gets a share roughly in line with its weight
+        assert max(loads.values()) < 2 * min(loads.values())
+        assert loads["n7"] > loads["n0"]
+
+    def test_weighted_policy_samples_by_weight(self):
+        nodes = [_node("n1", trust=0.9, capacity=0), _node("n2", trust=0.9, capacity=80)]
+        rng = random.Random(1)
+        picks = Counter(choose_node(nodes, {}, policy="weighted", rng=rng)["node_id"] for _ in range(1000))
+        assert picks["n1"] > 5 * picks["n2"]
+
+    def test_spread_viewers_accounts_for_earlier_picks(self):
+        nodes = [_node("n1", trust=0.9, capacity=10), _node("n2", trust=0.9, capacity=10)]
+        mapping = spread_viewers([f"v{i}" for i in range(10)], nodes, {"n1": 0, "n2": 0})
+        assert Counter(mapping.values()) == {"n1": 5, "n2": 5}
+
+
+class TestAssignViewers:
+    @pytest.mark.asyncio
+    async def test_applies_mapping_in_one_script_call(self):
+        script = AsyncMock(return_value=2)
+        r = MagicMock()
+        r.register_script.return_value = script
+        with patch("app.viewer_assignment._assign_script", None), \
+             patch("app.viewer_assignment.time.time", return_value=1000.0):
+            changed = await assign_viewers(r, "s1", {"v1": "n1", "v2": None})
+        assert changed == 2
+        script.assert_awaited_once_with(
+            keys=["stream:s1:viewers", "stream:s1:load", "viewers:activity", "viewers:streams"],
+            args=[1000.0, "s1|", "v1", "n1", "v2", ""],
+        )
+
+    @pytest.mark.asyncio
+    async def test_empty_mapping_skips_redis(self):
+        r = MagicMock()
+        assert await assign_viewers(r, "s1", {}) == 0
+        r.register_script.assert_not_called()
+
+
 # ---------------------------------------------------------------------------
 # SRS fallback logging
 # ---------------------------------------------------------------------------